@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Per-Backend Admission Control for the API Gateway
+Caps concurrent requests per backend and queues the overflow by priority class
+(interactive chat, collaboration sub-tasks, batch automation). When the queue is
+full or a request waits too long, it is shed immediately with 429/503 and a
+Retry-After hint instead of piling onto a saturated backend.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from deadlines import deadline_manager
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_COLLABORATION = 1
+PRIORITY_BATCH = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_COLLABORATION: 'collaboration',
+    PRIORITY_BATCH: 'batch'
+}
+
+# task_type values that imply a lower priority class when no header is given
+TASK_TYPE_PRIORITIES = {
+    'collaboration': PRIORITY_COLLABORATION,
+    'collaborative': PRIORITY_COLLABORATION,
+    'batch': PRIORITY_BATCH,
+    'automation': PRIORITY_BATCH,
+    'bulk': PRIORITY_BATCH
+}
+
+# Share of the wait queue each class may fill, so batch work can't crowd out chat
+QUEUE_SHARE = {
+    PRIORITY_INTERACTIVE: 1.0,
+    PRIORITY_COLLABORATION: 0.8,
+    PRIORITY_BATCH: 0.5
+}
+
+def priority_from_request(headers, task_type: Optional[str] = None) -> int:
+    """Priority class from the X-Priority header, falling back to the task type"""
+    explicit = (headers.get('X-Priority') or '').strip().lower()
+    for priority, name in PRIORITY_NAMES.items():
+        if explicit == name:
+            return priority
+    return TASK_TYPE_PRIORITIES.get((task_type or '').lower(), PRIORITY_INTERACTIVE)
+
+@dataclass
+class AdmissionConfig:
+    """Concurrency and queueing limits for one backend"""
+    enabled: bool = True
+    max_concurrent: int = 32
+    max_queue: int = 64
+    max_wait: float = 5.0       # seconds a request may queue before it is shed
+
+    @classmethod
+    def from_env(cls, backend_name: Optional[str] = None) -> 'AdmissionConfig':
+        """Build config from ADMISSION_* env vars, with optional <NAME>_ADMISSION_* overrides"""
+        def setting(key: str, default: str) -> str:
+            if backend_name:
+                override = os.getenv(f"{backend_name.upper()}_ADMISSION_{key}")
+                if override is not None:
+                    return override
+            return os.getenv(f"ADMISSION_{key}", default)
+
+        return cls(
+            enabled=setting('ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            max_concurrent=int(setting('MAX_CONCURRENT', '32')),
+            max_queue=int(setting('MAX_QUEUE', '64')),
+            max_wait=float(setting('MAX_WAIT', '5'))
+        )
+
+class AdmissionRejected(Exception):
+    """A request was shed; carries the HTTP status and Retry-After hint"""
+
+    def __init__(self, backend: str, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"Backend '{backend}' is saturated: {reason}")
+        self.backend = backend
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class _Waiter:
+    """A queued request; grant() hands it a slot from whichever thread releases one"""
+
+    def __init__(self, priority: int, grant: Callable[[], None]):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+        self._grant = grant
+
+    def grant(self):
+        self.granted = True
+        self._grant()
+
+class BackendAdmission:
+    """Concurrency limit plus a priority wait queue for one backend"""
+
+    def __init__(self, name: str, config: AdmissionConfig):
+        self.name = name
+        self.config = config
+        self.in_flight = 0
+        self._queue: List[Any] = []
+        self._queued_by_priority = {priority: 0 for priority in PRIORITY_NAMES}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._waits: Deque[float] = deque(maxlen=500)
+        self._service_time: Optional[float] = None
+        self.stats_counters = {
+            'admitted': 0,
+            'queued': 0,
+            'rejected_queue_full': 0,
+            'rejected_timeout': 0,
+            'rejected_deadline': 0,
+            'released': 0
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(self._queued_by_priority.values())
+
+    def _retry_after(self) -> int:
+        # Caller holds self._lock: time to drain the current queue at the observed service rate
+        service_time = self._service_time or 1.0
+        drain = (self.queue_depth + 1) * service_time / max(1, self.config.max_concurrent)
+        return max(1, int(drain + 0.999))
+
+    def _try_admit(self, priority: int, grant: Callable[[], None]) -> Optional[_Waiter]:
+        """Admit now (returns None) or enqueue (returns the waiter); raises when shedding"""
+        with self._lock:
+            if self.in_flight < self.config.max_concurrent and self.queue_depth == 0:
+                self.in_flight += 1
+                self.stats_counters['admitted'] += 1
+                self._waits.append(0.0)
+                return None
+
+            limit = int(self.config.max_queue * QUEUE_SHARE.get(priority, 1.0))
+            if self.queue_depth >= limit:
+                self.stats_counters['rejected_queue_full'] += 1
+                raise AdmissionRejected(
+                    self.name, f"{PRIORITY_NAMES.get(priority, priority)} queue full "
+                    f"({self.queue_depth} waiting, {self.in_flight} in flight)",
+                    429, self._retry_after()
+                )
+
+            waiter = _Waiter(priority, grant)
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self._queued_by_priority[priority] = self._queued_by_priority.get(priority, 0) + 1
+            self.stats_counters['queued'] += 1
+            return waiter
+
+    def _withdraw(self, waiter: _Waiter) -> bool:
+        """Take a waiter out of the queue; False if it was granted a slot in the meantime"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            waiter.cancelled = True
+            self._queued_by_priority[waiter.priority] -= 1
+            return True
+
+    def _timed_out(self, waiter: _Waiter):
+        """Shed a waiter that queued for max_wait (or until its request's deadline), unless a
+        slot arrived just in time"""
+        if not self._withdraw(waiter):
+            return
+        if deadline_manager.exhausted():
+            with self._lock:
+                self.stats_counters['rejected_deadline'] += 1
+            raise deadline_manager.exceeded('admission', self.name)
+        with self._lock:
+            self.stats_counters['rejected_timeout'] += 1
+            retry_after = self._retry_after()
+        raise AdmissionRejected(
+            self.name, f"queued longer than {self.config.max_wait:.1f}s", 503, retry_after
+        )
+
+    def _granted(self, waiter: _Waiter):
+        with self._lock:
+            self._waits.append(time.monotonic() - waiter.enqueued_at)
+            self.stats_counters['admitted'] += 1
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        """Block until a slot is free (from a worker thread)"""
+        event = threading.Event()
+        waiter = self._try_admit(priority, event.set)
+        if waiter is None:
+            return
+        if not event.wait(deadline_manager.timeout(self.config.max_wait)):
+            self._timed_out(waiter)
+        self._granted(waiter)
+
+    async def acquire_async(self, priority: int = PRIORITY_INTERACTIVE):
+        """Wait for a slot without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+        waiter = self._try_admit(priority, grant)
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(future), deadline_manager.timeout(self.config.max_wait))
+        except asyncio.TimeoutError:
+            self._timed_out(waiter)
+        except asyncio.CancelledError:
+            # Caller went away while queued; hand back a slot granted in the meantime
+            if not self._withdraw(waiter):
+                self.release()
+            raise
+        self._granted(waiter)
+
+    def release(self, service_time: Optional[float] = None):
+        """Return a slot, handing it straight to the highest-priority waiter"""
+        with self._lock:
+            self.stats_counters['released'] += 1
+            if service_time is not None:
+                self._service_time = service_time if self._service_time is None else \
+                    0.2 * service_time + 0.8 * self._service_time
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if waiter.cancelled:
+                    continue
+                self._queued_by_priority[waiter.priority] -= 1
+                waiter.grant()
+                return
+            self.in_flight -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            counters = dict(self.stats_counters)
+            return {
+                'max_concurrent': self.config.max_concurrent,
+                'max_queue': self.config.max_queue,
+                'in_flight': self.in_flight,
+                'queue_depth': self.queue_depth,
+                'queue_depth_by_priority': {
+                    PRIORITY_NAMES[p]: n for p, n in self._queued_by_priority.items()
+                },
+                'wait_ms_avg': round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                'wait_ms_p95': round(waits[int(0.95 * (len(waits) - 1))] * 1000, 2) if waits else 0.0,
+                'service_time_ms': round(self._service_time * 1000, 1) if self._service_time else None,
+                **counters
+            }
+
+class AdmissionController:
+    """Per-backend admission, created on first use"""
+
+    def __init__(self):
+        self.backends: Dict[str, BackendAdmission] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> BackendAdmission:
+        admission = self.backends.get(name)
+        if admission is None:
+            with self._lock:
+                admission = self.backends.get(name)
+                if admission is None:
+                    admission = BackendAdmission(name, AdmissionConfig.from_env(name))
+                    self.backends[name] = admission
+        return admission
+
+    def configure(self, name: str, config: AdmissionConfig):
+        """Replace a backend's limits (waiters already queued keep their place)"""
+        self.get(name).config = config
+
+    @contextmanager
+    def slot(self, name: str, priority: int = PRIORITY_INTERACTIVE):
+        """Hold one of a backend's request slots for the duration of the block"""
+        admission = self.get(name)
+        if not admission.config.enabled:
+            yield
+            return
+        admission.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            admission.release(time.monotonic() - started)
+
+    def acquire(self, name: str, priority: int = PRIORITY_INTERACTIVE) -> Callable[[], None]:
+        """Take a slot and return its release callback (for streams that outlive the caller)"""
+        admission = self.get(name)
+        if not admission.config.enabled:
+            return lambda: None
+        admission.acquire(priority)
+        started = time.monotonic()
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                admission.release(time.monotonic() - started)
+
+        return release
+
+    async def acquire_async(self, name: str, priority: int = PRIORITY_INTERACTIVE) -> Callable[[], None]:
+        """Async variant of acquire() for orchestrator coroutines"""
+        admission = self.get(name)
+        if not admission.config.enabled:
+            return lambda: None
+        await admission.acquire_async(priority)
+        started = time.monotonic()
+        return lambda: admission.release(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: admission.snapshot() for name, admission in list(self.backends.items())}
+
+# Global admission controller instance
+admission_controller = AdmissionController()
@@ -12,6 +12,9 @@ from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
+# Request budget the gateway propagates to every backend hop (see deadlines.py)
+DEADLINE_HEADER = "X-Request-Timeout"
+
 @dataclass
 class AIResponse:
     """Response from AI service"""
@@ -33,6 +36,7 @@ class AdvancedAIStack:
                 task_type: str = "general",
                 max_tokens: int = 512,
                 temperature: float = 0.7,
+                timeout: float = 60,
                 **kwargs) -> AIResponse:
         """
         Send completion request to AI stack
@@ -42,6 +46,7 @@ class AdvancedAIStack:
             task_type: Type of task ('reasoning', 'general', 'coding', 'creative', 'advanced')
             max_tokens: Maximum tokens to generate
             temperature: Sampling temperature
+            timeout: Seconds to wait; the gateway is told to give up at the same time
             **kwargs: Additional parameters
         
         Returns:
@@ -59,7 +64,8 @@ class AdvancedAIStack:
             response = self.session.post(
                 f"{self.base_url}/v1/completions", 
                 json=payload,
-                timeout=60
+                headers={DEADLINE_HEADER: str(timeout)},
+                timeout=timeout
             )
             response.raise_for_status()
             
@@ -111,6 +117,7 @@ class AdvancedAIStack:
     def chat_complete(self,
                      messages: List[Dict[str, str]],
                      task_type: str = "general",
+                     timeout: float = 60,
                      **kwargs) -> AIResponse:
         """
         Send chat completion request (OpenAI format)
@@ -118,6 +125,7 @@ class AdvancedAIStack:
         Args:
             messages: List of message dicts with 'role' and 'content'
             task_type: Type of task
+            timeout: Seconds to wait; the gateway is told to give up at the same time
             **kwargs: Additional parameters
         
         Returns:
@@ -133,7 +141,8 @@ class AdvancedAIStack:
             response = self.session.post(
                 f"{self.base_url}/v1/chat/completions",
                 json=payload,
-                timeout=60
+                headers={DEADLINE_HEADER: str(timeout)},
+                timeout=timeout
             )
             response.raise_for_status()
             
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Session and Prefix Affinity for Backend Replicas
+Requests of one conversation (X-Session-Id header or session_id/conversation_id
+field), or sharing a long prompt prefix, are pinned to the same replica of a
+backend pool by consistent hashing, so vLLM's prefix cache is reused instead of
+recomputed on another replica. Bounded loads (each replica takes at most
+load_factor times its weighted share of outstanding requests) spill a hot key to
+the next replica on the ring rather than overloading its home. Reports how often
+requests reach their home replica and the response latency on each path.
+"""
+
+import os
+import bisect
+import hashlib
+import threading
+import contextvars
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+from latency_stats import QuantileSketch
+
+logger = logging.getLogger(__name__)
+
+SESSION_HEADERS = ('X-Session-Id', 'X-Conversation-Id')
+SESSION_FIELDS = ('session_id', 'conversation_id')
+
+# 'home': the key's own replica; 'spill': the next one with room; 'unkeyed': plain balancing
+OUTCOMES = ('home', 'spill', 'unkeyed')
+
+_current_request: contextvars.ContextVar[Optional['AffinityRequest']] = contextvars.ContextVar(
+    'current_affinity', default=None
+)
+
+@dataclass
+class AffinityConfig:
+    """Affinity keys and how much imbalance a hot key may cause"""
+    enabled: bool = True
+    prefix_chars: int = 1024        # leading prompt characters fingerprinted when there is no session
+    min_prefix_chars: int = 256     # shorter prompts have no prefix worth pinning
+    load_factor: float = 1.25       # replica cap: this times its weighted share of outstanding requests
+    virtual_nodes: int = 100        # ring points per unit of replica weight
+
+    @classmethod
+    def from_env(cls) -> 'AffinityConfig':
+        return cls(
+            enabled=os.getenv('AFFINITY_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            prefix_chars=int(os.getenv('AFFINITY_PREFIX_CHARS', '1024')),
+            min_prefix_chars=int(os.getenv('AFFINITY_MIN_PREFIX_CHARS', '256')),
+            load_factor=float(os.getenv('AFFINITY_LOAD_FACTOR', '1.25')),
+            virtual_nodes=int(os.getenv('AFFINITY_VIRTUAL_NODES', '100'))
+        )
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'big')
+
+def session_from_request(headers, data: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Conversation/session ID from the request headers or body, if the client sent one"""
+    for header in SESSION_HEADERS:
+        value = headers.get(header)
+        if value:
+            return str(value)
+    for field in SESSION_FIELDS:
+        value = (data or {}).get(field)
+        if value:
+            return str(value)
+    return None
+
+class HashRing:
+    """Consistent-hash ring over replica URLs, with points in proportion to weight"""
+
+    def __init__(self, nodes: Sequence[Tuple[str, float]], virtual_nodes: int = 100):
+        points = []
+        for index, (url, weight) in enumerate(nodes):
+            for replica in range(max(1, round(virtual_nodes * weight))):
+                points.append((_hash(f"{url}#{replica}"), index))
+        points.sort()
+        self._hashes = [point for point, _ in points]
+        self._nodes = [index for _, index in points]
+        self.size = len(nodes)
+
+    def walk(self, key: str) -> Iterator[int]:
+        """Node indexes in ring order from the key's position, each once"""
+        start = bisect.bisect(self._hashes, _hash(key))
+        seen = set()
+        total = len(self._nodes)
+        for offset in range(total):
+            index = self._nodes[(start + offset) % total]
+            if index not in seen:
+                seen.add(index)
+                yield index
+                if len(seen) == self.size:
+                    return
+
+class AffinityRequest:
+    """Affinity key of the request in progress, and where each backend pool placed it"""
+
+    __slots__ = ('key', 'kind', 'stream', 'outcomes')
+
+    def __init__(self, key: Optional[str], kind: str, stream: bool):
+        self.key = key
+        self.kind = kind            # 'session', 'prefix' or 'none'
+        self.stream = stream
+        self.outcomes: Dict[str, str] = {}
+
+    def picked(self, pool: str, outcome: str):
+        self.outcomes[pool] = outcome
+
+class AffinityRouter:
+    """Affinity keys per request, bounded-load replica choice and hit-rate statistics"""
+
+    def __init__(self, config: Optional[AffinityConfig] = None):
+        self.config = config or AffinityConfig.from_env()
+        self._lock = threading.Lock()
+        self._latency = {
+            (outcome, stream): QuantileSketch() for outcome in OUTCOMES for stream in (False, True)
+        }
+        self.stats_counters = {
+            'key_session': 0,
+            'key_prefix': 0,
+            'key_none': 0,
+            **{outcome: 0 for outcome in OUTCOMES}
+        }
+
+    def key_for(self, session_id: Optional[str], prompt: str) -> Tuple[Optional[str], str]:
+        """(affinity key, kind) for a request: its session, else its prompt prefix, else none"""
+        if session_id:
+            return f"session:{session_id}", 'session'
+        if len(prompt) >= self.config.min_prefix_chars:
+            return f"prefix:{_hash(prompt[:self.config.prefix_chars]):016x}", 'prefix'
+        return None, 'none'
+
+    @contextmanager
+    def scope(self, session_id: Optional[str], prompt: str, stream: bool = False):
+        """Route the backend calls made in this block by the request's affinity key"""
+        if not self.config.enabled:
+            yield None
+            return
+        key, kind = self.key_for(session_id, prompt)
+        with self._lock:
+            self.stats_counters[f'key_{kind}'] += 1
+        token = _current_request.set(AffinityRequest(key, kind, stream))
+        try:
+            yield _current_request.get()
+        finally:
+            _current_request.reset(token)
+
+    def current(self) -> Optional[AffinityRequest]:
+        return _current_request.get()
+
+    def ring(self, nodes: Sequence[Tuple[str, float]]) -> HashRing:
+        return HashRing(nodes, self.config.virtual_nodes)
+
+    def choose(self, ring: HashRing, key: str, endpoints: Sequence[Any], available: Sequence[Any]) -> Tuple[Any, bool]:
+        """Bounded-load consistent hashing: the first replica from the key's ring position that
+        is available and under its cap. Endpoints need .outstanding and .weight; returns
+        (endpoint, is_home)"""
+        total_weight = sum(endpoint.weight for endpoint in available)
+        outstanding = sum(endpoint.outstanding for endpoint in available)
+        candidates = set(map(id, available))
+        first = None
+        for position, index in enumerate(ring.walk(key)):
+            endpoint = endpoints[index]
+            if id(endpoint) not in candidates:
+                continue
+            first = first or endpoint
+            cap = self.config.load_factor * (outstanding + 1) * endpoint.weight / total_weight
+            if endpoint.outstanding + 1 <= max(1.0, cap):
+                return endpoint, position == 0
+        # Every replica is at its cap: the nearest available one takes it
+        return first, False
+
+    def observe(self, outcome: Optional[str], latency: float, stream: bool):
+        """A request placed by `outcome` got its response after `latency` seconds"""
+        if outcome is None:
+            return
+        with self._lock:
+            self.stats_counters[outcome] += 1
+            self._latency[(outcome, stream)].add(latency)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.stats_counters)
+            latency = {}
+            for (outcome, stream), sketch in self._latency.items():
+                if sketch.total <= 0:
+                    continue
+                p50, p95 = sketch.quantiles((0.5, 0.95))
+                kind = 'time_to_first_byte' if stream else 'completion'
+                latency.setdefault(outcome, {})[kind] = {
+                    'p50_ms': round(p50 * 1000, 1),
+                    'p95_ms': round(p95 * 1000, 1)
+                }
+        placed = counters['home'] + counters['spill']
+        return {
+            'enabled': self.config.enabled,
+            'load_factor': self.config.load_factor,
+            'home_hit_rate': round(counters['home'] / placed, 4) if placed else 0.0,
+            'latency': latency,
+            **counters
+        }
+
+# Global affinity router instance
+affinity_router = AffinityRouter()
@@ -5,19 +5,44 @@ Routes requests to appropriate backends based on task type
 Enhanced with MCP (Model Context Protocol) server integration
 """
 
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, make_response, g
 import requests
 import json
 import logging
 import os
 import asyncio
+import functools
+import hmac
 import time
-from typing import Dict, Any
-from collaboration_orchestrator import orchestrator, TaskType
-from workflow_templates import workflow_manager
-from mcp_server_registry import mcp_registry
+from dataclasses import asdict
+from typing import Awaitable, Callable, Dict, Any, Iterator, List, Optional, Tuple
 from enhanced_router import intelligent_router
-from platform_aware_router import platform_router
+from backend_clients import BackendClientManager, RawBody
+from streaming import SSE_HEADERS, SSE_DONE, sse_event, stream_backend_response
+from response_cache import response_cache, request_fingerprint, cache_policy_from_headers, CACHE_DEFAULT
+from request_coalescing import request_coalescer
+from hedging import hedger, HedgeFailed, attempt_cancelled
+from health_prober import health_prober, probe_backends
+from load_signals import load_signals
+from affinity import affinity_router, session_from_request, SESSION_FIELDS
+from micro_batching import micro_batcher
+from admission_control import admission_controller, AdmissionRejected, priority_from_request, PRIORITY_INTERACTIVE
+from rate_limiter import rate_limiter, estimate_tokens, Decision
+from circuit_breaker import circuit_breakers, CircuitOpen, HALF_OPEN
+from metrics import (
+    metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE, GATEWAY_REQUESTS, GATEWAY_REQUEST_DURATION,
+    GATEWAY_TIME_TO_FIRST_BYTE, GATEWAY_IN_FLIGHT, BACKEND_ERRORS, ROUTER_FALLBACKS
+)
+from tracing import tracer, TRACEPARENT_HEADER, SPAN_KIND_CLIENT
+from deadlines import deadline_manager, DeadlineExceeded
+from traffic_capture import traffic_capture, sanitise
+from startup import lazy_import, is_initialised, resolve, startup_tracker
+
+# Collaboration, MCP and platform routing (and aiohttp behind them) load on first use
+orchestrator = lazy_import('collaboration_orchestrator', 'orchestrator')
+workflow_manager = lazy_import('workflow_templates', 'workflow_manager')
+mcp_registry = lazy_import('mcp_server_registry', 'mcp_registry')
+platform_router = lazy_import('platform_aware_router', 'platform_router')
 
 app = Flask(__name__)
 
@@ -28,8 +53,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Backend configurations - use environment variables with fallbacks
-BACKENDS = {
+# Backend configurations - use environment variables with fallbacks. Each may list several
+# replicas, 'url[;weight=N],url...', balanced per request (BACKEND_EJECT_* / BACKEND_BALANCER_*)
+BACKEND_ENDPOINTS = {
     'reasoning': os.getenv('REASONING_MODEL_URL', 'http://localhost:8000'),      # vLLM DeepSeek R1
     'general': os.getenv('GENERAL_MODEL_URL', 'http://localhost:8001'),          # vLLM Mistral
     'coding': os.getenv('CODING_MODEL_URL', 'http://localhost:8002'),            # vLLM DeepSeek Coder
@@ -37,101 +63,989 @@ BACKENDS = {
     'advanced': os.getenv('ADVANCED_MODEL_URL', 'http://localhost:5000')         # Oobabooga API
 }
 
-def route_request(task_type: str, prompt: str, **kwargs) -> Dict[str, Any]:
-    """Route request to appropriate backend using intelligent routing"""
+# Keep-alive connection pool per backend replica (sizes/timeouts via BACKEND_POOL_SIZE, BACKEND_*_TIMEOUT)
+backend_clients = BackendClientManager(BACKEND_ENDPOINTS)
+
+# Primary URL per backend, for logs and responses that name one
+BACKENDS = backend_clients.backends
+
+# 'enriched' (default) decodes the completion body and adds a routing_info field;
+# 'passthrough' relays backend bodies byte for byte with routing metadata in
+# X-Routed-Model / X-Routing-Reason / X-Fallback-Used headers (callers can still ask
+# for the enriched body per request with `X-Routing-Info: body`)
+RESPONSE_MODE = os.getenv('GATEWAY_RESPONSE_MODE', 'enriched').lower()
+ROUTING_INFO_HEADER = 'X-Routing-Info'
+
+# Backend and platform service health, probed in the background (HEALTH_PROBE_* env vars)
+async def probe_backend_health() -> Dict[str, Dict[str, Any]]:
+    """Probe every backend replica, taking failing replicas out of their pool's rotation"""
+    health = await probe_backends(backend_clients.endpoint_urls(), health_prober.config.timeout)
+    backend_clients.observe_health(health)
+    return health
+
+health_prober.register('backends', probe_backend_health)
+def services_built() -> bool:
+    """Whether the orchestrator and MCP registry behind /services exist yet (the gateway's
+    lazy imports resolve to the modules' own lazy singletons, so check both layers)"""
+    return all(is_initialised(obj) and is_initialised(resolve(obj)) for obj in (orchestrator, mcp_registry))
+
+# Background rounds leave /services alone until a request has built its registries
+health_prober.register('services', lambda: orchestrator.get_service_status(), ready=services_built)
+
+# Scheduler load scraped from each backend's /metrics for queue-aware routing (LOAD_* env vars)
+load_signals.set_backends(backend_clients.endpoint_urls(), backend_clients.in_flight)
+
+def build_backend_request(model: str, prompt: str, **kwargs) -> Tuple[str, Dict[str, Any]]:
+    """Build the (path, payload) pair for a backend's native completion API"""
+    stream = bool(kwargs.get('stream'))
+    
+    if model == 'creative':
+        # KoboldCpp API format (token streaming lives on a separate endpoint)
+        payload = {
+            "prompt": prompt,
+            "max_length": kwargs.get('max_tokens', 512),
+            "temperature": kwargs.get('temperature', 0.8)
+        }
+        return ("/api/extra/generate/stream" if stream else "/api/v1/generate"), payload
+    
+    # OpenAI-compatible format for vLLM and Oobabooga
+    payload = {
+        "model": "auto",
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": kwargs.get('max_tokens', 512),
+        "temperature": kwargs.get('temperature', 0.7)
+    }
+    if stream:
+        payload["stream"] = True
+    return "/v1/chat/completions", payload
+
+def call_backend(model: str, prompt: str, **kwargs) -> Any:
+    """Send a completion to a backend over its pooled connection and return the decoded body"""
+    if micro_batcher.applies_to(model, bool(kwargs.get('stream'))):
+        _, payload = build_backend_request(model, prompt, **kwargs)
+        return micro_batcher.submit(
+            model, (payload['max_tokens'], payload['temperature']), prompt,
+            lambda: post_completion(model, prompt, **kwargs),
+            lambda prompts: call_backend_batch(model, prompts, **kwargs)
+        )
+    return post_completion(model, prompt, **kwargs)
+
+def post_completion(model: str, prompt: str, **kwargs) -> Any:
+    """One completion request in the backend's native format; the body stays undecoded
+    (a RawBody) in passthrough mode"""
+    path, payload = build_backend_request(model, prompt, **kwargs)
+    with admission_controller.slot(model, kwargs.get('priority', PRIORITY_INTERACTIVE)):
+        response = backend_clients.get(model).post(path, json=payload)
+    response.raise_for_status()
+    if RESPONSE_MODE == 'passthrough':
+        return RawBody.from_response(response)
+    return response.json()
+
+def call_backend_batch(model: str, prompts: List[str], **kwargs) -> List[Dict[str, Any]]:
+    """Send several prompts (already in the model's chat template, see micro_batching) in one
+    vLLM /v1/completions call and split the choices back into one chat.completion body per prompt"""
+    _, chat_payload = build_backend_request(model, '', **kwargs)
+    payload = {k: v for k, v in chat_payload.items() if k != 'messages'}
+    payload['prompt'] = prompts
+    
+    with admission_controller.slot(model, kwargs.get('priority', PRIORITY_INTERACTIVE)):
+        response = backend_clients.get(model).post('/v1/completions', json=payload)
+    response.raise_for_status()
+    body = response.json()
+    
+    choices = {choice.get('index', i): choice for i, choice in enumerate(body.get('choices', []))}
+    if len(choices) != len(prompts):
+        raise requests.exceptions.RequestException(
+            f"Batched completion returned {len(choices)} choices for {len(prompts)} prompts"
+        )
+    
+    return [{
+        'id': f"{body.get('id', 'cmpl')}-{i}",
+        'object': 'chat.completion',
+        'created': body.get('created', int(time.time())),
+        'model': body.get('model', model),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': choices[i].get('text', '')},
+            'finish_reason': choices[i].get('finish_reason')
+        }],
+        'batch': {'size': len(prompts), 'index': i}
+    } for i in range(len(prompts))]
+
+def open_backend_stream(model: str, prompt: str, **kwargs) -> requests.Response:
+    """Start a streaming completion; returns once the backend has accepted the request"""
+    path, payload = build_backend_request(model, prompt, **dict(kwargs, stream=True))
+    response = backend_clients.get(model).post(path, json=payload, stream=True)
+    try:
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        response.close()
+        raise
+    return response
+
+def _generation_params(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Request body minus the fields route_request takes positionally or from headers"""
+    return {k: v for k, v in data.items()
+            if k not in ('task_type', 'prompt', 'cache_policy', 'priority', 'timeout') + SESSION_FIELDS}
+
+def wants_passthrough(headers) -> bool:
+    """Whether this request's completion body is relayed unchanged (routing metadata in headers)"""
+    return RESPONSE_MODE == 'passthrough' and (headers.get(ROUTING_INFO_HEADER) or '').lower() != 'body'
+
+def with_routing_info(result: Any, routing_info: Dict[str, Any], passthrough: bool) -> Any:
+    """The completion body in the shape the caller asked for: a RawBody carrying routing_info
+    for the response headers, or the decoded body with a routing_info field (a copy, since
+    bodies may be shared with coalesced callers)"""
+    if passthrough:
+        body = result if isinstance(result, RawBody) else RawBody.encode(result)
+        return body.with_routing_info(routing_info)
+    if isinstance(result, RawBody):
+        result = result.json()
+    if isinstance(result, dict):
+        result = dict(result, routing_info=routing_info)
+    return result
+
+def routing_headers(routing_info: Dict[str, Any]) -> Dict[str, str]:
+    """Routing metadata as response headers"""
+    reason = str(routing_info.get('routing_reason', ''))
+    return {
+        'X-Routed-Model': str(routing_info.get('selected_model', '')),
+        'X-Routing-Reason': reason.encode('latin-1', 'replace').decode('latin-1').replace('\r', ' ').replace('\n', ' '),
+        'X-Fallback-Used': routing_info.get('used_fallback') or ''
+    }
+
+class BackendUnavailableError(Exception):
+    """Raised when the routed backend and every fallback failed"""
+
+    def __init__(self, primary_error: Exception):
+        super().__init__(str(primary_error))
+        self.primary_error = primary_error
+
+def admit_circuit(model: str, fail_open: bool = False) -> bool:
+    """Pass the backend's circuit breaker right before calling it; returns whether a half-open
+    probe slot is held (to abandon() if the call never reaches the backend). Raises
+    CircuitOpen unless failing open"""
+    admitted = circuit_breakers.acquire(model)
+    if admitted is None and not fail_open:
+        raise CircuitOpen(model)
+    return admitted == HALF_OPEN
+
+def dispatch_with_fallback(backend_name: str, optimal_model: str, fallback_models: List[str],
+                           prompt: str, start_time: float, routing_context: Optional[str] = None,
+                           circuit_fail_open: bool = False, **kwargs) -> Tuple[Any, Optional[str]]:
+    """Call the routed backend, hedging with the first fallback when it runs slow, then try
+    the remaining fallbacks in order; returns (result, fallback_used)"""
+    fallbacks = [model for model in fallback_models if model in BACKENDS and model != backend_name]
+    hedge_model = fallbacks[0] if fallbacks else None
+    
+    def call_tracked(model: str, metrics_model: str, started: float, fail_open: bool = False):
+        probe = admit_circuit(metrics_model, fail_open)
+        try:
+            with tracer.span('backend.call', SPAN_KIND_CLIENT, backend=model):
+                result = call_backend(model, prompt, **kwargs)
+        except requests.exceptions.RequestException as e:
+            if attempt_cancelled():
+                # Lost a hedge race and was cut off on purpose: not a backend failure
+                if probe:
+                    circuit_breakers.abandon(metrics_model)
+                raise
+            # Update performance metrics (and the circuit breaker) for failure
+            intelligent_router.update_performance_metrics(
+                metrics_model, time.time() - started, False, routing_context
+            )
+            BACKEND_ERRORS.labels(model, type(e).__name__).inc()
+            raise
+        except BaseException:
+            # Shed or out of time before the backend answered: nothing to tell the breaker
+            if probe:
+                circuit_breakers.abandon(metrics_model)
+            raise
+        
+        # Update performance metrics (also when this call lost a hedge race)
+        intelligent_router.update_performance_metrics(metrics_model, time.time() - started, True, routing_context)
+        return result
+    
+    def call_primary():
+        return call_tracked(backend_name, optimal_model, start_time, circuit_fail_open)
+    
+    def call_hedge():
+        return call_tracked(hedge_model, hedge_model, time.time())
+    
+    hedge_delay = hedger.hedge_delay(intelligent_router.latency_percentile(
+        optimal_model, hedger.config.percentile, hedger.config.min_samples
+    ))
+    
+    try:
+        result, hedge_won = hedger.race(call_primary, call_hedge if hedge_model else None, hedge_delay)
+        if hedge_won:
+            logger.info(f"Hedge to {hedge_model} beat {backend_name} (hedge delay {hedge_delay:.3f}s)")
+            ROUTER_FALLBACKS.labels(backend_name, hedge_model).inc()
+            return result, hedge_model
+        return result, None
+        
+    except HedgeFailed as e:
+        if isinstance(e.primary_error, (AdmissionRejected, DeadlineExceeded)):
+            # Shed load fast rather than pushing it onto the fallbacks; and a request whose
+            # deadline passed has nobody left to answer
+            raise e.primary_error
+        logger.error(f"Error routing request to {backend_name}: {e.primary_error}")
+        
+        # Try the fallback models the hedge didn't already cover
+        for fallback_model in (fallbacks[1:] if e.hedged else fallbacks):
+            deadline_manager.check('fallback', fallback_model)
+            logger.info(f"Trying fallback model: {fallback_model}")
+            try:
+                result = call_tracked(fallback_model, fallback_model, time.time())
+                logger.info(f"Fallback to {fallback_model} successful")
+                ROUTER_FALLBACKS.labels(backend_name, fallback_model).inc()
+                return result, fallback_model
+                
+            except DeadlineExceeded:
+                raise
+            except Exception as fallback_error:
+                logger.error(f"Fallback to {fallback_model} also failed: {fallback_error}")
+                continue
+        
+        raise BackendUnavailableError(e.primary_error)
+
+@tracer.traced('route_request')
+def route_request(task_type: str, prompt: str, cache_policy: str = CACHE_DEFAULT,
+                  passthrough: bool = False, session_id: Optional[str] = None, **kwargs) -> Any:
+    """Route request to appropriate backend using intelligent routing. Returns the decoded
+    body with routing_info, a RawBody when `passthrough` is set, or an error dict. The
+    session (or a long prompt prefix) keeps the request on one replica of the backend."""
     
     # Use intelligent router to get optimal model
     budget_factor = kwargs.get('budget_factor', 1.0)
     start_time = time.time()
+    span = tracer.current_span()
     
-    optimal_model, routing_info = intelligent_router.get_optimal_model(
-        prompt, task_type, budget_factor
-    )
+    with tracer.span('router.select'):
+        optimal_model, routing_info = intelligent_router.get_optimal_model(
+            prompt, task_type, budget_factor
+        )
+    span.set_attribute('task_type', task_type)
+    span.set_attribute('routed_model', optimal_model)
     
-    backend_url = BACKENDS.get(optimal_model, BACKENDS['general'])
+    backend_name = optimal_model if optimal_model in BACKENDS else 'general'
+    backend_url = BACKENDS[backend_name]
     logger.info(f"Intelligent routing: {task_type} -> {optimal_model} ({backend_url})")
     logger.info(f"Routing reason: {routing_info['routing_reason']}")
     
+    # Deterministic completions can be answered from the response cache
+    path, payload = build_backend_request(backend_name, prompt, **kwargs)
+    cache_key = None
+    if response_cache.should_cache(payload, cache_policy):
+        cache_key = request_fingerprint(backend_name, path, payload)
+        if cache_policy == CACHE_DEFAULT:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                routing_info['cache'] = 'hit'
+                return with_routing_info(cached, routing_info, passthrough)
+        routing_info['cache'] = 'miss'
+    elif response_cache.config.enabled:
+        response_cache.record_bypass()
+        routing_info['cache'] = 'bypass'
+    
+    def dispatch():
+        with affinity_router.scope(session_id, prompt):
+            return dispatch_with_fallback(
+                backend_name, optimal_model, routing_info.get('fallback_models', []),
+                prompt, start_time, routing_info.get('routing_context'),
+                routing_info.get('circuit_fail_open', False), **kwargs
+            )
+    
     try:
-        if task_type == 'creative':
-            # KoboldCpp API format
-            payload = {
-                "prompt": prompt,
-                "max_length": kwargs.get('max_tokens', 512),
-                "temperature": kwargs.get('temperature', 0.8)
-            }
-            response = requests.post(f"{backend_url}/api/v1/generate", json=payload, timeout=30)
+        # Identical requests already in flight share one backend call
+        if request_coalescer.applies_to(payload):
+            key = cache_key or request_fingerprint(backend_name, path, payload)
+            (result, fallback_used), shared = request_coalescer.do(key, dispatch)
         else:
-            # OpenAI-compatible format for vLLM and Oobabooga
-            payload = {
-                "model": "auto",
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": kwargs.get('max_tokens', 512),
-                "temperature": kwargs.get('temperature', 0.7)
-            }
-            response = requests.post(f"{backend_url}/v1/chat/completions", json=payload, timeout=30)
+            (result, fallback_used), shared = dispatch(), False
+    except BackendUnavailableError as e:
+        return {"error": f"All backends unavailable. Primary: {str(e)}", "routing_info": routing_info}
+    
+    routing_info['coalesced'] = shared
+    if fallback_used:
+        routing_info['used_fallback'] = fallback_used
+    span.set_attribute('cache', routing_info.get('cache'))
+    span.set_attribute('coalesced', shared)
+    span.set_attribute('used_fallback', fallback_used)
+    
+    if cache_key and not fallback_used and not shared:
+        # The cache keeps decoded bodies; only deterministic requests pay for decoding one
+        decoded = result.json() if isinstance(result, RawBody) else result
+        if isinstance(decoded, dict):
+            response_cache.put(cache_key, decoded)
+    
+    return with_routing_info(result, routing_info, passthrough)
+
+def open_stream_with_fallback(candidates: List[str], prompt: str, start_time: float,
+                              routing_context: Optional[str] = None, circuit_fail_open: bool = False,
+                              **kwargs) -> Tuple[Iterator[bytes], str]:
+    """Open a stream on the first candidate that accepts it; returns (sse_stream, model)"""
+    priority = kwargs.get('priority', PRIORITY_INTERACTIVE)
+    primary_error = None
+    for model in candidates:
+        if model != candidates[0]:
+            deadline_manager.check('fallback', model)
+        try:
+            release = admission_controller.acquire(model, priority)
+        except AdmissionRejected:
+            if model == candidates[0]:
+                raise
+            continue
         
-        response.raise_for_status()
-        result = response.json()
+        try:
+            probe = admit_circuit(model, circuit_fail_open and model == candidates[0])
+        except CircuitOpen as e:
+            release()
+            primary_error = primary_error or e
+            continue
+        
+        try:
+            with tracer.span('backend.stream_open', SPAN_KIND_CLIENT, backend=model):
+                response = open_backend_stream(model, prompt, **kwargs)
+        except DeadlineExceeded:
+            release()
+            if probe:
+                circuit_breakers.abandon(model)
+            raise
+        except requests.exceptions.RequestException as e:
+            release()
+            logger.error(f"Error opening stream to {model}: {e}")
+            intelligent_router.update_performance_metrics(model, time.time() - start_time, False, routing_context)
+            BACKEND_ERRORS.labels(model, type(e).__name__).inc()
+            primary_error = primary_error or e
+            continue
+        
+        if model != candidates[0]:
+            logger.info(f"Fallback to {model} successful")
+            ROUTER_FALLBACKS.labels(candidates[0], model).inc()
+        return TrackedStream(stream_backend_response(response, model), model, start_time, release,
+                             deadline_manager.current(), routing_context, probe), model
+    
+    raise BackendUnavailableError(primary_error)
+
+@tracer.traced('stream_request')
+def stream_request(task_type: str, prompt: str, session_id: Optional[str] = None,
+                   **kwargs) -> Tuple[Optional[Iterator[bytes]], Dict[str, Any]]:
+    """Route a streaming request. Routing and fallback complete before the first byte is
+    relayed; returns (sse_stream, routing_info) or (None, error_payload)"""
+    
+    budget_factor = kwargs.get('budget_factor', 1.0)
+    start_time = time.time()
+    
+    with tracer.span('router.select'):
+        optimal_model, routing_info = intelligent_router.get_optimal_model(
+            prompt, task_type, budget_factor
+        )
+    
+    backend_name = optimal_model if optimal_model in BACKENDS else 'general'
+    logger.info(f"Intelligent routing (stream): {task_type} -> {optimal_model} ({BACKENDS[backend_name]})")
+    
+    candidates = [backend_name] + [
+        model for model in routing_info.get('fallback_models', [])
+        if model in BACKENDS and model != backend_name
+    ]
+    
+    def open_stream():
+        with affinity_router.scope(session_id, prompt, stream=True):
+            return open_stream_with_fallback(candidates, prompt, start_time,
+                                             routing_info.get('routing_context'),
+                                             routing_info.get('circuit_fail_open', False), **kwargs)
+    
+    try:
+        path, payload = build_backend_request(backend_name, prompt, **dict(kwargs, stream=True))
+        if request_coalescer.applies_to(payload):
+            # Identical streams in flight share one backend stream, fanned out per subscriber
+            stream, model, shared = request_coalescer.stream(
+                request_fingerprint(backend_name, path, payload), open_stream
+            )
+        else:
+            (stream, model), shared = open_stream(), False
+    except BackendUnavailableError as e:
+        return None, {"error": f"All backends unavailable. Primary: {str(e)}", "routing_info": routing_info}
+    
+    routing_info['coalesced'] = shared
+    if model != backend_name:
+        routing_info['used_fallback'] = model
+    
+    return stream, routing_info
+
+class TrackedStream:
+    """Relays stream chunks, recording the full generation latency and freeing the backend's
+    admission slot once the stream ends or is closed (even if it was never iterated). Once the
+    request's deadline passes the backend stream is closed and a final error event is sent."""
+    
+    def __init__(self, chunks: Iterator[bytes], model: str, start_time: float,
+                 release: Callable[[], None], deadline=None, routing_context: Optional[str] = None,
+                 probe: bool = False):
+        self.chunks = chunks
+        self.model = model
+        self.start_time = start_time
+        self.release = release
+        self.deadline = deadline
+        self.routing_context = routing_context
+        self.probe = probe  # holds a half-open circuit breaker probe slot
+        self.finished = False
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self) -> bytes:
+        if self.finished:
+            raise StopIteration
+        if self.deadline is not None and self.deadline.expired:
+            # Checked between chunks; a stalled read is bounded by the read timeout set at open
+            self._close_upstream()
+            self._finish(False, record=False)
+            error = deadline_manager.exceeded('stream', self.model, self.deadline)
+            return sse_event({'error': {'message': str(error), 'type': 'deadline_exceeded'}}) + SSE_DONE
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            self._finish(True)
+            raise
+        except Exception:
+            self._finish(False)
+            raise
+    
+    def close(self):
+        # The client went away before the backend finished: says nothing about the backend
+        self._close_upstream()
+        self._finish(False, record=False)
+    
+    def _close_upstream(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+    
+    def _finish(self, success: bool, record: bool = True):
+        if self.finished:
+            return
+        self.finished = True
+        self.release()
+        if record:
+            intelligent_router.update_performance_metrics(
+                self.model, time.time() - self.start_time, success, self.routing_context
+            )
+        elif self.probe:
+            circuit_breakers.abandon(self.model)
+
+def _stream_response(task_type: str, prompt: str, data: Dict[str, Any], priority: int = PRIORITY_INTERACTIVE):
+    """Flask response for a `stream: true` completion request"""
+    stream, routing_info = stream_request(task_type, prompt, session_from_request(request.headers, data),
+                                          priority=priority, **_generation_params(data))
+    if stream is None:
+        note_routing(routing_info.get('routing_info', {}), routing_info)
+        return jsonify(routing_info), 502
+    note_routing(routing_info)
+    
+    headers = dict(SSE_HEADERS)
+    headers.update(routing_headers(routing_info))
+    return Response(stream, mimetype='text/event-stream', headers=headers)
+
+def _completion_response(result: Any):
+    """Flask response for a routed completion: passthrough bodies are relayed as received"""
+    if isinstance(result, RawBody):
+        note_routing(result.routing_info)
+        response = Response(result.content, content_type=result.content_type)
+        response.headers.update(routing_headers(result.routing_info))
+        return response
+    routing_info = result.get('routing_info', {})
+    note_routing(routing_info, result)
+    response = jsonify(result)
+    if 'selected_model' in routing_info:
+        response.headers.update(routing_headers(routing_info))
+    return response
+
+def _rejection_response(e: AdmissionRejected):
+    """Fast 429/503 for a request shed by admission control"""
+    g.metrics_outcome = 'rejected'
+    response = jsonify({"error": str(e), "backend": e.backend, "retry_after": e.retry_after})
+    response.status_code = e.status_code
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def _deadline_response(e: DeadlineExceeded):
+    """504 for a request whose time budget ran out before it could be answered"""
+    g.metrics_outcome = 'deadline'
+    response = jsonify({"error": str(e), "deadline_exceeded": True})
+    response.status_code = e.status_code
+    return response
+
+def _request_prompt(data: Optional[Dict[str, Any]]) -> str:
+    """Prompt text of a completion, chat or collaboration request body"""
+    if not isinstance(data, dict):
+        return ''
+    if data.get('prompt'):
+        return str(data['prompt'])
+    return ' '.join(str(m.get('content', '')) for m in data.get('messages', []) if isinstance(m, dict))
+
+def check_rate_limit(headers, remote_addr: Optional[str], data: Optional[Dict[str, Any]]) -> Optional[Decision]:
+    """Charge the caller's request, token and concurrency limits (None when limiting is off)"""
+    identity, config_key = rate_limiter.identify(headers, remote_addr)
+    max_tokens = data.get('max_tokens') if isinstance(data, dict) else None
+    return rate_limiter.check(identity, config_key, estimate_tokens(_request_prompt(data), max_tokens))
+
+def rate_limit_exceeded_payload(decision: Decision) -> Dict[str, Any]:
+    return {"error": f"Rate limit exceeded: {decision.reason}", "retry_after": decision.retry_after}
+
+def rate_limited(view):
+    """Enforce per-caller rate limits before a view runs and add rate-limit headers"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        decision = check_rate_limit(request.headers, request.remote_addr, request.get_json(silent=True))
+        if decision is None:
+            return view(*args, **kwargs)
+        if not decision.allowed:
+            response = jsonify(rate_limit_exceeded_payload(decision))
+            response.status_code = 429
+            response.headers.update(decision.headers())
+            return response
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            decision.release()
+            raise
+        response.headers.update(decision.headers())
+        # Streams keep their concurrency slot until the response is closed
+        response.call_on_close(decision.release)
+        return response
+    
+    return wrapper
+
+def status_outcome(status_code: int, outcome: str = 'ok') -> str:
+    """Outcome label for a finished request, overridden by its status code"""
+    if status_code == 429:
+        return 'rejected'
+    if status_code >= 400 and outcome not in ('rejected', 'deadline'):
+        return 'error'
+    return outcome
+
+def note_routing(routing_info: Dict[str, Any], result: Any = None):
+    """Record the routed model and how it was served for this request's metrics"""
+    g.metrics_model = routing_info.get('selected_model', 'none')
+    if isinstance(result, dict) and 'error' in result:
+        g.metrics_outcome = 'error'
+    elif routing_info.get('cache') == 'hit':
+        g.metrics_outcome = 'cache_hit'
+    elif routing_info.get('used_fallback'):
+        g.metrics_outcome = 'fallback'
+    elif routing_info.get('coalesced'):
+        g.metrics_outcome = 'coalesced'
+    else:
+        g.metrics_outcome = 'routed'
+
+class FirstChunkTimer:
+    """Streamed response body that reports when its first chunk goes out"""
+    
+    def __init__(self, body: Iterator[bytes], on_first_chunk: Callable[[], None]):
+        self.body = body
+        self.chunks = iter(body)
+        self.on_first_chunk = on_first_chunk
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self) -> bytes:
+        chunk = next(self.chunks)
+        if self.on_first_chunk is not None:
+            self.on_first_chunk()
+            self.on_first_chunk = None
+        return chunk
+    
+    def close(self):
+        if hasattr(self.body, 'close'):
+            self.body.close()
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    g.metrics_arrived = time.time()
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    GATEWAY_IN_FLIGHT.labels(g.metrics_endpoint).inc()
+    g.trace_span, g.trace_token = tracer.start_trace(
+        f"{request.method} {g.metrics_endpoint}", request.headers.get(TRACEPARENT_HEADER),
+        {'http.method': request.method, 'http.route': g.metrics_endpoint}
+    )
+    g.deadline_token = deadline_manager.attach(deadline_manager.from_request(
+        g.metrics_endpoint, request.headers, request.get_json(silent=True)
+    ))
+
+@app.after_request
+def add_trace_timing(response):
+    """Attach Server-Timing (and the inline breakdown when asked); streams end their trace on close"""
+    span = g.get('trace_span')
+    if span is None:
+        return response
+    span.set_attribute('http.status_code', response.status_code)
+    if response.status_code >= 500:
+        span.set_error(f"HTTP {response.status_code}")
+    
+    if response.is_streamed:
+        response.call_on_close(lambda: tracer.finish_trace(span))
+    else:
+        if response.is_json and tracer.wants_inline_timing(request.headers, request.args):
+            payload = response.get_json(silent=True)
+            if isinstance(payload, dict):
+                payload['timing'] = tracer.breakdown(span)
+                response.set_data(json.dumps(payload))
+        tracer.finish_trace(span)
+    
+    server_timing = tracer.server_timing(span)
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+        response.headers['X-Trace-Id'] = span.trace_id
+    return response
+
+@app.teardown_request
+def detach_request_trace(error=None):
+    tracer.detach(g.pop('trace_token', None))
+    deadline_manager.detach(g.pop('deadline_token', None))
+    startup_tracker.mark('first_request')
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and time it until its body (or stream) is complete; optionally
+    capture its sanitised shape for load replays"""
+    if 'metrics_started' not in g:
+        return response
+    started, endpoint = g.metrics_started, g.metrics_endpoint
+    model = g.get('metrics_model', 'none')
+    outcome = status_outcome(response.status_code, g.get('metrics_outcome', 'ok'))
+    GATEWAY_REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+    first_byte = GATEWAY_TIME_TO_FIRST_BYTE.labels(endpoint, model)
+    capture = None
+    if traffic_capture.wants(endpoint):
+        capture = sanitise(endpoint, request.method, request.get_json(silent=True), request.headers)
+    arrived_at, status_code = g.metrics_arrived, response.status_code
+    
+    def finish():
+        elapsed = time.perf_counter() - started
+        GATEWAY_REQUEST_DURATION.labels(endpoint, model, outcome).observe(elapsed)
+        GATEWAY_IN_FLIGHT.labels(endpoint).dec()
+        if capture is not None:
+            traffic_capture.record(capture, arrived_at, status_code, elapsed)
+    
+    if response.is_streamed:
+        response.response = FirstChunkTimer(
+            response.response, lambda: first_byte.observe(time.perf_counter() - started)
+        )
+        response.call_on_close(finish)
+    else:
+        first_byte.observe(time.perf_counter() - started)
+        finish()
+    return response
+
+def collect_component_metrics():
+    """Scrape-time metrics from admission control, circuit breakers, caching and rate limits"""
+    admission = admission_controller.stats()
+    breakers = circuit_breakers.stats()['backends']
+    cache = response_cache.stats()
+    coalescing = request_coalescer.stats()
+    hedging = hedger.stats()
+    batching = micro_batcher.stats()
+    limits = rate_limiter.stats()
+    return [
+        ('backend_admission_in_flight', 'gauge', 'Requests holding a backend admission slot',
+         [({'backend': name}, entry['in_flight']) for name, entry in admission.items()]),
+        ('backend_admission_queue_depth', 'gauge', 'Requests queued for a backend slot, by priority class',
+         [({'backend': name, 'priority': priority}, depth) for name, entry in admission.items()
+          for priority, depth in entry['queue_depth_by_priority'].items()]),
+        ('backend_admission_rejected_total', 'counter', 'Requests shed by admission control',
+         [({'backend': name, 'reason': reason}, entry[f'rejected_{reason}'])
+          for name, entry in admission.items() for reason in ('queue_full', 'timeout', 'deadline')]),
+        ('circuit_breaker_state', 'gauge', 'Circuit breaker state per backend (1 for the current state)',
+         [({'backend': name, 'state': state}, int(entry['state'] == state)) for name, entry in breakers.items()
+          for state in ('closed', 'open', 'half_open')]),
+        ('circuit_breaker_trips_total', 'counter', 'Times a backend circuit breaker opened',
+         [({'backend': name}, entry['trips']) for name, entry in breakers.items()]),
+        ('response_cache_lookups_total', 'counter', 'Response cache lookups by result',
+         [({'result': result}, cache[key]) for result, key in (('hit', 'hits'), ('miss', 'misses'), ('bypass', 'bypassed'))]),
+        ('response_cache_entries', 'gauge', 'Entries in the in-memory response cache',
+         [({}, cache['memory_entries'])]),
+        ('request_coalescing_total', 'counter', 'Requests that led or joined a coalesced backend call',
+         [({'role': role}, coalescing[role]) for role in ('leaders', 'coalesced', 'stream_leaders', 'stream_coalesced')]),
+        ('hedge_events_total', 'counter', 'Hedged request events',
+         [({'event': event}, hedging[event]) for event in ('requests', 'hedges_fired', 'hedge_wins', 'budget_denied')]),
+        ('micro_batch_requests_total', 'counter', 'Completions sent through the micro-batcher, by path',
+         [({'path': path}, batching[key]) for path, key in (('batched', 'batched_requests'), ('solo', 'solo_requests'))]),
+        ('micro_batches_total', 'counter', 'Multi-prompt batches sent to backends',
+         [({}, batching['batches'])]),
+        ('rate_limit_decisions_total', 'counter', 'Rate limit checks by result',
+         [({'result': key}, limits[key]) for key in ('allowed', 'rejected_rate', 'rejected_tokens', 'rejected_concurrency')])
+    ]
+
+metrics_registry.register_collector(collect_component_metrics)
+
+def _json_response(result: Tuple[Dict[str, Any], int]):
+    """Convert a (payload, status_code) handler result into a Flask response"""
+    payload, status_code = result
+    return jsonify(payload), status_code
+
+def run_coroutine(coro):
+    """Run a route handler coroutine to completion from a synchronous Flask worker"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(handle_within_deadline(coro))
+    finally:
+        loop.close()
+
+async def handle_within_deadline(handler: Awaitable[Tuple[Dict[str, Any], int]]) -> Tuple[Dict[str, Any], int]:
+    """Await a route handler within the request's remaining budget; once it runs out the
+    handler is cancelled, closing its open backend and MCP connections, and 504 is returned"""
+    try:
+        return await deadline_manager.run_within(handler, 'handler')
+    except DeadlineExceeded as e:
+        return {"error": str(e), "deadline_exceeded": True}, e.status_code
+
+# Async route handlers shared by the Flask app and the ASGI gateway (asgi_gateway.py).
+# Each returns a (payload, status_code) tuple.
+
+async def handle_collaborate(data: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+    """Multi-agent collaboration"""
+    try:
+        if not data:
+            return {"error": "No JSON data provided"}, 400
+            
+        prompt = data.get('prompt', '')
+        context = data.get('context', {})
+        
+        if not prompt:
+            return {"error": "No prompt provided"}, 400
+        
+        result = await orchestrator.simple_collaboration(prompt, context)
+        return result, 200
+            
+    except Exception as e:
+        logger.error(f"Error in collaboration endpoint: {e}")
+        return {"error": str(e)}, 500
+
+async def handle_create_plan(data: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+    """Create a collaboration plan without executing it"""
+    try:
+        if not data:
+            return {"error": "No JSON data provided"}, 400
+            
+        prompt = data.get('prompt', '')
+        context = data.get('context', {})
+        template_name = data.get('template', None)
         
-        # Update performance metrics
-        latency = time.time() - start_time
-        intelligent_router.update_performance_metrics(optimal_model, latency, True)
+        if not prompt:
+            return {"error": "No prompt provided"}, 400
         
-        # Add routing info to response
-        if isinstance(result, dict):
-            result['routing_info'] = routing_info
+        plan = await orchestrator.create_collaboration_plan(prompt, context, template_name)
         
-        return result
+        # Convert plan to dict for JSON serialization
+        plan_dict = {
+            "id": plan.id,
+            "task_sequence": [
+                {
+                    "id": task.id,
+                    "type": task.type.value,
+                    "prompt": task.prompt,
+                    "dependencies": task.dependencies,
+                    "assigned_services": task.assigned_services
+                }
+                for task in plan.task_sequence
+            ],
+            "service_allocation": plan.service_allocation,
+            "estimated_duration": plan.estimated_duration,
+            "parallel_execution": plan.parallel_execution
+        }
         
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error routing request to {backend_url}: {e}")
-        
-        # Update performance metrics for failure
-        latency = time.time() - start_time
-        intelligent_router.update_performance_metrics(optimal_model, latency, False)
-        
-        # Try fallback models
-        fallback_models = routing_info.get('fallback_models', [])
-        for fallback_model in fallback_models:
-            if fallback_model in BACKENDS:
-                logger.info(f"Trying fallback model: {fallback_model}")
-                try:
-                    fallback_url = BACKENDS[fallback_model]
-                    if fallback_model == 'creative':
-                        payload = {
-                            "prompt": prompt,
-                            "max_length": kwargs.get('max_tokens', 512),
-                            "temperature": kwargs.get('temperature', 0.8)
-                        }
-                        response = requests.post(f"{fallback_url}/api/v1/generate", json=payload, timeout=30)
-                    else:
-                        payload = {
-                            "model": "auto",
-                            "messages": [{"role": "user", "content": prompt}],
-                            "max_tokens": kwargs.get('max_tokens', 512),
-                            "temperature": kwargs.get('temperature', 0.7)
-                        }
-                        response = requests.post(f"{fallback_url}/v1/chat/completions", json=payload, timeout=30)
-                    
-                    response.raise_for_status()
-                    result = response.json()
-                    
-                    # Add fallback info
-                    if isinstance(result, dict):
-                        routing_info['used_fallback'] = fallback_model
-                        result['routing_info'] = routing_info
-                    
-                    logger.info(f"Fallback to {fallback_model} successful")
-                    return result
-                    
-                except Exception as fallback_error:
-                    logger.error(f"Fallback to {fallback_model} also failed: {fallback_error}")
-                    continue
+        return plan_dict, 200
         
-        return {"error": f"All backends unavailable. Primary: {str(e)}", "routing_info": routing_info}
+    except Exception as e:
+        logger.error(f"Error creating collaboration plan: {e}")
+        return {"error": str(e)}, 500
+
+async def handle_execute_plan(plan_id: str) -> Tuple[Dict[str, Any], int]:
+    """Execute a previously created collaboration plan"""
+    try:
+        result = await orchestrator.execute_collaboration_plan(plan_id)
+        return result, 200
+    except Exception as e:
+        logger.error(f"Error executing collaboration plan: {e}")
+        return {"error": str(e)}, 500
+
+async def handle_services(fresh: bool = False) -> Tuple[Dict[str, Any], int]:
+    """Get status and information about all platform services"""
+    try:
+        snapshot, probed_now = await health_prober.get_async('services', fresh=fresh)
+        if snapshot.data is None:
+            return {"error": snapshot.error, "snapshot": health_prober.describe(snapshot, probed_now)}, 503
+        status = dict(snapshot.data, snapshot=health_prober.describe(snapshot, probed_now))
+        return status, 200
+    except Exception as e:
+        logger.error(f"Error getting service status: {e}")
+        return {"error": str(e)}, 500
+
+async def handle_collaborate_with_template(data: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+    """Multi-agent collaboration using a specific template"""
+    try:
+        if not data:
+            return {"error": "No JSON data provided"}, 400
+            
+        prompt = data.get('prompt', '')
+        template_name = data.get('template')
+        context = data.get('context', {})
+        
+        if not prompt:
+            return {"error": "No prompt provided"}, 400
+        
+        if not template_name:
+            return {"error": "No template specified"}, 400
+        
+        # Validate template exists
+        if not workflow_manager.get_template(template_name):
+            return {"error": f"Template '{template_name}' not found"}, 404
+        
+        # Run collaboration with specific template
+        plan = await orchestrator.create_collaboration_plan(prompt, context, template_name)
+        result = await orchestrator.execute_collaboration_plan(plan.id)
+        
+        # Add template information to result
+        result["template_used"] = template_name
+        result["template_info"] = workflow_manager.get_workflow_config(template_name)
+        
+        return result, 200
+        
+    except Exception as e:
+        logger.error(f"Error in template collaboration endpoint: {e}")
+        return {"error": str(e)}, 500
+
+async def handle_mcp_server_health(server_name: str) -> Tuple[Dict[str, Any], int]:
+    """Check health of a specific MCP server"""
+    try:
+        health = await mcp_registry.check_server_health(server_name)
+        return health, 200
+    except Exception as e:
+        logger.error(f"Error checking MCP server health for {server_name}: {e}")
+        return {"error": str(e)}, 500
+
+async def handle_all_mcp_health() -> Tuple[Dict[str, Any], int]:
+    """Check health of all MCP servers"""
+    try:
+        health_results = await mcp_registry.check_all_servers()
+        
+        online_count = sum(1 for result in health_results.values() 
+                         if result.get('status') == 'online')
+        
+        return {
+            "overall_status": "healthy" if online_count > 0 else "unhealthy",
+            "online_servers": online_count,
+            "total_servers": len(health_results),
+            "servers": health_results
+        }, 200
+    except Exception as e:
+        logger.error(f"Error checking all MCP server health: {e}")
+        return {"error": str(e)}, 500
+
+async def handle_mcp_invoke(server_name: str, data: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+    """Invoke a method on a specific MCP server"""
+    try:
+        if not data:
+            return {"error": "No JSON data provided"}, 400
+        
+        method = data.get('method')
+        params = data.get('params', {})
+        
+        if not method:
+            return {"error": "No method specified"}, 400
+        
+        # Check if server exists
+        server_info = mcp_registry.get_server_info(server_name)
+        if not server_info:
+            return {"error": f"MCP server '{server_name}' not found"}, 404
+        
+        # For now, handle FortiManager server directly
+        if server_name == 'fortimanager':
+            from network_agents.fortimanager_mcp_server import FortiManagerMCPServer
+            fm_server = FortiManagerMCPServer()
+            await fm_server.start_session()
+            try:
+                result = await fm_server.handle_mcp_request(method, params)
+            finally:
+                await fm_server.close()
+            return result, 200
+        else:
+            return {
+                "error": f"Direct invocation not yet implemented for {server_name}",
+                "available_servers": ["fortimanager"]
+            }, 501
+        
+    except Exception as e:
+        logger.error(f"Error invoking MCP server {server_name}: {e}")
+        return {"error": str(e)}, 500
+
+async def handle_restaurant_network(restaurant: Optional[str]) -> Tuple[Dict[str, Any], int]:
+    """Get overview of restaurant networks"""
+    try:
+        result = await orchestrator.get_restaurant_network_status(restaurant)
+        return result, 200
+    except Exception as e:
+        logger.error(f"Error getting restaurant network overview: {e}")
+        return {"error": str(e)}, 500
+
+async def handle_restaurant_monitor(data: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+    """Real-time monitoring of restaurant network"""
+    try:
+        if not data:
+            return {"error": "No JSON data provided"}, 400
+        
+        restaurant = data.get('restaurant')
+        duration = data.get('duration', 60)
+        
+        if not restaurant:
+            return {"error": "Restaurant parameter required"}, 400
+        
+        result = await orchestrator.execute_mcp_task('fortimanager', 'monitor_restaurant_network', {
+            'restaurant': restaurant,
+            'duration': duration
+        })
+        return result, 200
+    except Exception as e:
+        logger.error(f"Error monitoring restaurant network: {e}")
+        return {"error": str(e)}, 500
+
+async def handle_restaurant_security(restaurant: str, severity: str) -> Tuple[Dict[str, Any], int]:
+    """Get security alerts for restaurant networks"""
+    try:
+        result = await orchestrator.execute_mcp_task('fortimanager', 'get_security_alerts', {
+            'restaurant': restaurant,
+            'severity': severity
+        })
+        return result, 200
+    except Exception as e:
+        logger.error(f"Error getting restaurant security alerts: {e}")
+        return {"error": str(e)}, 500
+
+async def handle_collaborate_with_mcp(data: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+    """Multi-agent collaboration with MCP server integration"""
+    try:
+        if not data:
+            return {"error": "No JSON data provided"}, 400
+        
+        prompt = data.get('prompt', '')
+        template_name = data.get('template')
+        context = data.get('context', {})
+        
+        if not prompt:
+            return {"error": "No prompt provided"}, 400
+        
+        result = await orchestrator.collaborate_with_mcp(prompt, template_name, context)
+        return result, 200
+        
+    except Exception as e:
+        logger.error(f"Error in MCP collaboration: {e}")
+        return {"error": str(e)}, 500
 
 @app.route('/v1/completions', methods=['POST'])
+@rate_limited
 def completions():
     """Main completion endpoint"""
     try:
@@ -145,14 +1059,30 @@ def completions():
         if not prompt:
             return jsonify({"error": "No prompt provided"}), 400
         
-        result = route_request(task_type, prompt, **data)
-        return jsonify(result)
+        priority = priority_from_request(request.headers, task_type)
+        if data.get('stream'):
+            return _stream_response(task_type, prompt, data, priority)
+        
+        result = route_request(
+            task_type, prompt,
+            cache_policy=cache_policy_from_headers(request.headers),
+            passthrough=wants_passthrough(request.headers),
+            session_id=session_from_request(request.headers, data),
+            priority=priority,
+            **_generation_params(data)
+        )
+        return _completion_response(result)
         
+    except AdmissionRejected as e:
+        return _rejection_response(e)
+    except DeadlineExceeded as e:
+        return _deadline_response(e)
     except Exception as e:
         logger.error(f"Error in completions endpoint: {e}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/v1/chat/completions', methods=['POST'])
+@rate_limited
 def chat_completions():
     """OpenAI-compatible chat completions endpoint"""
     try:
@@ -172,111 +1102,146 @@ def chat_completions():
         prompt = user_messages[-1].get('content', '')
         task_type = data.get('task_type', 'general')
         
-        result = route_request(task_type, prompt, **data)
-        return jsonify(result)
+        priority = priority_from_request(request.headers, task_type)
+        if data.get('stream'):
+            return _stream_response(task_type, prompt, data, priority)
         
+        result = route_request(
+            task_type, prompt,
+            cache_policy=cache_policy_from_headers(request.headers),
+            passthrough=wants_passthrough(request.headers),
+            session_id=session_from_request(request.headers, data),
+            priority=priority,
+            **_generation_params(data)
+        )
+        return _completion_response(result)
+        
+    except AdmissionRejected as e:
+        return _rejection_response(e)
+    except DeadlineExceeded as e:
+        return _deadline_response(e)
     except Exception as e:
         logger.error(f"Error in chat completions endpoint: {e}")
         return jsonify({"error": str(e)}), 500
 
+def _wants_fresh(args) -> bool:
+    """?fresh=1 bypasses the cached health snapshot"""
+    return args.get('fresh', '').lower() in ('1', 'true', 'yes')
+
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint for all backends"""
-    status = {}
-    overall_health = True
+    """Health check endpoint for all backends (served from the background probe snapshot)"""
+    try:
+        snapshot, probed_now = health_prober.get('backends', fresh=_wants_fresh(request.args))
+    except Exception as e:
+        logger.error(f"Error probing backend health: {e}")
+        return jsonify({"overall_status": "unknown", "gateway": "online", "error": str(e)}), 503
     
+    status = {}
     for name, url in BACKENDS.items():
-        try:
-            # Try different health endpoints
-            health_endpoints = ['/health', '/v1/models', '/api/v1/info']
-            backend_healthy = False
-            
-            for endpoint in health_endpoints:
-                try:
-                    response = requests.get(f"{url}{endpoint}", timeout=5)
-                    if response.status_code == 200:
-                        backend_healthy = True
-                        break
-                except:
-                    continue
-            
-            status[name] = {
-                "status": "online" if backend_healthy else "offline",
-                "url": url
-            }
-            
-            if not backend_healthy:
-                overall_health = False
-                
-        except Exception as e:
-            status[name] = {
-                "status": "error",
-                "url": url,
-                "error": str(e)
-            }
-            overall_health = False
+        entry = (snapshot.data or {}).get(name)
+        if entry is None:
+            status[name] = {"status": "unknown", "url": url}
+            continue
+        status[name] = {key: entry[key] for key in ('status', 'url', 'latency_ms', 'error', 'endpoints') if key in entry}
     
+    overall_health = all(entry['status'] == 'online' for entry in status.values())
     return jsonify({
         "overall_status": "healthy" if overall_health else "unhealthy",
         "backends": status,
-        "gateway": "online"
+        "gateway": "online",
+        "snapshot": health_prober.describe(snapshot, probed_now)
     })
 
 @app.route('/models', methods=['GET'])
 def list_models():
-    """List available models from all backends"""
-    models = {}
+    """List available models from all backends (served from the background probe snapshot)"""
+    try:
+        snapshot, _ = health_prober.get('backends', fresh=_wants_fresh(request.args))
+    except Exception as e:
+        logger.error(f"Error probing backend models: {e}")
+        return jsonify({"error": str(e)}), 503
     
-    for name, url in BACKENDS.items():
-        try:
-            response = requests.get(f"{url}/v1/models", timeout=5)
-            if response.status_code == 200:
-                backend_models = response.json()
-                models[name] = backend_models
-        except:
+    models = {}
+    for name, entry in (snapshot.data or {}).items():
+        if 'models' in entry:
+            models[name] = entry['models']
+        elif 'models_error' in entry:
             models[name] = {"error": "Could not fetch models"}
     
     return jsonify(models)
 
 @app.route('/v1/collaborate', methods=['POST'])
+@rate_limited
 def collaborate():
     """Multi-agent collaboration endpoint"""
-    try:
-        data = request.json
-        if not data:
-            return jsonify({"error": "No JSON data provided"}), 400
-            
-        prompt = data.get('prompt', '')
-        context = data.get('context', {})
-        
-        if not prompt:
-            return jsonify({"error": "No prompt provided"}), 400
-        
-        # Run collaboration asynchronously
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(
-                orchestrator.simple_collaboration(prompt, context)
-            )
-            return jsonify(result)
-        finally:
-            loop.close()
-            
-    except Exception as e:
-        logger.error(f"Error in collaboration endpoint: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _json_response(run_coroutine(handle_collaborate(request.get_json(silent=True))))
 
 @app.route('/router/analytics', methods=['GET'])
 def get_routing_analytics():
     """Get intelligent routing analytics"""
     try:
         analytics = intelligent_router.get_analytics()
+        analytics['connection_pools'] = backend_clients.stats()
+        analytics['affinity'] = affinity_router.stats()
+        analytics['response_cache'] = response_cache.stats()
+        analytics['request_coalescing'] = request_coalescer.stats()
+        analytics['hedging'] = hedger.stats()
+        analytics['health_prober'] = health_prober.stats()
+        analytics['micro_batching'] = micro_batcher.stats()
+        analytics['admission'] = admission_controller.stats()
+        analytics['rate_limits'] = rate_limiter.stats()
+        analytics['tracing'] = tracer.stats()
+        analytics['traffic_capture'] = traffic_capture.stats()
+        analytics['deadlines'] = deadline_manager.stats()
+        analytics['startup'] = startup_tracker.report()
+        if is_initialised(mcp_registry):
+            from mcp_server_registry import credential_resolver
+            analytics['startup']['credentials'] = credential_resolver.stats()
         return jsonify(analytics)
     except Exception as e:
         logger.error(f"Error getting analytics: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus metrics for the gateway, router and orchestrator"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/ratelimits', methods=['GET'])
+def get_rate_limits():
+    """Current rate limits and the calling client's remaining allowance"""
+    identity, config_key = rate_limiter.identify(request.headers, request.remote_addr)
+    limit = rate_limiter.limit_for(config_key)
+    return jsonify({
+        **rate_limiter.stats(),
+        'caller': {
+            'identity': identity,
+            'limit': asdict(limit),
+            'concurrent_requests': rate_limiter.store.active(identity)
+        }
+    })
+
+@app.route('/ratelimits', methods=['PUT'])
+def update_rate_limits():
+    """Replace rate limits live (requires RATE_LIMIT_ADMIN_TOKEN via X-Admin-Token)"""
+    admin_token = os.getenv('RATE_LIMIT_ADMIN_TOKEN')
+    supplied = request.headers.get('X-Admin-Token', '')
+    if not admin_token or not hmac.compare_digest(supplied.encode('utf-8'), admin_token.encode('utf-8')):
+        return jsonify({"error": "Rate limit administration is not enabled for this caller"}), 403
+    
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "No JSON data provided"}), 400
+        config = rate_limiter.update_config(data)
+        return jsonify(config.to_dict(mask_keys=True))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid rate limit config: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error updating rate limits: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/router/optimal-model', methods=['POST'])
 def get_optimal_model():
     """Get optimal model recommendation without executing"""
@@ -309,86 +1274,18 @@ def get_optimal_model():
 @app.route('/v1/plan', methods=['POST'])
 def create_plan():
     """Create a collaboration plan without executing it"""
-    try:
-        data = request.json
-        if not data:
-            return jsonify({"error": "No JSON data provided"}), 400
-            
-        prompt = data.get('prompt', '')
-        context = data.get('context', {})
-        template_name = data.get('template', None)
-        
-        if not prompt:
-            return jsonify({"error": "No prompt provided"}), 400
-        
-        # Create collaboration plan
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            plan = loop.run_until_complete(
-                orchestrator.create_collaboration_plan(prompt, context, template_name)
-            )
-            
-            # Convert plan to dict for JSON serialization
-            plan_dict = {
-                "id": plan.id,
-                "task_sequence": [
-                    {
-                        "id": task.id,
-                        "type": task.type.value,
-                        "prompt": task.prompt,
-                        "dependencies": task.dependencies,
-                        "assigned_services": task.assigned_services
-                    }
-                    for task in plan.task_sequence
-                ],
-                "service_allocation": plan.service_allocation,
-                "estimated_duration": plan.estimated_duration,
-                "parallel_execution": plan.parallel_execution
-            }
-            
-            return jsonify(plan_dict)
-        finally:
-            loop.close()
-        
-    except Exception as e:
-        logger.error(f"Error creating collaboration plan: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _json_response(run_coroutine(handle_create_plan(request.get_json(silent=True))))
 
 @app.route('/v1/execute/<plan_id>', methods=['POST'])
+@rate_limited
 def execute_plan(plan_id):
     """Execute a previously created collaboration plan"""
-    try:
-        # Execute collaboration plan
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(
-                orchestrator.execute_collaboration_plan(plan_id)
-            )
-            return jsonify(result)
-        finally:
-            loop.close()
-        
-    except Exception as e:
-        logger.error(f"Error executing collaboration plan: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _json_response(run_coroutine(handle_execute_plan(plan_id)))
 
 @app.route('/services', methods=['GET'])
 def get_services():
     """Get status and information about all platform services"""
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            status = loop.run_until_complete(orchestrator.get_service_status())
-            return jsonify(status)
-        finally:
-            loop.close()
-        
-    except Exception as e:
-        logger.error(f"Error getting service status: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _json_response(run_coroutine(handle_services(_wants_fresh(request.args))))
 
 @app.route('/workflows', methods=['GET'])
 def list_workflows():
@@ -441,51 +1338,13 @@ def suggest_workflow():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/v1/collaborate/template', methods=['POST'])
+@rate_limited
 def collaborate_with_template():
     """Multi-agent collaboration using a specific template"""
-    try:
-        data = request.json
-        if not data:
-            return jsonify({"error": "No JSON data provided"}), 400
-            
-        prompt = data.get('prompt', '')
-        template_name = data.get('template')
-        context = data.get('context', {})
-        
-        if not prompt:
-            return jsonify({"error": "No prompt provided"}), 400
-        
-        if not template_name:
-            return jsonify({"error": "No template specified"}), 400
-        
-        # Validate template exists
-        if not workflow_manager.get_template(template_name):
-            return jsonify({"error": f"Template '{template_name}' not found"}), 404
-        
-        # Run collaboration with specific template
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            plan = loop.run_until_complete(
-                orchestrator.create_collaboration_plan(prompt, context, template_name)
-            )
-            result = loop.run_until_complete(
-                orchestrator.execute_collaboration_plan(plan.id)
-            )
-            
-            # Add template information to result
-            result["template_used"] = template_name
-            result["template_info"] = workflow_manager.get_workflow_config(template_name)
-            
-            return jsonify(result)
-        finally:
-            loop.close()
-        
-    except Exception as e:
-        logger.error(f"Error in template collaboration endpoint: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _json_response(run_coroutine(handle_collaborate_with_template(request.get_json(silent=True))))
 
 # MCP Server Endpoints
+
 @app.route('/mcp', methods=['GET'])
 def list_mcp_servers():
     """List all registered MCP servers"""
@@ -515,89 +1374,17 @@ def get_mcp_server_info(server_name):
 @app.route('/mcp/<server_name>/health', methods=['GET'])
 def check_mcp_server_health(server_name):
     """Check health of a specific MCP server"""
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            health = loop.run_until_complete(
-                mcp_registry.check_server_health(server_name)
-            )
-            return jsonify(health)
-        finally:
-            loop.close()
-    except Exception as e:
-        logger.error(f"Error checking MCP server health for {server_name}: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _json_response(run_coroutine(handle_mcp_server_health(server_name)))
 
 @app.route('/mcp/health', methods=['GET'])
 def check_all_mcp_servers_health():
     """Check health of all MCP servers"""
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            health_results = loop.run_until_complete(
-                mcp_registry.check_all_servers()
-            )
-            
-            online_count = sum(1 for result in health_results.values() 
-                             if result.get('status') == 'online')
-            
-            return jsonify({
-                "overall_status": "healthy" if online_count > 0 else "unhealthy",
-                "online_servers": online_count,
-                "total_servers": len(health_results),
-                "servers": health_results
-            })
-        finally:
-            loop.close()
-    except Exception as e:
-        logger.error(f"Error checking all MCP server health: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _json_response(run_coroutine(handle_all_mcp_health()))
 
 @app.route('/mcp/<server_name>/invoke', methods=['POST'])
 def invoke_mcp_server(server_name):
     """Invoke a method on a specific MCP server"""
-    try:
-        data = request.json
-        if not data:
-            return jsonify({"error": "No JSON data provided"}), 400
-        
-        method = data.get('method')
-        params = data.get('params', {})
-        
-        if not method:
-            return jsonify({"error": "No method specified"}), 400
-        
-        # Check if server exists
-        server_info = mcp_registry.get_server_info(server_name)
-        if not server_info:
-            return jsonify({"error": f"MCP server '{server_name}' not found"}), 404
-        
-        # For now, handle FortiManager server directly
-        if server_name == 'fortimanager':
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                from network_agents.fortimanager_mcp_server import FortiManagerMCPServer
-                fm_server = FortiManagerMCPServer()
-                loop.run_until_complete(fm_server.start_session())
-                result = loop.run_until_complete(
-                    fm_server.handle_mcp_request(method, params)
-                )
-                loop.run_until_complete(fm_server.close())
-                return jsonify(result)
-            finally:
-                loop.close()
-        else:
-            return jsonify({
-                "error": f"Direct invocation not yet implemented for {server_name}",
-                "available_servers": ["fortimanager"]
-            }), 501
-        
-    except Exception as e:
-        logger.error(f"Error invoking MCP server {server_name}: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _json_response(run_coroutine(handle_mcp_invoke(server_name, request.get_json(silent=True))))
 
 @app.route('/mcp/capabilities/<capability>', methods=['GET'])
 def get_servers_by_capability(capability):
@@ -618,103 +1405,26 @@ def get_servers_by_capability(capability):
 @app.route('/v1/restaurant/network', methods=['GET'])
 def get_restaurant_network_overview():
     """Get overview of restaurant networks"""
-    try:
-        restaurant = request.args.get('restaurant')
-        
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(
-                orchestrator.get_restaurant_network_status(restaurant)
-            )
-            return jsonify(result)
-        finally:
-            loop.close()
-    except Exception as e:
-        logger.error(f"Error getting restaurant network overview: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _json_response(run_coroutine(handle_restaurant_network(request.args.get('restaurant'))))
 
 @app.route('/v1/restaurant/monitor', methods=['POST'])
 def monitor_restaurant_network():
     """Real-time monitoring of restaurant network"""
-    try:
-        data = request.json
-        if not data:
-            return jsonify({"error": "No JSON data provided"}), 400
-        
-        restaurant = data.get('restaurant')
-        duration = data.get('duration', 60)
-        
-        if not restaurant:
-            return jsonify({"error": "Restaurant parameter required"}), 400
-        
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(
-                orchestrator.execute_mcp_task('fortimanager', 'monitor_restaurant_network', {
-                    'restaurant': restaurant,
-                    'duration': duration
-                })
-            )
-            return jsonify(result)
-        finally:
-            loop.close()
-    except Exception as e:
-        logger.error(f"Error monitoring restaurant network: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _json_response(run_coroutine(handle_restaurant_monitor(request.get_json(silent=True))))
 
 @app.route('/v1/restaurant/security', methods=['GET'])
 def get_restaurant_security_alerts():
     """Get security alerts for restaurant networks"""
-    try:
-        restaurant = request.args.get('restaurant', 'all')
-        severity = request.args.get('severity', 'all')
-        
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(
-                orchestrator.execute_mcp_task('fortimanager', 'get_security_alerts', {
-                    'restaurant': restaurant,
-                    'severity': severity
-                })
-            )
-            return jsonify(result)
-        finally:
-            loop.close()
-    except Exception as e:
-        logger.error(f"Error getting restaurant security alerts: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _json_response(run_coroutine(handle_restaurant_security(
+        request.args.get('restaurant', 'all'),
+        request.args.get('severity', 'all')
+    )))
 
 @app.route('/v1/collaborate/mcp', methods=['POST'])
+@rate_limited
 def collaborate_with_mcp():
     """Multi-agent collaboration with MCP server integration"""
-    try:
-        data = request.json
-        if not data:
-            return jsonify({"error": "No JSON data provided"}), 400
-        
-        prompt = data.get('prompt', '')
-        template_name = data.get('template')
-        context = data.get('context', {})
-        
-        if not prompt:
-            return jsonify({"error": "No prompt provided"}), 400
-        
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(
-                orchestrator.collaborate_with_mcp(prompt, template_name, context)
-            )
-            return jsonify(result)
-        finally:
-            loop.close()
-        
-    except Exception as e:
-        logger.error(f"Error in MCP collaboration: {e}")
-        return jsonify({"error": str(e)}), 500
+    return _json_response(run_coroutine(handle_collaborate_with_mcp(request.get_json(silent=True))))
 
 @app.route('/info', methods=['GET'])
 def gateway_info():
@@ -725,7 +1435,7 @@ def gateway_info():
         "backends": list(BACKENDS.keys()),
         "endpoints": {
             "/v1/completions": "Main completion endpoint",
-            "/v1/chat/completions": "OpenAI-compatible chat endpoint",
+            "/v1/chat/completions": "OpenAI-compatible chat endpoint (supports stream: true)",
             "/v1/collaborate": "Multi-agent collaboration endpoint",
             "/v1/collaborate/template": "Collaboration with specific template",
             "/v1/collaborate/mcp": "Collaboration with MCP server integration",
@@ -737,13 +1447,15 @@ def gateway_info():
             "/workflows": "List available workflow templates",
             "/workflows/<name>": "Get specific workflow template info",
             "/workflows/suggest": "Suggest best template for prompt",
-            "/health": "Health check for all backends",
+            "/health": "Health check for all backends (cached snapshot; ?fresh=1 re-probes)",
             "/services": "Status of all platform services",
             "/models": "List available models",
             "/mcp": "List all MCP servers",
             "/mcp/<server>/health": "Check MCP server health",
             "/mcp/<server>/invoke": "Invoke MCP server method",
             "/mcp/capabilities/<capability>": "Get servers by capability",
+            "/metrics": "Prometheus metrics (latency histograms, in-flight gauges, error counters)",
+            "/ratelimits": "Rate limits and the caller's remaining allowance (PUT to update live)",
             "/info": "This information endpoint"
         },
         "collaboration_features": {
@@ -822,6 +1534,8 @@ def get_platform_analytics():
         logger.error(f"Error getting platform analytics: {e}")
         return jsonify({"error": str(e)}), 500
 
+startup_tracker.mark('imported')
+
 if __name__ == '__main__':
     logger.info("Starting Advanced AI Stack Gateway on port 9000")
     app.run(host='0.0.0.0', port=9000, debug=False)
\ No newline at end of file
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+ASGI Entry Point for the Unified API Gateway
+Serves the gateway routes on one long-lived event loop. Collaboration, planning,
+service status, MCP and restaurant routes await the orchestrator / mcp_registry
+coroutines directly; every other route is delegated to the Flask app on a
+bounded worker thread pool, so both entry points expose the same API.
+
+Run with:   uvicorn asgi_gateway:app --host 0.0.0.0 --port 9000
+The Flask app stays available as the WSGI entry point (gunicorn api_gateway:app).
+"""
+
+import asyncio
+import io
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Pattern, Tuple
+from urllib.parse import parse_qs
+
+from werkzeug.datastructures import Headers
+
+import api_gateway
+from api_gateway import (
+    handle_collaborate,
+    handle_create_plan,
+    handle_execute_plan,
+    handle_services,
+    handle_collaborate_with_template,
+    handle_mcp_server_health,
+    handle_all_mcp_health,
+    handle_mcp_invoke,
+    handle_restaurant_network,
+    handle_restaurant_monitor,
+    handle_restaurant_security,
+    handle_collaborate_with_mcp,
+)
+from health_prober import health_prober
+from load_signals import load_signals
+from tracing import tracer, TRACEPARENT_HEADER
+from deadlines import deadline_manager
+from traffic_capture import traffic_capture, sanitise
+from startup import is_initialised
+from metrics import GATEWAY_REQUESTS, GATEWAY_REQUEST_DURATION, GATEWAY_TIME_TO_FIRST_BYTE, GATEWAY_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+# Worker threads for routes that still execute synchronously (backend completions, health probes)
+ASGI_WORKER_THREADS = int(os.getenv('GATEWAY_ASGI_THREADS', '32'))
+
+@dataclass
+class ASGIRequest:
+    """Minimal request view handed to native ASGI route handlers"""
+    method: str
+    path: str
+    query_string: bytes
+    headers: Dict[str, str]
+    body: bytes
+    path_params: Dict[str, str] = field(default_factory=dict)
+
+    def json(self) -> Optional[Any]:
+        """Decode the request body as JSON, returning None when it is missing or invalid"""
+        if not self.body:
+            return None
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+    @property
+    def header_map(self) -> Headers:
+        """Case-insensitive view of the headers, for helpers shared with the Flask routes"""
+        return Headers(list(self.headers.items()))
+
+    @property
+    def args(self) -> Dict[str, str]:
+        """Query string arguments (first value per key, like Flask's request.args.get)"""
+        parsed = parse_qs(self.query_string.decode('latin-1'), keep_blank_values=True)
+        return {key: values[0] for key, values in parsed.items()}
+
+Handler = Callable[[ASGIRequest], Awaitable[Tuple[Dict[str, Any], int]]]
+
+class Route(NamedTuple):
+    method: str
+    path: str
+    pattern: Pattern
+    handler: Handler
+    rate_limited: bool
+
+class ASGIGateway:
+    """ASGI application serving native async routes with a Flask fallback"""
+
+    def __init__(self, wsgi_app, worker_threads: int = ASGI_WORKER_THREADS):
+        self.wsgi_app = wsgi_app
+        self.worker_threads = worker_threads
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.routes: List[Route] = []
+
+    def route(self, path: str, methods: List[str], rate_limited: bool = False):
+        """Register a native async handler using Flask-style '<param>' path syntax"""
+        pattern = re.compile('^' + re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', path) + '$')
+
+        def decorator(handler: Handler) -> Handler:
+            for method in methods:
+                self.routes.append(Route(method, path, pattern, handler, rate_limited))
+            return handler
+
+        return decorator
+
+    def _match(self, method: str, path: str) -> Tuple[Optional[Route], Dict[str, str]]:
+        for route in self.routes:
+            if route.method != method:
+                continue
+            match = route.pattern.match(path)
+            if match:
+                return route, match.groupdict()
+        return None, {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        body = await self._read_body(receive)
+        route, path_params = self._match(scope['method'], scope['path'])
+
+        if route is None:
+            await self._call_wsgi(scope, body, send)
+            return
+
+        request = ASGIRequest(
+            method=scope['method'],
+            path=scope['path'],
+            query_string=scope.get('query_string', b''),
+            headers={k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])},
+            body=body,
+            path_params=path_params
+        )
+
+        started, arrived_at = time.perf_counter(), time.time()
+        in_flight = GATEWAY_IN_FLIGHT.labels(route.path)
+        in_flight.inc()
+        span, token = tracer.start_trace(
+            f"{route.method} {route.path}", request.headers.get(TRACEPARENT_HEADER),
+            {'http.method': route.method, 'http.route': route.path}
+        )
+        deadline_token = deadline_manager.attach(
+            deadline_manager.from_request(route.path, request.header_map, request.json())
+        )
+        try:
+            status_code = await self._dispatch(route, request, scope, send, span)
+        finally:
+            in_flight.dec()
+            tracer.finish_trace(span)
+            tracer.detach(token)
+            deadline_manager.detach(deadline_token)
+        elapsed = time.perf_counter() - started
+        GATEWAY_REQUESTS.labels(route.path, route.method, str(status_code)).inc()
+        GATEWAY_TIME_TO_FIRST_BYTE.labels(route.path, 'none').observe(elapsed)
+        GATEWAY_REQUEST_DURATION.labels(route.path, 'none', api_gateway.status_outcome(status_code)).observe(elapsed)
+        if traffic_capture.wants(route.path):
+            entry = sanitise(route.path, route.method, request.json(), request.header_map)
+            traffic_capture.record(entry, arrived_at, status_code, elapsed)
+
+    async def _dispatch(self, route: Route, request: ASGIRequest, scope, send, span) -> int:
+        """Run a native handler behind its rate limit; returns the status code sent"""
+        decision = None
+        if route.rate_limited:
+            client = scope.get('client') or ('', 0)
+            # The SQLite store can block on its file lock; keep that off the event loop
+            decision = await asyncio.get_running_loop().run_in_executor(
+                self._ensure_executor(), api_gateway.check_rate_limit,
+                request.header_map, client[0], request.json()
+            )
+            if decision is not None and not decision.allowed:
+                await self._send_json(send, api_gateway.rate_limit_exceeded_payload(decision), 429,
+                                      decision.headers())
+                return 429
+
+        try:
+            try:
+                payload, status_code = await api_gateway.handle_within_deadline(route.handler(request))
+            except Exception as e:
+                logger.error(f"Unhandled error in ASGI route {scope['path']}: {e}")
+                payload, status_code = {"error": str(e)}, 500
+
+            headers = decision.headers() if decision else {}
+            span.set_attribute('http.status_code', status_code)
+            if isinstance(payload, dict) and tracer.wants_inline_timing(request.header_map, request.args):
+                payload = dict(payload, timing=tracer.breakdown(span))
+            tracer.finish_trace(span)
+            server_timing = tracer.server_timing(span)
+            if server_timing:
+                headers['Server-Timing'] = server_timing
+                headers['X-Trace-Id'] = span.trace_id
+
+            await self._send_json(send, payload, status_code, headers)
+            return status_code
+        finally:
+            if decision is not None:
+                # Not awaited, so the slot is returned even when this task is cancelled
+                self._ensure_executor().submit(decision.release)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._ensure_executor()
+                health_prober.start(asyncio.get_running_loop())
+                load_signals.start(asyncio.get_running_loop())
+                logger.info(f"ASGI gateway started with {self.worker_threads} worker threads")
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await health_prober.stop()
+                await load_signals.prober.stop()
+                if is_initialised(api_gateway.mcp_registry):
+                    await api_gateway.mcp_registry.close()
+                api_gateway.backend_clients.close()
+                api_gateway.hedger.close()
+                if is_initialised(api_gateway.intelligent_router):
+                    api_gateway.intelligent_router.policy.save()
+                if self.executor:
+                    self.executor.shutdown(wait=False)
+                    self.executor = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.worker_threads,
+                thread_name_prefix='gateway-worker'
+            )
+        return self.executor
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        return b''.join(chunks)
+
+    @staticmethod
+    async def _send_json(send, payload: Any, status_code: int, extra_headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('latin-1'))
+        ]
+        for name, value in (extra_headers or {}).items():
+            headers.append((name.lower().encode('latin-1'), str(value).encode('latin-1')))
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': headers
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _call_wsgi(self, scope, body: bytes, send):
+        """Serve a route through the Flask app on the worker thread pool, relaying
+        the response body chunk by chunk so streamed (SSE) responses stay streamed"""
+        environ = self._build_environ(scope, body)
+        loop = asyncio.get_running_loop()
+        executor = self._ensure_executor()
+        status, headers, first_chunk, chunks, result = await loop.run_in_executor(
+            executor, self._start_wsgi, environ
+        )
+
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': status,
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            })
+            chunk = first_chunk
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(executor, next, chunks, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    def _start_wsgi(self, environ: Dict[str, Any]):
+        """Call the WSGI app and pull the first body chunk (WSGI apps may defer start_response)"""
+        response_state = {}
+
+        def start_response(status, headers, exc_info=None):
+            response_state['status'] = int(status.split(' ', 1)[0])
+            response_state['headers'] = headers
+
+        result = self.wsgi_app(environ, start_response)
+        chunks = iter(result)
+        first_chunk = next(chunks, None)
+
+        return response_state['status'], response_state['headers'], first_chunk, chunks, result
+
+    @staticmethod
+    def _build_environ(scope, body: bytes) -> Dict[str, Any]:
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+
+        for raw_name, raw_value in scope.get('headers', []):
+            name = raw_name.decode('latin-1').upper().replace('-', '_')
+            value = raw_value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name == 'CONTENT_LENGTH':
+                continue
+            else:
+                key = f'HTTP_{name}'
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+        return environ
+
+app = ASGIGateway(api_gateway.app)
+
+@app.route('/v1/collaborate', methods=['POST'], rate_limited=True)
+async def collaborate(request: ASGIRequest):
+    return await handle_collaborate(request.json())
+
+@app.route('/v1/plan', methods=['POST'])
+async def create_plan(request: ASGIRequest):
+    return await handle_create_plan(request.json())
+
+@app.route('/v1/execute/<plan_id>', methods=['POST'], rate_limited=True)
+async def execute_plan(request: ASGIRequest):
+    return await handle_execute_plan(request.path_params['plan_id'])
+
+@app.route('/services', methods=['GET'])
+async def get_services(request: ASGIRequest):
+    return await handle_services(api_gateway._wants_fresh(request.args))
+
+@app.route('/v1/collaborate/template', methods=['POST'], rate_limited=True)
+async def collaborate_with_template(request: ASGIRequest):
+    return await handle_collaborate_with_template(request.json())
+
+@app.route('/v1/collaborate/mcp', methods=['POST'], rate_limited=True)
+async def collaborate_with_mcp(request: ASGIRequest):
+    return await handle_collaborate_with_mcp(request.json())
+
+@app.route('/mcp/health', methods=['GET'])
+async def check_all_mcp_servers_health(request: ASGIRequest):
+    return await handle_all_mcp_health()
+
+@app.route('/mcp/<server_name>/health', methods=['GET'])
+async def check_mcp_server_health(request: ASGIRequest):
+    return await handle_mcp_server_health(request.path_params['server_name'])
+
+@app.route('/mcp/<server_name>/invoke', methods=['POST'])
+async def invoke_mcp_server(request: ASGIRequest):
+    return await handle_mcp_invoke(request.path_params['server_name'], request.json())
+
+@app.route('/v1/restaurant/network', methods=['GET'])
+async def get_restaurant_network_overview(request: ASGIRequest):
+    return await handle_restaurant_network(request.args.get('restaurant'))
+
+@app.route('/v1/restaurant/monitor', methods=['POST'])
+async def monitor_restaurant_network(request: ASGIRequest):
+    return await handle_restaurant_monitor(request.json())
+
+@app.route('/v1/restaurant/security', methods=['GET'])
+async def get_restaurant_security_alerts(request: ASGIRequest):
+    args = request.args
+    return await handle_restaurant_security(args.get('restaurant', 'all'), args.get('severity', 'all'))
+
+if __name__ == '__main__':
+    import uvicorn
+    logger.info("Starting Advanced AI Stack Gateway (ASGI) on port 9000")
+    uvicorn.run(app, host='0.0.0.0', port=9000)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Pooled Backend HTTP Clients for the API Gateway
+One keep-alive connection pool per backend replica with separate connect/read
+timeouts and per-pool statistics, so completions don't pay TCP setup on every
+request. Backends with several replicas are balanced by backend_pools.
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Any, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from tracing import tracer
+from deadlines import deadline_manager
+from hedging import current_attempt, attempt_cancelled
+from backend_pools import BackendPool, EndpointSpec, parse_endpoints
+
+logger = logging.getLogger(__name__)
+
+Timeout = Union[float, Tuple[float, float]]
+
+class RawBody:
+    """A backend response body relayed to the client as received, without a JSON round trip.
+    Shared between coalesced and hedged callers, so it is never mutated; routing metadata
+    is attached to a copy."""
+    __slots__ = ('content', 'content_type', 'routing_info')
+
+    def __init__(self, content: bytes, content_type: str = 'application/json',
+                 routing_info: Optional[Dict[str, Any]] = None):
+        self.content = content
+        self.content_type = content_type
+        self.routing_info = routing_info
+
+    @classmethod
+    def from_response(cls, response: requests.Response) -> 'RawBody':
+        return cls(response.content, response.headers.get('Content-Type', 'application/json'))
+
+    @classmethod
+    def encode(cls, payload: Any) -> 'RawBody':
+        """Wrap an already-decoded body (cache hit, split micro-batch result)"""
+        return cls(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def with_routing_info(self, routing_info: Dict[str, Any]) -> 'RawBody':
+        return RawBody(self.content, self.content_type, routing_info)
+
+class _AttemptTrackingPool:
+    """Registers each checked-out connection with the hedge attempt (if any) that is using
+    it, so a losing attempt's socket can be shut down mid-request"""
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        attempt = current_attempt.get()
+        if attempt is not None:
+            conn._hedge_attempt = attempt
+            attempt.register(conn)
+        return conn
+
+    def _put_conn(self, conn):
+        attempt = conn.__dict__.pop('_hedge_attempt', None) if conn is not None else None
+        if attempt is not None:
+            attempt.unregister(conn)
+        super()._put_conn(conn)
+
+class _TrackingHTTPConnectionPool(_AttemptTrackingPool, HTTPConnectionPool):
+    pass
+
+class _TrackingHTTPSConnectionPool(_AttemptTrackingPool, HTTPSConnectionPool):
+    pass
+
+class CancellableAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections can be cut by a cancelled hedge attempt"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TrackingHTTPConnectionPool,
+            'https': _TrackingHTTPSConnectionPool
+        }
+
+@dataclass
+class PoolConfig:
+    """Connection pool settings for a single backend"""
+    pool_size: int = 20
+    keep_alive: bool = True
+    connect_timeout: float = 3.0
+    read_timeout: float = 30.0
+    block_when_full: bool = True
+
+    @classmethod
+    def from_env(cls, backend_name: Optional[str] = None) -> 'PoolConfig':
+        """Build config from BACKEND_* env vars, with optional <NAME>_BACKEND_* overrides"""
+        def setting(key: str, default: str) -> str:
+            if backend_name:
+                override = os.getenv(f"{backend_name.upper()}_BACKEND_{key}")
+                if override is not None:
+                    return override
+            return os.getenv(f"BACKEND_{key}", default)
+
+        return cls(
+            pool_size=int(setting('POOL_SIZE', '20')),
+            keep_alive=setting('KEEP_ALIVE', 'true').lower() in ('1', 'true', 'yes'),
+            connect_timeout=float(setting('CONNECT_TIMEOUT', '3')),
+            read_timeout=float(setting('READ_TIMEOUT', '30')),
+            block_when_full=setting('POOL_BLOCK', 'true').lower() in ('1', 'true', 'yes')
+        )
+
+class BackendClient:
+    """Keep-alive HTTP client bound to one backend base URL"""
+
+    def __init__(self, name: str, base_url: str, config: Optional[PoolConfig] = None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.config = config or PoolConfig.from_env(name)
+
+        self.session = requests.Session()
+        self.adapter = CancellableAdapter(
+            pool_connections=1,
+            pool_maxsize=self.config.pool_size,
+            pool_block=self.config.block_when_full,
+            max_retries=0
+        )
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        if not self.config.keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._requests = 0
+        self._errors = 0
+        self._waits = 0
+        # Set by a BackendPool: called on start and with (latency, success) on completion
+        self.on_result: Optional[Callable[..., None]] = None
+
+    @property
+    def default_timeout(self) -> Tuple[float, float]:
+        return (self.config.connect_timeout, self.config.read_timeout)
+
+    def _resolve_timeout(self, timeout: Optional[Timeout]) -> Tuple[float, float]:
+        if timeout is None:
+            connect, read = self.default_timeout
+        elif isinstance(timeout, tuple):
+            connect, read = timeout
+        else:
+            # A single number caps the read timeout; connect stays at the pool setting
+            connect, read = min(self.config.connect_timeout, timeout), timeout
+        # Neither phase may outlast the request's remaining budget
+        return (deadline_manager.timeout(connect), deadline_manager.timeout(read))
+
+    def request(self, method: str, path: str, timeout: Optional[Timeout] = None, **kwargs) -> requests.Response:
+        """Send a request to the backend over the pooled session (propagating the trace context
+        and remaining deadline). Raises DeadlineExceeded instead of calling a backend the
+        request no longer has time for, or when the budget ran out mid-call; the timed-out
+        connection is closed, which makes vLLM abort the generation."""
+        deadline_manager.check('backend', self.name)
+        if attempt_cancelled():
+            raise requests.exceptions.ConnectionError(f"Request to {self.name} cancelled: hedge race lost")
+        kwargs['headers'] = deadline_manager.inject(tracer.inject(kwargs.get('headers')))
+        with self._lock:
+            if self._in_flight >= self.config.pool_size:
+                self._waits += 1
+            self._in_flight += 1
+            self._requests += 1
+        on_result = self.on_result
+        if on_result is not None:
+            on_result(None, None, started=True)
+        started = time.monotonic()
+        success: Optional[bool] = False
+
+        try:
+            response = self.session.request(
+                method, f"{self.base_url}{path}",
+                timeout=self._resolve_timeout(timeout),
+                **kwargs
+            )
+            success = response.status_code < 500
+            return response
+        except requests.exceptions.Timeout as e:
+            if deadline_manager.exhausted():
+                # The caller's budget ran out, not the backend's patience; don't count it as an error
+                success = None
+                raise deadline_manager.exceeded('backend', self.name) from e
+            with self._lock:
+                self._errors += 1
+            raise
+        except requests.exceptions.RequestException:
+            if attempt_cancelled():
+                # This call lost a hedge race and its connection was cut on purpose
+                success = None
+                raise
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            if on_result is not None:
+                on_result(time.monotonic() - started, success)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def get(self, path: str, timeout: Optional[Timeout] = None, **kwargs) -> requests.Response:
+        return self.request('GET', path, timeout=timeout, **kwargs)
+
+    def post(self, path: str, timeout: Optional[Timeout] = None, **kwargs) -> requests.Response:
+        return self.request('POST', path, timeout=timeout, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool statistics: open/idle connections, in-flight requests and pool waits"""
+        idle = 0
+        created = 0
+        for pool in list(self.adapter.poolmanager.pools._container.values()):
+            created += pool.num_connections
+            if pool.pool is not None:
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+
+        with self._lock:
+            in_flight = self._in_flight
+            return {
+                'url': self.base_url,
+                'open': idle + in_flight,
+                'idle': idle,
+                'in_flight': in_flight,
+                'connections_created': created,
+                'requests': self._requests,
+                'errors': self._errors,
+                'waits': self._waits,
+                'config': asdict(self.config)
+            }
+
+    def close(self):
+        self.session.close()
+
+class BackendClientManager:
+    """Pooled clients per configured backend: one per replica, balanced when there are several"""
+
+    def __init__(self, backends: Dict[str, Union[str, List[EndpointSpec]]]):
+        # A backend is a URL spec ('url[;weight=N],...') or already-parsed endpoints
+        self.endpoints: Dict[str, List[EndpointSpec]] = {
+            name: parse_endpoints(spec) if isinstance(spec, str) else list(spec)
+            for name, spec in backends.items()
+        }
+        self.backends = {name: endpoints[0].url for name, endpoints in self.endpoints.items()}
+        self.pools: Dict[str, BackendPool] = {}
+        self._lock = threading.Lock()
+
+    def _build(self, name: str, config: Optional[PoolConfig] = None) -> BackendPool:
+        return BackendPool(name, self.endpoints[name], lambda url: BackendClient(name, url, config))
+
+    def pool(self, name: str) -> BackendPool:
+        """Get (or lazily create) the replica pool for a backend"""
+        pool = self.pools.get(name)
+        if pool is None:
+            with self._lock:
+                pool = self.pools.get(name)
+                if pool is None:
+                    pool = self._build(name)
+                    self.pools[name] = pool
+        return pool
+
+    def get(self, name: str) -> BackendClient:
+        """Pooled client for a backend, on the replica its balancer picks for this request"""
+        return self.pool(name).client()
+
+    def configure(self, name: str, config: PoolConfig):
+        """Replace the pools for a backend with new settings"""
+        with self._lock:
+            old = self.pools.get(name)
+            self.pools[name] = self._build(name, config)
+        if old:
+            for endpoint in old.endpoints:
+                endpoint.client.close()
+
+    def in_flight(self, name: str) -> int:
+        """Requests currently open to any replica of a backend (0 before its pool exists)"""
+        pool = self.pools.get(name)
+        return sum(endpoint.client.in_flight for endpoint in pool.endpoints) if pool else 0
+
+    def endpoint_urls(self) -> Dict[str, List[str]]:
+        return {name: [endpoint.url for endpoint in endpoints] for name, endpoints in self.endpoints.items()}
+
+    def observe_health(self, health: Dict[str, Dict[str, Any]]):
+        """Feed a health-probe round (see probe_backends) to the replica pools"""
+        for name, entry in health.items():
+            if len(self.endpoints.get(name, ())) < 2:
+                continue
+            pool = self.pool(name)
+            for replica in entry.get('endpoints', []):
+                pool.observe_probe(replica['url'], replica['status'] == 'online')
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {}
+        for name, pool in list(self.pools.items()):
+            if len(pool.endpoints) == 1:
+                stats[name] = pool.endpoints[0].client.stats()
+            else:
+                stats[name] = dict(pool.stats(), clients=[endpoint.client.stats() for endpoint in pool.endpoints])
+        return stats
+
+    def close(self):
+        for pool in list(self.pools.values()):
+            for endpoint in pool.endpoints:
+                endpoint.client.close()
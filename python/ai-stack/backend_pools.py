@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Replica Pools and Load Balancing for Backend Roles
+Each routing role (reasoning, general, ...) can be served by several replica
+endpoints, given as a comma-separated URL list with optional weights, e.g.
+REASONING_MODEL_URL="http://vllm-a:8000;weight=2,http://vllm-b:8000". The router
+picks the role; the pool picks the replica by power-of-two-choices over
+outstanding requests and a latency EWMA, and ejects replicas that keep failing
+or fail health probes, with exponential back-off before they are tried again.
+Requests with a session or long-prefix affinity key go to their consistent-hash
+replica instead (see affinity).
+"""
+
+import os
+import time
+import random
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from affinity import affinity_router
+
+logger = logging.getLogger(__name__)
+
+class EndpointSpec(NamedTuple):
+    url: str
+    weight: float = 1.0
+
+def parse_endpoints(spec: str) -> List[EndpointSpec]:
+    """Parse 'url[;weight=N],url...' into endpoint specs (a bare URL is one endpoint)"""
+    endpoints = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        url, *options = [part.strip() for part in item.split(';')]
+        weight = 1.0
+        for option in options:
+            key, _, value = option.partition('=')
+            if key.strip() == 'weight':
+                weight = float(value)
+            else:
+                raise ValueError(f"Unknown endpoint option {option!r} in {item!r}")
+        if weight <= 0:
+            raise ValueError(f"Endpoint weight must be positive in {item!r}")
+        endpoints.append(EndpointSpec(url.rstrip('/'), weight))
+    if not endpoints:
+        raise ValueError(f"No endpoint URLs in {spec!r}")
+    return endpoints
+
+@dataclass
+class BalancerConfig:
+    """Replica selection and outlier ejection settings"""
+    latency_alpha: float = 0.3          # EWMA weight of the newest latency sample
+    initial_latency: float = 1.0        # seconds assumed for a replica before it has answered
+    eject_after: int = 3                # consecutive failures that eject a replica
+    eject_seconds: float = 10.0         # first ejection; doubles per repeat ejection
+    max_eject_seconds: float = 300.0
+    max_ejected_share: float = 0.5      # never eject more than this share of a pool
+
+    @classmethod
+    def from_env(cls) -> 'BalancerConfig':
+        return cls(
+            latency_alpha=float(os.getenv('BACKEND_BALANCER_LATENCY_ALPHA', '0.3')),
+            initial_latency=float(os.getenv('BACKEND_BALANCER_INITIAL_LATENCY', '1.0')),
+            eject_after=int(os.getenv('BACKEND_EJECT_AFTER', '3')),
+            eject_seconds=float(os.getenv('BACKEND_EJECT_SECONDS', '10')),
+            max_eject_seconds=float(os.getenv('BACKEND_MAX_EJECT_SECONDS', '300')),
+            max_ejected_share=float(os.getenv('BACKEND_MAX_EJECTED_SHARE', '0.5'))
+        )
+
+class Endpoint:
+    """One replica: its client, weight and balancing/health state"""
+
+    def __init__(self, spec: EndpointSpec, client: Any, config: BalancerConfig):
+        self.url = spec.url
+        self.weight = spec.weight
+        self.client = client
+        self.outstanding = 0
+        self.latency = config.initial_latency
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.probe_down = False
+        self.requests = 0
+        self.errors = 0
+
+    def ejected(self, now: float) -> bool:
+        return self.probe_down or now < self.ejected_until
+
+    def cost(self) -> float:
+        """Expected wait if chosen: queued work times recent latency, per unit of weight"""
+        return (self.outstanding + 1) * self.latency / self.weight
+
+class BackendPool:
+    """Replicas of one backend role, balanced by power-of-two-choices"""
+
+    def __init__(self, name: str, endpoints: List[EndpointSpec],
+                 make_client: Callable[[str], Any], config: Optional[BalancerConfig] = None):
+        self.name = name
+        self.config = config or BalancerConfig.from_env()
+        self.endpoints = [Endpoint(spec, make_client(spec.url), self.config) for spec in endpoints]
+        self.ring = affinity_router.ring([(endpoint.url, endpoint.weight) for endpoint in self.endpoints]) \
+            if len(self.endpoints) > 1 else None
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self.stats_counters = {
+            'picks': 0,
+            'ejections': 0,
+            'all_ejected': 0
+        }
+        for endpoint in self.endpoints:
+            endpoint.client.on_result = self._recorder(endpoint)
+
+    def _recorder(self, endpoint: Endpoint) -> Callable[..., None]:
+        def record(latency: Optional[float], success: Optional[bool], started: bool = False):
+            self._record(endpoint, latency, success, started)
+        return record
+
+    def _available(self, now: float) -> List[Endpoint]:
+        available = [endpoint for endpoint in self.endpoints if not endpoint.ejected(now)]
+        if not available:
+            # Fail open: a pool with every replica ejected still has to try something
+            self.stats_counters['all_ejected'] += 1
+            return self.endpoints
+        return available
+
+    def _weighted_choice(self, candidates: List[Endpoint]) -> Endpoint:
+        total = sum(endpoint.weight for endpoint in candidates)
+        point = self._random.random() * total
+        for endpoint in candidates:
+            point -= endpoint.weight
+            if point < 0:
+                return endpoint
+        return candidates[-1]
+
+    def pick(self) -> Endpoint:
+        """The request's affinity replica (by consistent hashing, within its load bound) when it
+        has an affinity key; otherwise sample two replicas by weight and take the one with the
+        lower expected wait"""
+        if len(self.endpoints) == 1:
+            return self.endpoints[0]
+        request = affinity_router.current()
+        with self._lock:
+            self.stats_counters['picks'] += 1
+            candidates = self._available(time.monotonic())
+            if request is not None and request.key is not None:
+                endpoint, home = affinity_router.choose(self.ring, request.key, self.endpoints, candidates)
+                request.picked(self.name, 'home' if home else 'spill')
+                return endpoint
+            if request is not None:
+                request.picked(self.name, 'unkeyed')
+            if len(candidates) == 1:
+                return candidates[0]
+            first = self._weighted_choice(candidates)
+            second = self._weighted_choice([endpoint for endpoint in candidates if endpoint is not first])
+            return first if first.cost() <= second.cost() else second
+
+    def client(self) -> Any:
+        return self.pick().client
+
+    def _record(self, endpoint: Endpoint, latency: Optional[float], success: Optional[bool], started: bool):
+        """Client callback: a request to `endpoint` started, or finished after `latency` seconds
+        (success None: ended by the caller's deadline, which says nothing about the replica)"""
+        with self._lock:
+            if started:
+                endpoint.outstanding += 1
+                endpoint.requests += 1
+                return
+            endpoint.outstanding -= 1
+            if success is None:
+                return
+            if success:
+                endpoint.consecutive_failures = 0
+                request = affinity_router.current()
+                if request is not None and latency is not None:
+                    affinity_router.observe(request.outcomes.get(self.name), latency, request.stream)
+                if endpoint.ejections and time.monotonic() - endpoint.ejected_until > self.config.max_eject_seconds:
+                    endpoint.ejections = 0   # healthy long enough: back-off starts over
+                if latency is not None:
+                    alpha = self.config.latency_alpha
+                    endpoint.latency = alpha * latency + (1 - alpha) * endpoint.latency
+                return
+            endpoint.errors += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.config.eject_after and len(self.endpoints) > 1:
+                self._eject(endpoint, time.monotonic())
+
+    def _can_eject(self, endpoint: Endpoint, now: float) -> bool:
+        ejected = sum(1 for other in self.endpoints if other is not endpoint and other.ejected(now))
+        return ejected + 1 <= self.config.max_ejected_share * len(self.endpoints)
+
+    def _eject(self, endpoint: Endpoint, now: float):
+        if endpoint.ejected(now):
+            return
+        if not self._can_eject(endpoint, now):
+            return
+        duration = min(self.config.max_eject_seconds, self.config.eject_seconds * 2 ** endpoint.ejections)
+        endpoint.ejected_until = now + duration
+        endpoint.ejections += 1
+        endpoint.consecutive_failures = 0
+        self.stats_counters['ejections'] += 1
+        logger.warning(f"Ejected {self.name} replica {endpoint.url} for {duration:.0f}s "
+                       f"after {self.config.eject_after} consecutive failures")
+
+    def observe_probe(self, url: str, online: bool):
+        """Health-probe result for a replica: offline replicas are skipped until back online"""
+        if len(self.endpoints) == 1:
+            return
+        with self._lock:
+            now = time.monotonic()
+            for endpoint in self.endpoints:
+                if endpoint.url != url or endpoint.probe_down == (not online):
+                    continue
+                if online:
+                    endpoint.probe_down = False
+                    logger.info(f"{self.name} replica {url} passed its health probe again")
+                elif self._can_eject(endpoint, now):
+                    endpoint.probe_down = True
+                    logger.warning(f"{self.name} replica {url} failed its health probe")
+
+    def urls(self) -> List[str]:
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            endpoints = [{
+                'url': endpoint.url,
+                'weight': endpoint.weight,
+                'outstanding': endpoint.outstanding,
+                'latency_ewma_ms': round(endpoint.latency * 1000, 1),
+                'ejected': endpoint.ejected(now),
+                'ejected_for_s': round(max(0.0, endpoint.ejected_until - now), 1),
+                'probe_down': endpoint.probe_down,
+                'ejections': endpoint.ejections,
+                'requests': endpoint.requests,
+                'errors': endpoint.errors
+            } for endpoint in self.endpoints]
+            counters = dict(self.stats_counters)
+        return {'strategy': 'p2c', 'endpoints': endpoints, **counters}
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Per-Backend Circuit Breakers for the Intelligent Router
+Each backend breaker opens on a run of consecutive failures or a high error rate
+over a sliding window, rejects traffic while open, then admits a few half-open
+probe requests before closing again.
+"""
+
+import os
+import time
+import threading
+import logging
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpen(Exception):
+    """Raised when a backend's breaker turns a dispatch away"""
+
+    def __init__(self, backend: str):
+        super().__init__(f"Circuit breaker for {backend} is open")
+        self.backend = backend
+
+@dataclass
+class BreakerConfig:
+    """Trip and recovery thresholds shared by every backend breaker"""
+    enabled: bool = True
+    failure_threshold: int = 5          # consecutive failures that trip the breaker
+    error_rate_threshold: float = 0.5   # error rate over the window that trips it
+    window_seconds: float = 60.0
+    min_window_requests: int = 10       # error rate is ignored below this volume
+    open_seconds: float = 30.0          # cool-down before half-open probing
+    max_open_seconds: float = 300.0     # cap for the cool-down after repeated re-trips
+    half_open_probes: int = 1           # concurrent probe requests while half-open
+    probe_successes: int = 2            # successful probes needed to close
+    probe_timeout: float = 60.0         # a probe slot that never reports is reclaimed
+    history_size: int = 50
+
+    @classmethod
+    def from_env(cls) -> 'BreakerConfig':
+        return cls(
+            enabled=os.getenv('CIRCUIT_BREAKER_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            failure_threshold=int(os.getenv('CIRCUIT_BREAKER_FAILURES', '5')),
+            error_rate_threshold=float(os.getenv('CIRCUIT_BREAKER_ERROR_RATE', '0.5')),
+            window_seconds=float(os.getenv('CIRCUIT_BREAKER_WINDOW', '60')),
+            min_window_requests=int(os.getenv('CIRCUIT_BREAKER_MIN_REQUESTS', '10')),
+            open_seconds=float(os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS', '30')),
+            max_open_seconds=float(os.getenv('CIRCUIT_BREAKER_MAX_OPEN_SECONDS', '300')),
+            half_open_probes=int(os.getenv('CIRCUIT_BREAKER_PROBES', '1')),
+            probe_successes=int(os.getenv('CIRCUIT_BREAKER_PROBE_SUCCESSES', '2')),
+            probe_timeout=float(os.getenv('CIRCUIT_BREAKER_PROBE_TIMEOUT', '60')),
+            history_size=int(os.getenv('CIRCUIT_BREAKER_HISTORY', '50'))
+        )
+
+class CircuitBreaker:
+    """Closed / open / half-open state machine for one backend"""
+
+    def __init__(self, name: str, config: BreakerConfig):
+        self.name = name
+        self.config = config
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.open_seconds = config.open_seconds
+        self.probe_successes = 0
+        self.probes_in_flight: List[float] = []
+        self.window: Deque[Tuple[float, bool]] = deque()
+        self.trips = 0
+        self.rejected = 0
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=config.history_size)
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str, reason: str):
+        # Caller holds self._lock
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker '{self.name}': {self.state} -> {state} ({reason})")
+        self.history.append({
+            'timestamp': time.time(),
+            'from': self.state,
+            'to': state,
+            'reason': reason
+        })
+        self.state = state
+        if state == OPEN:
+            self.trips += 1
+            self.opened_at = time.monotonic()
+            self.probes_in_flight = []
+        elif state == HALF_OPEN:
+            self.probe_successes = 0
+            self.probes_in_flight = []
+        elif state == CLOSED:
+            self.consecutive_failures = 0
+            self.open_seconds = self.config.open_seconds
+            self.window.clear()
+
+    def _refresh(self, now: float):
+        # Caller holds self._lock: move open -> half-open after the cool-down, reclaim stale probes
+        if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN, f"cool-down of {self.open_seconds:.0f}s elapsed")
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = [t for t in self.probes_in_flight if now - t < self.config.probe_timeout]
+
+    def allow(self) -> bool:
+        """Whether the router may rank this backend right now; read-only, never reserves a probe"""
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN:
+                return len(self.probes_in_flight) < self.config.half_open_probes
+            return False
+
+    def acquire(self) -> Optional[str]:
+        """Admit one request; returns the state it was admitted in (HALF_OPEN means it holds
+        a probe slot), or None when rejected"""
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            if self.state == CLOSED:
+                return CLOSED
+            if self.state == HALF_OPEN and len(self.probes_in_flight) < self.config.half_open_probes:
+                self.probes_in_flight.append(now)
+                return HALF_OPEN
+            self.rejected += 1
+            return None
+
+    def abandon(self):
+        """Return the probe slot of a HALF_OPEN acquire() whose request never reached the backend"""
+        with self._lock:
+            if self.state == HALF_OPEN and self.probes_in_flight:
+                self.probes_in_flight.pop(0)
+
+    def record(self, success: bool):
+        """Feed one request outcome into the breaker"""
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+
+            if self.state == HALF_OPEN:
+                if self.probes_in_flight:
+                    self.probes_in_flight.pop(0)
+                if not success:
+                    # Failed probe: back off harder before the next attempt
+                    self.open_seconds = min(self.open_seconds * 2, self.config.max_open_seconds)
+                    self._transition(OPEN, 'half-open probe failed')
+                    return
+                self.probe_successes += 1
+                if self.probe_successes >= self.config.probe_successes:
+                    self._transition(CLOSED, f"{self.probe_successes} probe(s) succeeded")
+                return
+
+            if self.state == OPEN:
+                # Late result from a request admitted before the trip
+                return
+
+            self.window.append((now, success))
+            while self.window and now - self.window[0][0] > self.config.window_seconds:
+                self.window.popleft()
+
+            if success:
+                self.consecutive_failures = 0
+                return
+
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.config.failure_threshold:
+                self._transition(OPEN, f"{self.consecutive_failures} consecutive failures")
+                return
+
+            total = len(self.window)
+            if total >= self.config.min_window_requests:
+                error_rate = sum(1 for _, ok in self.window if not ok) / total
+                if error_rate >= self.config.error_rate_threshold:
+                    self._transition(
+                        OPEN, f"error rate {error_rate:.0%} over last {self.config.window_seconds:.0f}s"
+                    )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            total = len(self.window)
+            errors = sum(1 for _, ok in self.window if not ok)
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'window_requests': total,
+                'window_error_rate': round(errors / total, 4) if total else 0.0,
+                'open_seconds': self.open_seconds,
+                'reopens_in': round(max(0.0, self.open_seconds - (now - self.opened_at)), 1)
+                              if self.state == OPEN else None,
+                'probes_in_flight': len(self.probes_in_flight),
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'history': list(self.history)
+            }
+
+class CircuitBreakerRegistry:
+    """One breaker per backend, created on first use"""
+
+    def __init__(self, config: Optional[BreakerConfig] = None):
+        self.config = config or BreakerConfig.from_env()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self.breakers.setdefault(name, CircuitBreaker(name, self.config))
+        return breaker
+
+    def allow(self, name: str) -> bool:
+        """Read-only check for ranking and dry runs"""
+        return not self.config.enabled or self.get(name).allow()
+
+    def acquire(self, name: str) -> Optional[str]:
+        """Admit a request about to be dispatched; pair with record(), or with abandon() if
+        it was admitted HALF_OPEN"""
+        if not self.config.enabled:
+            return CLOSED
+        return self.get(name).acquire()
+
+    def abandon(self, name: str):
+        if self.config.enabled:
+            self.get(name).abandon()
+
+    def record(self, name: str, success: bool):
+        if self.config.enabled:
+            self.get(name).record(success)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.config.enabled,
+            'config': asdict(self.config),
+            'backends': {name: breaker.snapshot() for name, breaker in list(self.breakers.items())}
+        }
+
+# Global circuit breaker registry
+circuit_breakers = CircuitBreakerRegistry()
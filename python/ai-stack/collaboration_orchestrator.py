@@ -18,6 +18,14 @@ import uuid
 from datetime import datetime, timedelta
 # Import workflow_manager inside functions to avoid circular import
 from mcp_server_registry import mcp_registry
+from admission_control import admission_controller, AdmissionRejected, PRIORITY_COLLABORATION
+from tracing import tracer, SPAN_KIND_CLIENT
+from deadlines import deadline_manager, DeadlineExceeded
+from startup import Lazy
+from metrics import (
+    ORCHESTRATOR_PLANS_CREATED, ORCHESTRATOR_PLAN_TASKS, ORCHESTRATOR_PLANS_EXECUTED, ORCHESTRATOR_PLAN_DURATION,
+    ORCHESTRATOR_TASKS, ORCHESTRATOR_TASK_DURATION, ORCHESTRATOR_TASKS_IN_FLIGHT
+)
 
 # Configure logging
 logging.basicConfig(
@@ -26,6 +34,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Gateway backend behind each model service, so sub-tasks share the gateway's admission limits
+SERVICE_BACKENDS = {
+    "vllm-reasoning": "reasoning",
+    "vllm-general": "general",
+    "vllm-coding": "coding",
+    "oobabooga": "advanced",
+    "koboldcpp": "creative"
+}
+
 class TaskType(Enum):
     """Task types for different AI services"""
     REASONING = "reasoning"
@@ -364,6 +381,7 @@ class CollaborationOrchestrator:
         self.collaboration_plans: Dict[str, CollaborationPlan] = {}
         self.mcp_registry = mcp_registry
     
+    @tracer.traced('orchestrator.create_plan')
     async def create_collaboration_plan(self, prompt: str, context: Dict[str, Any] = None, template_name: str = None) -> CollaborationPlan:
         """Create a collaboration plan for a complex task"""
         if context is None:
@@ -373,20 +391,24 @@ class CollaborationOrchestrator:
         from workflow_templates import workflow_manager
         
         # Use workflow template if specified or auto-suggest
+        source = 'decomposer'
         if template_name:
             if workflow_manager.get_template(template_name):
                 subtasks = workflow_manager.create_tasks_from_template(template_name, prompt, context)
+                source = template_name
             else:
                 logger.warning(f"Template '{template_name}' not found, falling back to decomposition")
                 subtasks = self.decomposer.decompose_task(prompt, context)
         else:
             # Auto-suggest template based on prompt
-            suggested_template = workflow_manager.suggest_template(prompt)
+            with tracer.span('orchestrator.template_suggest'):
+                suggested_template = workflow_manager.suggest_template(prompt)
             logger.info(f"Auto-suggested template: {suggested_template}")
             
             try:
                 subtasks = workflow_manager.create_tasks_from_template(suggested_template, prompt, context)
                 context["used_template"] = suggested_template
+                source = suggested_template
             except Exception as e:
                 logger.warning(f"Failed to use suggested template: {e}, falling back to decomposition")
                 subtasks = self.decomposer.decompose_task(prompt, context)
@@ -402,7 +424,8 @@ class CollaborationOrchestrator:
         )
         
         # Assign services to tasks
-        await self.registry.health_check_all()
+        with tracer.span('orchestrator.health_check_all'):
+            await self.registry.health_check_all()
         
         for task in subtasks:
             best_service = self.registry.get_best_service_for_task(task.type)
@@ -413,10 +436,43 @@ class CollaborationOrchestrator:
                 plan.service_allocation[best_service].append(task.id)
         
         self.collaboration_plans[plan_id] = plan
+        ORCHESTRATOR_PLANS_CREATED.labels(source).inc()
+        tracer.current_span().set_attribute('workflow.source', source)
+        tracer.current_span().set_attribute('plan.tasks', len(subtasks))
+        ORCHESTRATOR_PLAN_TASKS.observe(len(subtasks))
         return plan
     
+    @tracer.traced('orchestrator.execute_task')
     async def execute_task(self, session: aiohttp.ClientSession, task: Task) -> Dict[str, Any]:
-        """Execute a single task on assigned service"""
+        """Execute a single task on assigned service, recording its outcome and latency"""
+        service_name = task.assigned_services[0] if task.assigned_services else 'unassigned'
+        span = tracer.current_span()
+        span.set_attribute('task.id', task.id)
+        span.set_attribute('task.type', task.type.value)
+        span.set_attribute('service', service_name)
+        in_flight = ORCHESTRATOR_TASKS_IN_FLIGHT.labels(service_name)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            result = await self._execute_task(session, task)
+        finally:
+            in_flight.dec()
+        ORCHESTRATOR_TASK_DURATION.labels(service_name).observe(time.perf_counter() - started)
+        if "error" not in result:
+            outcome = "success"
+        elif result.get("deadline_exceeded"):
+            outcome = "deadline"
+        elif "retry_after" in result:
+            outcome = "rejected"
+        else:
+            outcome = "error"
+        ORCHESTRATOR_TASKS.labels(service_name, outcome).inc()
+        span.set_attribute('outcome', outcome)
+        if outcome != "success":
+            span.set_error(result.get("error"))
+        return result
+    
+    async def _execute_task(self, session: aiohttp.ClientSession, task: Task) -> Dict[str, Any]:
         if not task.assigned_services:
             return {"error": "No service assigned to task"}
         
@@ -451,27 +507,48 @@ class CollaborationOrchestrator:
             }
             endpoint = f"{service.url}/api/completion"
         
+        backend = SERVICE_BACKENDS.get(service_name, service_name)
         try:
-            async with session.post(
-                endpoint,
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=service.timeout)
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    task.status = "completed"
-                    task.completed_at = datetime.now()
-                    task.result = result
-                    return result
-                else:
-                    error_text = await response.text()
-                    return {"error": f"Service returned {response.status}: {error_text}"}
+            # Later tasks of a plan whose request has run out of time are skipped outright
+            deadline_manager.check('orchestrator_task', service_name)
+            with tracer.span('admission.wait', backend=backend):
+                release = await admission_controller.acquire_async(backend, PRIORITY_COLLABORATION)
+        except AdmissionRejected as e:
+            return {"error": str(e), "retry_after": e.retry_after}
+        except DeadlineExceeded as e:
+            return {"error": str(e), "deadline_exceeded": True}
+        
+        try:
+            with tracer.span('backend.call', SPAN_KIND_CLIENT, backend=service_name) as backend_span:
+                async with session.post(
+                    endpoint,
+                    json=payload,
+                    headers=deadline_manager.inject(tracer.inject()),
+                    timeout=aiohttp.ClientTimeout(total=deadline_manager.timeout(service.timeout))
+                ) as response:
+                    backend_span.set_attribute('http.status_code', response.status)
+                    if response.status == 200:
+                        result = await response.json()
+                        task.status = "completed"
+                        task.completed_at = datetime.now()
+                        task.result = result
+                        return result
+                    else:
+                        error_text = await response.text()
+                        backend_span.set_error(f"HTTP {response.status}")
+                        return {"error": f"Service returned {response.status}: {error_text}"}
         
         except asyncio.TimeoutError:
+            if deadline_manager.exhausted():
+                return {"error": str(deadline_manager.exceeded('orchestrator_task', service_name)),
+                        "deadline_exceeded": True}
             return {"error": f"Timeout waiting for {service_name}"}
         except Exception as e:
             return {"error": f"Error executing task on {service_name}: {str(e)}"}
+        finally:
+            release()
     
+    @tracer.traced('orchestrator.execute_plan')
     async def execute_collaboration_plan(self, plan_id: str) -> Dict[str, Any]:
         """Execute a collaboration plan"""
         if plan_id not in self.collaboration_plans:
@@ -479,6 +556,7 @@ class CollaborationOrchestrator:
         
         plan = self.collaboration_plans[plan_id]
         results = {}
+        started = time.perf_counter()
         
         async with aiohttp.ClientSession() as session:
             if plan.parallel_execution:
@@ -521,6 +599,17 @@ class CollaborationOrchestrator:
                     if "error" not in result:
                         self.completed_tasks[task.id] = task
         
+        mode = "parallel" if plan.parallel_execution else "sequential"
+        failed = sum(1 for result in results.values() if isinstance(result, Exception) or "error" in result)
+        if not failed:
+            outcome = "success"
+        elif failed < len(plan.task_sequence):
+            outcome = "partial"
+        else:
+            outcome = "failed"
+        ORCHESTRATOR_PLAN_DURATION.labels(mode).observe(time.perf_counter() - started)
+        ORCHESTRATOR_PLANS_EXECUTED.labels(mode, outcome).inc()
+        
         return {
             "plan_id": plan_id,
             "status": "completed",
@@ -596,6 +685,7 @@ class CollaborationOrchestrator:
             logger.error(f"Error executing MCP task on {server_name}: {e}")
             return {"error": str(e)}
     
+    @tracer.traced('orchestrator.collaborate_with_mcp')
     async def collaborate_with_mcp(self, prompt: str, template_name: str = None, context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Collaboration workflow that includes MCP server integration"""
         if context is None:
@@ -605,7 +695,8 @@ class CollaborationOrchestrator:
         from workflow_templates import workflow_manager
         
         # Get template with MCP integrations
-        template = workflow_manager.get_template(template_name or workflow_manager.suggest_template(prompt))
+        with tracer.span('orchestrator.template_suggest'):
+            template = workflow_manager.get_template(template_name or workflow_manager.suggest_template(prompt))
         if not template:
             return {"error": "No suitable workflow template found"}
         
@@ -663,7 +754,7 @@ class CollaborationOrchestrator:
         """Get all available MCP capabilities and their servers"""
         capabilities = {}
         
-        for server_name, server in self.mcp_registry.servers.items():
+        for server_name, server in list(self.mcp_registry.servers.items()):
             for capability in server.capabilities:
                 if capability not in capabilities:
                     capabilities[capability] = []
@@ -671,8 +762,8 @@ class CollaborationOrchestrator:
         
         return capabilities
 
-# Global orchestrator instance
-orchestrator = CollaborationOrchestrator()
+# Global orchestrator instance, built on first use
+orchestrator = Lazy(CollaborationOrchestrator, 'orchestrator')
 
 async def main():
     """Test the collaboration orchestrator"""
@@ -11,6 +11,8 @@ from dataclasses import dataclass
 from enum import Enum
 import time
 
+from startup import Lazy
+
 logger = logging.getLogger(__name__)
 
 class ServiceType(Enum):
@@ -635,4 +637,4 @@ class ComprehensiveServiceRegistry:
         }
 
 # Global comprehensive service registry
-comprehensive_registry = ComprehensiveServiceRegistry()
\ No newline at end of file
+comprehensive_registry = Lazy(ComprehensiveServiceRegistry, 'comprehensive_registry')
\ No newline at end of file
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Request Deadlines for the API Gateway
+Every request gets a total time budget from the X-Request-Timeout header, a
+`timeout` field in its body, or a per-endpoint default. The deadline travels in
+a context variable through routing, fallbacks, orchestrator sub-tasks and MCP
+calls; each hop caps its own timeout at the remaining budget, forwards what is
+left downstream, and gives up (closing its backend connection) once it passes.
+"""
+
+import os
+import time
+import asyncio
+import contextvars
+import threading
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Dict, Optional
+
+from metrics import DEADLINE_EXCEEDED
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+# Seconds; long enough for a primary call plus a fallback on the completion routes
+DEFAULT_ENDPOINT_TIMEOUTS = {
+    '/v1/completions': 90.0,
+    '/v1/chat/completions': 90.0,
+    '/v1/collaborate': 300.0,
+    '/v1/collaborate/template': 300.0,
+    '/v1/collaborate/mcp': 300.0,
+    '/v1/execute/<plan_id>': 300.0
+}
+
+_current_deadline: contextvars.ContextVar[Optional['Deadline']] = contextvars.ContextVar(
+    'current_deadline', default=None
+)
+
+def _parse_endpoint_timeouts(spec: str) -> Dict[str, float]:
+    """'/v1/completions=30,/v1/collaborate=120' -> {endpoint: seconds}"""
+    timeouts = {}
+    for part in spec.split(','):
+        endpoint, _, seconds = part.strip().partition('=')
+        if endpoint and seconds:
+            timeouts[endpoint] = float(seconds)
+    return timeouts
+
+@dataclass
+class DeadlineConfig:
+    """Where budgets come from and how small a budget is still worth spending"""
+    enabled: bool = True
+    default_timeout: float = 120.0
+    max_timeout: float = 600.0
+    min_hop_timeout: float = 0.05   # don't start a backend call with less time than this left
+    endpoint_timeouts: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_ENDPOINT_TIMEOUTS))
+
+    @classmethod
+    def from_env(cls) -> 'DeadlineConfig':
+        endpoint_timeouts = dict(DEFAULT_ENDPOINT_TIMEOUTS)
+        endpoint_timeouts.update(_parse_endpoint_timeouts(os.getenv('DEADLINE_ENDPOINT_TIMEOUTS', '')))
+        return cls(
+            enabled=os.getenv('DEADLINES_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            default_timeout=float(os.getenv('DEADLINE_DEFAULT_TIMEOUT', '120')),
+            max_timeout=float(os.getenv('DEADLINE_MAX_TIMEOUT', '600')),
+            min_hop_timeout=float(os.getenv('DEADLINE_MIN_HOP_TIMEOUT', '0.05')),
+            endpoint_timeouts=endpoint_timeouts
+        )
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out; maps to 504 Gateway Timeout"""
+    status_code = 504
+
+    def __init__(self, stage: str, budget: float, detail: str = ''):
+        where = f"{stage} ({detail})" if detail else stage
+        super().__init__(f"Request deadline of {budget:.1f}s exceeded during {where}")
+        self.stage = stage
+        self.budget = budget
+
+class Deadline:
+    """A point in (monotonic) time by which the request must be answered"""
+    __slots__ = ('budget', 'expires_at', 'source')
+
+    def __init__(self, budget: float, source: str = 'default'):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+        self.source = source
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+class DeadlineManager:
+    """Derives request deadlines and applies the current one to each hop"""
+
+    def __init__(self, config: Optional[DeadlineConfig] = None):
+        self.config = config or DeadlineConfig.from_env()
+        self._lock = threading.Lock()
+        self.stats_counters = {'requests': 0, 'from_header': 0, 'from_body': 0, 'exceeded': 0}
+
+    def from_request(self, endpoint: str, headers, data: Any = None) -> Optional[Deadline]:
+        """Deadline for an incoming request: header, then body `timeout`, then endpoint default"""
+        if not self.config.enabled:
+            return None
+        budget, source = None, 'default'
+        for value, origin in ((headers.get(DEADLINE_HEADER), 'header'),
+                              (data.get('timeout') if isinstance(data, dict) else None, 'body')):
+            try:
+                budget = float(value)
+            except (TypeError, ValueError):
+                continue
+            if budget > 0:
+                source = origin
+                break
+            budget = None
+        if budget is None:
+            budget = self.config.endpoint_timeouts.get(endpoint, self.config.default_timeout)
+        with self._lock:
+            self.stats_counters['requests'] += 1
+            if source != 'default':
+                self.stats_counters[f'from_{source}'] += 1
+        return Deadline(min(budget, self.config.max_timeout), source)
+
+    def attach(self, deadline: Optional[Deadline]):
+        """Make a deadline current for this request; returns a token for detach()"""
+        return _current_deadline.set(deadline)
+
+    def detach(self, token):
+        if token is not None:
+            _current_deadline.reset(token)
+
+    @contextmanager
+    def scope(self, deadline: Optional[Deadline]):
+        """Run a block under a specific deadline (None lifts it)"""
+        token = _current_deadline.set(deadline)
+        try:
+            yield deadline
+        finally:
+            _current_deadline.reset(token)
+
+    def current(self) -> Optional[Deadline]:
+        return _current_deadline.get()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left in the current request's budget (None without a deadline)"""
+        deadline = _current_deadline.get()
+        return deadline.remaining() if deadline is not None else None
+
+    def exhausted(self) -> bool:
+        """Whether too little budget is left to start another hop"""
+        deadline = _current_deadline.get()
+        return deadline is not None and deadline.remaining() < self.config.min_hop_timeout
+
+    def timeout(self, default: float) -> float:
+        """A hop's timeout: its own default, capped at the remaining budget. Never zero, which
+        aiohttp and asyncio.wait_for would read as 'no timeout'."""
+        deadline = _current_deadline.get()
+        if deadline is None:
+            return default
+        return max(0.001, min(default, deadline.remaining()))
+
+    def exceeded(self, stage: str, detail: str = '', deadline: Optional[Deadline] = None) -> DeadlineExceeded:
+        """Count an abandoned stage and build the exception to raise for it"""
+        deadline = deadline or _current_deadline.get()
+        DEADLINE_EXCEEDED.labels(stage).inc()
+        with self._lock:
+            self.stats_counters['exceeded'] += 1
+        return DeadlineExceeded(stage, deadline.budget if deadline else 0.0, detail)
+
+    def check(self, stage: str, detail: str = ''):
+        """Raise DeadlineExceeded when there is no budget left for `stage`"""
+        if self.exhausted():
+            raise self.exceeded(stage, detail)
+
+    def inject(self, headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Copy of `headers` carrying the remaining budget for the next hop"""
+        headers = dict(headers or {})
+        deadline = _current_deadline.get()
+        if deadline is not None:
+            headers[DEADLINE_HEADER] = f'{deadline.remaining():.3f}'
+        return headers
+
+    async def run_within(self, coro: Awaitable[Any], stage: str) -> Any:
+        """Await `coro`, cancelling it (and the requests it has open) when the budget runs out"""
+        remaining = self.remaining()
+        if remaining is None:
+            return await coro
+        try:
+            return await asyncio.wait_for(coro, remaining)
+        except asyncio.TimeoutError:
+            raise self.exceeded(stage)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.stats_counters)
+        return {
+            'enabled': self.config.enabled,
+            'default_timeout': self.config.default_timeout,
+            'max_timeout': self.config.max_timeout,
+            'endpoint_timeouts': self.config.endpoint_timeouts,
+            **counters
+        }
+
+# Global deadline manager instance
+deadline_manager = DeadlineManager()
@@ -5,7 +5,7 @@ Upgrades existing api_gateway.py with intelligent routing capabilities
 Integrates RouteLLM concepts with current architecture
 """
 
-import re
+import os
 import time
 import hashlib
 from typing import Dict, Any, Optional, List, Tuple
@@ -13,19 +13,24 @@ from dataclasses import dataclass
 from enum import Enum
 import logging
 
+from circuit_breaker import circuit_breakers
+from metrics import ROUTER_DECISIONS, ROUTER_DECISION_DURATION, BACKEND_REQUEST_DURATION
+from startup import Lazy, lazy_import
+from prompt_features import prompt_analyser
+from routing_cache import RoutingDecisionCache
+from latency_stats import LatencyStatsConfig, ModelLatencyStats
+from routing_policy import RoutingPolicy, context_key
+from load_signals import load_signals
+
 logger = logging.getLogger(__name__)
 
-try:
-    import numpy as np
-    HAS_NUMPY = True
-except ImportError:
-    HAS_NUMPY = False
-    # Simple numpy replacement for basic functions
-    class SimpleNumPy:
-        @staticmethod
-        def mean(data):
-            return sum(data) / len(data) if data else 0.0
-    np = SimpleNumPy()
+# Learned task/complexity classifier; imported (with numpy) only when a trained model is configured
+task_classifier = lazy_import('task_classifier', 'task_classifier') if os.getenv('TASK_CLASSIFIER_MODEL') else None
+
+def _latency_bonus(avg_latency: float) -> float:
+    # Models at or above 2s average latency all score the same here. Rounded to 0.001 (50ms of
+    # latency) so every completion's small shift in the mean doesn't invalidate cached scores
+    return round(max(0, (2.0 - avg_latency) * 0.02), 3)
 
 class ComplexityLevel(Enum):
     SIMPLE = "simple"
@@ -33,6 +38,8 @@ class ComplexityLevel(Enum):
     COMPLEX = "complex"
     EXPERT = "expert"
 
+COMPLEXITY_VALUES = frozenset(level.value for level in ComplexityLevel)
+
 @dataclass
 class ModelCapability:
     name: str
@@ -93,57 +100,46 @@ class IntelligentRouter:
             )
         }
         
-        self.routing_cache = {}
-        self.performance_metrics = {}
+        self.routing_cache = RoutingDecisionCache()
+        self.latency_config = LatencyStatsConfig.from_env()
+        self.performance_metrics: Dict[str, ModelLatencyStats] = {}
+        self.policy = RoutingPolicy()
         
     def analyze_complexity(self, prompt: str) -> ComplexityLevel:
+        """Prompt complexity from the learned classifier when it is confident, else the heuristic"""
+        if task_classifier is not None:
+            learned = task_classifier.predict('complexity', prompt)
+            if learned in COMPLEXITY_VALUES:
+                return ComplexityLevel(learned)
+        return self.heuristic_complexity(prompt)
+    
+    def heuristic_complexity(self, prompt: str) -> ComplexityLevel:
         """Analyze prompt complexity using multiple indicators"""
         
-        prompt_lower = prompt.lower()
+        features = prompt_analyser.analyse(prompt)
         
         # Length factor (longer prompts often more complex)
-        length_score = min(len(prompt) / 800, 1.0)
-        
-        # Expert-level indicators
-        expert_patterns = [
-            r'\b(theorem|proof|lemma|corollary)\b',
-            r'\b(quantum|cryptography|optimization|complexity theory)\b',
-            r'\b(differential equations|linear algebra|calculus)\b',
-            r'[∑∫∂∆∇]',  # Mathematical symbols
-            r'\b(algorithm analysis|big o|asymptotic)\b'
-        ]
-        expert_score = sum(1 for pattern in expert_patterns 
-                         if re.search(pattern, prompt_lower))
-        
-        # Complex-level indicators  
-        complex_patterns = [
-            r'\b(implement|architecture|design pattern|optimization)\b',
-            r'\b(analysis|synthesis|evaluate|compare)\b',
-            r'\b(machine learning|neural network|data structure)\b',
-            r'\b(database design|system architecture)\b'
-        ]
-        complex_score = sum(1 for pattern in complex_patterns 
-                          if re.search(pattern, prompt_lower))
-        
-        # Technical indicators
-        technical_patterns = [
-            r'\b(function|class|method|variable)\b',
-            r'\b(calculate|solve|determine|find)\b',
-            r'\b(algorithm|programming|debug)\b'
-        ]
-        technical_score = sum(1 for pattern in technical_patterns 
-                            if re.search(pattern, prompt_lower))
+        length_score = min(features.length / 800, 1.0)
+        
+        # Expert-level indicators (proofs, advanced topics, higher math, math symbols, big-O)
+        expert_score = features.count('expert')
+        
+        # Complex-level indicators (architecture, evaluation, ML, system design)
+        complex_score = features.count('complex')
+        
+        # Technical indicators (code terms, problem solving, programming)
+        technical_score = features.count('technical')
         
         # Code blocks or structured content
         structure_score = 0
-        if '```' in prompt or prompt.count('\n') > 10:
+        if features.code_fence or features.newlines > 10:
             structure_score = 1
         
         # Multiple questions or steps
-        question_score = min(prompt.count('?') + prompt.count('step') * 0.5, 2)
+        question_score = min(features.questions + features.steps * 0.5, 2)
         
         # Determine complexity level
-        if expert_score >= 2 or ('∫' in prompt and 'solve' in prompt_lower):
+        if expert_score >= 2 or (features.integral and features.has('solve')):
             return ComplexityLevel.EXPERT
         elif expert_score >= 1 or complex_score >= 2:
             return ComplexityLevel.COMPLEX  
@@ -155,47 +151,27 @@ class IntelligentRouter:
             return ComplexityLevel.SIMPLE
     
     def classify_task_type(self, prompt: str) -> str:
+        """Task type from the learned classifier when it is confident, else the heuristic"""
+        if task_classifier is not None:
+            learned = task_classifier.predict('task_type', prompt)
+            if learned in self.models:
+                return learned
+        return self.heuristic_task_type(prompt)
+    
+    def heuristic_task_type(self, prompt: str) -> str:
         """Enhanced task classification with better pattern matching"""
         
-        prompt_lower = prompt.lower()
+        features = prompt_analyser.analyse(prompt)
         
-        # Scoring system for each task type
+        # Scoring system for each task type: how many of its keywords the prompt contains
         scores = {
-            'reasoning': 0,
-            'coding': 0,
-            'creative': 0,
-            'advanced': 0,
+            'reasoning': features.count('reasoning'),
+            'coding': features.count('coding'),
+            'creative': features.count('creative'),
+            'advanced': features.count('advanced'),
             'general': 0
         }
         
-        # Reasoning indicators
-        reasoning_patterns = [
-            'solve', 'calculate', 'prove', 'analyze', 'logic', 'theorem',
-            'equation', 'mathematical', 'reasoning', 'deduce', 'infer'
-        ]
-        scores['reasoning'] = sum(1 for pattern in reasoning_patterns if pattern in prompt_lower)
-        
-        # Coding indicators
-        coding_patterns = [
-            'code', 'function', 'class', 'python', 'javascript', 'programming',
-            'debug', 'algorithm', 'implementation', 'syntax', 'compile'
-        ]
-        scores['coding'] = sum(1 for pattern in coding_patterns if pattern in prompt_lower)
-        
-        # Creative indicators
-        creative_patterns = [
-            'story', 'poem', 'creative', 'write', 'narrative', 'character',
-            'plot', 'fiction', 'imagine', 'describe'
-        ]
-        scores['creative'] = sum(1 for pattern in creative_patterns if pattern in prompt_lower)
-        
-        # Advanced/research indicators
-        advanced_patterns = [
-            'research', 'academic', 'paper', 'study', 'analysis', 'review',
-            'synthesis', 'comparison', 'evaluation', 'methodology'
-        ]
-        scores['advanced'] = sum(1 for pattern in advanced_patterns if pattern in prompt_lower)
-        
         # Find the highest scoring task type
         max_score = max(scores.values())
         if max_score == 0:
@@ -249,32 +225,78 @@ class IntelligentRouter:
             score -= cost_penalty * 0.05
         
         # Latency factor (minor consideration)
-        latency_bonus = max(0, (2.0 - model.avg_latency) * 0.02)
-        score += latency_bonus
+        score += _latency_bonus(self.routing_latency(model))
         
         return max(0.0, score)
     
     def get_optimal_model(self, prompt: str, task_type: Optional[str] = None, 
                          budget_factor: float = 1.0) -> Tuple[str, Dict[str, Any]]:
         """Get optimal model for the given prompt and constraints"""
-        
-        # Auto-classify if task_type not provided
-        if not task_type:
-            task_type = self.classify_task_type(prompt)
-        
-        # Analyze complexity
-        complexity = self.analyze_complexity(prompt)
-        
-        # Calculate scores for all models
-        model_scores = {}
-        for model_name, model_config in self.models.items():
-            score = self.calculate_routing_score(
-                model_config, task_type, complexity, budget_factor
-            )
-            model_scores[model_name] = score
-        
-        # Select best model
-        best_model = max(model_scores, key=model_scores.get)
+        started = time.perf_counter()
+        
+        # Reuse the analysis (and scores, if no metric has moved them) of an identical request
+        epoch = self.routing_cache.epoch
+        cache_key = self.routing_cache.key(prompt, task_type, budget_factor)
+        cached = self.routing_cache.get(cache_key, epoch)
+        if cached is not None:
+            (task_type, complexity), model_scores = cached
+        else:
+            # Auto-classify if task_type not provided
+            if not task_type:
+                task_type = self.classify_task_type(prompt)
+            
+            # Analyze complexity
+            complexity = self.analyze_complexity(prompt)
+            model_scores = None
+        
+        if model_scores is None:
+            # Calculate scores for all models
+            model_scores = {}
+            for model_name, model_config in self.models.items():
+                score = self.calculate_routing_score(
+                    model_config, task_type, complexity, budget_factor
+                )
+                model_scores[model_name] = score
+            self.routing_cache.put(cache_key, (task_type, complexity), model_scores, epoch)
+        
+        # Live load is never cached: penalise backends by their expected queueing delay
+        scores, queue_delays = model_scores, {}
+        if load_signals.config.enabled:
+            queue_delays = load_signals.queue_delays({
+                name: self.routing_latency(config) for name, config in self.models.items()
+            })
+            if queue_delays:
+                scores = {
+                    model: max(0.0, score - load_signals.penalty(queue_delays.get(model, 0.0)))
+                    for model, score in model_scores.items()
+                }
+        
+        # The policy orders models from those scores and what traffic has shown per
+        # (task type, complexity); skip backends whose circuit breaker is open. This is a
+        # read-only check: the dispatch path acquires the breaker (and any half-open probe
+        # slot) when it actually calls the backend, so dry-run selections hold nothing
+        routing_context = context_key(task_type, complexity.value)
+        ranked, explored = self.policy.rank(routing_context, scores)
+        best_model = next((model for model in ranked if circuit_breakers.allow(model)), None)
+        circuit_fail_open = best_model is None
+        if circuit_fail_open:
+            # Every breaker is open: fail open to the best-scoring model rather than refuse
+            best_model = ranked[0]
+            circuit_open = [model for model in ranked if model != best_model]
+        else:
+            circuit_open = ranked[:ranked.index(best_model)]
+        
+        routing_reason = self._get_routing_reason(best_model, task_type, complexity)
+        if circuit_open:
+            routing_reason += f" (circuit open: {', '.join(circuit_open)})"
+        load_shifted_from = None
+        if scores is not model_scores:
+            unloaded_best = max(model_scores, key=model_scores.get)
+            if unloaded_best != max(scores, key=scores.get):
+                load_shifted_from = unloaded_best
+                load_signals.record_shift()
+                routing_reason += (f" (load: routed away from {unloaded_best}, "
+                                   f"~{queue_delays[unloaded_best]:.1f}s expected queue)")
         
         # Routing metadata
         routing_info = {
@@ -282,14 +304,30 @@ class IntelligentRouter:
             'detected_complexity': complexity.value,
             'model_scores': model_scores,
             'selected_model': best_model,
-            'routing_reason': self._get_routing_reason(best_model, task_type, complexity),
+            'routing_reason': routing_reason,
             'estimated_cost': self.models[best_model].cost_per_token,
             'estimated_latency': self.models[best_model].avg_latency,
-            'fallback_models': self.models[best_model].fallback_models
+            'fallback_models': [
+                model for model in self.models[best_model].fallback_models
+                if circuit_breakers.allow(model)
+            ],
+            'circuit_open': circuit_open,
+            'circuit_fail_open': circuit_fail_open,
+            'routing_context': routing_context,
+            'policy': self.policy.config.policy,
+            'explored': explored,
+            'queue_delays': {model: round(delay, 3) for model, delay in queue_delays.items()},
+            'load_shifted_from': load_shifted_from
         }
         
+        ROUTER_DECISION_DURATION.observe(time.perf_counter() - started)
+        ROUTER_DECISIONS.labels(best_model, complexity.value).inc()
         return best_model, routing_info
     
+    def invalidate_routing_cache(self):
+        """Call after editing a model's capability, cost or latency figures directly"""
+        self.routing_cache.invalidate('model definitions changed')
+    
     def _get_routing_reason(self, model: str, task_type: str, complexity: ComplexityLevel) -> str:
         """Generate human-readable routing explanation"""
         model_config = self.models[model]
@@ -309,42 +347,62 @@ class IntelligentRouter:
             
         return f"Selected {model} because it's " + " and ".join(reasons) if reasons else f"best overall match"
     
-    def update_performance_metrics(self, model: str, latency: float, success: bool):
-        """Update model performance metrics based on actual usage"""
-        if model not in self.performance_metrics:
-            self.performance_metrics[model] = {
-                'total_requests': 0,
-                'success_rate': 0.0,
-                'avg_latency': 0.0,
-                'latency_samples': []
-            }
-        
-        metrics = self.performance_metrics[model]
-        metrics['total_requests'] += 1
-        
-        # Update latency (keep last 100 samples)
-        metrics['latency_samples'].append(latency)
-        if len(metrics['latency_samples']) > 100:
-            metrics['latency_samples'].pop(0)
-        metrics['avg_latency'] = np.mean(metrics['latency_samples'])
-        
-        # Update success rate
-        success_count = getattr(metrics, 'success_count', 0)
-        if success:
-            success_count += 1
-        metrics['success_count'] = success_count
-        metrics['success_rate'] = success_count / metrics['total_requests']
+    def _model_stats(self, model: str) -> ModelLatencyStats:
+        stats = self.performance_metrics.get(model)
+        if stats is None:
+            stats = self.performance_metrics.setdefault(model, ModelLatencyStats(self.latency_config))
+        return stats
+    
+    def routing_latency(self, model: ModelCapability) -> float:
+        """Latency used to score a model: the observed ROUTER_LATENCY_SIGNAL (mean, ewma or a
+        tail percentile), or its configured figure until it has served a request"""
+        stats = self.performance_metrics.get(model.name)
+        observed = stats.latency(self.latency_config.routing_signal) if stats is not None else None
+        return model.avg_latency if observed is None else observed
+    
+    def update_performance_metrics(self, model: str, latency: float, success: bool,
+                                   routing_context: Optional[str] = None, quality: Optional[float] = None):
+        """Update model performance metrics based on actual usage; with the request's
+        routing_context the routing policy learns from it too (quality in [0, 1] if known)"""
+        config = self.models.get(model)
+        before = _latency_bonus(self.routing_latency(config)) if config else None
+        
+        stats = self._model_stats(model)
+        stats.record(latency, success)
         
         # Update model config with real performance data
-        if model in self.models:
-            self.models[model].avg_latency = metrics['avg_latency']
+        if config is not None:
+            config.avg_latency = stats.mean
+            after = _latency_bonus(self.routing_latency(config))
+            if after != before:
+                # Only now do cached scores differ from a fresh computation
+                self.routing_cache.invalidate(f"{model} latency bonus {before:.4f} -> {after:.4f}")
+        
+        self.policy.update(routing_context, model, latency, success, quality)
+        
+        # Feed the backend's circuit breaker
+        circuit_breakers.record(model, success)
+        BACKEND_REQUEST_DURATION.labels(model, 'success' if success else 'error').observe(latency)
+    
+    def latency_percentile(self, model: str, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """Observed latency percentile for a model, or None with too few samples"""
+        stats = self.performance_metrics.get(model)
+        if stats is None or stats.samples < max(1, min_samples):
+            return None
+        return stats.percentile(percentile)
     
     def get_analytics(self) -> Dict[str, Any]:
         """Get routing analytics"""
         return {
             'total_models': len(self.models),
-            'performance_metrics': self.performance_metrics,
+            'latency_signal': self.latency_config.routing_signal,
+            'performance_metrics': {model: stats.snapshot() for model, stats in list(self.performance_metrics.items())},
             'cache_size': len(self.routing_cache),
+            'routing_cache': self.routing_cache.stats(),
+            'routing_policy': self.policy.stats(),
+            'load_signals': load_signals.stats(),
+            'circuit_breakers': circuit_breakers.stats(),
+            'task_classifier': task_classifier.stats() if task_classifier is not None else None,
             'model_capabilities': {name: {
                 'cost_per_token': config.cost_per_token,
                 'performance_score': config.performance_score,
@@ -355,4 +413,4 @@ class IntelligentRouter:
         }
 
 # Global router instance
-intelligent_router = IntelligentRouter()
\ No newline at end of file
+intelligent_router = Lazy(IntelligentRouter, 'intelligent_router')
\ No newline at end of file
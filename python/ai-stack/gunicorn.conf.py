@@ -0,0 +1,21 @@
+"""
+Gunicorn settings for the AI Stack Gateway
+Enables prometheus_client multiprocess mode so /metrics aggregates every worker.
+Worker count, bind address and logging stay on the command line.
+"""
+
+import os
+import shutil
+
+# Workers inherit this before importing metrics.py
+multiproc_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus-multiproc')
+
+def on_starting(server):
+    """Start from an empty metrics directory so samples from a previous run are not served"""
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges (in-flight counts) from the aggregate"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Background Health Prober for the API Gateway
+Probes every backend (and the orchestrator's service view, once it has been
+built) on a jittered interval, spreading the probes of a round across it, and
+keeps a timestamped snapshot so /health, /models and /services answer from
+memory instead of probing on every poll.
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Endpoints tried in turn on each backend until one answers 200 (which marks it online);
+# /v1/models first since its body also lists the backend's models
+HEALTH_ENDPOINTS = ['/v1/models', '/health', '/api/v1/info']
+
+@dataclass
+class ProberConfig:
+    """Probe cadence and timeouts"""
+    interval: float = 10.0
+    jitter: float = 0.2             # +/- fraction of the interval
+    timeout: float = 3.0            # per probe request
+    stale_after: float = 30.0       # snapshots older than this are flagged stale
+    fresh_timeout: float = 10.0     # how long a ?fresh=1 caller waits for a probe round
+
+    @classmethod
+    def from_env(cls) -> 'ProberConfig':
+        interval = float(os.getenv('HEALTH_PROBE_INTERVAL', '10'))
+        return cls(
+            interval=interval,
+            jitter=float(os.getenv('HEALTH_PROBE_JITTER', '0.2')),
+            timeout=float(os.getenv('HEALTH_PROBE_TIMEOUT', '3')),
+            stale_after=float(os.getenv('HEALTH_PROBE_STALE_AFTER', str(interval * 3))),
+            fresh_timeout=float(os.getenv('HEALTH_PROBE_FRESH_TIMEOUT', '10'))
+        )
+
+@dataclass
+class Snapshot:
+    """Result of one probe round"""
+    data: Any
+    checked_at: float
+    duration: float
+    error: Optional[str] = None
+
+    def describe(self, stale_after: float, fresh: bool = False) -> Dict[str, Any]:
+        """Snapshot metadata reported alongside the cached data"""
+        age = max(0.0, time.time() - self.checked_at)
+        return {
+            'checked_at': datetime.fromtimestamp(self.checked_at).isoformat(),
+            'age_seconds': round(age, 3),
+            'stale': age > stale_after,
+            'probe_duration_ms': round(self.duration * 1000, 1),
+            'fresh': fresh,
+            'error': self.error
+        }
+
+async def _probe_endpoint(session: 'aiohttp.ClientSession', url: str) -> Dict[str, Any]:
+    started = time.monotonic()
+    try:
+        async with session.get(url) as response:
+            body = None
+            if response.status == 200 and url.endswith('/v1/models'):
+                try:
+                    body = await response.json(content_type=None)
+                except ValueError:
+                    body = None
+            return {'status': response.status, 'body': body,
+                    'latency_ms': round((time.monotonic() - started) * 1000, 1)}
+    except Exception as e:
+        return {'status': None, 'error': str(e) or type(e).__name__}
+
+async def probe_backend(session: 'aiohttp.ClientSession', name: str, url: str) -> Dict[str, Any]:
+    """Probe one backend's health endpoints in turn, stopping at the first healthy one"""
+    base = url.rstrip('/')
+    by_path: Dict[str, Dict[str, Any]] = {}
+    for path in HEALTH_ENDPOINTS:
+        by_path[path] = await _probe_endpoint(session, base + path)
+        if by_path[path]['status'] == 200:
+            break
+    results = list(by_path.values())
+
+    healthy = [r for r in results if r['status'] == 200]
+    entry = {
+        'status': 'online' if healthy else 'offline',
+        'url': url,
+        'latency_ms': min(r['latency_ms'] for r in healthy) if healthy else None
+    }
+
+    models = by_path.get('/v1/models', {'status': None})
+    if models['status'] == 200 and models.get('body') is not None:
+        entry['models'] = models['body']
+    elif models['status'] is None:
+        entry['models_error'] = models.get('error')
+    if not healthy:
+        entry['error'] = next((r.get('error') for r in results if r.get('error')), None)
+    return entry
+
+async def probe_replicas(session: 'aiohttp.ClientSession', name: str, urls: List[str]) -> Dict[str, Any]:
+    """Probe every replica of a backend; the backend is online while any replica is"""
+    replicas = await asyncio.gather(*[probe_backend(session, name, url) for url in urls])
+    online = [replica for replica in replicas if replica['status'] == 'online']
+    entry = dict(min(online, key=lambda replica: replica['latency_ms']) if online else replicas[0])
+    entry['endpoints'] = [{key: replica[key] for key in ('status', 'url', 'latency_ms', 'error') if key in replica}
+                          for replica in replicas]
+    return entry
+
+async def probe_backends(backends: Dict[str, Union[str, List[str]]], timeout: float = 3.0) -> Dict[str, Dict[str, Any]]:
+    """Probe every backend (each replica, for a list of URLs) concurrently; returns {name: entry}"""
+    import aiohttp  # imported on the prober's first round, not at gateway startup
+
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(timeout=client_timeout) as session:
+        entries = await asyncio.gather(*[
+            probe_backend(session, name, urls) if isinstance(urls, str) else
+            probe_backend(session, name, urls[0]) if len(urls) == 1 else
+            probe_replicas(session, name, urls)
+            for name, urls in backends.items()
+        ])
+    return dict(zip(backends.keys(), entries))
+
+class HealthProber:
+    """Runs registered probes on one event loop and caches their latest snapshot"""
+
+    def __init__(self, config: Optional[ProberConfig] = None):
+        self.config = config or ProberConfig.from_env()
+        self.probes: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self.ready: Dict[str, Callable[[], bool]] = {}
+        self.snapshots: Dict[str, Snapshot] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.rounds = 0
+
+    def register(self, name: str, probe: Callable[[], Awaitable[Any]],
+                 ready: Optional[Callable[[], bool]] = None):
+        """Add a named probe coroutine function to every round. With `ready`, background
+        rounds skip the probe until ready() is true (callers asking for it still run it)"""
+        self.probes[name] = probe
+        if ready is not None:
+            self.ready[name] = ready
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Start probing on `loop` (call from inside it), or on a dedicated daemon thread"""
+        with self._lock:
+            if self._loop is not None:
+                return
+            if loop is not None:
+                self._loop = loop
+                self._task = loop.create_task(self.run())
+                self._ready.set()
+                return
+            self._loop = asyncio.new_event_loop()
+
+        def _serve():
+            asyncio.set_event_loop(self._loop)
+            self._task = self._loop.create_task(self.run())
+            self._loop.call_soon(self._ready.set)
+            self._loop.run_forever()
+
+        threading.Thread(target=_serve, name='health-prober', daemon=True).start()
+        self._ready.wait(timeout=5)
+
+    async def stop(self):
+        """Stop probing (from the prober's own loop)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _due(self, name: str) -> bool:
+        ready = self.ready.get(name)
+        return ready is None or ready()
+
+    async def run(self):
+        """Probe forever on a jittered interval, starting each probe of a round in its
+        own slice of the interval rather than all at once"""
+        while True:
+            names = [name for name in list(self.probes) if self._due(name)]
+            slot = self.config.interval / max(1, len(names))
+            jitter = slot * self.config.jitter
+            started = []
+            for name in names or [None]:
+                if name is not None:
+                    started.append(asyncio.ensure_future(self.refresh(name)))
+                await asyncio.sleep(max(0.1, slot + random.uniform(-jitter, jitter)))
+            await asyncio.gather(*started, return_exceptions=True)
+            self.rounds += 1
+
+    async def refresh(self, name: str) -> Snapshot:
+        """Run one probe now, sharing a round that is already in flight"""
+        inflight = self._inflight.get(name)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[name] = future
+        started = time.monotonic()
+        try:
+            data = await self.probes[name]()
+            snapshot = Snapshot(data, time.time(), time.monotonic() - started)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            logger.warning(f"Health probe '{name}' failed: {e}")
+            previous = self.snapshots.get(name)
+            snapshot = Snapshot(previous.data if previous else None, time.time(),
+                                time.monotonic() - started, error=str(e))
+        finally:
+            self._inflight.pop(name, None)
+
+        self.snapshots[name] = snapshot
+        future.set_result(snapshot)
+        return snapshot
+
+    def get(self, name: str, fresh: bool = False) -> Tuple[Snapshot, bool]:
+        """Snapshot for a probe from any thread; probes synchronously when fresh or empty.
+        Returns (snapshot, probed_now)"""
+        self.start()
+        snapshot = self.snapshots.get(name)
+        if snapshot is not None and not fresh:
+            return snapshot, False
+        future = asyncio.run_coroutine_threadsafe(self.refresh(name), self._loop)
+        return future.result(timeout=self.config.fresh_timeout), True
+
+    async def get_async(self, name: str, fresh: bool = False) -> Tuple[Snapshot, bool]:
+        """Coroutine variant of get() usable from any event loop"""
+        self.start()
+        snapshot = self.snapshots.get(name)
+        if snapshot is not None and not fresh:
+            return snapshot, False
+        if asyncio.get_running_loop() is self._loop:
+            coro = self.refresh(name)
+        else:
+            coro = asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self.refresh(name), self._loop))
+        return await asyncio.wait_for(coro, timeout=self.config.fresh_timeout), True
+
+    def describe(self, snapshot: Snapshot, fresh: bool = False) -> Dict[str, Any]:
+        return snapshot.describe(self.config.stale_after, fresh)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'interval': self.config.interval,
+            'rounds': self.rounds,
+            'snapshots': {name: self.describe(snapshot) for name, snapshot in list(self.snapshots.items())}
+        }
+
+# Global health prober instance
+health_prober = HealthProber()
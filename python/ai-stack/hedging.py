@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Hedged Backend Requests for the API Gateway
+When the routed backend hasn't answered within its observed latency percentile,
+the first fallback is started in parallel and whichever succeeds first wins; the
+loser's backend connection is shut down so the backend stops generating for it.
+A token-bucket budget caps the extra load that hedges put on the backends.
+"""
+
+import os
+import socket
+import threading
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class HedgeConfig:
+    """Hedging policy settings"""
+    enabled: bool = True
+    percentile: float = 95.0        # primary latency percentile that triggers a hedge
+    min_samples: int = 20           # below this, default_delay is used instead
+    default_delay: float = 2.0
+    min_delay: float = 0.05
+    max_delay: float = 10.0
+    budget_ratio: float = 0.05      # hedges allowed per primary request (0.05 = 5% extra load)
+    budget_burst: float = 10.0      # hedges that may be spent back to back
+    max_workers: int = 128
+
+    @classmethod
+    def from_env(cls) -> 'HedgeConfig':
+        return cls(
+            enabled=os.getenv('HEDGING_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            percentile=float(os.getenv('HEDGE_PERCENTILE', '95')),
+            min_samples=int(os.getenv('HEDGE_MIN_SAMPLES', '20')),
+            default_delay=float(os.getenv('HEDGE_DEFAULT_DELAY', '2.0')),
+            min_delay=float(os.getenv('HEDGE_MIN_DELAY', '0.05')),
+            max_delay=float(os.getenv('HEDGE_MAX_DELAY', '10.0')),
+            budget_ratio=float(os.getenv('HEDGE_BUDGET_RATIO', '0.05')),
+            budget_burst=float(os.getenv('HEDGE_BUDGET_BURST', '10')),
+            max_workers=int(os.getenv('HEDGE_MAX_WORKERS', '128'))
+        )
+
+class HedgeBudget:
+    """Token bucket refilled by primary requests and drained by hedges"""
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def available(self) -> bool:
+        """Whether a hedge could be paid for right now (does not spend)"""
+        with self._lock:
+            return self.tokens >= 1.0
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+class Attempt:
+    """Cancellation handle for one raced call. Backend clients register the connection a
+    request is using while it is checked out; cancel() shuts those sockets down, which
+    fails the blocked read and makes vLLM abort the generation."""
+
+    def __init__(self):
+        self.cancelled = False
+        self._connections: List[Any] = []
+        self._lock = threading.Lock()
+
+    def register(self, connection: Any):
+        with self._lock:
+            self._connections.append(connection)
+
+    def unregister(self, connection: Any):
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            sock = getattr(connection, 'sock', None)
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+# The raced call running in this context, if any
+current_attempt: contextvars.ContextVar[Optional[Attempt]] = contextvars.ContextVar('hedge_attempt', default=None)
+
+def attempt_cancelled() -> bool:
+    """Whether the current call lost a hedge race (its failure is not the backend's fault)"""
+    attempt = current_attempt.get()
+    return attempt is not None and attempt.cancelled
+
+class HedgeFailed(Exception):
+    """Every call started by a race failed"""
+
+    def __init__(self, primary_error: BaseException, hedged: bool):
+        super().__init__(str(primary_error))
+        self.primary_error = primary_error
+        self.hedged = hedged
+
+class Hedger:
+    """Runs a primary call with an optional delayed hedge call"""
+
+    def __init__(self, config: Optional[HedgeConfig] = None):
+        self.config = config or HedgeConfig.from_env()
+        self.budget = HedgeBudget(self.config.budget_ratio, self.config.budget_burst)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.stats_counters = {
+            'requests': 0,
+            'hedges_fired': 0,
+            'hedge_wins': 0,
+            'primary_wins': 0,
+            'budget_denied': 0,
+            'pool_full': 0,
+            'losers_cancelled': 0
+        }
+        self._slots = 0
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.stats_counters[counter] += 1
+
+    def _reserve(self) -> bool:
+        """Claim an executor thread so queued work is never mistaken for a slow backend"""
+        with self._lock:
+            if self._slots >= self.config.max_workers:
+                return False
+            self._slots += 1
+            return True
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._slots -= 1
+
+    def _submit(self, attempt: Attempt, fn: Callable[[], Any]):
+        """Run fn on a reserved thread in a copy of the caller's context (so trace spans keep
+        their parent) with `attempt` as its cancellation handle"""
+        def run():
+            current_attempt.set(attempt)
+            return fn()
+
+        future = self._get_executor().submit(contextvars.copy_context().run, run)
+        future.add_done_callback(self._release)
+        return future
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.config.max_workers,
+                    thread_name_prefix='hedge'
+                )
+            return self._executor
+
+    def hedge_delay(self, observed: Optional[float]) -> float:
+        """Delay before hedging, from the primary's observed latency percentile"""
+        delay = observed if observed is not None else self.config.default_delay
+        return max(self.config.min_delay, min(self.config.max_delay, delay))
+
+    def race(self, primary: Callable[[], Any], hedge: Optional[Callable[[], Any]],
+             delay: float) -> Tuple[Any, bool]:
+        """Run primary, hedging after `delay` seconds; returns (result, hedge_won).
+
+        Raises HedgeFailed when the primary failed and the hedge (if one was
+        started) failed too. A fast primary failure is raised without hedging,
+        leaving the caller's sequential fallbacks to take over. The primary only
+        moves to the hedge pool when the budget and a free thread for it allow a
+        hedge; otherwise it runs inline.
+        """
+        self._count('requests')
+        self.budget.earn()
+
+        # When no hedge can fire for this request, keep the primary on the caller's thread
+        hedgeable = self.config.enabled and hedge is not None and self.budget.available()
+        if hedgeable and not self._reserve():
+            self._count('pool_full')
+            hedgeable = False
+        if not hedgeable:
+            try:
+                return primary(), False
+            except Exception as e:
+                raise HedgeFailed(e, hedged=False)
+
+        attempts = {False: Attempt(), True: Attempt()}
+        primary_future = self._submit(attempts[False], primary)
+        done, _ = wait([primary_future], timeout=delay)
+        fire = not done and self.budget.try_spend()
+        if fire and not self._reserve():
+            self._count('pool_full')
+            fire = False
+        if not fire:
+            if not done:
+                self._count('budget_denied')
+            try:
+                result = primary_future.result()
+            except Exception as e:
+                raise HedgeFailed(e, hedged=False)
+            self._count('primary_wins')
+            return result, False
+
+        self._count('hedges_fired')
+        hedge_future = self._submit(attempts[True], hedge)
+        labels = {primary_future: False, hedge_future: True}
+        pending = set(labels)
+        primary_error: Optional[BaseException] = None
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    self._cancel_losers(pending, labels, attempts)
+                    hedge_won = labels[future]
+                    self._count('hedge_wins' if hedge_won else 'primary_wins')
+                    return future.result(), hedge_won
+                if not labels[future]:
+                    primary_error = error
+                else:
+                    logger.error(f"Hedge request failed: {error}")
+
+        raise HedgeFailed(primary_error or error, hedged=True)
+
+    def _cancel_losers(self, pending, labels, attempts):
+        """Stop losing calls: a queued one never starts, one mid-request has its backend
+        connection shut down so the backend stops generating for it"""
+        for future in pending:
+            attempts[labels[future]].cancel()
+            if not future.cancel():
+                self._count('losers_cancelled')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.stats_counters)
+        requests = counters['requests']
+        hedges = counters['hedges_fired']
+        return {
+            'enabled': self.config.enabled,
+            'percentile': self.config.percentile,
+            'budget_ratio': self.config.budget_ratio,
+            'budget_tokens': round(self.budget.tokens, 3),
+            'hedge_rate': round(hedges / requests, 4) if requests else 0.0,
+            'hedge_win_rate': round(counters['hedge_wins'] / hedges, 4) if hedges else 0.0,
+            **counters
+        }
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+# Global hedger instance
+hedger = Hedger()
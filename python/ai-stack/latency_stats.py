@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Per-Model Latency and Outcome Statistics for the Router
+Constant-memory, O(1)-per-request bookkeeping for each backend model: a fixed
+ring buffer of recent latencies (running mean), an EWMA, a log-bucketed quantile
+sketch for p50/p95/p99 (or any percentile) that decays so it follows recent
+behaviour, lifetime success/error counters, and per-second buckets for
+time-windowed request and error rates.
+"""
+
+import os
+import math
+import time
+import threading
+import logging
+from array import array
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# What the router treats as a model's latency when scoring it
+LATENCY_SIGNALS = ('mean', 'ewma', 'p50', 'p95', 'p99')
+
+@dataclass
+class LatencyStatsConfig:
+    """Window sizes and smoothing for per-model statistics"""
+    window_size: int = 100              # samples in the ring buffer (mean, min_samples checks)
+    ewma_alpha: float = 0.1
+    sketch_accuracy: float = 0.02       # relative error of sketch quantiles
+    sketch_half_life: int = 1024        # samples after which older observations count half
+    rate_window: int = 60               # seconds covered by the windowed request/error rates
+    routing_signal: str = 'mean'        # one of LATENCY_SIGNALS
+
+    @classmethod
+    def from_env(cls) -> 'LatencyStatsConfig':
+        signal = os.getenv('ROUTER_LATENCY_SIGNAL', 'mean').lower()
+        if signal not in LATENCY_SIGNALS:
+            logger.warning(f"Unknown ROUTER_LATENCY_SIGNAL {signal!r}; using mean")
+            signal = 'mean'
+        return cls(
+            window_size=int(os.getenv('ROUTER_LATENCY_WINDOW', '100')),
+            ewma_alpha=float(os.getenv('ROUTER_LATENCY_EWMA_ALPHA', '0.1')),
+            sketch_accuracy=float(os.getenv('ROUTER_LATENCY_SKETCH_ACCURACY', '0.02')),
+            sketch_half_life=int(os.getenv('ROUTER_LATENCY_SKETCH_HALF_LIFE', '1024')),
+            rate_window=int(os.getenv('ROUTER_RATE_WINDOW', '60')),
+            routing_signal=signal
+        )
+
+class RingBuffer:
+    """Fixed-size float ring with a running sum (re-summed exactly on each wrap)"""
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._values = array('d', bytes(8 * self.size))
+        self._next = 0
+        self.count = 0
+        self._sum = 0.0
+
+    def append(self, value: float):
+        if self.count == self.size:
+            self._sum -= self._values[self._next]
+        else:
+            self.count += 1
+        self._values[self._next] = value
+        self._sum += value
+        self._next += 1
+        if self._next == self.size:
+            self._next = 0
+            self._sum = math.fsum(self._values)   # drop accumulated rounding error
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self._sum / self.count if self.count else None
+
+    def values(self) -> List[float]:
+        """Samples oldest first"""
+        if self.count < self.size:
+            return list(self._values[:self.count])
+        return list(self._values[self._next:]) + list(self._values[:self._next])
+
+class QuantileSketch:
+    """Log-bucketed histogram (DDSketch-style): any quantile within +/- relative_accuracy,
+    O(1) inserts, and every bucket halves each `half_life` samples so estimates follow
+    the model's recent latency rather than its whole history"""
+
+    def __init__(self, relative_accuracy: float = 0.02, half_life: int = 1024,
+                 min_value: float = 1e-4, max_value: float = 3600.0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self._offset = math.ceil(math.log(min_value) / self._log_gamma)
+        self._buckets = math.ceil(math.log(max_value) / self._log_gamma) - self._offset + 1
+        self._counts = array('d', bytes(8 * self._buckets))
+        self._lo = self._buckets    # lowest / highest non-empty bucket
+        self._hi = -1
+        self.total = 0.0
+        self.half_life = max(1, half_life)
+        self._since_decay = 0
+
+    def _index(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        return min(self._buckets - 1, math.ceil(math.log(value) / self._log_gamma) - self._offset)
+
+    def _value(self, index: int) -> float:
+        # Midpoint of the bucket (gamma^(i-1), gamma^i] in relative terms
+        return 2 * self.gamma ** (index + self._offset) / (self.gamma + 1)
+
+    def add(self, value: float):
+        index = self._index(value)
+        self._counts[index] += 1.0
+        self.total += 1.0
+        if index < self._lo:
+            self._lo = index
+        if index > self._hi:
+            self._hi = index
+        self._since_decay += 1
+        if self._since_decay >= self.half_life:
+            self._since_decay = 0
+            counts = self._counts
+            for i in range(self._lo, self._hi + 1):
+                counts[i] *= 0.5
+            self.total *= 0.5
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        """Estimates for each q in [0, 1] (ascending order is fastest), in one scan"""
+        if self.total <= 0:
+            return [None] * len(qs)
+        order = sorted(range(len(qs)), key=lambda k: qs[k])
+        results: List[Optional[float]] = [None] * len(qs)
+        counts, cumulative, position = self._counts, 0.0, 0
+        for i in range(self._lo, self._hi + 1):
+            cumulative += counts[i]
+            while position < len(order) and cumulative >= qs[order[position]] * self.total:
+                results[order[position]] = self._value(i)
+                position += 1
+            if position == len(order):
+                break
+        for k in order[position:]:
+            results[k] = self._value(self._hi)
+        return results
+
+    def quantile(self, q: float) -> Optional[float]:
+        return self.quantiles([q])[0]
+
+class RateWindow:
+    """Requests and errors per one-second bucket over the last `seconds` seconds"""
+
+    def __init__(self, seconds: int = 60):
+        self.seconds = max(1, seconds)
+        self._stamps = array('q', [-1] * self.seconds)
+        self._requests = array('q', bytes(8 * self.seconds))
+        self._errors = array('q', bytes(8 * self.seconds))
+
+    def record(self, success: bool, now: float):
+        second = int(now)
+        slot = second % self.seconds
+        if self._stamps[slot] != second:
+            self._stamps[slot] = second
+            self._requests[slot] = 0
+            self._errors[slot] = 0
+        self._requests[slot] += 1
+        if not success:
+            self._errors[slot] += 1
+
+    def totals(self, now: float) -> Dict[str, Any]:
+        oldest = int(now) - self.seconds
+        requests = errors = 0
+        for slot in range(self.seconds):
+            if self._stamps[slot] > oldest:
+                requests += self._requests[slot]
+                errors += self._errors[slot]
+        return {
+            'seconds': self.seconds,
+            'requests': requests,
+            'errors': errors,
+            'requests_per_second': round(requests / self.seconds, 3),
+            'error_rate': round(errors / requests, 4) if requests else 0.0
+        }
+
+class ModelLatencyStats:
+    """All latency and outcome statistics for one model; thread-safe"""
+
+    def __init__(self, config: Optional[LatencyStatsConfig] = None):
+        self.config = config or LatencyStatsConfig()
+        self._lock = threading.Lock()
+        self.window = RingBuffer(self.config.window_size)
+        self.sketch = QuantileSketch(self.config.sketch_accuracy, self.config.sketch_half_life)
+        self.rates = RateWindow(self.config.rate_window)
+        self.ewma: Optional[float] = None
+        self.total_requests = 0
+        self.success_count = 0
+        self.error_count = 0
+        self._quantiles: Optional[List[Optional[float]]] = None   # p50/p95/p99, until the next sample
+
+    def record(self, latency: float, success: bool, now: Optional[float] = None):
+        """Add one request's outcome and latency (seconds)"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.total_requests += 1
+            if success:
+                self.success_count += 1
+            else:
+                self.error_count += 1
+            self.rates.record(success, now)
+            self.window.append(latency)
+            self.sketch.add(latency)
+            alpha = self.config.ewma_alpha
+            self.ewma = latency if self.ewma is None else alpha * latency + (1 - alpha) * self.ewma
+            self._quantiles = None
+
+    @property
+    def samples(self) -> int:
+        """Samples currently in the window"""
+        return self.window.count
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.window.mean
+
+    @property
+    def success_rate(self) -> float:
+        return self.success_count / self.total_requests if self.total_requests else 0.0
+
+    def _tail(self) -> List[Optional[float]]:
+        quantiles = self._quantiles
+        if quantiles is None:
+            with self._lock:
+                quantiles = self._quantiles = self.sketch.quantiles((0.5, 0.95, 0.99))
+        return quantiles
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Latency at a percentile (0-100) from the sketch"""
+        fixed = {50.0: 0, 95.0: 1, 99.0: 2}.get(float(percentile))
+        if fixed is not None:
+            return self._tail()[fixed]
+        with self._lock:
+            return self.sketch.quantile(percentile / 100.0)
+
+    def latency(self, signal: str) -> Optional[float]:
+        """The latency figure named by `signal` (see LATENCY_SIGNALS); None without samples"""
+        if signal == 'mean':
+            return self.mean
+        if signal == 'ewma':
+            return self.ewma
+        return self.percentile(float(signal[1:]))
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.monotonic() if now is None else now
+        p50, p95, p99 = self._tail()
+        with self._lock:
+            return {
+                'total_requests': self.total_requests,
+                'success_count': self.success_count,
+                'error_count': self.error_count,
+                'success_rate': round(self.success_rate, 4),
+                'avg_latency': self.mean or 0.0,
+                'ewma_latency': self.ewma or 0.0,
+                'p50_latency': p50,
+                'p95_latency': p95,
+                'p99_latency': p99,
+                'window_samples': self.window.count,
+                'recent': self.rates.totals(now)
+            }
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Trace Replay and Open-Loop Load Harness for the API Gateway
+Replays captured gateway traffic (traffic_capture.py) at 1x-Nx speed, or sends
+synthetic open-loop arrivals, against a running gateway or an in-process one
+wired to the stub backends (stub_backends.py). Reports throughput, p50/p95/p99
+latency and error rates per endpoint, optionally against a saved baseline.
+
+Usage:
+    TRAFFIC_CAPTURE_PATH=traffic.jsonl python api_gateway.py     # record live traffic
+    python load_harness.py replay traffic.jsonl --speed 4 --out after.json --baseline before.json
+    python load_harness.py synthetic --rate 50 --duration 30 \\
+        --mix /v1/chat/completions=0.7,/v1/completions=0.2,/v1/collaborate=0.1
+    python load_harness.py replay traffic.jsonl --url http://localhost:9000 --speed 2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from gateway_benchmark import percentile, setup_stub_environment, start_asgi_server, start_flask_server
+
+logger = logging.getLogger(__name__)
+
+# Endpoints whose body carries the prompt as a plain 'prompt' field
+PROMPT_ENDPOINTS = ('/v1/completions', '/v1/collaborate', '/v1/collaborate/template', '/v1/collaborate/mcp')
+
+FILLER_WORDS = ('analyze', 'network', 'latency', 'summary', 'deploy', 'restaurant', 'router',
+                'firewall', 'policy', 'model', 'request', 'config', 'service', 'report')
+
+@dataclass
+class PlannedRequest:
+    """One request of a load plan, scheduled `offset` seconds after the start"""
+    offset: float
+    endpoint: str
+    body: Dict[str, Any]
+    method: str = 'POST'
+    headers: Dict[str, str] = field(default_factory=dict)
+
+@dataclass
+class Outcome:
+    endpoint: str
+    status: Optional[int]
+    latency: float
+    first_byte: Optional[float]
+    lag: float                      # how late the request left versus its schedule
+    error: Optional[str] = None
+
+def filler_text(chars: int, tag: str, rng: random.Random) -> str:
+    """Prompt of roughly `chars` characters; the tag keeps it distinct from every other request
+    so replays don't collapse into cache hits or coalesced calls"""
+    words = [f'[{tag}]']
+    length = len(words[0])
+    while length < chars:
+        word = rng.choice(FILLER_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+def build_body(endpoint: str, prompt_chars: int, messages: int, params: Dict[str, Any],
+               tag: str, rng: random.Random) -> Dict[str, Any]:
+    """Request body of the captured shape for an endpoint"""
+    body = dict(params)
+    if endpoint == '/v1/chat/completions':
+        count = max(1, messages)
+        per_message = max(1, prompt_chars // count)
+        # Alternate roles so the last message is always the user's
+        roles = ['user' if (count - i) % 2 == 1 else 'assistant' for i in range(count)]
+        body['messages'] = [
+            {'role': role, 'content': filler_text(per_message, f'{tag}-{i}', rng)}
+            for i, role in enumerate(roles)
+        ]
+    else:
+        body['prompt'] = filler_text(prompt_chars, tag, rng)
+    if endpoint == '/v1/collaborate/template':
+        body.setdefault('template', 'research_analysis')
+    return body
+
+def load_capture(path: str, seed: int = 0) -> List[PlannedRequest]:
+    """Load plan from a traffic capture file, keeping the recorded inter-arrival times"""
+    rng = random.Random(seed)
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    entries.sort(key=lambda e: e['ts'])
+
+    plan, skipped = [], Counter()
+    origin = entries[0]['ts'] if entries else 0.0
+    for index, entry in enumerate(entries):
+        endpoint = entry['endpoint']
+        if entry.get('method', 'POST') != 'POST' or '<' in endpoint:
+            # Path-parameter routes (e.g. /v1/execute/<plan_id>) reference state we can't recreate
+            skipped[endpoint] += 1
+            continue
+        headers = {}
+        if entry.get('priority'):
+            headers['X-Priority'] = entry['priority']
+        if entry.get('caller'):
+            headers['X-API-Key'] = f"replay-{entry['caller']}"
+        body = build_body(endpoint, entry.get('prompt_chars', 0), entry.get('messages', 1),
+                          entry.get('params', {}), f'replay-{index}', rng)
+        plan.append(PlannedRequest(entry['ts'] - origin, endpoint, body, headers=headers))
+
+    if skipped:
+        logger.warning(f"Skipped {sum(skipped.values())} requests to unreplayable endpoints: {dict(skipped)}")
+    return plan
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """'/v1/chat/completions=0.7,/v1/completions=0.3' -> normalised weights"""
+    mix = {}
+    for part in spec.split(','):
+        endpoint, _, weight = part.strip().partition('=')
+        mix[endpoint] = float(weight or 1)
+    total = sum(mix.values())
+    return {endpoint: weight / total for endpoint, weight in mix.items()}
+
+def synthetic_plan(rate: float, duration: float, mix: Dict[str, float], prompt_chars: int,
+                   max_tokens: int, stream_ratio: float, seed: int = 0) -> List[PlannedRequest]:
+    """Open-loop Poisson arrivals at `rate` per second with log-normal prompt sizes"""
+    rng = random.Random(seed)
+    endpoints, weights = list(mix), list(mix.values())
+    plan, offset, index = [], 0.0, 0
+    while True:
+        offset += rng.expovariate(rate)
+        if offset >= duration:
+            return plan
+        endpoint = rng.choices(endpoints, weights)[0]
+        chars = max(8, int(rng.lognormvariate(0, 0.75) * prompt_chars))
+        params: Dict[str, Any] = {}
+        if endpoint in ('/v1/completions', '/v1/chat/completions'):
+            params = {'max_tokens': max_tokens, 'temperature': 0.7}
+            if rng.random() < stream_ratio:
+                params['stream'] = True
+        messages = rng.choice((1, 1, 1, 3)) if endpoint == '/v1/chat/completions' else 1
+        plan.append(PlannedRequest(offset, endpoint,
+                                   build_body(endpoint, chars, messages, params, f'synthetic-{index}', rng)))
+        index += 1
+
+async def _send(session: aiohttp.ClientSession, base_url: str, request: PlannedRequest,
+                lag: float, timeout: float) -> Outcome:
+    started = time.perf_counter()
+    first_byte = None
+    try:
+        async with session.request(request.method, base_url + request.endpoint, json=request.body,
+                                   headers=request.headers,
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            async for _ in response.content.iter_any():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+            return Outcome(request.endpoint, response.status, time.perf_counter() - started, first_byte, lag)
+    except Exception as e:
+        return Outcome(request.endpoint, None, time.perf_counter() - started, first_byte, lag,
+                       error=type(e).__name__)
+
+async def run_open_loop(base_url: str, plan: List[PlannedRequest], speed: float = 1.0,
+                        max_in_flight: int = 1024, timeout: float = 120.0) -> Dict[str, Any]:
+    """Send every planned request at its (speed-scaled) time, regardless of earlier responses"""
+    base_url = base_url.rstrip('/')
+    outcomes: List[Outcome] = []
+    tasks = []
+    in_flight = 0
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=max_in_flight)) as session:
+        async def tracked(request: PlannedRequest, lag: float):
+            nonlocal in_flight
+            in_flight += 1
+            try:
+                outcomes.append(await _send(session, base_url, request, lag, timeout))
+            finally:
+                in_flight -= 1
+
+        started = time.perf_counter()
+        for request in plan:
+            due = started + request.offset / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lag = max(0.0, time.perf_counter() - due)
+            if in_flight >= max_in_flight:
+                # The harness itself is saturated; count it rather than silently going closed-loop
+                outcomes.append(Outcome(request.endpoint, None, 0.0, None, lag, error='client_saturated'))
+                continue
+            tasks.append(asyncio.ensure_future(tracked(request, lag)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return summarize(outcomes, elapsed)
+
+def _summary(outcomes: List[Outcome], elapsed: float) -> Dict[str, Any]:
+    latencies = [o.latency for o in outcomes if o.status is not None and o.status < 400]
+    first_bytes = [o.first_byte for o in outcomes if o.first_byte is not None and o.status == 200]
+    errors = [o for o in outcomes if o.status is None or o.status >= 400]
+    statuses = Counter(str(o.status) if o.status is not None else o.error for o in outcomes)
+    return {
+        'requests': len(outcomes),
+        'errors': len(errors),
+        'error_rate': round(len(errors) / len(outcomes), 4) if outcomes else 0.0,
+        'statuses': dict(statuses),
+        'throughput_rps': round((len(outcomes) - len(errors)) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'ttfb_p50_ms': round(percentile(first_bytes, 50) * 1000, 1),
+        'ttfb_p95_ms': round(percentile(first_bytes, 95) * 1000, 1),
+        'max_send_lag_ms': round(max((o.lag for o in outcomes), default=0.0) * 1000, 1)
+    }
+
+def summarize(outcomes: List[Outcome], elapsed: float) -> Dict[str, Any]:
+    """Overall and per-endpoint throughput, latency percentiles and error rates"""
+    by_endpoint: Dict[str, List[Outcome]] = {}
+    for outcome in outcomes:
+        by_endpoint.setdefault(outcome.endpoint, []).append(outcome)
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'overall': _summary(outcomes, elapsed),
+        'endpoints': {endpoint: _summary(items, elapsed) for endpoint, items in sorted(by_endpoint.items())}
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Relative change of the headline numbers versus a baseline report"""
+    keys = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate')
+
+    def delta(current, previous):
+        return {
+            key: round((current[key] - previous[key]) / previous[key] * 100, 1) if previous.get(key) else None
+            for key in keys
+        }
+
+    return {
+        'overall_pct': delta(report['overall'], baseline['overall']),
+        'endpoints_pct': {
+            endpoint: delta(summary, baseline['endpoints'][endpoint])
+            for endpoint, summary in report['endpoints'].items() if endpoint in baseline.get('endpoints', {})
+        }
+    }
+
+def start_local_gateway(args) -> str:
+    """Start stub backends and an in-process gateway; returns its base URL"""
+    setup_stub_environment(args)
+
+    import api_gateway
+    import asgi_gateway
+
+    if args.server == 'flask':
+        start_flask_server(api_gateway.app, args.port, args.flask_workers)
+    else:
+        start_asgi_server(asgi_gateway.app, args.port)
+    return f'http://127.0.0.1:{args.port}'
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured or synthetic load against the gateway')
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+
+    replay = subparsers.add_parser('replay', help='Replay a traffic capture (TRAFFIC_CAPTURE_PATH) file')
+    replay.add_argument('capture')
+    replay.add_argument('--speed', type=float, default=1.0, help='Time compression factor (4 = 4x faster)')
+    replay.add_argument('--limit', type=int, default=None, help='Replay only the first N requests')
+
+    synthetic = subparsers.add_parser('synthetic', help='Open-loop Poisson arrivals')
+    synthetic.add_argument('--rate', type=float, default=20.0, help='Arrivals per second')
+    synthetic.add_argument('--duration', type=float, default=30.0, help='Seconds of arrivals')
+    synthetic.add_argument('--mix', default='/v1/chat/completions=0.7,/v1/completions=0.3',
+                           help='endpoint=weight pairs')
+    synthetic.add_argument('--prompt-chars', type=int, default=400, help='Median prompt size')
+    synthetic.add_argument('--max-tokens', type=int, default=64)
+    synthetic.add_argument('--stream-ratio', type=float, default=0.0, help='Share of streamed completions')
+
+    for sub in (replay, synthetic):
+        sub.add_argument('--url', default=None, help='Target gateway (default: in-process gateway on stubs)')
+        sub.add_argument('--server', choices=['asgi', 'flask'], default='asgi')
+        sub.add_argument('--port', type=int, default=19102)
+        sub.add_argument('--flask-workers', type=int, default=8)
+        sub.add_argument('--latency-scale', type=float, default=1.0)
+        sub.add_argument('--request-overhead', type=float, default=None,
+                         help='Serialized per-request stub backend cost in seconds')
+        sub.add_argument('--profiles', default=None, help='JSON file of stub backend profile overrides')
+        sub.add_argument('--max-in-flight', type=int, default=1024)
+        sub.add_argument('--timeout', type=float, default=120.0)
+        sub.add_argument('--seed', type=int, default=0)
+        sub.add_argument('--out', default=None, help='Write the report to this file')
+        sub.add_argument('--baseline', default=None, help='Earlier report to compare against')
+        sub.add_argument('--verbose', action='store_true', help='Keep gateway warning logs')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.mode == 'replay':
+        plan = load_capture(args.capture, args.seed)[:args.limit]
+        speed = args.speed
+    else:
+        plan = synthetic_plan(args.rate, args.duration, parse_mix(args.mix), args.prompt_chars,
+                              args.max_tokens, args.stream_ratio, args.seed)
+        speed = 1.0
+    if not args.verbose:
+        # Health checks against platform services that aren't running locally are expected to fail
+        logging.disable(logging.WARNING)
+
+    base_url = args.url or start_local_gateway(args)
+    report = {
+        'mode': args.mode,
+        'target': base_url,
+        'planned_requests': len(plan),
+        'speed': speed,
+        **asyncio.run(run_open_loop(base_url, plan, speed, args.max_in_flight, args.timeout))
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['vs_baseline'] = compare(report, json.load(f))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Backend Load Signals for Queue-Aware Routing
+Scrapes each backend's Prometheus /metrics in the background for vLLM scheduler
+state (running and waiting requests, KV-cache usage) and turns it into an
+expected queueing delay per backend. Backends without vLLM metrics, or whose
+scrape has gone stale, fall back to the gateway's own counters: requests queued
+for admission plus requests already in flight to the backend. The router
+subtracts a penalty proportional to that delay from its scores.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from admission_control import admission_controller
+from health_prober import HealthProber, ProberConfig
+
+logger = logging.getLogger(__name__)
+
+# vLLM scheduler gauges (summed over label sets); KV-cache usage was renamed in vLLM 0.9
+RUNNING_METRICS = ('vllm:num_requests_running',)
+WAITING_METRICS = ('vllm:num_requests_waiting', 'vllm:num_requests_swapped')
+KV_CACHE_METRICS = ('vllm:kv_cache_usage_perc', 'vllm:gpu_cache_usage_perc')
+
+@dataclass
+class LoadSignalConfig:
+    """Scrape cadence and how strongly queueing delay weighs against static scores"""
+    enabled: bool = True
+    scrape_interval: float = 2.0
+    scrape_timeout: float = 1.0
+    stale_after: float = 10.0           # older scrapes fall back to gateway counters
+    penalty_per_second: float = 0.05    # score penalty per second of expected queueing delay
+    max_penalty: float = 0.5
+    kv_cache_threshold: float = 0.9     # usage above this counts as extra queueing (preemption risk)
+
+    @classmethod
+    def from_env(cls) -> 'LoadSignalConfig':
+        return cls(
+            enabled=os.getenv('LOAD_ROUTING_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            scrape_interval=float(os.getenv('LOAD_SCRAPE_INTERVAL', '2')),
+            scrape_timeout=float(os.getenv('LOAD_SCRAPE_TIMEOUT', '1')),
+            stale_after=float(os.getenv('LOAD_STALE_AFTER', '10')),
+            penalty_per_second=float(os.getenv('LOAD_PENALTY_PER_SECOND', '0.05')),
+            max_penalty=float(os.getenv('LOAD_MAX_PENALTY', '0.5')),
+            kv_cache_threshold=float(os.getenv('LOAD_KV_CACHE_THRESHOLD', '0.9'))
+        )
+
+def parse_prometheus_text(text: str) -> Dict[str, float]:
+    """Sum of every sample per metric name in Prometheus text exposition format"""
+    totals: Dict[str, float] = {}
+    for line in text.splitlines():
+        if not line or line[0] == '#':
+            continue
+        name_end = len(line)
+        for stop in ('{', ' '):
+            index = line.find(stop)
+            if 0 <= index < name_end:
+                name_end = index
+        name = line[:name_end]
+        rest = line[name_end:]
+        if rest.startswith('{'):
+            close = rest.rfind('}')
+            if close < 0:
+                continue
+            rest = rest[close + 1:]
+        fields = rest.split()
+        if not fields:
+            continue
+        try:
+            value = float(fields[0])
+        except ValueError:
+            continue
+        totals[name] = totals.get(name, 0.0) + value
+    return totals
+
+def scheduler_state(metrics: Dict[str, float]) -> Optional[Dict[str, float]]:
+    """Running/waiting/KV-cache figures from parsed vLLM metrics, or None if absent"""
+    if not any(name in metrics for name in RUNNING_METRICS + WAITING_METRICS):
+        return None
+    kv_cache = next((metrics[name] for name in KV_CACHE_METRICS if name in metrics), None)
+    return {
+        'running': sum(metrics.get(name, 0.0) for name in RUNNING_METRICS),
+        'waiting': sum(metrics.get(name, 0.0) for name in WAITING_METRICS),
+        'kv_cache_usage': kv_cache
+    }
+
+async def _scrape(session: Any, url: str) -> Dict[str, Any]:
+    started = time.monotonic()
+    try:
+        async with session.get(url.rstrip('/') + '/metrics') as response:
+            if response.status != 200:
+                return {'error': f"HTTP {response.status}"}
+            state = scheduler_state(parse_prometheus_text(await response.text()))
+    except Exception as e:
+        return {'error': str(e) or type(e).__name__}
+    if state is None:
+        return {'error': 'no vLLM scheduler metrics'}
+    state['scraped_at'] = time.monotonic()
+    state['scrape_ms'] = round((time.monotonic() - started) * 1000, 1)
+    return state
+
+def _combine(replicas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One backend's state from its replicas' scrapes: queues add up, KV-cache is the worst"""
+    scraped = [state for state in replicas if 'error' not in state]
+    if not scraped:
+        return replicas[0]
+    kv_caches = [state['kv_cache_usage'] for state in scraped if state['kv_cache_usage'] is not None]
+    return {
+        'running': sum(state['running'] for state in scraped),
+        'waiting': sum(state['waiting'] for state in scraped),
+        'kv_cache_usage': max(kv_caches) if kv_caches else None,
+        'replicas_scraped': len(scraped),
+        'scraped_at': min(state['scraped_at'] for state in scraped),
+        'scrape_ms': max(state['scrape_ms'] for state in scraped)
+    }
+
+async def scrape_backends(backends: Dict[str, List[str]], timeout: float = 1.0) -> Dict[str, Dict[str, Any]]:
+    """Scrape every backend replica's /metrics concurrently; returns {name: state or error}"""
+    import aiohttp
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        results = await asyncio.gather(*[
+            asyncio.gather(*[_scrape(session, url) for url in urls]) for urls in backends.values()
+        ])
+    return {name: _combine(list(replicas)) for name, replicas in zip(backends.keys(), results)}
+
+class LoadSignalCollector:
+    """Latest scheduler state per backend, and the queueing delay it implies"""
+
+    def __init__(self, config: Optional[LoadSignalConfig] = None):
+        self.config = config or LoadSignalConfig.from_env()
+        self.backends: Dict[str, List[str]] = {}
+        # Requests the gateway has open to a backend (its pooled clients' in-flight count)
+        self.in_flight: Callable[[str], int] = lambda model: 0
+        self.prober = HealthProber(ProberConfig(
+            interval=self.config.scrape_interval,
+            timeout=self.config.scrape_timeout,
+            stale_after=self.config.stale_after
+        ))
+        self.prober.register('load', lambda: scrape_backends(self.backends, self.config.scrape_timeout))
+        self.stats_counters = {
+            'decisions_shifted': 0
+        }
+
+    def set_backends(self, backends: Dict[str, Union[str, List[str]]],
+                     in_flight: Optional[Callable[[str], int]] = None):
+        """Backends to scrape (name -> base URL or replica URLs); scraping starts on first use.
+        in_flight(name) counts the gateway's open requests to a backend for the fallback estimate"""
+        self.backends = {name: [urls] if isinstance(urls, str) else list(urls) for name, urls in backends.items()}
+        if in_flight is not None:
+            self.in_flight = in_flight
+
+    def _gateway_load(self, model: str) -> Dict[str, int]:
+        """In-flight and queued requests as the gateway sees them (admission may be off)"""
+        admission = admission_controller.get(model)
+        return {
+            'in_flight': max(admission.in_flight, self.in_flight(model)),
+            'waiting': admission.queue_depth,
+            'capacity': max(1, admission.config.max_concurrent)
+        }
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        if self.config.enabled and self.backends:
+            self.prober.start(loop)
+
+    def _scraped(self, model: str, now: float) -> Optional[Dict[str, Any]]:
+        snapshot = self.prober.snapshots.get('load')
+        if snapshot is None or not snapshot.data:
+            return None
+        state = snapshot.data.get(model)
+        if not state or 'error' in state or now - state['scraped_at'] > self.config.stale_after:
+            return None
+        return state
+
+    def queue_delay(self, model: str, service_time: float, now: Optional[float] = None) -> float:
+        """Expected seconds a new request waits before `model` starts on it"""
+        now = time.monotonic() if now is None else now
+        state = self._scraped(model, now)
+        if state is not None:
+            # The engine finishes about `running` requests per service time
+            delay = state['waiting'] * service_time / max(1.0, state['running'])
+            kv_cache = state['kv_cache_usage']
+            threshold = self.config.kv_cache_threshold
+            if kv_cache is not None and kv_cache > threshold and threshold < 1.0:
+                delay += service_time * min(1.0, (kv_cache - threshold) / (1.0 - threshold))
+            return delay
+
+        # Everything ahead of a new request, worked off max_concurrent at a time
+        load = self._gateway_load(model)
+        return (load['waiting'] + load['in_flight']) * service_time / load['capacity']
+
+    def queue_delays(self, service_times: Dict[str, float]) -> Dict[str, float]:
+        """Expected queueing delay for each model (given its service time) that has any"""
+        if not self.config.enabled:
+            return {}
+        self.start()
+        now = time.monotonic()
+        delays = {}
+        for model, service_time in service_times.items():
+            delay = self.queue_delay(model, service_time, now)
+            if delay > 0:
+                delays[model] = delay
+        return delays
+
+    def penalty(self, delay: float) -> float:
+        """Score penalty for an expected queueing delay"""
+        return min(self.config.max_penalty, delay * self.config.penalty_per_second)
+
+    def record_shift(self):
+        self.stats_counters['decisions_shifted'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        snapshot = self.prober.snapshots.get('load')
+        backends = {}
+        for model in self.backends:
+            state = self._scraped(model, now)
+            if state is not None:
+                backends[model] = {'source': 'vllm', **{k: v for k, v in state.items() if k != 'scraped_at'}}
+            else:
+                load = self._gateway_load(model)
+                backends[model] = {
+                    'source': 'gateway',
+                    'in_flight': load['in_flight'],
+                    'waiting': load['waiting'],
+                    'scrape_error': (snapshot.data or {}).get(model, {}).get('error') if snapshot else None
+                }
+        return {
+            'enabled': self.config.enabled,
+            'scrape_interval': self.config.scrape_interval,
+            'scrape_rounds': self.prober.rounds,
+            'backends': backends,
+            **self.stats_counters
+        }
+
+# Global load signal collector
+load_signals = LoadSignalCollector()
@@ -6,14 +6,21 @@ Secure integration of Model Context Protocol servers with the AI stack
 
 import os
 import json
+import time
 import asyncio
 import aiohttp
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Any
 from dataclasses import dataclass, asdict
 from datetime import datetime
 import subprocess
 
+from tracing import tracer
+from deadlines import deadline_manager
+from startup import Lazy
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -36,6 +43,97 @@ class MCPServer:
         if self.capabilities is None:
             self.capabilities = []
 
+@dataclass
+class CredentialConfig:
+    """How credentials missing from the environment are looked up"""
+    helper_enabled: bool = True
+    helper_timeout: float = 10.0
+    workers: int = 4
+
+    @classmethod
+    def from_env(cls) -> 'CredentialConfig':
+        return cls(
+            helper_enabled=os.getenv('MCP_CREDENTIAL_HELPER_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            helper_timeout=float(os.getenv('MCP_CREDENTIAL_HELPER_TIMEOUT', '10')),
+            workers=int(os.getenv('MCP_CREDENTIAL_WORKERS', '4'))
+        )
+
+class CredentialResolver:
+    """Resolves credentials off the startup path. Environment variables answer immediately;
+    keys that need the GitHub secrets helper are looked up concurrently on a small thread
+    pool, and every result (including a miss) is cached for the life of the process."""
+
+    def __init__(self, config: Optional[CredentialConfig] = None):
+        self.config = config or CredentialConfig.from_env()
+        self._lock = threading.Lock()
+        self._results: Dict[str, Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.stats_counters = {'from_env': 0, 'from_helper': 0, 'missing': 0, 'helper_seconds': 0.0}
+
+    def resolve(self, key: str) -> Future:
+        """Future for a credential's value (None when unavailable); starts the lookup once"""
+        with self._lock:
+            future = self._results.get(key)
+            if future is not None:
+                return future
+            value = os.getenv(key)
+            if value or not self.config.helper_enabled:
+                future = Future()
+                future.set_result(value or None)
+                self.stats_counters['from_env' if value else 'missing'] += 1
+            else:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.config.workers,
+                                                        thread_name_prefix='mcp-credentials')
+                future = self._executor.submit(self._from_helper, key)
+            self._results[key] = future
+            return future
+
+    def when_resolved(self, key: str, callback: Callable[[Optional[str]], None]):
+        """Call `callback(value)` once the credential is known (immediately if it already is)"""
+        def _done(future: Future):
+            try:
+                callback(future.result())
+            except Exception as e:
+                logger.error(f"Registering servers for credential {key} failed: {e}")
+        self.resolve(key).add_done_callback(_done)
+
+    def get(self, key: str, timeout: Optional[float] = None) -> Optional[str]:
+        """Blocking lookup, for callers that can't proceed without the credential"""
+        return self.resolve(key).result(timeout=timeout)
+
+    def _from_helper(self, key: str) -> Optional[str]:
+        """Try GitHub secrets for a credential that isn't in the environment"""
+        started = time.perf_counter()
+        value = None
+        try:
+            result = subprocess.run([
+                'gh', 'secret', 'get', key
+            ], capture_output=True, text=True, timeout=self.config.helper_timeout)
+
+            if result.returncode == 0:
+                value = result.stdout.strip() or None
+        except (subprocess.TimeoutExpired, FileNotFoundError):
+            logger.warning(f"Could not retrieve GitHub secret for {key}")
+        with self._lock:
+            self.stats_counters['from_helper' if value else 'missing'] += 1
+            self.stats_counters['helper_seconds'] += time.perf_counter() - started
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = sorted(key for key, future in self._results.items() if not future.done())
+            return {
+                'helper_enabled': self.config.helper_enabled,
+                'resolved': len(self._results) - len(pending),
+                'pending': pending,
+                **self.stats_counters,
+                'helper_seconds': round(self.stats_counters['helper_seconds'], 3)
+            }
+
+# Global credential resolver instance
+credential_resolver = CredentialResolver()
+
 class MCPServerRegistry:
     """Registry and manager for MCP servers"""
     
@@ -61,40 +159,37 @@ class MCPServerRegistry:
             ]
         )
         
+        # Servers below need a credential; each is registered as soon as its credential
+        # resolves (env vars at once, GitHub secrets lookups concurrently in the background)
+
         # GitHub MCP Server (using GitHub secrets)
-        github_token = self._get_secure_credential('GITHUB_PERSONAL_ACCESS_TOKEN')
-        if github_token:
-            self.servers['github'] = MCPServer(
-                name='GitHub Integration',
-                type='url',
-                endpoint='https://api.githubcopilot.com/mcp/',
-                capabilities=['code_management', 'repository_operations', 'issue_tracking'],
-                headers={'Authorization': f'Bearer {github_token}'}
-            )
+        self._register_with_credential('GITHUB_PERSONAL_ACCESS_TOKEN', 'github', lambda github_token: MCPServer(
+            name='GitHub Integration',
+            type='url',
+            endpoint='https://api.githubcopilot.com/mcp/',
+            capabilities=['code_management', 'repository_operations', 'issue_tracking'],
+            headers={'Authorization': f'Bearer {github_token}'}
+        ))
         
         # API Dog MCP Server
-        apidog_token = self._get_secure_credential('APIDOG_ACCESS_TOKEN')
-        if apidog_token:
-            self.servers['apidog'] = MCPServer(
-                name='API Testing Platform',
-                type='command',
-                command='npx',
-                args=['-y', 'apidog-mcp-server@latest', '--project=950315'],
-                env={'APIDOG_ACCESS_TOKEN': apidog_token},
-                capabilities=['api_testing', 'documentation', 'mock_services']
-            )
+        self._register_with_credential('APIDOG_ACCESS_TOKEN', 'apidog', lambda apidog_token: MCPServer(
+            name='API Testing Platform',
+            type='command',
+            command='npx',
+            args=['-y', 'apidog-mcp-server@latest', '--project=950315'],
+            env={'APIDOG_ACCESS_TOKEN': apidog_token},
+            capabilities=['api_testing', 'documentation', 'mock_services']
+        ))
         
         # Meraki MCP Server
-        meraki_key = self._get_secure_credential('MERAKI_API_KEY')
-        if meraki_key:
-            self.servers['meraki'] = MCPServer(
-                name='Cisco Meraki Network Management',
-                type='command',
-                command='node',
-                args=['/home/keith/meraki-mcp-server/meraki.js'],
-                env={'MERAKI_API_KEY': meraki_key},
-                capabilities=['network_management', 'device_monitoring', 'restaurant_networks']
-            )
+        self._register_with_credential('MERAKI_API_KEY', 'meraki', lambda meraki_key: MCPServer(
+            name='Cisco Meraki Network Management',
+            type='command',
+            command='node',
+            args=['/home/keith/meraki-mcp-server/meraki.js'],
+            env={'MERAKI_API_KEY': meraki_key},
+            capabilities=['network_management', 'device_monitoring', 'restaurant_networks']
+        ))
         
         # Figma MCP Server (via Composio)
         self.servers['figma'] = MCPServer(
@@ -105,43 +200,36 @@ class MCPServerRegistry:
         )
         
         # FortiManager MCP Server (for restaurant network management)
-        fortinet_key = self._get_secure_credential('FORTINET_API_KEY')
-        if fortinet_key:
-            self.servers['fortimanager'] = MCPServer(
-                name='FortiManager Network Control',
-                type='command',
-                command='python3',
-                args=['/home/keith/chat-copilot/network-agents/fortimanager_mcp_server.py'],
-                env={
-                    'FORTINET_API_KEY': fortinet_key,
-                    'FORTIMANAGER_HOST': os.getenv('FORTIMANAGER_HOST', 'localhost'),
-                    'FORTIMANAGER_USERNAME': os.getenv('FORTIMANAGER_USERNAME', 'admin')
-                },
-                capabilities=['fortinet_management', 'restaurant_security', 'policy_management']
-            )
+        self._register_with_credential('FORTINET_API_KEY', 'fortimanager', lambda fortinet_key: MCPServer(
+            name='FortiManager Network Control',
+            type='command',
+            command='python3',
+            args=['/home/keith/chat-copilot/network-agents/fortimanager_mcp_server.py'],
+            env={
+                'FORTINET_API_KEY': fortinet_key,
+                'FORTIMANAGER_HOST': os.getenv('FORTIMANAGER_HOST', 'localhost'),
+                'FORTIMANAGER_USERNAME': os.getenv('FORTIMANAGER_USERNAME', 'admin')
+            },
+            capabilities=['fortinet_management', 'restaurant_security', 'policy_management']
+        ))
+    
+    def _register_with_credential(self, key: str, server_name: str, build: Callable[[str], MCPServer]):
+        """Register a server once its credential resolves; skipped if it can't be found"""
+        def _register(value: Optional[str]):
+            if value:
+                self.servers[server_name] = build(value)
+            else:
+                logger.info(f"MCP server {server_name} not registered: {key} is not available")
+        credential_resolver.when_resolved(key, _register)
     
     def _get_secure_credential(self, key: str) -> Optional[str]:
-        """Get credential from environment with fallback to GitHub secrets"""
-        # First try environment variable
-        value = os.getenv(key)
-        if value:
-            return value
-        
-        # Try GitHub secrets if available
-        try:
-            result = subprocess.run([
-                'gh', 'secret', 'get', key
-            ], capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
-                return result.stdout.strip()
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            logger.warning(f"Could not retrieve GitHub secret for {key}")
-        
-        return None
+        """Get credential from environment with fallback to GitHub secrets (blocking, cached)"""
+        return credential_resolver.get(key)
     
+    @tracer.traced('mcp.check_server_health')
     async def check_server_health(self, server_name: str) -> Dict[str, Any]:
         """Check health of a specific MCP server"""
+        tracer.current_span().set_attribute('mcp.server', server_name)
         if server_name not in self.servers:
             return {'status': 'not_found', 'error': f'Server {server_name} not registered'}
         
@@ -168,8 +256,8 @@ class MCPServerRegistry:
             self.session = aiohttp.ClientSession()
         
         try:
-            headers = server.headers or {}
-            timeout = aiohttp.ClientTimeout(total=10)
+            headers = deadline_manager.inject(tracer.inject(server.headers))
+            timeout = aiohttp.ClientTimeout(total=deadline_manager.timeout(10))
             
             async with self.session.get(
                 server.endpoint + '/health',
@@ -207,7 +295,7 @@ class MCPServerRegistry:
                 stderr=asyncio.subprocess.PIPE
             )
             
-            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=5)
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=deadline_manager.timeout(5))
             
             if process.returncode == 0:
                 server.status = 'online'
@@ -234,7 +322,7 @@ class MCPServerRegistry:
                 stderr=asyncio.subprocess.PIPE
             )
             
-            await asyncio.wait_for(process.communicate(), timeout=10)
+            await asyncio.wait_for(process.communicate(), timeout=deadline_manager.timeout(10))
             
             if process.returncode == 0:
                 server.status = 'online'
@@ -252,13 +340,13 @@ class MCPServerRegistry:
         """Check health of all registered MCP servers"""
         results = {}
         
-        # Check all servers concurrently
+        # Check all servers concurrently (servers may still be registering in the background)
+        server_names = list(self.servers.keys())
         tasks = [
             self.check_server_health(name) 
-            for name in self.servers.keys()
+            for name in server_names
         ]
         
-        server_names = list(self.servers.keys())
         health_results = await asyncio.gather(*tasks, return_exceptions=True)
         
         for name, result in zip(server_names, health_results):
@@ -272,7 +360,7 @@ class MCPServerRegistry:
     def get_servers_by_capability(self, capability: str) -> List[str]:
         """Get list of server names that support a specific capability"""
         return [
-            name for name, server in self.servers.items()
+            name for name, server in list(self.servers.items())
             if capability in server.capabilities
         ]
     
@@ -302,7 +390,7 @@ class MCPServerRegistry:
                 'capabilities': server.capabilities,
                 'last_checked': server.last_checked
             }
-            for name, server in self.servers.items()
+            for name, server in list(self.servers.items())
         }
     
     async def close(self):
@@ -310,8 +398,8 @@ class MCPServerRegistry:
         if self.session:
             await self.session.close()
 
-# Global registry instance
-mcp_registry = MCPServerRegistry()
+# Global registry instance, built on first use
+mcp_registry = Lazy(MCPServerRegistry, 'mcp_registry')
 
 async def get_mcp_registry() -> MCPServerRegistry:
     """Get the global MCP registry instance"""
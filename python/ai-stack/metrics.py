@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Prometheus Metrics for the AI Stack
+Counters, gauges and histograms built on prometheus_client. Under gunicorn the
+gateway runs several worker processes: when PROMETHEUS_MULTIPROC_DIR is set each
+worker writes its samples to memory-mapped files in that directory and /metrics
+aggregates every worker (see gunicorn.conf.py). Component state that already
+lives elsewhere (admission queues, circuit breakers, caches) is exported through
+collectors evaluated at scrape time in the worker serving the scrape.
+"""
+
+import os
+import threading
+import logging
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Seconds; covers cache hits (~ms) up to long reasoning generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# (name, type, help, [(labels, value), ...]) produced by a collector at scrape time
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+def multiprocess_enabled() -> bool:
+    """Whether samples are shared between worker processes through PROMETHEUS_MULTIPROC_DIR"""
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir'))
+
+class MetricsRegistry:
+    """The gateway's metric families plus scrape-time component collectors"""
+
+    def __init__(self):
+        self.registry = CollectorRegistry()
+        self.collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+        self.registry.register(self)
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        """Add a function returning metric families computed at scrape time"""
+        with self._lock:
+            self.collectors.append(collector)
+
+    def collect(self):
+        """prometheus_client collector protocol: component families from this process"""
+        with self._lock:
+            collectors = list(self.collectors)
+        # Component state is per worker; label it so series from different workers stay apart
+        worker = {'pid': str(os.getpid())} if multiprocess_enabled() else {}
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                family_type = CounterMetricFamily if kind == 'counter' else GaugeMetricFamily
+                labelnames = list(worker) + sorted({key for labels, _ in samples for key in labels})
+                family = family_type(name, documentation, labels=labelnames)
+                for labels, value in samples:
+                    merged = dict(worker, **labels)
+                    family.add_metric([merged.get(key, '') for key in labelnames], value)
+                yield family
+
+    def render(self) -> bytes:
+        """All metrics in the Prometheus text exposition format, aggregated across
+        worker processes in multiprocess mode"""
+        if not multiprocess_enabled():
+            return generate_latest(self.registry)
+        # Gateway families come from every worker's files; components from this worker
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(self)
+        return generate_latest(registry)
+
+# Global metrics registry
+metrics_registry = MetricsRegistry()
+
+# Gateway
+GATEWAY_REQUESTS = Counter(
+    'gateway_requests_total', 'HTTP requests handled by the gateway',
+    ('endpoint', 'method', 'status'), registry=metrics_registry.registry
+)
+GATEWAY_REQUEST_DURATION = Histogram(
+    'gateway_request_duration_seconds', 'Gateway request latency until the response body is complete',
+    ('endpoint', 'model', 'outcome'), buckets=DEFAULT_BUCKETS,
+    registry=metrics_registry.registry
+)
+GATEWAY_TIME_TO_FIRST_BYTE = Histogram(
+    'gateway_time_to_first_byte_seconds', 'Latency until the first response body chunk is sent',
+    ('endpoint', 'model'), buckets=DEFAULT_BUCKETS,
+    registry=metrics_registry.registry
+)
+GATEWAY_IN_FLIGHT = Gauge(
+    'gateway_requests_in_flight', 'Gateway requests currently being handled or streamed',
+    ('endpoint',), registry=metrics_registry.registry, multiprocess_mode='livesum'
+)
+DEADLINE_EXCEEDED = Counter(
+    'gateway_deadline_exceeded_total', 'Work abandoned because the request deadline passed, by stage',
+    ('stage',), registry=metrics_registry.registry
+)
+
+# Backends (as seen by the router)
+BACKEND_REQUEST_DURATION = Histogram(
+    'backend_request_duration_seconds', 'Backend completion latency, including full stream duration',
+    ('backend', 'outcome'), buckets=DEFAULT_BUCKETS,
+    registry=metrics_registry.registry
+)
+BACKEND_ERRORS = Counter(
+    'backend_errors_total', 'Failed backend calls by error class',
+    ('backend', 'error'), registry=metrics_registry.registry
+)
+
+# Router
+ROUTER_DECISIONS = Counter(
+    'router_decisions_total', 'Routing decisions by selected model and detected complexity',
+    ('model', 'complexity'), registry=metrics_registry.registry
+)
+ROUTER_DECISION_DURATION = Histogram(
+    'router_decision_duration_seconds', 'Time spent choosing a model',
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05),
+    registry=metrics_registry.registry
+)
+ROUTER_FALLBACKS = Counter(
+    'router_fallbacks_total', 'Requests served by a fallback or hedge instead of the routed model',
+    ('routed_model', 'served_by'), registry=metrics_registry.registry
+)
+
+# Collaboration orchestrator
+ORCHESTRATOR_PLANS_CREATED = Counter(
+    'orchestrator_plans_created_total', 'Collaboration plans created, by workflow source',
+    ('source',), registry=metrics_registry.registry
+)
+ORCHESTRATOR_PLAN_TASKS = Histogram(
+    'orchestrator_plan_tasks', 'Sub-tasks per collaboration plan',
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20), registry=metrics_registry.registry
+)
+ORCHESTRATOR_PLANS_EXECUTED = Counter(
+    'orchestrator_plans_executed_total', 'Collaboration plans executed, by result',
+    ('mode', 'outcome'), registry=metrics_registry.registry
+)
+ORCHESTRATOR_PLAN_DURATION = Histogram(
+    'orchestrator_plan_duration_seconds', 'Collaboration plan execution time',
+    ('mode',), buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+    registry=metrics_registry.registry
+)
+ORCHESTRATOR_TASKS = Counter(
+    'orchestrator_tasks_total', 'Collaboration sub-tasks executed, by service and result',
+    ('service', 'outcome'), registry=metrics_registry.registry
+)
+ORCHESTRATOR_TASK_DURATION = Histogram(
+    'orchestrator_task_duration_seconds', 'Collaboration sub-task latency, including admission wait',
+    ('service',), buckets=DEFAULT_BUCKETS,
+    registry=metrics_registry.registry
+)
+ORCHESTRATOR_TASKS_IN_FLIGHT = Gauge(
+    'orchestrator_tasks_in_flight', 'Collaboration sub-tasks currently executing',
+    ('service',), registry=metrics_registry.registry, multiprocess_mode='livesum'
+)
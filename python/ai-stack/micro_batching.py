@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Adaptive Micro-Batching for vLLM Backends
+Concurrent completions for the same backend with identical sampling parameters
+are collected for a short window and sent as one multi-prompt /v1/completions
+call. The window and batch size follow the observed arrival rate, so a lightly
+loaded backend sees no added latency. /v1/completions applies no chat template,
+so only backends with a configured prompt template are batched: their batched
+prompts must reach the model formatted as /v1/chat/completions would.
+"""
+
+import os
+import math
+import time
+import threading
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from deadlines import deadline_manager, Deadline
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class BatchConfig:
+    """Micro-batching limits"""
+    enabled: bool = False
+    backends: tuple = ('reasoning', 'general', 'coding')   # vLLM roles only
+    max_wait_ms: float = 10.0
+    max_batch_size: int = 16
+    # The model's chat template rendered for one user turn, '{prompt}' marking the message and
+    # without the BOS token /v1/completions adds itself, e.g. '[INST] {prompt} [/INST]'
+    prompt_templates: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls) -> 'BatchConfig':
+        """MICRO_BATCH_* env vars; templates from MICRO_BATCH_PROMPT_TEMPLATE with optional
+        <NAME>_MICRO_BATCH_PROMPT_TEMPLATE overrides"""
+        backends = tuple(b.strip() for b in os.getenv('MICRO_BATCH_BACKENDS', 'reasoning,general,coding').split(',') if b.strip())
+        shared = os.getenv('MICRO_BATCH_PROMPT_TEMPLATE', '')
+        templates = {
+            backend: os.getenv(f"{backend.upper()}_MICRO_BATCH_PROMPT_TEMPLATE", shared) for backend in backends
+        }
+        return cls(
+            enabled=os.getenv('MICRO_BATCHING', 'false').lower() in ('1', 'true', 'yes'),
+            backends=backends,
+            max_wait_ms=float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', '10')),
+            max_batch_size=int(os.getenv('MICRO_BATCH_MAX_SIZE', '16')),
+            prompt_templates={backend: template for backend, template in templates.items() if template}
+        )
+
+class LoadEstimator:
+    """EWMA of request inter-arrival time and batch round-trip latency for one backend"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.interarrival: Optional[float] = None
+        self.latency: Optional[float] = None
+        self._last_arrival: Optional[float] = None
+
+    def arrival(self, now: float):
+        if self._last_arrival is not None:
+            gap = now - self._last_arrival
+            self.interarrival = gap if self.interarrival is None else \
+                self.alpha * gap + (1 - self.alpha) * self.interarrival
+        self._last_arrival = now
+
+    def completed(self, latency: float):
+        self.latency = latency if self.latency is None else \
+            self.alpha * latency + (1 - self.alpha) * self.latency
+
+    @property
+    def rate(self) -> float:
+        """Requests per second (0 until two arrivals were seen); decays while idle"""
+        if self.interarrival is None:
+            return 0.0
+        idle = time.monotonic() - self._last_arrival
+        return 1.0 / max(self.interarrival, idle, 1e-6)
+
+class _Batch:
+    """Prompts collected for one (backend, parameters) window"""
+
+    def __init__(self, target_size: int):
+        self.target_size = target_size
+        self.prompts: List[str] = []
+        self.deadlines: List[Optional[Deadline]] = []
+        self.results: List[Any] = []
+        self.error: Optional[BaseException] = None
+        self.closed = False
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+    def latest_deadline(self) -> Optional[Deadline]:
+        """The batch call runs until its most patient member gives up (None if any has no deadline)"""
+        if not self.deadlines or None in self.deadlines:
+            return None
+        return max(self.deadlines, key=lambda deadline: deadline.expires_at)
+
+class MicroBatcher:
+    """Leader-based batching: the first request of a window waits and sends the batch"""
+
+    def __init__(self, config: Optional[BatchConfig] = None):
+        self.config = config or BatchConfig.from_env()
+        self._open: Dict[Hashable, _Batch] = {}
+        self._load: Dict[str, LoadEstimator] = {}
+        self._lock = threading.Lock()
+        self.stats_counters = {
+            'requests': 0,
+            'batches': 0,
+            'batched_requests': 0,
+            'solo_requests': 0,
+            'batch_errors': 0
+        }
+        # Without the model's chat template a batched prompt would differ from the solo request
+        self.batched_backends = tuple(
+            backend for backend in self.config.backends
+            if '{prompt}' in self.config.prompt_templates.get(backend, '')
+        )
+        if self.config.enabled:
+            for backend in self.config.backends:
+                if backend not in self.batched_backends:
+                    logger.warning(f"Micro-batching disabled for {backend}: no prompt template with "
+                                   f"'{{prompt}}' (set MICRO_BATCH_PROMPT_TEMPLATE)")
+
+    def applies_to(self, backend: str, stream: bool = False) -> bool:
+        return self.config.enabled and not stream and backend in self.batched_backends
+
+    def format_prompt(self, backend: str, prompt: str) -> str:
+        """A user message in the backend's chat template, for /v1/completions"""
+        return self.config.prompt_templates[backend].replace('{prompt}', prompt)
+
+    def _plan(self, load: LoadEstimator) -> Tuple[float, int]:
+        """Window (seconds) and target size from the current arrival rate"""
+        max_wait = self.config.max_wait_ms / 1000.0
+        rate = load.rate
+        if rate * max_wait < 1.0:
+            # Not expecting a companion request within the window: send immediately
+            return 0.0, 1
+        # Aim for roughly the requests that arrive during one backend round trip
+        round_trip = load.latency or max_wait
+        target = max(2, min(self.config.max_batch_size, math.ceil(rate * round_trip)))
+        return min(max_wait, (target - 1) / rate), target
+
+    def submit(self, backend: str, params: Hashable, prompt: str,
+               send_one: Callable[[], Any], send_batch: Callable[[List[str]], List[Any]]) -> Any:
+        """Complete one prompt, possibly as part of a batch; blocks until its result is ready"""
+        key = (backend, params)
+        with self._lock:
+            self.stats_counters['requests'] += 1
+            load = self._load.setdefault(backend, LoadEstimator())
+            load.arrival(time.monotonic())
+
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                wait, target = self._plan(load)
+                if target <= 1:
+                    self.stats_counters['solo_requests'] += 1
+                    batch = None
+                else:
+                    batch = _Batch(target)
+                    self._open[key] = batch
+            if batch is not None:
+                index = len(batch.prompts)
+                batch.prompts.append(self.format_prompt(backend, prompt))
+                batch.deadlines.append(deadline_manager.current())
+                if len(batch.prompts) >= batch.target_size:
+                    self._close(key, batch)
+
+        if batch is None:
+            return self._timed(load, send_one)
+
+        if not leader:
+            if not batch.done.wait(deadline_manager.remaining()):
+                # This request gave up; the batch carries on for the others
+                raise deadline_manager.exceeded('micro_batch', backend)
+            if batch.error is not None:
+                raise batch.error
+            return batch.results[index]
+
+        batch.full.wait(wait)
+        with self._lock:
+            self._close(key, batch)
+            self.stats_counters['batches'] += 1
+            self.stats_counters['batched_requests'] += len(batch.prompts)
+
+        try:
+            if len(batch.prompts) == 1:
+                batch.results = [self._timed(load, send_one)]
+            else:
+                with deadline_manager.scope(batch.latest_deadline()):
+                    batch.results = self._timed(load, lambda: send_batch(batch.prompts))
+        except BaseException as e:
+            batch.error = e
+            with self._lock:
+                self.stats_counters['batch_errors'] += 1
+            raise
+        finally:
+            batch.done.set()
+        return batch.results[0]
+
+    def _close(self, key: Hashable, batch: _Batch):
+        # Caller holds self._lock
+        if not batch.closed:
+            batch.closed = True
+            if self._open.get(key) is batch:
+                del self._open[key]
+            batch.full.set()
+
+    def _timed(self, load: LoadEstimator, fn: Callable[[], Any]) -> Any:
+        started = time.monotonic()
+        result = fn()
+        with self._lock:
+            load.completed(time.monotonic() - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.stats_counters)
+            load = {
+                backend: {
+                    'arrival_rate_rps': round(estimator.rate, 2),
+                    'round_trip_ms': round(estimator.latency * 1000, 1) if estimator.latency else None,
+                    'window_ms': round(self._plan(estimator)[0] * 1000, 2),
+                    'target_batch_size': self._plan(estimator)[1]
+                }
+                for backend, estimator in self._load.items()
+            }
+        batches = counters['batches']
+        return {
+            'enabled': self.config.enabled,
+            'batched_backends': list(self.batched_backends),
+            'max_wait_ms': self.config.max_wait_ms,
+            'max_batch_size': self.config.max_batch_size,
+            'avg_batch_size': round(counters['batched_requests'] / batches, 2) if batches else 0.0,
+            'backends': load,
+            **counters
+        }
+
+# Global micro-batcher instance
+micro_batcher = MicroBatcher()
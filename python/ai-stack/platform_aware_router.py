@@ -14,7 +14,7 @@ Routes requests to ALL services across the entire platform including:
 - And more platform services
 """
 
-import re
+import os
 import time
 import hashlib
 import requests
@@ -23,19 +23,14 @@ from dataclasses import dataclass
 from enum import Enum
 import logging
 from comprehensive_service_registry import comprehensive_registry, ServiceType
+from startup import Lazy, lazy_import
+from prompt_features import prompt_analyser
+from routing_cache import RoutingDecisionCache
 
 logger = logging.getLogger(__name__)
 
-try:
-    import numpy as np
-    HAS_NUMPY = True
-except ImportError:
-    HAS_NUMPY = False
-    class SimpleNumPy:
-        @staticmethod
-        def mean(data):
-            return sum(data) / len(data) if data else 0.0
-    np = SimpleNumPy()
+# Learned task/complexity classifier; imported (with numpy) only when a trained model is configured
+task_classifier = lazy_import('task_classifier', 'task_classifier') if os.getenv('TASK_CLASSIFIER_MODEL') else None
 
 class TaskType(Enum):
     # Core LLM Tasks
@@ -60,6 +55,9 @@ class ComplexityLevel(Enum):
     COMPLEX = "complex"
     EXPERT = "expert"
 
+TASK_TYPE_VALUES = frozenset(task.value for task in TaskType)
+COMPLEXITY_VALUES = frozenset(level.value for level in ComplexityLevel)
+
 @dataclass
 class ServiceCapability:
     name: str
@@ -79,7 +77,7 @@ class PlatformAwareRouter:
     def __init__(self):
         self.services = self._initialize_all_services()
         self.comprehensive_registry = comprehensive_registry
-        self.routing_cache = {}
+        self.routing_cache = RoutingDecisionCache()
         self.performance_metrics = {}
         
     def _initialize_all_services(self) -> Dict[str, ServiceCapability]:
@@ -264,34 +262,24 @@ class PlatformAwareRouter:
         }
     
     def analyze_complexity(self, prompt: str) -> ComplexityLevel:
+        """Prompt complexity from the learned classifier when it is confident, else the heuristic"""
+        if task_classifier is not None:
+            learned = task_classifier.predict('platform_complexity', prompt)
+            if learned in COMPLEXITY_VALUES:
+                return ComplexityLevel(learned)
+        return self.heuristic_complexity(prompt)
+    
+    def heuristic_complexity(self, prompt: str) -> ComplexityLevel:
         """Analyze prompt complexity using multiple indicators"""
-        prompt_lower = prompt.lower()
-        
-        # Expert-level indicators
-        expert_patterns = [
-            r'\b(theorem|proof|lemma|corollary)\b',
-            r'\b(quantum|cryptography|optimization|complexity theory)\b',
-            r'\b(differential equations|linear algebra|calculus)\b',
-            r'[∑∫∂∆∇]',
-            r'\b(algorithm analysis|big o|asymptotic)\b',
-            r'\b(multi-agent|orchestrate|workflow|automation)\b'
-        ]
-        expert_score = sum(1 for pattern in expert_patterns 
-                         if re.search(pattern, prompt_lower))
-        
-        # Complex-level indicators  
-        complex_patterns = [
-            r'\b(implement|architecture|design pattern|optimization)\b',
-            r'\b(analysis|synthesis|evaluate|compare)\b',
-            r'\b(machine learning|neural network|data structure)\b',
-            r'\b(database design|system architecture)\b',
-            r'\b(search|research|investigate|explore)\b',
-            r'\b(graph|cypher|relationship|network)\b'
-        ]
-        complex_score = sum(1 for pattern in complex_patterns 
-                          if re.search(pattern, prompt_lower))
-        
-        if expert_score >= 2 or ('∫' in prompt and 'solve' in prompt_lower):
+        features = prompt_analyser.analyse(prompt)
+        
+        # Expert-level indicators (as the model router's, plus multi-agent / workflow terms)
+        expert_score = features.count('platform_expert')
+        
+        # Complex-level indicators (as the model router's, plus search and graph terms)
+        complex_score = features.count('platform_complex')
+        
+        if expert_score >= 2 or (features.integral and features.has('solve')):
             return ComplexityLevel.EXPERT
         elif expert_score >= 1 or complex_score >= 2:
             return ComplexityLevel.COMPLEX  
@@ -301,44 +289,49 @@ class PlatformAwareRouter:
             return ComplexityLevel.SIMPLE
     
     def classify_task_type(self, prompt: str) -> TaskType:
+        """Task type from the learned classifier when it is confident, else the heuristic"""
+        if task_classifier is not None:
+            learned = task_classifier.predict('platform_task_type', prompt)
+            if learned in TASK_TYPE_VALUES:
+                return TaskType(learned)
+        return self.heuristic_task_type(prompt)
+    
+    def heuristic_task_type(self, prompt: str) -> TaskType:
         """Enhanced task classification for all platform services"""
-        prompt_lower = prompt.lower()
+        features = prompt_analyser.analyse(prompt)
         
         # Multi-agent/Collaboration indicators
-        if any(word in prompt_lower for word in ['multi-agent', 'collaborate', 'workflow', 'orchestrate', 'automate', 'plan']):
-            if any(word in prompt_lower for word in ['complex', 'multi-step', 'orchestrate']):
+        if features.count('collaboration'):
+            if features.count('multi_step'):
                 return TaskType.MULTI_AGENT
             return TaskType.COLLABORATION
         
         # Search/Research indicators
-        if any(word in prompt_lower for word in ['search', 'find', 'research', 'look up', 'investigate', 'explore']):
-            if any(word in prompt_lower for word in ['web', 'internet', 'recent', 'current', 'latest']):
+        if features.count('search'):
+            if features.count('recency'):
                 return TaskType.RESEARCH
             return TaskType.SEARCH
         
         # Graph/Database indicators
-        if any(word in prompt_lower for word in ['graph', 'cypher', 'neo4j', 'relationship', 'node', 'edge']):
+        if features.count('graph'):
             return TaskType.GRAPH_QUERY
         
         # Network/Security indicators
-        if any(word in prompt_lower for word in ['scan', 'port', 'network', 'ip', 'security']):
+        if features.count('network'):
             return TaskType.NETWORK_SCAN
         
         # Local LLM indicators
-        if any(word in prompt_lower for word in ['local', 'offline', 'private', 'llama', 'mistral']):
+        if features.count('local'):
             return TaskType.LOCAL_LLM
         
         # Core LLM task classification
-        reasoning_patterns = ['solve', 'calculate', 'prove', 'analyze', 'logic', 'theorem']
-        if sum(1 for pattern in reasoning_patterns if pattern in prompt_lower) >= 2:
+        if features.count('platform_reasoning') >= 2:
             return TaskType.REASONING
         
-        coding_patterns = ['code', 'function', 'class', 'python', 'javascript', 'programming']
-        if sum(1 for pattern in coding_patterns if pattern in prompt_lower) >= 1:
+        if features.count('platform_coding') >= 1:
             return TaskType.CODING
         
-        creative_patterns = ['story', 'poem', 'creative', 'write', 'narrative', 'character']
-        if sum(1 for pattern in creative_patterns if pattern in prompt_lower) >= 1:
+        if features.count('platform_creative') >= 1:
             return TaskType.CREATIVE
         
         return TaskType.GENERAL
@@ -412,18 +405,28 @@ class PlatformAwareRouter:
                            budget_factor: float = 1.0) -> Tuple[str, Dict[str, Any]]:
         """Get optimal service for the given prompt and constraints"""
         
-        if not task_type:
-            task_type = self.classify_task_type(prompt)
-        
-        complexity = self.analyze_complexity(prompt)
-        
-        # Calculate scores for all services
-        service_scores = {}
-        for service_name, service_config in self.services.items():
-            score = self.calculate_routing_score(
-                service_config, task_type, complexity, budget_factor
-            )
-            service_scores[service_name] = score
+        # Service scores only change when a service definition does (see invalidate_routing_cache)
+        epoch = self.routing_cache.epoch
+        cache_key = self.routing_cache.key(prompt, task_type, budget_factor)
+        cached = self.routing_cache.get(cache_key, epoch)
+        if cached is not None:
+            (task_type, complexity), service_scores = cached
+        else:
+            if not task_type:
+                task_type = self.classify_task_type(prompt)
+            
+            complexity = self.analyze_complexity(prompt)
+            service_scores = None
+        
+        if service_scores is None:
+            # Calculate scores for all services
+            service_scores = {}
+            for service_name, service_config in self.services.items():
+                score = self.calculate_routing_score(
+                    service_config, task_type, complexity, budget_factor
+                )
+                service_scores[service_name] = score
+            self.routing_cache.put(cache_key, (task_type, complexity), service_scores, epoch)
         
         # Select best service
         best_service = max(service_scores, key=service_scores.get)
@@ -449,6 +452,10 @@ class PlatformAwareRouter:
         
         return best_service, routing_info
     
+    def invalidate_routing_cache(self):
+        """Call after editing a service's capability, cost or latency figures"""
+        self.routing_cache.invalidate('service definitions changed')
+    
     def _get_routing_reason(self, service: str, task_type: TaskType, complexity: ComplexityLevel) -> str:
         """Generate human-readable routing explanation"""
         service_config = self.services[service]
@@ -527,6 +534,8 @@ class PlatformAwareRouter:
             },
             'performance_metrics': self.performance_metrics,
             'cache_size': len(self.routing_cache),
+            'routing_cache': self.routing_cache.stats(),
+            'task_classifier': task_classifier.stats() if task_classifier is not None else None,
             'service_capabilities': {
                 name: {
                     'endpoint': config.endpoint,
@@ -544,4 +553,4 @@ class PlatformAwareRouter:
         }
 
 # Global platform-aware router instance
-platform_router = PlatformAwareRouter()
\ No newline at end of file
+platform_router = Lazy(PlatformAwareRouter, 'platform_router')
\ No newline at end of file
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Single-Pass Prompt Feature Extraction for the Routers
+Every keyword and regex indicator used by IntelligentRouter and PlatformAwareRouter
+is compiled once into one trie-shaped regex. A prompt is lowercased and scanned
+once; each hit is attributed to the indicators it satisfies (whole-word indicators
+check their boundaries on the hit), and the result is a PromptFeatures vector that
+both routers score from, instead of dozens of separate scans per request.
+
+Usage:
+    python prompt_features.py --sizes 100,1000,10000,100000 --iterations 200
+"""
+
+import re
+import time
+import random
+import argparse
+import logging
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class Indicator(NamedTuple):
+    """A named prompt signal: present when any of its literals occurs in the lowercased
+    prompt (as a whole word when whole_word is set, matching the routers' `\\b(...)\\b`)"""
+    name: str
+    literals: Tuple[str, ...]
+    whole_word: bool = True
+
+# Regex indicators; each counts once however often it matches
+PATTERN_INDICATORS = [
+    Indicator('proof_terms', ('theorem', 'proof', 'lemma', 'corollary')),
+    Indicator('advanced_topics', ('quantum', 'cryptography', 'optimization', 'complexity theory')),
+    Indicator('higher_math', ('differential equations', 'linear algebra', 'calculus')),
+    Indicator('math_symbols', ('∑', '∫', '∂', '∆', '∇'), whole_word=False),
+    Indicator('complexity_analysis', ('algorithm analysis', 'big o', 'asymptotic')),
+    Indicator('automation_terms', ('multi-agent', 'orchestrate', 'workflow', 'automation')),
+    Indicator('engineering_terms', ('implement', 'architecture', 'design pattern', 'optimization')),
+    Indicator('evaluation_terms', ('analysis', 'synthesis', 'evaluate', 'compare')),
+    Indicator('ml_terms', ('machine learning', 'neural network', 'data structure')),
+    Indicator('system_design_terms', ('database design', 'system architecture')),
+    Indicator('investigation_terms', ('search', 'research', 'investigate', 'explore')),
+    Indicator('graph_terms', ('graph', 'cypher', 'relationship', 'network')),
+    Indicator('code_terms', ('function', 'class', 'method', 'variable')),
+    Indicator('problem_solving_terms', ('calculate', 'solve', 'determine', 'find')),
+    Indicator('programming_terms', ('algorithm', 'programming', 'debug')),
+]
+
+# Indicator groups the routers score on. Members name a pattern indicator above or are
+# plain keywords, which match anywhere in the prompt (substring semantics)
+INDICATOR_GROUPS: Dict[str, Tuple[str, ...]] = {
+    # IntelligentRouter.analyze_complexity
+    'expert': ('proof_terms', 'advanced_topics', 'higher_math', 'math_symbols', 'complexity_analysis'),
+    'complex': ('engineering_terms', 'evaluation_terms', 'ml_terms', 'system_design_terms'),
+    'technical': ('code_terms', 'problem_solving_terms', 'programming_terms'),
+    # IntelligentRouter.classify_task_type
+    'reasoning': ('solve', 'calculate', 'prove', 'analyze', 'logic', 'theorem',
+                  'equation', 'mathematical', 'reasoning', 'deduce', 'infer'),
+    'coding': ('code', 'function', 'class', 'python', 'javascript', 'programming',
+               'debug', 'algorithm', 'implementation', 'syntax', 'compile'),
+    'creative': ('story', 'poem', 'creative', 'write', 'narrative', 'character',
+                 'plot', 'fiction', 'imagine', 'describe'),
+    'advanced': ('research', 'academic', 'paper', 'study', 'analysis', 'review',
+                 'synthesis', 'comparison', 'evaluation', 'methodology'),
+    # PlatformAwareRouter.analyze_complexity
+    'platform_expert': ('proof_terms', 'advanced_topics', 'higher_math', 'math_symbols',
+                        'complexity_analysis', 'automation_terms'),
+    'platform_complex': ('engineering_terms', 'evaluation_terms', 'ml_terms', 'system_design_terms',
+                         'investigation_terms', 'graph_terms'),
+    # PlatformAwareRouter.classify_task_type
+    'collaboration': ('multi-agent', 'collaborate', 'workflow', 'orchestrate', 'automate', 'plan'),
+    'multi_step': ('complex', 'multi-step', 'orchestrate'),
+    'search': ('search', 'find', 'research', 'look up', 'investigate', 'explore'),
+    'recency': ('web', 'internet', 'recent', 'current', 'latest'),
+    'graph': ('graph', 'cypher', 'neo4j', 'relationship', 'node', 'edge'),
+    'network': ('scan', 'port', 'network', 'ip', 'security'),
+    'local': ('local', 'offline', 'private', 'llama', 'mistral'),
+    'platform_reasoning': ('solve', 'calculate', 'prove', 'analyze', 'logic', 'theorem'),
+    'platform_coding': ('code', 'function', 'class', 'python', 'javascript', 'programming'),
+    'platform_creative': ('story', 'poem', 'creative', 'write', 'narrative', 'character'),
+}
+
+# Order of the group counts in PromptFeatures.vector()
+GROUP_ORDER = tuple(INDICATOR_GROUPS)
+
+def _is_word_char(ch: str) -> bool:
+    # Same definition as `\b` for str patterns
+    return ch.isalnum() or ch == '_'
+
+def _trie_regex(literals: Iterable[str]) -> str:
+    """Alternation of literals factored into a trie, longest alternative first, so the
+    regex engine follows one branch per character instead of trying every literal"""
+    trie: Dict[str, dict] = {}
+    for literal in literals:
+        node = trie
+        for ch in literal:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def emit(node: Dict[str, dict]) -> str:
+        terminal = '' in node
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if terminal:
+            # Greedy: the longer literal wins; shorter ones are recovered as prefixes
+            return '(?:' + body + ')?' if len(branches) == 1 else body + '?'
+        return body
+
+    return emit(trie)
+
+class PromptFeatures(NamedTuple):
+    """What the routers know about a prompt after one scan"""
+    length: int
+    newlines: int
+    questions: int
+    steps: int                   # occurrences of 'step' (case-sensitive, as the router counts it)
+    code_fence: bool
+    integral: bool               # '∫' appears (an expert signal when combined with 'solve')
+    indicators: FrozenSet[str]   # names of the indicators / keywords present
+    groups: Dict[str, int]       # group -> number of its members present
+
+    def count(self, group: str) -> int:
+        return self.groups[group]
+
+    def has(self, indicator: str) -> bool:
+        return indicator in self.indicators
+
+    def vector(self) -> List[float]:
+        """Numeric feature vector: shape counts, then group counts in GROUP_ORDER"""
+        return [float(self.length), float(self.newlines), float(self.questions), float(self.steps),
+                float(self.code_fence), float(self.integral)] + [float(self.groups[g]) for g in GROUP_ORDER]
+
+class PromptAnalyser:
+    """Compiles the indicator tables once and extracts PromptFeatures in one pass"""
+
+    def __init__(self, indicators: Optional[List[Indicator]] = None,
+                 groups: Optional[Dict[str, Tuple[str, ...]]] = None):
+        self.groups = dict(groups or INDICATOR_GROUPS)
+        self.indicators: Dict[str, Indicator] = {ind.name: ind for ind in (indicators or PATTERN_INDICATORS)}
+        for members in self.groups.values():
+            for member in members:
+                if member not in self.indicators:
+                    self.indicators[member] = Indicator(member, (member,), whole_word=False)
+
+        # literal -> [(indicator, whole_word)] it can satisfy
+        self._satisfies: Dict[str, List[Tuple[str, bool]]] = {}
+        for indicator in self.indicators.values():
+            for literal in indicator.literals:
+                self._satisfies.setdefault(literal, []).append((indicator.name, indicator.whole_word))
+
+        # A hit on a literal is also a hit on every literal that is a prefix of it
+        literals = sorted(self._satisfies)
+        self._prefixes: Dict[str, Tuple[str, ...]] = {
+            literal: tuple(other for other in literals if literal.startswith(other))
+            for literal in literals
+        }
+        # Zero-width lookahead, so overlapping hits ('research' / 'search') are all reported
+        self._scanner = re.compile('(?=(' + _trie_regex(literals) + '))')
+        self._member_of: Dict[str, List[str]] = {}
+        for group, members in self.groups.items():
+            for member in members:
+                self._member_of.setdefault(member, []).append(group)
+        self._last: Tuple[Optional[str], Optional[PromptFeatures]] = (None, None)
+
+    def analyse(self, prompt: str) -> PromptFeatures:
+        """Features of `prompt`; the last result is reused when both routing steps ask"""
+        last_prompt, last_features = self._last
+        if last_prompt is prompt:
+            return last_features
+
+        text = prompt.lower()
+        size = len(text)
+        found = set()
+        settled = set()     # literals whose indicators are all found
+        exhausted = set()   # hit literals whose prefixes are all settled: later hits add nothing
+        for match in self._scanner.finditer(text):
+            literal = match.group(1)
+            if literal in exhausted:
+                continue
+            start = match.start()
+            prefixes = self._prefixes[literal]
+            for prefix in prefixes:
+                if prefix in settled:
+                    continue
+                unresolved = False
+                for name, whole_word in self._satisfies[prefix]:
+                    if name in found:
+                        continue
+                    if whole_word:
+                        end = start + len(prefix)
+                        if (start and _is_word_char(text[start - 1])) or \
+                                (end < size and _is_word_char(text[end])):
+                            unresolved = True
+                            continue
+                    found.add(name)
+                if not unresolved:
+                    settled.add(prefix)
+            if all(prefix in settled for prefix in prefixes):
+                exhausted.add(literal)
+
+        indicators = frozenset(found)
+        groups = dict.fromkeys(self.groups, 0)
+        for name in indicators:
+            for group in self._member_of.get(name, ()):
+                groups[group] += 1
+        features = PromptFeatures(
+            length=len(prompt),
+            newlines=prompt.count('\n'),
+            questions=prompt.count('?'),
+            steps=prompt.count('step'),
+            code_fence='```' in prompt,
+            integral='∫' in prompt,
+            indicators=indicators,
+            groups=groups
+        )
+        self._last = (prompt, features)
+        return features
+
+# Global prompt analyser instance
+prompt_analyser = PromptAnalyser()
+
+# ---------------------------------------------------------------------------
+# Micro-benchmark: the routers' former per-pattern scans vs. one compiled pass
+# ---------------------------------------------------------------------------
+
+_VOCABULARY = ('the of and to in is for with on that this by from as be are it at an or was '
+               'please explain write function class data system request user value result '
+               'analysis design network search story code model time solve research').split()
+
+def _sample_prompt(size: int, rng: random.Random) -> str:
+    words, total = [], 0
+    while total < size:
+        word = rng.choice(_VOCABULARY)
+        words.append(word)
+        total += len(word) + 1
+    text = ' '.join(words)[:size]
+    return '\n'.join(text[i:i + 80] for i in range(0, len(text), 80))
+
+# The routers' indicators as they used to be written: one regex or substring test each
+_LEGACY_PATTERNS = {
+    ind.name: (r'\b(' + '|'.join(ind.literals) + r')\b') if ind.whole_word else '[' + ''.join(ind.literals) + ']'
+    for ind in PATTERN_INDICATORS
+}
+
+def _legacy_scan(prompt: str) -> int:
+    """What the two routers did per request before this module: every group member
+    scanned separately over the lowercased prompt"""
+    prompt_lower = prompt.lower()
+    hits = 0
+    for members in INDICATOR_GROUPS.values():
+        for member in members:
+            pattern = _LEGACY_PATTERNS.get(member)
+            if pattern is None:
+                hits += member in prompt_lower
+            else:
+                hits += re.search(pattern, prompt_lower) is not None
+    return hits
+
+def run_benchmark(sizes: List[int], iterations: int, seed: int = 7) -> List[Dict[str, float]]:
+    rng = random.Random(seed)
+    analyser = PromptAnalyser()
+    rows = []
+    for size in sizes:
+        # Fresh strings each round so the one-entry reuse in analyse() doesn't short-circuit
+        prompts = [_sample_prompt(size, rng) for _ in range(8)]
+        rounds = max(5, iterations * 1000 // max(size, 1000))
+
+        started = time.perf_counter()
+        for i in range(rounds):
+            _legacy_scan(prompts[i % len(prompts)])
+        legacy = (time.perf_counter() - started) / rounds
+
+        started = time.perf_counter()
+        for i in range(rounds):
+            analyser._last = (None, None)
+            analyser.analyse(prompts[i % len(prompts)])
+        single = (time.perf_counter() - started) / rounds
+
+        rows.append({'bytes': size, 'rounds': rounds, 'legacy_us': legacy * 1e6,
+                     'single_pass_us': single * 1e6, 'speedup': legacy / single if single else 0.0})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Prompt feature extraction micro-benchmark')
+    parser.add_argument('--sizes', default='100,1000,10000,100000', help='Prompt sizes in bytes')
+    parser.add_argument('--iterations', type=int, default=200, help='Rounds at <=1 KB (scaled down for larger prompts)')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rows = run_benchmark([int(size) for size in args.sizes.split(',')], args.iterations, args.seed)
+    print(f"{'bytes':>8} {'rounds':>7} {'per-pattern scans':>18} {'single pass':>12} {'speedup':>8}")
+    for row in rows:
+        print(f"{row['bytes']:>8} {row['rounds']:>7} {row['legacy_us']:>15.1f} us "
+              f"{row['single_pass_us']:>9.1f} us {row['speedup']:>7.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Per-Caller Rate Limiting for the API Gateway
+Token buckets for requests/sec and estimated tokens/sec plus a concurrent
+request cap, keyed by API key (or client IP). Opt-in with RATE_LIMIT_ENABLED.
+Limits are reloaded live from a JSON file or the /ratelimits endpoint, and
+bucket state can live in a SQLite file shared by every gateway worker process
+on the host.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import ipaddress
+import sqlite3
+import threading
+import logging
+from dataclasses import dataclass, asdict, field
+from typing import Any, Callable, Container, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Only honour X-Forwarded-For when the gateway sits behind a trusted proxy: either every
+# peer (RATE_LIMIT_TRUST_FORWARDED) or peers inside RATE_LIMIT_TRUSTED_PROXIES (CIDRs)
+TRUST_FORWARDED_FOR = os.getenv('RATE_LIMIT_TRUST_FORWARDED', 'false').lower() in ('1', 'true', 'yes')
+
+def parse_networks(spec: str) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+    """Comma-separated CIDRs (bare addresses allowed); invalid entries are logged and skipped"""
+    networks = []
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+        except ValueError:
+            logger.error(f"Ignoring invalid trusted proxy network {entry!r}")
+    return networks
+
+# nginx-configs/ssl-main.conf proxies to the gateway over the default Docker bridge
+TRUSTED_PROXIES = parse_networks(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', '127.0.0.1/32,::1/128,172.17.0.0/16'))
+
+# Idle callers' bucket state is dropped after this long (a full refill for the default limits)
+BUCKET_IDLE_TTL = float(os.getenv('RATE_LIMIT_IDLE_TTL', '600'))
+
+@dataclass
+class RateLimit:
+    """Limits applied to one caller"""
+    requests_per_second: float = 20.0
+    burst_requests: float = 40.0
+    tokens_per_second: float = 20000.0
+    burst_tokens: float = 80000.0
+    max_concurrent: int = 16
+
+@dataclass
+class RateLimitConfig:
+    """Default limits plus per-key overrides ('ip:<addr>' entries match client IPs)"""
+    enabled: bool = False
+    default: RateLimit = field(default_factory=RateLimit)
+    keys: Dict[str, RateLimit] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], base: Optional['RateLimitConfig'] = None) -> 'RateLimitConfig':
+        base = base or cls()
+        default = RateLimit(**{**asdict(base.default), **data.get('default', {})})
+        keys = {
+            key: RateLimit(**{**asdict(default), **overrides})
+            for key, overrides in data.get('keys', {}).items()
+        }
+        return cls(enabled=bool(data.get('enabled', base.enabled)), default=default, keys=keys)
+
+    @classmethod
+    def from_env(cls) -> 'RateLimitConfig':
+        return cls(
+            enabled=os.getenv('RATE_LIMIT_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+            default=RateLimit(
+                requests_per_second=float(os.getenv('RATE_LIMIT_RPS', '20')),
+                burst_requests=float(os.getenv('RATE_LIMIT_BURST', '40')),
+                tokens_per_second=float(os.getenv('RATE_LIMIT_TPS', '20000')),
+                burst_tokens=float(os.getenv('RATE_LIMIT_TOKEN_BURST', '80000')),
+                max_concurrent=int(os.getenv('RATE_LIMIT_MAX_CONCURRENT', '16'))
+            )
+        )
+
+    def to_dict(self, mask_keys: bool = False) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'default': asdict(self.default),
+            'keys': {(mask_key(key) if mask_keys else key): asdict(limit) for key, limit in self.keys.items()}
+        }
+
+def mask_key(key: str) -> str:
+    """Display form of a config key: client IPs as-is, API keys reduced to a prefix"""
+    return key if key.startswith('ip:') else f"{key[:4]}***"
+
+@dataclass
+class Decision:
+    """Outcome of a rate-limit check, with everything needed for response headers"""
+    allowed: bool
+    limit: RateLimit
+    remaining_requests: float
+    remaining_tokens: float
+    reset_seconds: float
+    retry_after: int = 0
+    reason: Optional[str] = None
+    release: Callable[[], None] = lambda: None
+
+    def headers(self) -> Dict[str, str]:
+        """Standard rate-limit response headers (draft RateLimit-* plus X-RateLimit-*)"""
+        headers = {
+            'RateLimit-Limit': str(int(self.limit.burst_requests)),
+            'RateLimit-Remaining': str(max(0, int(self.remaining_requests))),
+            'RateLimit-Reset': str(max(0, int(self.reset_seconds + 0.999))),
+            'X-RateLimit-Limit-Requests': str(int(self.limit.burst_requests)),
+            'X-RateLimit-Remaining-Requests': str(max(0, int(self.remaining_requests))),
+            'X-RateLimit-Limit-Tokens': str(int(self.limit.burst_tokens)),
+            'X-RateLimit-Remaining-Tokens': str(max(0, int(self.remaining_tokens))),
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(self.retry_after)
+        return headers
+
+def _refill(tokens: float, updated_at: float, rate: float, burst: float, now: float) -> float:
+    return min(burst, tokens + max(0.0, now - updated_at) * rate)
+
+def _levels(buckets: Dict[str, Tuple[float, float]], limit: RateLimit, now: float) -> Tuple[float, float]:
+    """(requests, tokens) currently left in a caller's buckets, after refill"""
+    req_tokens, req_at = buckets.get('requests', (limit.burst_requests, now))
+    tok_tokens, tok_at = buckets.get('tokens', (limit.burst_tokens, now))
+    return (_refill(req_tokens, req_at, limit.requests_per_second, limit.burst_requests, now),
+            _refill(tok_tokens, tok_at, limit.tokens_per_second, limit.burst_tokens, now))
+
+def _take(buckets: Dict[str, Tuple[float, float]], limit: RateLimit, cost_tokens: float,
+          now: float) -> Tuple[bool, float, float, float, Optional[str]]:
+    """Apply one request to the caller's (requests, tokens) buckets in place.
+    Returns (allowed, remaining_requests, remaining_tokens, wait_seconds, reason)"""
+    requests_left, tokens_left = _levels(buckets, limit, now)
+
+    # A single request larger than the whole bucket is charged the full bucket
+    cost_tokens = min(cost_tokens, limit.burst_tokens)
+
+    wait, reason = 0.0, None
+    if requests_left < 1.0:
+        wait = (1.0 - requests_left) / max(limit.requests_per_second, 1e-9)
+        reason = 'request rate exceeded'
+    if tokens_left < cost_tokens:
+        token_wait = (cost_tokens - tokens_left) / max(limit.tokens_per_second, 1e-9)
+        if token_wait > wait:
+            wait, reason = token_wait, 'token rate exceeded'
+
+    allowed = reason is None
+    if allowed:
+        requests_left -= 1.0
+        tokens_left -= cost_tokens
+    buckets['requests'] = (requests_left, now)
+    buckets['tokens'] = (tokens_left, now)
+    return allowed, requests_left, tokens_left, wait, reason
+
+class MemoryStore:
+    """Bucket and concurrency state for a single gateway process"""
+
+    def __init__(self, idle_ttl: float = BUCKET_IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self._buckets: Dict[str, Dict[str, Tuple[float, float]]] = {}
+        self._active: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.time() + idle_ttl
+
+    def take(self, identity: str, limit: RateLimit, cost_tokens: float):
+        now = time.time()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            return _take(self._buckets.setdefault(identity, {}), limit, cost_tokens, now)
+
+    def peek(self, identity: str, limit: RateLimit) -> Tuple[float, float]:
+        """(requests, tokens) left for a caller without charging anything"""
+        with self._lock:
+            return _levels(self._buckets.get(identity, {}), limit, time.time())
+
+    def _sweep(self, now: float):
+        """Forget callers not seen for idle_ttl (caller holds the lock)"""
+        cutoff = now - self.idle_ttl
+        idle = [identity for identity, buckets in self._buckets.items()
+                if max((updated_at for _, updated_at in buckets.values()), default=0.0) <= cutoff]
+        for identity in idle:
+            del self._buckets[identity]
+        self._next_sweep = now + self.idle_ttl
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._buckets)
+
+    def enter(self, identity: str, max_concurrent: int) -> Optional[str]:
+        """Reserve a concurrency slot; returns a lease id or None when at the cap"""
+        with self._lock:
+            active = self._active.get(identity, 0)
+            if active >= max_concurrent:
+                return None
+            self._active[identity] = active + 1
+            return identity
+
+    def leave(self, identity: str, lease: str):
+        with self._lock:
+            active = self._active.get(identity, 0) - 1
+            if active > 0:
+                self._active[identity] = active
+            else:
+                self._active.pop(identity, None)
+
+    def active(self, identity: str) -> int:
+        with self._lock:
+            return self._active.get(identity, 0)
+
+class SQLiteStore:
+    """Bucket and concurrency state shared by gateway workers through a local SQLite file"""
+
+    def __init__(self, path: str, lease_ttl: float = 600.0, idle_ttl: float = BUCKET_IDLE_TTL):
+        self.path = path
+        self.lease_ttl = lease_ttl      # leases of crashed workers expire after this
+        self.idle_ttl = idle_ttl
+        self._next_sweep = time.time() + idle_ttl
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets ("
+                     " identity TEXT NOT NULL, bucket TEXT NOT NULL,"
+                     " tokens REAL NOT NULL, updated_at REAL NOT NULL,"
+                     " PRIMARY KEY (identity, bucket))")
+        conn.execute("CREATE TABLE IF NOT EXISTS leases ("
+                     " lease TEXT PRIMARY KEY, identity TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_leases_identity ON leases(identity)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, identity: str, limit: RateLimit, cost_tokens: float):
+        conn = self._connect()
+        now = time.time()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.idle_ttl
+            conn.execute("DELETE FROM buckets WHERE updated_at <= ?", (now - self.idle_ttl,))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("SELECT bucket, tokens, updated_at FROM buckets WHERE identity = ?",
+                                (identity,)).fetchall()
+            buckets = {bucket: (tokens, updated_at) for bucket, tokens, updated_at in rows}
+            result = _take(buckets, limit, cost_tokens, now)
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (identity, bucket, tokens, updated_at) VALUES (?, ?, ?, ?)",
+                [(identity, bucket, tokens, updated_at) for bucket, (tokens, updated_at) in buckets.items()]
+            )
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def peek(self, identity: str, limit: RateLimit) -> Tuple[float, float]:
+        rows = self._connect().execute("SELECT bucket, tokens, updated_at FROM buckets WHERE identity = ?",
+                                       (identity,)).fetchall()
+        return _levels({bucket: (tokens, updated_at) for bucket, tokens, updated_at in rows}, limit, time.time())
+
+    def enter(self, identity: str, max_concurrent: int) -> Optional[str]:
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE identity = ? AND expires_at <= ?", (identity, now))
+            active = conn.execute("SELECT COUNT(*) FROM leases WHERE identity = ?", (identity,)).fetchone()[0]
+            lease = None
+            if active < max_concurrent:
+                lease = uuid.uuid4().hex
+                conn.execute("INSERT INTO leases (lease, identity, expires_at) VALUES (?, ?, ?)",
+                             (lease, identity, now + self.lease_ttl))
+            conn.execute("COMMIT")
+            return lease
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def leave(self, identity: str, lease: str):
+        self._connect().execute("DELETE FROM leases WHERE lease = ?", (lease,))
+
+    def active(self, identity: str) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM leases WHERE identity = ? AND expires_at > ?", (identity, time.time())
+        ).fetchone()[0]
+
+def caller_identity(headers, remote_addr: Optional[str], keys: Container[str] = ()) -> Tuple[str, Optional[str]]:
+    """(identity, config_key) for a request: hashed API key if it is one of the configured
+    keys, else client IP (so made-up keys can't each claim a fresh bucket)"""
+    auth = headers.get('Authorization') or ''
+    api_key = headers.get('X-API-Key') or (auth[7:].strip() if auth.lower().startswith('bearer ') else '')
+    if api_key and api_key in keys:
+        return 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16], api_key
+    address = forwarded_client(headers.get('X-Forwarded-For') or '', remote_addr) or remote_addr or 'unknown'
+    return f'ip:{address}', f'ip:{address}'
+
+def _is_trusted_proxy(address: Optional[str]) -> bool:
+    try:
+        ip = ipaddress.ip_address((address or '').strip())
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def forwarded_client(forwarded_for: str, remote_addr: Optional[str]) -> Optional[str]:
+    """Client address from X-Forwarded-For when the peer is a trusted proxy: the
+    right-most hop that is not itself a trusted proxy (left-most entries are
+    client-supplied and could be forged)"""
+    hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+    if not hops:
+        return None
+    if TRUST_FORWARDED_FOR:
+        return hops[0]
+    if not _is_trusted_proxy(remote_addr):
+        return None
+    for hop in reversed(hops):
+        if not _is_trusted_proxy(hop):
+            return hop
+    return hops[0]
+
+def estimate_tokens(prompt: str, max_tokens: Optional[int]) -> int:
+    """Rough token cost of a completion: ~4 characters per prompt token plus the output budget"""
+    try:
+        output = int(max_tokens) if max_tokens is not None else 512
+    except (TypeError, ValueError):
+        output = 512
+    return len(prompt or '') // 4 + max(0, output)
+
+class RateLimiter:
+    """Checks callers against their limits; config reloads live from RATE_LIMIT_CONFIG"""
+
+    def __init__(self, config: Optional[RateLimitConfig] = None,
+                 config_path: Optional[str] = None, store_path: Optional[str] = None):
+        self.base_config = config or RateLimitConfig.from_env()
+        self.config = self.base_config
+        self.config_path = config_path if config_path is not None else os.getenv('RATE_LIMIT_CONFIG')
+        store_path = store_path if store_path is not None else os.getenv('RATE_LIMIT_STORE')
+        self.store = SQLiteStore(store_path) if store_path else MemoryStore()
+        self._config_mtime = None
+        self._config_checked = 0.0
+        self._lock = threading.Lock()
+        self.stats_counters = {
+            'allowed': 0,
+            'rejected_rate': 0,
+            'rejected_tokens': 0,
+            'rejected_concurrency': 0
+        }
+        self._reload_config()
+
+    def _reload_config(self):
+        """Pick up edits to the config file (checked at most once a second)"""
+        if not self.config_path:
+            return
+        now = time.monotonic()
+        if now - self._config_checked < 1.0:
+            return
+        self._config_checked = now
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            return
+        if mtime == self._config_mtime:
+            return
+        try:
+            with open(self.config_path) as f:
+                self.config = RateLimitConfig.from_dict(json.load(f), self.base_config)
+            self._config_mtime = mtime
+            logger.info(f"Loaded rate limits from {self.config_path} ({len(self.config.keys)} key overrides)")
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Invalid rate limit config {self.config_path}: {e}")
+            self._config_mtime = mtime
+
+    def update_config(self, data: Dict[str, Any]) -> RateLimitConfig:
+        """Apply new limits now, and persist them so other workers reload them"""
+        config = RateLimitConfig.from_dict(data, self.base_config)
+        with self._lock:
+            self.config = config
+        if self.config_path:
+            tmp_path = f"{self.config_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(config.to_dict(), f, indent=2)
+            os.replace(tmp_path, self.config_path)
+            self._config_mtime = os.path.getmtime(self.config_path)
+        return config
+
+    def identify(self, headers, remote_addr: Optional[str]) -> Tuple[str, Optional[str]]:
+        """caller_identity() against the current key overrides"""
+        self._reload_config()
+        return caller_identity(headers, remote_addr, self.config.keys)
+
+    def limit_for(self, config_key: Optional[str]) -> RateLimit:
+        return self.config.keys.get(config_key, self.config.default)
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.stats_counters[counter] += 1
+
+    def check(self, identity: str, config_key: Optional[str], cost_tokens: float) -> Optional[Decision]:
+        """Charge one request to a caller; None when rate limiting is disabled.
+        An allowed decision holds a concurrency slot until decision.release() is called."""
+        self._reload_config()
+        if not self.config.enabled:
+            return None
+
+        limit = self.limit_for(config_key)
+        # Reserve the concurrency slot first so a request turned away here is not charged
+        lease = self.store.enter(identity, limit.max_concurrent)
+        if lease is None:
+            self._count('rejected_concurrency')
+            requests_left, tokens_left = self.store.peek(identity, limit)
+            reset = (limit.burst_requests - requests_left) / max(limit.requests_per_second, 1e-9)
+            return Decision(False, limit, requests_left, tokens_left, reset, retry_after=1,
+                            reason=f"more than {limit.max_concurrent} concurrent requests")
+
+        try:
+            allowed, requests_left, tokens_left, wait, reason = self.store.take(identity, limit, cost_tokens)
+        except BaseException:
+            self.store.leave(identity, lease)
+            raise
+        reset = (limit.burst_requests - requests_left) / max(limit.requests_per_second, 1e-9)
+        decision = Decision(allowed, limit, requests_left, tokens_left, reset,
+                            retry_after=max(1, int(wait + 0.999)) if not allowed else 0, reason=reason)
+        if not allowed:
+            self.store.leave(identity, lease)
+            self._count('rejected_tokens' if reason == 'token rate exceeded' else 'rejected_rate')
+            return decision
+
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                self.store.leave(identity, lease)
+
+        decision.release = release
+        self._count('allowed')
+        return decision
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.stats_counters)
+        return {
+            'store': 'sqlite' if isinstance(self.store, SQLiteStore) else 'memory',
+            'config_path': self.config_path,
+            **self.config.to_dict(mask_keys=True),
+            **counters
+        }
+
+# Global rate limiter instance
+rate_limiter = RateLimiter()
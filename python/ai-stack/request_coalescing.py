@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+In-Flight Request Coalescing (single-flight) for the API Gateway
+Concurrent requests with the same fingerprint attach to one in-flight backend
+call and share its result; streaming requests share one backend stream that
+is fanned out to every subscriber.
+"""
+
+import os
+import threading
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from deadlines import deadline_manager, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# 'deterministic' (default) only coalesces temperature-0 requests, since sampled completions
+# differ per caller; 'all' coalesces every identical request, 'off' disables
+COALESCING_MODE = os.getenv('REQUEST_COALESCING', 'deterministic').lower()
+
+_END = object()
+
+class _Call:
+    """One in-flight call shared by a leader and its followers"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+class StreamFanout:
+    """Replays one upstream chunk iterator to any number of subscribers.
+
+    Whichever subscriber first needs a chunk that hasn't arrived yet pulls it from
+    upstream; the others wait, so the stream keeps flowing as long as anyone reads it.
+    """
+
+    def __init__(self, upstream: Iterator[bytes], meta: Any, on_finished: Callable[[], None]):
+        self.upstream = upstream
+        self.meta = meta
+        self._on_finished = on_finished
+        self._chunks: List[bytes] = []
+        self._cond = threading.Condition()
+        self._finished = False
+        self._error: Optional[BaseException] = None
+        self._pulling = False
+        self._subscribers = 0
+
+    def attach(self) -> bool:
+        """Reserve a subscription; False once the upstream has finished"""
+        with self._cond:
+            if self._finished:
+                return False
+            self._subscribers += 1
+            return True
+
+    def _finish(self, error: Optional[BaseException] = None):
+        # Caller holds self._cond
+        if not self._finished:
+            self._finished = True
+            self._error = error
+            self._on_finished()
+        self._cond.notify_all()
+
+    def subscribe(self) -> 'Subscription':
+        """Iterate the shared stream from its first chunk (call attach() first)"""
+        return Subscription(self)
+
+    def _chunk(self, index: int) -> Any:
+        """Chunk at index, pulling it from upstream if nobody else is; _END once finished"""
+        while True:
+            with self._cond:
+                while index >= len(self._chunks) and not self._finished and self._pulling:
+                    self._cond.wait()
+                if index < len(self._chunks):
+                    return self._chunks[index]
+                if self._finished:
+                    if self._error is not None:
+                        raise self._error
+                    return _END
+                self._pulling = True
+
+            try:
+                pulled = next(self.upstream, _END)
+            except Exception as e:
+                with self._cond:
+                    self._pulling = False
+                    self._finish(e)
+                continue
+
+            with self._cond:
+                self._pulling = False
+                if pulled is _END:
+                    self._finish()
+                else:
+                    self._chunks.append(pulled)
+                    self._cond.notify_all()
+
+    def _detach(self):
+        """Drop one subscription; the last one to leave early closes the upstream"""
+        with self._cond:
+            self._subscribers -= 1
+            abandoned = self._subscribers == 0 and not self._finished
+            if abandoned:
+                self._finish()
+        if abandoned and hasattr(self.upstream, 'close'):
+            self.upstream.close()
+
+class Subscription:
+    """One subscriber's view of a StreamFanout. Closing it detaches the subscriber even
+    if it was never iterated, so an early client disconnect cannot pin the upstream."""
+
+    def __init__(self, fanout: StreamFanout):
+        self.fanout = fanout
+        self.index = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if self.closed:
+            raise StopIteration
+        try:
+            chunk = self.fanout._chunk(self.index)
+        except BaseException:
+            self.close()
+            raise
+        if chunk is _END:
+            self.close()
+            raise StopIteration
+        self.index += 1
+        return chunk
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.fanout._detach()
+
+class SingleFlight:
+    """Collapse concurrent identical calls into one execution"""
+
+    def __init__(self, mode: str = COALESCING_MODE):
+        self.mode = mode
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, StreamFanout] = {}
+        self._lock = threading.Lock()
+        self.stats_counters = {
+            'leaders': 0,
+            'coalesced': 0,
+            'stream_leaders': 0,
+            'stream_coalesced': 0
+        }
+
+    def applies_to(self, payload: Dict[str, Any]) -> bool:
+        """Whether a backend payload is eligible for coalescing"""
+        if self.mode == 'off':
+            return False
+        if self.mode == 'deterministic':
+            try:
+                return float(payload.get('temperature', 1.0)) == 0.0
+            except (TypeError, ValueError):
+                return False
+        return True
+
+    def do(self, key: str, fn: Callable[[], Any], counter_prefix: str = '') -> Tuple[Any, bool]:
+        """Run fn once per key among concurrent callers; returns (result, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.stats_counters[f'{counter_prefix}coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.stats_counters[f'{counter_prefix}leaders'] += 1
+                leader = True
+
+        if not leader:
+            if not call.done.wait(deadline_manager.remaining()):
+                raise deadline_manager.exceeded('coalesced')
+            if call.error is not None:
+                if isinstance(call.error, DeadlineExceeded) and not deadline_manager.exhausted():
+                    # The leader ran out of time, but this caller still has budget of its own
+                    return fn(), False
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stream(self, key: str, open_fn: Callable[[], Tuple[Iterator[bytes], Any]]) -> Tuple[Iterator[bytes], Any, bool]:
+        """Share one upstream stream per key; returns (chunks, meta, shared).
+
+        open_fn returns (chunk_iterator, meta) and is itself single-flighted, so
+        requests arriving while the backend stream is being opened also attach.
+        """
+        with self._lock:
+            fanout = self._streams.get(key)
+        if fanout is not None and fanout.attach():
+            with self._lock:
+                self.stats_counters['stream_coalesced'] += 1
+            return fanout.subscribe(), fanout.meta, True
+
+        fanout, shared = self.do(f"stream:{key}", lambda: self._open_fanout(key, open_fn), 'stream_')
+        if not fanout.attach():
+            # Upstream already drained by the time this caller got here; serve it a fresh stream
+            fanout = self._open_fanout(key, open_fn)
+            fanout.attach()
+            shared = False
+
+        return fanout.subscribe(), fanout.meta, shared
+
+    def _open_fanout(self, key: str, open_fn) -> StreamFanout:
+        upstream, meta = open_fn()
+
+        def release():
+            with self._lock:
+                if self._streams.get(key) is fanout:
+                    del self._streams[key]
+
+        fanout = StreamFanout(upstream, meta, release)
+        with self._lock:
+            self._streams[key] = fanout
+        return fanout
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.stats_counters)
+            in_flight = len(self._calls)
+            streams = len(self._streams)
+        total = counters['leaders'] + counters['coalesced']
+        return {
+            'mode': self.mode,
+            'in_flight_calls': in_flight,
+            'in_flight_streams': streams,
+            'coalesced_ratio': round(counters['coalesced'] / total, 4) if total else 0.0,
+            **counters
+        }
+
+# Global coalescer instance
+request_coalescer = SingleFlight()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Completion Response Cache for the API Gateway
+Caches deterministic (temperature 0) completions keyed by a fingerprint of the
+routed model and its generation parameters. In-memory LRU with TTL, plus an
+optional SQLite tier that survives gateway restarts.
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Per-request cache policies (from Cache-Control / X-Gateway-Cache headers)
+CACHE_DEFAULT = 'default'   # read and write when the request is cacheable
+CACHE_REFRESH = 'refresh'   # skip the lookup but store the fresh result
+CACHE_BYPASS = 'bypass'     # neither read nor write
+
+@dataclass
+class CacheConfig:
+    """Response cache settings"""
+    enabled: bool = False
+    max_entries: int = 1024
+    ttl_seconds: float = 300.0
+    disk_path: Optional[str] = None
+    disk_max_entries: int = 50000
+
+    @classmethod
+    def from_env(cls) -> 'CacheConfig':
+        return cls(
+            enabled=os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+            max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1024')),
+            ttl_seconds=float(os.getenv('RESPONSE_CACHE_TTL', '300')),
+            disk_path=os.getenv('RESPONSE_CACHE_DB') or None,
+            disk_max_entries=int(os.getenv('RESPONSE_CACHE_DISK_MAX_ENTRIES', '50000'))
+        )
+
+def request_fingerprint(model: str, path: str, payload: Dict[str, Any]) -> str:
+    """Stable fingerprint of the routed model plus the backend request it would receive"""
+    normalised = json.dumps({'model': model, 'path': path, 'payload': payload},
+                            sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(normalised.encode('utf-8')).hexdigest()
+
+def is_deterministic(payload: Dict[str, Any]) -> bool:
+    """Only greedy (temperature 0) generations are safe to replay"""
+    try:
+        return float(payload.get('temperature', 1.0)) == 0.0
+    except (TypeError, ValueError):
+        return False
+
+def cache_policy_from_headers(headers) -> str:
+    """Map request headers onto a cache policy"""
+    explicit = (headers.get('X-Gateway-Cache') or '').strip().lower()
+    if explicit in (CACHE_REFRESH, CACHE_BYPASS):
+        return explicit
+
+    cache_control = (headers.get('Cache-Control') or '').lower()
+    if 'no-store' in cache_control:
+        return CACHE_BYPASS
+    if 'no-cache' in cache_control:
+        return CACHE_REFRESH
+    return CACHE_DEFAULT
+
+class DiskCacheTier:
+    """SQLite-backed second tier shared across gateway restarts (and worker processes)"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, stored_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_stored ON completions(stored_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM completions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= time.time():
+            return None
+        return json.loads(value), expires_at
+
+    def put(self, key: str, value: Any, expires_at: float) -> int:
+        """Store an entry; returns how many rows were evicted to stay within bounds"""
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO completions (key, value, expires_at, stored_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, separators=(',', ':')), expires_at, time.time())
+        )
+        self._writes += 1
+        if self._writes % 100 != 0:
+            return 0
+
+        # Periodic cleanup: drop expired rows, then the oldest rows beyond the cap
+        evicted = conn.execute("DELETE FROM completions WHERE expires_at <= ?", (time.time(),)).rowcount
+        evicted += conn.execute(
+            "DELETE FROM completions WHERE key IN ("
+            " SELECT key FROM completions ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        ).rowcount
+        return evicted
+
+    def delete(self, key: str):
+        self._connect().execute("DELETE FROM completions WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM completions")
+
+    def size(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+class ResponseCache:
+    """LRU + TTL cache of backend completion bodies"""
+
+    def __init__(self, config: Optional[CacheConfig] = None):
+        self.config = config or CacheConfig.from_env()
+        self._entries: 'OrderedDict[str, Tuple[Any, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk: Optional[DiskCacheTier] = None
+        if self.config.enabled and self.config.disk_path:
+            try:
+                self.disk = DiskCacheTier(self.config.disk_path, self.config.disk_max_entries)
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache disk tier disabled ({self.config.disk_path}): {e}")
+
+        self.stats_counters = {
+            'hits': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'bypassed': 0,
+            'evictions_lru': 0,
+            'evictions_expired': 0,
+            'evictions_disk': 0
+        }
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self.stats_counters[counter] += amount
+
+    def should_cache(self, payload: Dict[str, Any], policy: str = CACHE_DEFAULT) -> bool:
+        """Whether this request participates in caching at all"""
+        return self.config.enabled and policy != CACHE_BYPASS and is_deterministic(payload)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Look up a cached body; counts a hit or miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats_counters['hits'] += 1
+                    self.stats_counters['memory_hits'] += 1
+                    return value
+                del self._entries[key]
+                self.stats_counters['evictions_expired'] += 1
+
+        if self.disk is not None:
+            try:
+                found = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache disk read failed: {e}")
+                found = None
+            if found is not None:
+                value, expires_at = found
+                self._put_memory(key, value, expires_at)
+                self._count('hits')
+                self._count('disk_hits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def put(self, key: str, value: Any):
+        """Store a backend body under key with the configured TTL"""
+        expires_at = time.time() + self.config.ttl_seconds
+        self._put_memory(key, value, expires_at)
+        self._count('stores')
+
+        if self.disk is not None:
+            try:
+                evicted = self.disk.put(key, value, expires_at)
+                if evicted:
+                    self._count('evictions_disk', evicted)
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache disk write failed: {e}")
+
+    def _put_memory(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.config.max_entries:
+                self._entries.popitem(last=False)
+                self.stats_counters['evictions_lru'] += 1
+
+    def record_bypass(self):
+        self._count('bypassed')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.stats_counters)
+            memory_entries = len(self._entries)
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'enabled': self.config.enabled,
+            'memory_entries': memory_entries,
+            'max_entries': self.config.max_entries,
+            'ttl_seconds': self.config.ttl_seconds,
+            'disk_tier': self.config.disk_path if self.disk is not None else None,
+            'hit_rate': round(counters['hits'] / lookups, 4) if lookups else 0.0,
+            **counters
+        }
+
+# Global response cache instance
+response_cache = ResponseCache()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Routing Decision Cache for the Routers
+Bounded LRU of routing decisions keyed by a prompt fingerprint, the requested
+task_type and budget_factor. An entry keeps the prompt analysis (task type and
+complexity, which depend on the prompt alone) and the per-model scores computed
+under the router's current score epoch. Routers bump the epoch whenever a model
+metric changes in a way that alters scores; a stale entry is then rescored without
+re-analysing the prompt, so decisions are identical with the cache on or off.
+Circuit breakers are consulted on every request and never cached.
+"""
+
+import os
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RoutingCacheConfig:
+    """Routing decision cache settings"""
+    enabled: bool = True
+    max_entries: int = 4096
+
+    @classmethod
+    def from_env(cls) -> 'RoutingCacheConfig':
+        return cls(
+            enabled=os.getenv('ROUTING_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            max_entries=int(os.getenv('ROUTING_CACHE_MAX_ENTRIES', '4096'))
+        )
+
+def prompt_fingerprint(prompt: str) -> bytes:
+    """Compact digest of a prompt, so cache keys don't hold on to long prompts"""
+    return hashlib.blake2b(prompt.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+class RoutingDecisionCache:
+    """LRU of (analysis, scores) per routing key, with epoch-based score invalidation"""
+
+    def __init__(self, config: Optional[RoutingCacheConfig] = None):
+        self.config = config or RoutingCacheConfig.from_env()
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, Dict[str, float], int]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self.stats_counters = {
+            'hits': 0,
+            'rescored': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def epoch(self) -> int:
+        """Current score epoch; read it before reading the model metrics a score uses"""
+        return self._epoch
+
+    def key(self, prompt: str, *params: Hashable) -> Optional[Hashable]:
+        """Cache key for a routing call, or None when the cache is off"""
+        if not self.config.enabled:
+            return None
+        return (prompt_fingerprint(prompt),) + params
+
+    def get(self, key: Optional[Hashable], epoch: int) -> Optional[Tuple[Any, Optional[Dict[str, float]]]]:
+        """(analysis, scores) for key; scores is None when computed under an older epoch"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats_counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            analysis, scores, scored_epoch = entry
+            if scored_epoch != epoch:
+                self.stats_counters['rescored'] += 1
+                return analysis, None
+            self.stats_counters['hits'] += 1
+            return analysis, dict(scores)
+
+    def put(self, key: Optional[Hashable], analysis: Any, scores: Dict[str, float], epoch: int):
+        """Store a decision's analysis and the scores computed under `epoch`"""
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = (analysis, dict(scores), epoch)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.config.max_entries:
+                self._entries.popitem(last=False)
+                self.stats_counters['evictions'] += 1
+
+    def invalidate(self, reason: str = ''):
+        """Model metrics changed enough to alter scores: rescore entries on next use"""
+        with self._lock:
+            self._epoch += 1
+            self.stats_counters['invalidations'] += 1
+        if reason:
+            logger.debug(f"Routing scores invalidated: {reason}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.stats_counters)
+            entries = len(self._entries)
+        lookups = counters['hits'] + counters['rescored'] + counters['misses']
+        return {
+            'enabled': self.config.enabled,
+            'entries': entries,
+            'max_entries': self.config.max_entries,
+            'epoch': self._epoch,
+            'hit_rate': round(counters['hits'] / lookups, 4) if lookups else 0.0,
+            'analysis_hit_rate': round((counters['hits'] + counters['rescored']) / lookups, 4) if lookups else 0.0,
+            **counters
+        }
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Learning Routing Policies for the Intelligent Router
+The router's static scores rank models from hand-set capability, cost and
+latency figures. A policy turns those scores into the per-request ranking:
+'static' keeps the score order, while 'thompson' (Thompson sampling) and 'ucb'
+run a contextual bandit per (task_type, complexity) bucket whose reward blends
+observed success, latency and an optional quality signal. Each arm is
+warm-started from the static scores, exploration is capped per bucket, models
+the static scores rule out are never tried, and learned state persists to a
+JSON file so restarts keep what traffic has taught the router. Gateway workers
+share that file: each save merges what this worker learned since its last save
+into the state the others wrote, under an exclusive file lock.
+"""
+
+import os
+import json
+import math
+import time
+import random
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:     # not on Windows; saves there are single-writer
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('static', 'thompson', 'ucb')
+
+@dataclass
+class RoutingPolicyConfig:
+    """Routing policy selection, reward shaping and exploration limits"""
+    policy: str = 'static'              # one of POLICIES
+    state_path: Optional[str] = None    # JSON file the learned state is loaded from and saved to
+    save_interval: float = 30.0         # seconds between state saves while learning
+    prior_weight: float = 20.0          # observations the static scores are worth at warm start
+    prior_reward: float = 0.8           # expected reward of the statically best model
+    min_static_ratio: float = 0.5       # never try models scoring below this share of the best
+    max_exploration: float = 0.1        # share of a bucket's decisions that may leave the greedy pick
+    ucb_exploration: float = 0.5        # width of the UCB confidence bonus
+    decay: float = 0.999                # per-update discount on observations, to follow drift
+    latency_target: float = 2.0         # seconds at which a success earns half the latency reward
+    success_weight: float = 0.5
+    latency_weight: float = 0.3
+    quality_weight: float = 0.2         # only counted when a quality signal is supplied
+    max_contexts: int = 512             # buckets tracked; requests beyond this route statically
+
+    @classmethod
+    def from_env(cls) -> 'RoutingPolicyConfig':
+        policy = os.getenv('ROUTING_POLICY', 'static').lower()
+        if policy not in POLICIES:
+            logger.warning(f"Unknown ROUTING_POLICY {policy!r}; using static")
+            policy = 'static'
+        return cls(
+            policy=policy,
+            state_path=os.getenv('ROUTING_POLICY_STATE') or None,
+            save_interval=float(os.getenv('ROUTING_POLICY_SAVE_INTERVAL', '30')),
+            prior_weight=float(os.getenv('ROUTING_POLICY_PRIOR_WEIGHT', '20')),
+            prior_reward=float(os.getenv('ROUTING_POLICY_PRIOR_REWARD', '0.8')),
+            min_static_ratio=float(os.getenv('ROUTING_POLICY_MIN_STATIC_RATIO', '0.5')),
+            max_exploration=float(os.getenv('ROUTING_POLICY_MAX_EXPLORATION', '0.1')),
+            ucb_exploration=float(os.getenv('ROUTING_POLICY_UCB_EXPLORATION', '0.5')),
+            decay=float(os.getenv('ROUTING_POLICY_DECAY', '0.999')),
+            latency_target=float(os.getenv('ROUTING_POLICY_LATENCY_TARGET', '2.0')),
+            success_weight=float(os.getenv('ROUTING_POLICY_SUCCESS_WEIGHT', '0.5')),
+            latency_weight=float(os.getenv('ROUTING_POLICY_LATENCY_WEIGHT', '0.3')),
+            quality_weight=float(os.getenv('ROUTING_POLICY_QUALITY_WEIGHT', '0.2')),
+            max_contexts=int(os.getenv('ROUTING_POLICY_MAX_CONTEXTS', '512'))
+        )
+
+def context_key(task_type: str, complexity: str) -> str:
+    """Bucket a routing decision is learned under"""
+    return f"{task_type}|{complexity}"
+
+class ContextState:
+    """Discounted reward observations per model, plus exploration counts, for one bucket.
+    What this worker added since its last save, and the decay applied meanwhile, are also
+    kept apart so a save can merge them into what other workers saved"""
+
+    __slots__ = ('arms', 'decisions', 'explorations', 'new_arms', 'new_decisions',
+                 'new_explorations', 'decayed')
+
+    def __init__(self):
+        self.arms: Dict[str, List[float]] = {}   # model -> [reward sum, (1 - reward) sum]
+        self.decisions = 0.0
+        self.explorations = 0.0
+        self.new_arms: Dict[str, List[float]] = {}
+        self.new_decisions = 0.0
+        self.new_explorations = 0.0
+        self.decayed = 1.0
+
+    def decide(self, explored: bool):
+        self.decisions += 1
+        self.new_decisions += 1
+        if explored:
+            self.explorations += 1
+            self.new_explorations += 1
+
+    def decay(self, factor: float):
+        for arms in (self.arms, self.new_arms):
+            for arm in arms.values():
+                arm[0] *= factor
+                arm[1] *= factor
+        self.decisions *= factor
+        self.explorations *= factor
+        self.new_decisions *= factor
+        self.new_explorations *= factor
+        self.decayed *= factor
+
+    def observe(self, model: str, reward: float):
+        for arms in (self.arms, self.new_arms):
+            arm = arms.setdefault(model, [0.0, 0.0])
+            arm[0] += reward
+            arm[1] += 1.0 - reward
+
+    def merged(self, saved: Optional['ContextState']) -> 'ContextState':
+        """This bucket as it would be had this worker's updates since its last save been
+        applied to `saved` (the file's latest state); with nothing saved, a copy of this one"""
+        if saved is None:
+            return ContextState.from_dict(self.to_dict())
+        state = ContextState()
+        state.arms = {model: [r * self.decayed, f * self.decayed] for model, (r, f) in saved.arms.items()}
+        for model, (r, f) in self.new_arms.items():
+            arm = state.arms.setdefault(model, [0.0, 0.0])
+            arm[0] += r
+            arm[1] += f
+        state.decisions = saved.decisions * self.decayed + self.new_decisions
+        state.explorations = saved.explorations * self.decayed + self.new_explorations
+        return state
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'arms': {model: list(arm) for model, arm in self.arms.items()},
+            'decisions': self.decisions,
+            'explorations': self.explorations
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ContextState':
+        state = cls()
+        state.arms = {model: [float(r), float(f)] for model, (r, f) in data.get('arms', {}).items()}
+        state.decisions = float(data.get('decisions', 0.0))
+        state.explorations = float(data.get('explorations', 0.0))
+        return state
+
+class RoutingPolicy:
+    """Ranks models for a request from their static scores and what traffic has shown"""
+
+    def __init__(self, config: Optional[RoutingPolicyConfig] = None):
+        self.config = config or RoutingPolicyConfig.from_env()
+        self._contexts: Dict[str, ContextState] = {}
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._dirty = False
+        self._replace = False
+        self._last_save = time.monotonic()
+        self.stats_counters = {
+            'decisions': 0,
+            'explorations': 0,
+            'exploration_capped': 0,
+            'updates': 0,
+            'untracked_contexts': 0,
+            'saves': 0,
+            'save_errors': 0
+        }
+        if self.learning:
+            self.load()
+
+    @property
+    def learning(self) -> bool:
+        return self.config.policy != 'static'
+
+    def _posterior(self, state: ContextState, model: str, score: float, best: float) -> Tuple[float, float]:
+        """Beta(alpha, beta) over the model's reward: the static-score prior plus observations"""
+        config = self.config
+        prior_mean = config.prior_reward * min(1.0, score / best)
+        rewards, failures = state.arms.get(model, (0.0, 0.0))
+        return (1.0 + config.prior_weight * prior_mean + rewards,
+                1.0 + config.prior_weight * (1.0 - prior_mean) + failures)
+
+    def rank(self, context: str, scores: Dict[str, float]) -> Tuple[List[str], bool]:
+        """Models in the order to try them, and whether the first is an exploratory pick"""
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        best = scores[ranked[0]] if ranked else 0.0
+        if not self.learning or best <= 0:
+            return ranked, False
+
+        config = self.config
+        candidates = [model for model in ranked if scores[model] >= best * config.min_static_ratio]
+        with self._lock:
+            self.stats_counters['decisions'] += 1
+            state = self._contexts.get(context)
+            if state is None:
+                if len(self._contexts) >= config.max_contexts:
+                    self.stats_counters['untracked_contexts'] += 1
+                    return ranked, False
+                state = self._contexts[context] = ContextState()
+
+            posteriors = {model: self._posterior(state, model, scores[model], best) for model in candidates}
+            means = {model: a / (a + b) for model, (a, b) in posteriors.items()}
+            greedy = max(candidates, key=means.get)
+            if config.policy == 'thompson':
+                samples = {model: self._random.betavariate(a, b) for model, (a, b) in posteriors.items()}
+                choice = max(candidates, key=samples.get)
+            else:
+                total = sum(a + b for a, b in posteriors.values())
+                choice = max(candidates, key=lambda model: means[model] + config.ucb_exploration * math.sqrt(
+                    math.log(total) / sum(posteriors[model])))
+
+            explored = choice != greedy
+            if explored and state.explorations + 1 > config.max_exploration * (state.decisions + 1):
+                # Over this bucket's exploration budget: take the best-known model
+                self.stats_counters['exploration_capped'] += 1
+                choice, explored = greedy, False
+            state.decide(explored)
+            if explored:
+                self.stats_counters['explorations'] += 1
+
+        if choice != ranked[0]:
+            ranked.remove(choice)
+            ranked.insert(0, choice)
+        return ranked, explored
+
+    def reward(self, latency: float, success: bool, quality: Optional[float] = None) -> float:
+        """Reward in [0, 1]: nothing for a failure, else success, speed and quality blended"""
+        if not success:
+            return 0.0
+        config = self.config
+        latency_score = config.latency_target / (config.latency_target + max(0.0, latency))
+        total = config.success_weight + config.latency_weight * latency_score
+        weights = config.success_weight + config.latency_weight
+        if quality is not None:
+            total += config.quality_weight * min(1.0, max(0.0, quality))
+            weights += config.quality_weight
+        return total / weights if weights > 0 else 1.0
+
+    def update(self, context: Optional[str], model: str, latency: float, success: bool,
+               quality: Optional[float] = None):
+        """Learn from one request served by `model` in `context`"""
+        if not self.learning or context is None:
+            return
+        reward = self.reward(latency, success, quality)
+        decay = self.config.decay
+        with self._lock:
+            state = self._contexts.get(context)
+            if state is None:
+                return
+            state.decay(decay)
+            state.observe(model, reward)
+            self.stats_counters['updates'] += 1
+            self._dirty = True
+            due = time.monotonic() - self._last_save >= self.config.save_interval
+        if due:
+            self.save()
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict[str, ContextState]]:
+        """Contexts in the state file ({} if there is none yet), or None if it is unreadable"""
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            return {key: ContextState.from_dict(value) for key, value in data.get('contexts', {}).items()}
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Ignoring unreadable routing policy state {path}: {e}")
+            return None
+
+    @staticmethod
+    @contextmanager
+    def _file_lock(path: str):
+        """Serialise read-merge-write of the state file across gateway workers"""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{path}.lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self):
+        path = self.config.state_path
+        if not path:
+            return
+        contexts = self._read(path)
+        if not contexts:
+            return
+        with self._lock:
+            self._contexts = contexts
+        logger.info(f"Loaded routing policy state for {len(contexts)} contexts from {path}")
+
+    def save(self):
+        """Merge what this worker learned since its last save into the state file (and take
+        up what other workers saved meanwhile), if one is configured and anything changed"""
+        path = self.config.state_path
+        with self._lock:
+            self._last_save = time.monotonic()
+            if not path or not self._dirty:
+                return
+        try:
+            with self._file_lock(path):
+                saved = self._read(path) or {}
+                with self._lock:
+                    if self._replace:
+                        saved = {}
+                    contexts = {key: state.merged(saved.get(key)) for key, state in self._contexts.items()}
+                    for key, state in saved.items():
+                        contexts.setdefault(key, state)
+                    data = {
+                        'policy': self.config.policy,
+                        'saved_at': time.time(),
+                        'contexts': {key: state.to_dict() for key, state in contexts.items()}
+                    }
+                    # Written while holding the lock so no update lands between merge and swap
+                    self._write(path, data)
+                    self._contexts = contexts
+                    self._dirty = self._replace = False
+                    self.stats_counters['saves'] += 1
+        except OSError as e:
+            with self._lock:
+                self.stats_counters['save_errors'] += 1
+            logger.error(f"Could not save routing policy state to {path}: {e}")
+
+    @staticmethod
+    def _write(path: str, data: Dict[str, Any]):
+        """Atomically replace the state file via a temp file no other worker writes to"""
+        directory, name = os.path.split(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, prefix=f".{name}.", suffix='.tmp',
+                                         delete=False) as f:
+            tmp_path = f.name
+            try:
+                json.dump(data, f)
+            except BaseException:
+                f.close()
+                os.unlink(tmp_path)
+                raise
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+
+    def reset(self):
+        """Forget everything learned; the next save replaces the file instead of merging"""
+        with self._lock:
+            self._contexts.clear()
+            self._dirty = True
+            self._replace = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            contexts = {
+                key: {
+                    'decisions': round(state.decisions, 2),
+                    'exploration_share': round(state.explorations / state.decisions, 4) if state.decisions else 0.0,
+                    'mean_reward': {
+                        model: round(rewards / (rewards + failures), 4)
+                        for model, (rewards, failures) in state.arms.items() if rewards + failures > 0
+                    }
+                } for key, state in self._contexts.items()
+            }
+            counters = dict(self.stats_counters)
+        return {
+            'policy': self.config.policy,
+            'state_path': self.config.state_path,
+            'contexts': contexts,
+            **counters
+        }
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Gateway Cold Start: Lazy Singletons and Startup Report
+The orchestrator, workflow templates, MCP registry and routers are built on
+first use instead of at import, so the gateway answers its first request
+without paying for subsystems that request doesn't touch. Every lazy
+initialisation is timed, and `python startup.py` breaks the cold start down
+into per-module import and initialisation cost.
+
+Usage:
+    python startup.py                 # import + init report for api_gateway
+    python startup.py --module asgi_gateway --top 20
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import subprocess
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+def process_age() -> Optional[float]:
+    """Seconds since this process was started (Linux only; None elsewhere)"""
+    try:
+        with open('/proc/self/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return None
+
+class StartupTracker:
+    """Records lazy initialisation cost and startup milestones for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.inits: Dict[str, Dict[str, Any]] = {}
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, phase: str):
+        """Note the first time a startup phase (e.g. 'imported', 'first_request') is reached"""
+        if phase in self.marks:
+            return
+        age = process_age()
+        with self._lock:
+            if phase not in self.marks and age is not None:
+                self.marks[phase] = round(age, 3)
+
+    def record_init(self, name: str, seconds: float, thread: str):
+        with self._lock:
+            self.inits[name] = {'init_ms': round(seconds * 1000, 2), 'thread': thread}
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'process_age_s': dict(self.marks), 'lazy_inits': dict(self.inits)}
+
+# Global startup tracker instance
+startup_tracker = StartupTracker()
+
+class Lazy:
+    """Proxy for a module-level singleton that builds it on first attribute access.
+    Attribute reads and writes are forwarded, so `from module import singleton` call
+    sites keep working unchanged; construction is thread-safe and happens once."""
+    __slots__ = ('_factory', '_name', '_instance', '_lock')
+
+    def __init__(self, factory: Callable[[], Any], name: Optional[str] = None):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_name', name or getattr(factory, '__name__', repr(factory)))
+        object.__setattr__(self, '_instance', _UNSET)
+        object.__setattr__(self, '_lock', threading.RLock())
+
+    def _resolve(self) -> Any:
+        instance = self._instance
+        if instance is _UNSET:
+            with self._lock:
+                if self._instance is _UNSET:
+                    started = time.perf_counter()
+                    instance = self._factory()
+                    if isinstance(instance, Lazy):
+                        instance = instance._resolve()
+                    object.__setattr__(self, '_instance', instance)
+                    startup_tracker.record_init(self._name, time.perf_counter() - started,
+                                               threading.current_thread().name)
+                    logger.debug(f"Initialised {self._name} on first use")
+                instance = self._instance
+        return instance
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._resolve(), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._resolve(), attr, value)
+
+    def __repr__(self) -> str:
+        if self._instance is _UNSET:
+            return f"<Lazy {self._name} (not initialised)>"
+        return repr(self._instance)
+
+def lazy_import(module: str, attr: str) -> Lazy:
+    """Defer both importing `module` and building its `attr` singleton until first use"""
+    return Lazy(lambda: getattr(importlib.import_module(module), attr), name=f"{module}.{attr}")
+
+def is_initialised(obj: Any) -> bool:
+    """Whether a (possibly lazy) singleton has been built yet"""
+    return not isinstance(obj, Lazy) or obj._instance is not _UNSET
+
+def resolve(obj: Any) -> Any:
+    """The real object behind a lazy singleton, building it if needed"""
+    return obj._resolve() if isinstance(obj, Lazy) else obj
+
+# Runs in a fresh interpreter: cold import, first request, then every lazy singleton
+_PROBE_SCRIPT = r'''
+import json, logging, sys, time
+started = time.perf_counter()
+module = __import__(sys.argv[1])
+imported = time.perf_counter()
+logging.disable(logging.WARNING)
+# Both entry points serve the Flask app's routes; the first request goes through it directly
+status = __import__('api_gateway').app.test_client().get(sys.argv[2]).status_code
+ready = time.perf_counter()
+import startup
+lazies = [(name, value) for mod in list(sys.modules.values()) if getattr(mod, '__file__', None)
+          for name, value in vars(mod).items() if isinstance(value, startup.Lazy)]
+for name, value in lazies:
+    startup.resolve(value)
+done = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - started, 'first_request_s': ready - imported, 'first_request_status': status,
+    'lazy_inits_s': done - ready, 'lazy_inits': startup.startup_tracker.report()['lazy_inits']
+}))
+'''
+
+def _parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Rows of `python -X importtime` output: (self_us, cumulative_us, depth, module)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            rows.append({'self_us': int(self_us), 'cumulative_us': int(cumulative_us),
+                         'depth': (len(name) - len(name.lstrip())) // 2, 'module': name.strip()})
+        except ValueError:
+            continue
+    return rows
+
+def import_breakdown(rows: List[Dict[str, Any]], first_party: set) -> Dict[str, Dict[str, float]]:
+    """Per-module import cost: first-party modules by their own (self) time, third-party
+    packages by the cumulative time of their top-level import"""
+    modules: Dict[str, Dict[str, float]] = {}
+    for row in rows:
+        package = row['module'].split('.')[0]
+        entry = modules.setdefault(package, {'self_ms': 0.0, 'cumulative_ms': 0.0,
+                                             'first_party': package in first_party})
+        entry['self_ms'] += row['self_us'] / 1000
+        if row['module'] == package:
+            entry['cumulative_ms'] = max(entry['cumulative_ms'], row['cumulative_us'] / 1000)
+    return modules
+
+def build_report(module: str, path: str) -> Dict[str, Any]:
+    """Measure a cold start of `module` in fresh interpreters"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.getenv('PYTHONPATH')])))
+
+    timed = subprocess.run([sys.executable, '-c', _PROBE_SCRIPT, module, path],
+                           capture_output=True, text=True, cwd=here, env=env)
+    if timed.returncode != 0:
+        raise RuntimeError(f"Cold start of {module} failed:\n{timed.stderr}")
+    timings = json.loads(timed.stdout.strip().splitlines()[-1])
+
+    traced = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=here, env=env)
+    first_party = {name[:-3] for name in os.listdir(here) if name.endswith('.py')}
+    breakdown = import_breakdown(_parse_importtime(traced.stderr), first_party)
+
+    return {
+        'module': module,
+        'import_ms': round(timings['import_s'] * 1000, 1),
+        'first_request_ms': round(timings['first_request_s'] * 1000, 1),
+        'ready_ms': round((timings['import_s'] + timings['first_request_s']) * 1000, 1),
+        'first_request': {'path': path, 'status': timings['first_request_status']},
+        'deferred_init_ms': round(timings['lazy_inits_s'] * 1000, 1),
+        'lazy_inits': timings['lazy_inits'],
+        'imports': breakdown
+    }
+
+def print_report(report: Dict[str, Any], top: int):
+    print(f"{report['module']}: import {report['import_ms']:.0f} ms, first request "
+          f"{report['first_request']['path']} -> {report['first_request']['status']} in "
+          f"{report['first_request_ms']:.0f} ms, ready after {report['ready_ms']:.0f} ms")
+    print(f"Deferred initialisation (paid on first use): {report['deferred_init_ms']:.0f} ms")
+    print("  (module.attr entries include importing the module on first use)")
+    for name, entry in sorted(report['lazy_inits'].items(), key=lambda item: -item[1]['init_ms']):
+        print(f"  {name:<48} {entry['init_ms']:>8.1f} ms")
+
+    imports = report['imports']
+    print("\nFirst-party modules (own import time):")
+    for name, entry in sorted(((n, e) for n, e in imports.items() if e['first_party']),
+                              key=lambda item: -item[1]['self_ms'])[:top]:
+        print(f"  {name:<48} {entry['self_ms']:>8.1f} ms")
+    print("\nOther packages, stdlib included (cumulative import time):")
+    for name, entry in sorted(((n, e) for n, e in imports.items() if not e['first_party']),
+                              key=lambda item: -item[1]['cumulative_ms'])[:top]:
+        print(f"  {name:<48} {entry['cumulative_ms']:>8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description='Gateway cold-start report')
+    parser.add_argument('--module', default='api_gateway', help='Entry point module to import')
+    parser.add_argument('--path', default='/info', help='Route used as the first request')
+    parser.add_argument('--top', type=int, default=15, help='Modules listed per section')
+    parser.add_argument('--json', action='store_true', help='Print the raw report as JSON')
+    args = parser.parse_args()
+
+    report = build_report(args.module, args.path)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args.top)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Server-Sent Events Helpers for Streaming Completions
+Relays OpenAI-style SSE chunks from vLLM / Oobabooga unchanged and maps
+KoboldCpp's token stream onto the same chat.completion.chunk format
+"""
+
+import json
+import time
+import uuid
+import logging
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+SSE_DONE = b"data: [DONE]\n\n"
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',  # disable nginx response buffering
+}
+
+def sse_event(data: Dict[str, Any]) -> bytes:
+    """Encode one SSE data event"""
+    return b"data: " + json.dumps(data, separators=(',', ':')).encode('utf-8') + b"\n\n"
+
+def chat_chunk(completion_id: str, model: str, created: int,
+               content: Optional[str] = None, finish_reason: Optional[str] = None) -> Dict[str, Any]:
+    """Build an OpenAI chat.completion.chunk payload"""
+    delta = {'content': content} if content is not None else {}
+    return {
+        'id': completion_id,
+        'object': 'chat.completion.chunk',
+        'created': created,
+        'model': model,
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+    }
+
+def iter_sse_data(response: requests.Response) -> Iterator[str]:
+    """Yield the data field of each SSE event in a streaming response"""
+    data_lines = []
+    for raw_line in response.iter_lines(chunk_size=None, decode_unicode=False):
+        line = raw_line.decode('utf-8') if isinstance(raw_line, bytes) else raw_line
+        if not line:
+            if data_lines:
+                yield '\n'.join(data_lines)
+                data_lines = []
+            continue
+        if line.startswith('data:'):
+            data_lines.append(line[5:].lstrip(' '))
+    if data_lines:
+        yield '\n'.join(data_lines)
+
+def relay_openai_stream(response: requests.Response) -> Iterator[bytes]:
+    """Pass OpenAI-compatible SSE bytes through as they arrive"""
+    try:
+        for chunk in response.iter_content(chunk_size=None):
+            if chunk:
+                yield chunk
+    finally:
+        response.close()
+
+def kobold_stream_to_openai(response: requests.Response, model: str) -> Iterator[bytes]:
+    """Translate KoboldCpp /api/extra/generate/stream token events into chat.completion chunks"""
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    try:
+        yield sse_event(chat_chunk(completion_id, model, created, content=''))
+        for data in iter_sse_data(response):
+            try:
+                event = json.loads(data)
+            except ValueError:
+                logger.warning(f"Skipping malformed KoboldCpp stream event: {data[:80]}")
+                continue
+            token = event.get('token')
+            if token:
+                yield sse_event(chat_chunk(completion_id, model, created, content=token))
+        yield sse_event(chat_chunk(completion_id, model, created, finish_reason='stop'))
+        yield SSE_DONE
+    finally:
+        response.close()
+
+def stream_backend_response(response: requests.Response, model: str) -> Iterator[bytes]:
+    """SSE byte stream in OpenAI chunk format for any backend response"""
+    if model == 'creative':
+        return kobold_stream_to_openai(response, model)
+    return relay_openai_stream(response)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Stub LLM Backends for Gateway Benchmarks
+Local aiohttp servers that emulate the vLLM, KoboldCpp and Oobabooga APIs
+with configurable latency and token-rate profiles
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class BackendProfile:
+    """Latency and throughput profile of an emulated backend"""
+    role: str
+    kind: str                       # 'vllm', 'koboldcpp', 'oobabooga'
+    port: int
+    env_var: str
+    first_token_latency: float = 0.05   # seconds before the first token
+    tokens_per_second: float = 200.0
+    response_tokens: int = 32
+    request_overhead: float = 0.0       # serialized per-HTTP-request cost of the API server
+
+# One stub per gateway backend role, on ports that don't collide with the real stack
+DEFAULT_PROFILES = {
+    'reasoning': BackendProfile('reasoning', 'vllm', 18000, 'REASONING_MODEL_URL',
+                                first_token_latency=0.08, tokens_per_second=120.0),
+    'general': BackendProfile('general', 'vllm', 18001, 'GENERAL_MODEL_URL',
+                              first_token_latency=0.03, tokens_per_second=300.0),
+    'coding': BackendProfile('coding', 'vllm', 18002, 'CODING_MODEL_URL',
+                             first_token_latency=0.05, tokens_per_second=200.0),
+    'creative': BackendProfile('creative', 'koboldcpp', 15001, 'CREATIVE_MODEL_URL',
+                               first_token_latency=0.06, tokens_per_second=150.0),
+    'advanced': BackendProfile('advanced', 'oobabooga', 15000, 'ADVANCED_MODEL_URL',
+                               first_token_latency=0.07, tokens_per_second=100.0),
+}
+
+class StubBackend:
+    """Single emulated backend serving the subset of its API the gateway uses"""
+
+    def __init__(self, profile: BackendProfile):
+        self.profile = profile
+        self.requests_served = 0
+        self.http_requests = 0
+        self._frontend: Optional[asyncio.Lock] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/health', self.health)
+        app.router.add_get('/v1/models', self.models)
+        app.router.add_post('/v1/chat/completions', self.chat_completions)
+        app.router.add_post('/v1/completions', self.completions)
+        if self.profile.kind == 'koboldcpp':
+            app.router.add_get('/api/v1/info', self.health)
+            app.router.add_post('/api/v1/generate', self.kobold_generate)
+            app.router.add_post('/api/extra/generate/stream', self.kobold_stream)
+        return app
+
+    async def _admit(self):
+        """Emulate the API server's per-request work (parsing, tokenization, scheduling),
+        which a single-process server performs one request at a time"""
+        self.http_requests += 1
+        if self.profile.request_overhead <= 0:
+            return
+        if self._frontend is None:
+            self._frontend = asyncio.Lock()
+        async with self._frontend:
+            await asyncio.sleep(self.profile.request_overhead)
+
+    async def _generate(self, max_tokens: int) -> int:
+        """Sleep for the emulated generation time and return the token count"""
+        tokens = max(1, min(int(max_tokens or self.profile.response_tokens), self.profile.response_tokens))
+        await asyncio.sleep(self.profile.first_token_latency + tokens / self.profile.tokens_per_second)
+        self.requests_served += 1
+        return tokens
+
+    def _text(self, tokens: int) -> str:
+        return ' '.join(['token'] * tokens)
+
+    async def _stream_tokens(self, request: web.Request, max_tokens: int, encode_event) -> web.StreamResponse:
+        """Emit one SSE event per token at the profile's token rate"""
+        tokens = max(1, min(int(max_tokens or self.profile.response_tokens), self.profile.response_tokens))
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+        await asyncio.sleep(self.profile.first_token_latency)
+        for index in range(tokens):
+            await response.write(encode_event(index, tokens))
+            await asyncio.sleep(1.0 / self.profile.tokens_per_second)
+        self.requests_served += 1
+        await response.write_eof()
+        return response
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok', 'backend': self.profile.role})
+
+    async def models(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'object': 'list',
+            'data': [{'id': f'stub-{self.profile.role}', 'object': 'model', 'owned_by': 'stub'}]
+        })
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        await self._admit()
+        if payload.get('stream'):
+            return await self._stream_chat(request, payload)
+        tokens = await self._generate(payload.get('max_tokens'))
+        return web.json_response({
+            'id': f'chatcmpl-{uuid.uuid4().hex[:12]}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': f'stub-{self.profile.role}',
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': self._text(tokens)},
+                'finish_reason': 'length'
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': tokens, 'total_tokens': tokens}
+        })
+
+    async def _stream_chat(self, request: web.Request, payload: dict) -> web.StreamResponse:
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:12]}'
+        created = int(time.time())
+
+        def encode_event(index: int, total: int) -> bytes:
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': f'stub-{self.profile.role}',
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': 'token '},
+                    'finish_reason': 'length' if index == total - 1 else None
+                }]
+            }
+            event = f"data: {json.dumps(chunk)}\n\n".encode('utf-8')
+            if index == total - 1:
+                event += b"data: [DONE]\n\n"
+            return event
+
+        return await self._stream_tokens(request, payload.get('max_tokens'), encode_event)
+
+    async def completions(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        await self._admit()
+        # A list of prompts is generated as one batch, one choice per prompt (like vLLM)
+        prompts = payload.get('prompt')
+        count = len(prompts) if isinstance(prompts, list) else 1
+        tokens = await self._generate(payload.get('max_tokens'))
+        self.requests_served += count - 1
+        return web.json_response({
+            'id': f'cmpl-{uuid.uuid4().hex[:12]}',
+            'object': 'text_completion',
+            'created': int(time.time()),
+            'model': f'stub-{self.profile.role}',
+            'choices': [
+                {'index': i, 'text': self._text(tokens), 'finish_reason': 'length'}
+                for i in range(count)
+            ],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': tokens * count, 'total_tokens': tokens * count}
+        })
+
+    async def kobold_generate(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        tokens = await self._generate(payload.get('max_length'))
+        return web.json_response({'results': [{'text': self._text(tokens)}]})
+
+    async def kobold_stream(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+
+        def encode_event(index: int, total: int) -> bytes:
+            return f"event: message\ndata: {json.dumps({'token': 'token '})}\n\n".encode('utf-8')
+
+        return await self._stream_tokens(request, payload.get('max_length'), encode_event)
+
+async def start_stub_backends(profiles: Optional[Dict[str, BackendProfile]] = None,
+                              host: str = '127.0.0.1') -> List[web.AppRunner]:
+    """Start one stub server per profile on the running event loop"""
+    profiles = profiles or DEFAULT_PROFILES
+    runners = []
+    for profile in profiles.values():
+        runner = web.AppRunner(StubBackend(profile).make_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, profile.port).start()
+        runners.append(runner)
+        logger.info(f"Stub {profile.kind} backend '{profile.role}' listening on {host}:{profile.port}")
+    return runners
+
+def stub_backend_env(profiles: Optional[Dict[str, BackendProfile]] = None,
+                     host: str = '127.0.0.1') -> Dict[str, str]:
+    """Environment variables that point the gateway and orchestrator at the stubs"""
+    profiles = profiles or DEFAULT_PROFILES
+    return {profile.env_var: f'http://{host}:{profile.port}' for profile in profiles.values()}
+
+def run_stub_backends_in_thread(profiles: Optional[Dict[str, BackendProfile]] = None,
+                                host: str = '127.0.0.1') -> asyncio.AbstractEventLoop:
+    """Run the stubs on a daemon thread (for synchronous benchmark scripts)"""
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def _serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(start_stub_backends(profiles, host))
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=_serve, name='stub-backends', daemon=True).start()
+    started.wait(timeout=10)
+    return loop
+
+def load_profiles(path: str, base: Optional[Dict[str, BackendProfile]] = None) -> Dict[str, BackendProfile]:
+    """Profiles with per-role overrides from a JSON file, e.g.
+    {"reasoning": {"first_token_latency": 0.4, "tokens_per_second": 35, "response_tokens": 256}}"""
+    with open(path) as f:
+        overrides = json.load(f)
+    profiles = dict(base or DEFAULT_PROFILES)
+    for role, fields in overrides.items():
+        if role not in profiles:
+            raise ValueError(f"Unknown backend role '{role}' in {path}")
+        profiles[role] = replace(profiles[role], **fields)
+    return profiles
+
+def scaled_profiles(latency_scale: float = 1.0, response_tokens: Optional[int] = None,
+                    request_overhead: float = 0.0,
+                    base: Optional[Dict[str, BackendProfile]] = None) -> Dict[str, BackendProfile]:
+    """Copy of the default (or given) profiles with latency scaled and an optional fixed response length"""
+    return {
+        role: replace(
+            profile,
+            first_token_latency=profile.first_token_latency * latency_scale,
+            tokens_per_second=profile.tokens_per_second / latency_scale if latency_scale else profile.tokens_per_second,
+            response_tokens=response_tokens or profile.response_tokens,
+            request_overhead=request_overhead or profile.request_overhead
+        )
+        for role, profile in (base or DEFAULT_PROFILES).items()
+    }
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Run stub LLM backends for gateway benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='Multiply emulated latency')
+    parser.add_argument('--response-tokens', type=int, default=None, help='Tokens generated per request')
+    parser.add_argument('--request-overhead', type=float, default=0.0,
+                        help='Serialized per-request API server cost in seconds')
+    parser.add_argument('--profiles', default=None, help='JSON file of per-role profile overrides')
+    args = parser.parse_args()
+
+    base = load_profiles(args.profiles) if args.profiles else None
+    profiles = scaled_profiles(args.latency_scale, args.response_tokens, args.request_overhead, base)
+    for name, value in stub_backend_env(profiles, args.host).items():
+        print(f"export {name}={value}")
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(start_stub_backends(profiles, args.host))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
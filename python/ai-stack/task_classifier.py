@@ -0,0 +1,559 @@
+#!/usr/bin/env python3
+"""
+Learned Task and Complexity Classifier for the Routers
+A small CPU-only alternative to the keyword heuristics in both routers: prompts
+become hashed word unigram/bigram and shape features, and one softmax logistic
+regression per label set ("head") scores them. Heads are 'task_type' and
+'complexity' (IntelligentRouter) and 'platform_task_type' and
+'platform_complexity' (PlatformAwareRouter). A model is trained offline from
+logged requests, loads from a single .npz file in milliseconds and classifies a
+prompt in microseconds; the routers use it when TASK_CLASSIFIER_MODEL is set and
+fall back to their heuristics on heads it lacks or predictions below
+TASK_CLASSIFIER_MIN_CONFIDENCE.
+
+Training data is JSONL, one request per line: the prompt ('prompt', or chat
+'messages'), any labels it has (the head names above, or the routing_info
+fields 'original_task_type'/'detected_complexity'), and optionally the observed
+outcome ('success', 'quality' in [0, 1]). Failed requests are dropped by default
+(their routing label is suspect) and quality scales a record's weight.
+
+Usage:
+    python task_classifier.py train --data requests.jsonl --out classifier.npz --holdout 0.2
+    python task_classifier.py train --data prompts.jsonl --out classifier.npz --label-missing
+    python task_classifier.py evaluate --model classifier.npz --data labelled.jsonl
+"""
+
+import os
+import re
+import json
+import math
+import time
+import zlib
+import random
+import argparse
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_HEADS = ('task_type', 'complexity')
+PLATFORM_HEADS = ('platform_task_type', 'platform_complexity')
+HEADS = MODEL_HEADS + PLATFORM_HEADS
+
+# Record fields each head's label is read from, in order of preference
+LABEL_FIELDS: Dict[str, Tuple[str, ...]] = {
+    'task_type': ('task_type', 'original_task_type'),
+    'complexity': ('complexity', 'detected_complexity'),
+    'platform_task_type': ('platform_task_type',),
+    'platform_complexity': ('platform_complexity',),
+}
+
+COMPLEXITY_ORDER = ('simple', 'moderate', 'complex', 'expert')
+
+# Words (letters/digits) and single symbols, so code braces and math signs are features too
+TOKEN_RE = re.compile(r"[^\W_]+|[^\w\s]")
+
+FORMAT_VERSION = 1
+
+@dataclass
+class TaskClassifierConfig:
+    """Which trained model the routers load and how sure it must be to override them"""
+    model_path: Optional[str] = None    # .npz written by `task_classifier.py train`; unset keeps the heuristics
+    min_confidence: float = 0.6         # below this probability the router's heuristic decides
+
+    @classmethod
+    def from_env(cls) -> 'TaskClassifierConfig':
+        return cls(
+            model_path=os.getenv('TASK_CLASSIFIER_MODEL') or None,
+            min_confidence=float(os.getenv('TASK_CLASSIFIER_MIN_CONFIDENCE', '0.6'))
+        )
+
+def prompt_tokens(prompt: str, max_chars: int = 8192) -> List[str]:
+    """Unigrams and bigrams of the (truncated, lowercased) prompt plus coarse shape tokens"""
+    words = TOKEN_RE.findall(prompt[:max_chars].lower())
+    tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    tokens.append(f"#chars:{int(math.log2(len(prompt) + 1))}")
+    tokens.append(f"#lines:{min(prompt.count(chr(10)), 64).bit_length()}")
+    tokens.append(f"#questions:{min(prompt.count('?'), 3)}")
+    if '```' in prompt:
+        tokens.append('#fence')
+    return tokens
+
+def featurise(prompt: str, n_features: int, max_chars: int = 8192) -> Tuple[np.ndarray, np.ndarray]:
+    """Sparse feature vector of a prompt: (hashed indexes, L2-normalised counts)"""
+    mask = n_features - 1
+    counts: Dict[int, int] = {}
+    for token in prompt_tokens(prompt, max_chars):
+        index = zlib.crc32(token.encode('utf-8', 'surrogatepass')) & mask
+        counts[index] = counts.get(index, 0) + 1
+    indexes = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    values /= math.sqrt(float(np.dot(values, values)))
+    return indexes, values
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+class Head(NamedTuple):
+    """One label set: a weight row per hashed feature and a bias, one column per label"""
+    labels: Tuple[str, ...]
+    weights: np.ndarray     # (n_features, n_labels) float32
+    bias: np.ndarray        # (n_labels,) float32
+
+class ClassifierModel:
+    """Hashed-feature logistic regression heads sharing one feature space"""
+
+    def __init__(self, heads: Dict[str, Head], n_features: int, max_chars: int = 8192,
+                 meta: Optional[Dict[str, Any]] = None):
+        if n_features & (n_features - 1):
+            raise ValueError(f"n_features must be a power of two, got {n_features}")
+        self.heads = heads
+        self.n_features = n_features
+        self.max_chars = max_chars
+        self.meta = meta or {}
+
+    def features(self, prompt: str) -> Tuple[np.ndarray, np.ndarray]:
+        return featurise(prompt, self.n_features, self.max_chars)
+
+    def probabilities(self, head: str, features: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        indexes, values = features
+        model = self.heads[head]
+        return _softmax(values @ model.weights[indexes] + model.bias)
+
+    def predict(self, head: str, features: Tuple[np.ndarray, np.ndarray]) -> Tuple[str, float]:
+        """(label, probability) of the most likely label"""
+        indexes, values = features
+        model = self.heads[head]
+        logits = (values @ model.weights[indexes] + model.bias).tolist()
+        # A handful of labels: plain floats beat numpy's per-call overhead here
+        top = max(logits)
+        best = logits.index(top)
+        return model.labels[best], 1.0 / sum(math.exp(logit - top) for logit in logits)
+
+    def save(self, path: str):
+        arrays: Dict[str, np.ndarray] = {}
+        for name, head in self.heads.items():
+            arrays[f"{name}.labels"] = np.array(head.labels)
+            arrays[f"{name}.weights"] = head.weights.astype(np.float32)
+            arrays[f"{name}.bias"] = head.bias.astype(np.float32)
+        meta = dict(self.meta, version=FORMAT_VERSION, n_features=self.n_features,
+                    max_chars=self.max_chars, heads=sorted(self.heads))
+        arrays['meta'] = np.array(json.dumps(meta))
+        # Uncompressed, so loading is a few reads rather than a decompression
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'ClassifierModel':
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != FORMAT_VERSION:
+                raise ValueError(f"Unsupported classifier format {meta.get('version')!r} in {path}")
+            heads = {
+                name: Head(tuple(str(label) for label in data[f"{name}.labels"]),
+                           data[f"{name}.weights"], data[f"{name}.bias"])
+                for name in meta['heads']
+            }
+        return cls(heads, int(meta['n_features']), int(meta.get('max_chars', 8192)), meta)
+
+class TaskClassifier:
+    """The routers' view of a trained model: confident predictions per head, else None"""
+
+    def __init__(self, config: Optional[TaskClassifierConfig] = None):
+        self.config = config or TaskClassifierConfig.from_env()
+        self.model: Optional[ClassifierModel] = None
+        self.load_ms: Optional[float] = None
+        self._lock = threading.Lock()
+        self._last: Tuple[Optional[str], Optional[Tuple[np.ndarray, np.ndarray]]] = (None, None)
+        self.stats_counters = {
+            'predictions': 0,
+            'confident': 0,
+            'low_confidence': 0,
+            'load_errors': 0
+        }
+        if self.config.model_path:
+            self.load(self.config.model_path)
+
+    def load(self, path: str):
+        started = time.perf_counter()
+        try:
+            model = ClassifierModel.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            self.stats_counters['load_errors'] += 1
+            logger.error(f"Ignoring unreadable task classifier {path}; routers keep their heuristics: {e}")
+            return
+        self.model = model
+        self.load_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Loaded task classifier {path} ({', '.join(sorted(model.heads))}) in {self.load_ms:.1f} ms")
+
+    def has(self, head: str) -> bool:
+        return self.model is not None and head in self.model.heads
+
+    def _features(self, prompt: str) -> Tuple[np.ndarray, np.ndarray]:
+        # Both routing steps ask about the same prompt object back to back
+        last_prompt, last_features = self._last
+        if last_prompt is prompt:
+            return last_features
+        features = self.model.features(prompt)
+        self._last = (prompt, features)
+        return features
+
+    def predict(self, head: str, prompt: str) -> Optional[str]:
+        """The head's label for `prompt`, or None without that head or below min_confidence"""
+        if not self.has(head):
+            return None
+        label, confidence = self.model.predict(head, self._features(prompt))
+        confident = confidence >= self.config.min_confidence
+        with self._lock:
+            self.stats_counters['predictions'] += 1
+            self.stats_counters['confident' if confident else 'low_confidence'] += 1
+        return label if confident else None
+
+    def stats(self) -> Dict[str, Any]:
+        model = self.model
+        return {
+            'model_path': self.config.model_path,
+            'loaded': model is not None,
+            'heads': {name: list(head.labels) for name, head in model.heads.items()} if model else {},
+            'n_features': model.n_features if model else None,
+            'trained_at': model.meta.get('trained_at') if model else None,
+            'load_ms': round(self.load_ms, 2) if self.load_ms is not None else None,
+            'min_confidence': self.config.min_confidence,
+            **self.stats_counters
+        }
+
+# Offline training and evaluation
+
+def read_records(paths: Iterable[str]) -> List[Dict[str, Any]]:
+    records = []
+    for path in paths:
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping malformed line {number} of {path}")
+                    continue
+                if isinstance(record, dict) and record_prompt(record):
+                    records.append(record)
+    return records
+
+def record_prompt(record: Dict[str, Any]) -> str:
+    """Prompt text of a logged completion or chat request"""
+    messages = record.get('messages')
+    if isinstance(messages, list):
+        return '\n'.join(str(m.get('content', '')) for m in messages if isinstance(m, dict))
+    return str(record.get('prompt') or '')
+
+def record_label(record: Dict[str, Any], head: str) -> Optional[str]:
+    for field in LABEL_FIELDS[head]:
+        value = record.get(field)
+        if isinstance(value, str) and value:
+            return value
+    return None
+
+def record_weight(record: Dict[str, Any], failed_weight: float = 0.0) -> float:
+    """Training weight from the observed outcome: failures count `failed_weight`, quality scales"""
+    weight = failed_weight if record.get('success') is False else 1.0
+    quality = record.get('quality')
+    if isinstance(quality, (int, float)):
+        weight *= min(1.0, max(0.0, float(quality)))
+    return weight
+
+def heuristic_labellers(heads: Sequence[str]) -> Dict[str, Callable[[str], str]]:
+    """The routers' own keyword heuristics, as label functions for the requested heads"""
+    labellers: Dict[str, Callable[[str], str]] = {}
+    if any(head in MODEL_HEADS for head in heads):
+        from enhanced_router import IntelligentRouter
+        model_router = IntelligentRouter()
+        labellers['task_type'] = model_router.heuristic_task_type
+        labellers['complexity'] = lambda prompt: model_router.heuristic_complexity(prompt).value
+    if any(head in PLATFORM_HEADS for head in heads):
+        from platform_aware_router import PlatformAwareRouter
+        platform_router = PlatformAwareRouter()
+        labellers['platform_task_type'] = lambda prompt: platform_router.heuristic_task_type(prompt).value
+        labellers['platform_complexity'] = lambda prompt: platform_router.heuristic_complexity(prompt).value
+    return {head: labeller for head, labeller in labellers.items() if head in heads}
+
+def _column_sums(index: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    """(size, k) sums of the rows of `values` (nnz, k) grouped by `index`"""
+    return np.stack([np.bincount(index, weights=values[:, k], minlength=size)
+                     for k in range(values.shape[1])], axis=1)
+
+def fit_head(features: List[Tuple[np.ndarray, np.ndarray]], labels: np.ndarray, weights: np.ndarray,
+             n_labels: int, n_features: int, epochs: int = 10, learning_rate: float = 2.0,
+             l2: float = 1e-4, batch_size: int = 64, seed: int = 7) -> Tuple[np.ndarray, np.ndarray]:
+    """Mini-batch gradient descent on weighted softmax cross-entropy with L2; updates only
+    touch the feature rows present in the batch"""
+    rng = np.random.default_rng(seed)
+    W = np.zeros((n_features, n_labels), dtype=np.float32)
+    bias = np.zeros(n_labels, dtype=np.float32)
+    order = np.arange(len(features))
+    for epoch in range(epochs):
+        rng.shuffle(order)
+        step = learning_rate / math.sqrt(1 + epoch)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            rows = np.concatenate([np.full(len(features[i][0]), row) for row, i in enumerate(batch)])
+            cols = np.concatenate([features[i][0] for i in batch])
+            vals = np.concatenate([features[i][1] for i in batch])
+            logits = _column_sums(rows, vals[:, None] * W[cols], len(batch)) + bias
+            grad = _softmax(logits)
+            grad[np.arange(len(batch)), labels[batch]] -= 1.0
+            grad *= (weights[batch] / len(batch))[:, None]
+            touched, inverse = np.unique(cols, return_inverse=True)
+            W[touched] *= 1.0 - step * l2
+            W[touched] -= step * _column_sums(inverse, vals[:, None] * grad[rows], len(touched)).astype(np.float32)
+            bias -= step * grad.sum(axis=0).astype(np.float32)
+    return W, bias
+
+def train(records: List[Dict[str, Any]], heads: Sequence[str] = HEADS, n_features: int = 1 << 16,
+          max_chars: int = 8192, epochs: int = 10, learning_rate: float = 2.0, l2: float = 1e-4,
+          batch_size: int = 64, failed_weight: float = 0.0, label_missing: bool = False,
+          seed: int = 7) -> ClassifierModel:
+    """Fit one head per label set present in `records` (missing labels come from the
+    heuristics when label_missing is set)"""
+    labellers = heuristic_labellers(heads) if label_missing else {}
+    features = [featurise(record_prompt(record), n_features, max_chars) for record in records]
+    weights = np.array([record_weight(record, failed_weight) for record in records], dtype=np.float32)
+    fitted: Dict[str, Head] = {}
+    counts: Dict[str, int] = {}
+    for head in heads:
+        labels = [record_label(record, head) for record in records]
+        if head in labellers:
+            labels = [label or labellers[head](record_prompt(record)) for label, record in zip(labels, records)]
+        rows = [i for i, label in enumerate(labels) if label is not None and weights[i] > 0]
+        names = tuple(sorted({labels[i] for i in rows}))
+        if len(names) < 2:
+            logger.info(f"Not training {head}: needs at least two labels, found {list(names)}")
+            continue
+        index = {name: position for position, name in enumerate(names)}
+        W, bias = fit_head([features[i] for i in rows], np.array([index[labels[i]] for i in rows]),
+                           weights[rows], len(names), n_features, epochs, learning_rate, l2, batch_size, seed)
+        fitted[head] = Head(names, W, bias)
+        counts[head] = len(rows)
+    if not fitted:
+        raise ValueError('No head had labelled records to train on')
+    return ClassifierModel(fitted, n_features, max_chars, meta={
+        'trained_at': time.time(),
+        'records': counts,
+        'epochs': epochs,
+        'heuristic_labels': label_missing
+    })
+
+def _percentiles_us(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {'mean_us': round(sum(ordered) / len(ordered) * 1e6, 1),
+            'p50_us': round(pick(0.5) * 1e6, 1), 'p99_us': round(pick(0.99) * 1e6, 1)}
+
+def _routing_cost(heads: Sequence[str], labelled: List[Tuple[str, Dict[str, str]]],
+                  predicted: Dict[str, List[Dict[str, str]]]) -> Dict[str, Any]:
+    """Where each labelling routes: mean per-token cost of the chosen backend, agreement with
+    routing on the true labels, and how often the choice cannot handle the true complexity"""
+    if 'task_type' in heads and 'complexity' in heads:
+        from enhanced_router import IntelligentRouter, ComplexityLevel
+        router = IntelligentRouter()
+        backends = router.models
+        task_of = str
+        task_head, complexity_head = 'task_type', 'complexity'
+    elif 'platform_task_type' in heads and 'platform_complexity' in heads:
+        from platform_aware_router import PlatformAwareRouter, TaskType, ComplexityLevel
+        router = PlatformAwareRouter()
+        backends = router.services
+        task_of = TaskType
+        task_head, complexity_head = 'platform_task_type', 'platform_complexity'
+    else:
+        return {}
+
+    def route(labels: Dict[str, str]) -> Optional[str]:
+        try:
+            task, complexity = task_of(labels[task_head]), ComplexityLevel(labels[complexity_head])
+        except (KeyError, ValueError):
+            return None
+        return max(backends, key=lambda name: router.calculate_routing_score(backends[name], task, complexity))
+
+    rows = [i for i, (_, gold) in enumerate(labelled) if task_head in gold and complexity_head in gold]
+    if not rows:
+        return {}
+    gold_routes = [route(labelled[i][1]) for i in rows]
+    report = {'requests': len(rows)}
+    for source, labels in [('labels', [labelled[i][1] for i in rows])] + \
+            [(source, [predicted[source][i] for i in rows]) for source in predicted]:
+        routes = [route(label) for label in labels]
+        chosen = [(name, gold_route, labelled[i][1][complexity_head])
+                  for name, gold_route, i in zip(routes, gold_routes, rows) if name is not None]
+        if not chosen:
+            continue
+        underpowered = sum(
+            1 for name, _, complexity in chosen if complexity in COMPLEXITY_ORDER and
+            COMPLEXITY_ORDER.index(backends[name].max_complexity.value) < COMPLEXITY_ORDER.index(complexity))
+        report[source] = {
+            'mean_cost_per_token': round(sum(backends[name].cost_per_token for name, _, _ in chosen) / len(chosen), 7),
+            'same_backend_as_labels': round(sum(name == gold for name, gold, _ in chosen) / len(chosen), 4),
+            'underpowered': round(underpowered / len(chosen), 4)
+        }
+    return report
+
+def evaluate(model: ClassifierModel, records: List[Dict[str, Any]], min_confidence: float = 0.6,
+             repeat: int = 3) -> Dict[str, Any]:
+    """Compare the heuristics, the model alone and the model with heuristic fallback (what the
+    routers run) on labelled records: accuracy, routing cost and per-prompt latency"""
+    heads = [head for head in HEADS if head in model.heads]
+    labellers = heuristic_labellers(heads)
+    prompts = [record_prompt(record) for record in records]
+    labelled = [(prompt, {head: label for head in heads if (label := record_label(record, head))})
+                for prompt, record in zip(prompts, records)]
+
+    predicted: Dict[str, List[Dict[str, str]]] = {'heuristic': [], 'model': [], 'model_with_fallback': []}
+    confident = {head: 0 for head in heads}
+    for prompt, _ in labelled:
+        heuristic, learned, combined = {}, {}, {}
+        features = model.features(prompt)
+        for head in heads:
+            heuristic[head] = labellers[head](prompt)
+            learned[head], confidence = model.predict(head, features)
+            sure = confidence >= min_confidence
+            confident[head] += sure
+            combined[head] = learned[head] if sure else heuristic[head]
+        predicted['heuristic'].append(heuristic)
+        predicted['model'].append(learned)
+        predicted['model_with_fallback'].append(combined)
+
+    accuracy: Dict[str, Any] = {}
+    for head in heads:
+        rows = [i for i, (_, gold) in enumerate(labelled) if head in gold]
+        if not rows:
+            continue
+        accuracy[head] = {'labelled': len(rows), 'model_coverage': round(confident[head] / len(labelled), 4)}
+        for source, labels in predicted.items():
+            correct = sum(labels[i][head] == labelled[i][1][head] for i in rows)
+            accuracy[head][source] = round(correct / len(rows), 4)
+
+    # Per-prompt classification latency, both heads of a router together as routing asks
+    heuristic_times: List[float] = []
+    model_times: List[float] = []
+    for _ in range(max(1, repeat)):
+        for prompt in prompts:
+            started = time.perf_counter()
+            for head in heads:
+                labellers[head](prompt)
+            heuristic_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            features = model.features(prompt)
+            for head in heads:
+                model.predict(head, features)
+            model_times.append(time.perf_counter() - started)
+
+    routing = {}
+    for router, group in (('model', MODEL_HEADS), ('platform', PLATFORM_HEADS)):
+        report = _routing_cost([head for head in group if head in heads], labelled, predicted)
+        if report:
+            routing[router] = report
+
+    return {
+        'records': len(records),
+        'min_confidence': min_confidence,
+        'accuracy': accuracy,
+        'routing_cost': routing,
+        'latency': {'heuristic': _percentiles_us(heuristic_times), 'model': _percentiles_us(model_times)}
+    } if prompts else {'records': 0}
+
+def print_evaluation(report: Dict[str, Any]):
+    print(f"{report['records']} records, model trusted at confidence >= {report.get('min_confidence')}")
+    print(f"\n{'head':<22} {'labelled':>8} {'heuristic':>10} {'model':>8} {'+fallback':>10} {'coverage':>9}")
+    for head, row in report.get('accuracy', {}).items():
+        print(f"{head:<22} {row['labelled']:>8} {row['heuristic']:>10.1%} {row['model']:>8.1%} "
+              f"{row['model_with_fallback']:>10.1%} {row['model_coverage']:>9.1%}")
+    for group, routing in report.get('routing_cost', {}).items():
+        print(f"\nRouting ({group} router, {routing['requests']} requests): "
+              f"{'cost/token':>11} {'same route':>11} {'underpowered':>13}")
+        for source in ('labels', 'heuristic', 'model', 'model_with_fallback'):
+            if source in routing:
+                row = routing[source]
+                print(f"  {source:<22} {row['mean_cost_per_token']:>11.6f} {row['same_backend_as_labels']:>11.1%} "
+                      f"{row['underpowered']:>13.1%}")
+    latency = report.get('latency')
+    if latency:
+        print(f"\n{'latency per prompt':<22} {'mean':>9} {'p50':>9} {'p99':>9}")
+        for source, row in latency.items():
+            print(f"  {source:<20} {row['mean_us']:>6.1f} us {row['p50_us']:>6.1f} us {row['p99_us']:>6.1f} us")
+    if 'load_ms' in report:
+        print(f"\nModel load: {report['load_ms']:.1f} ms ({report['model_bytes'] / 1024:.0f} KiB)")
+
+def _timed_load(path: str) -> Tuple[ClassifierModel, Dict[str, Any]]:
+    started = time.perf_counter()
+    model = ClassifierModel.load(path)
+    return model, {'load_ms': round((time.perf_counter() - started) * 1000, 2), 'model_bytes': os.path.getsize(path)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Train and evaluate the learned task/complexity classifier')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fit = subparsers.add_parser('train', help='Train a model from logged requests (JSONL)')
+    fit.add_argument('--data', action='append', required=True, help='JSONL file of requests (repeatable)')
+    fit.add_argument('--out', required=True, help='Model file to write (.npz)')
+    fit.add_argument('--heads', default=','.join(HEADS), help='Label sets to train')
+    fit.add_argument('--features', type=int, default=1 << 16, help='Hashed feature space size (power of two)')
+    fit.add_argument('--epochs', type=int, default=10)
+    fit.add_argument('--learning-rate', type=float, default=2.0)
+    fit.add_argument('--l2', type=float, default=1e-4)
+    fit.add_argument('--failed-weight', type=float, default=0.0, help='Weight of requests that failed')
+    fit.add_argument('--label-missing', action='store_true',
+                     help="Label records without a head's label using the router heuristic")
+    fit.add_argument('--holdout', type=float, default=0.0, help='Share of records held out for evaluation')
+    fit.add_argument('--seed', type=int, default=7)
+
+    check = subparsers.add_parser('evaluate', help='Compare a model with the heuristics on labelled requests')
+    check.add_argument('--model', required=True)
+    check.add_argument('--data', action='append', required=True, help='JSONL file of labelled requests (repeatable)')
+
+    for sub in (fit, check):
+        sub.add_argument('--min-confidence', type=float, default=TaskClassifierConfig.from_env().min_confidence)
+        sub.add_argument('--repeat', type=int, default=3, help='Timing rounds over the evaluation prompts')
+        sub.add_argument('--json', action='store_true', help='Print the evaluation as JSON')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    records = read_records(args.data)
+    if args.command == 'train':
+        held_out: List[Dict[str, Any]] = []
+        if args.holdout > 0:
+            random.Random(args.seed).shuffle(records)
+            cut = int(len(records) * args.holdout)
+            held_out, records = records[:cut], records[cut:]
+        started = time.perf_counter()
+        model = train(records, [head.strip() for head in args.heads.split(',') if head.strip()],
+                      n_features=args.features, epochs=args.epochs, learning_rate=args.learning_rate,
+                      l2=args.l2, failed_weight=args.failed_weight, label_missing=args.label_missing,
+                      seed=args.seed)
+        model.save(args.out)
+        print(f"Trained {', '.join(f'{head} ({count})' for head, count in model.meta['records'].items())} "
+              f"in {time.perf_counter() - started:.1f}s -> {args.out}")
+        if not held_out:
+            return
+        model, load = _timed_load(args.out)
+        report = dict(evaluate(model, held_out, args.min_confidence, args.repeat), **load)
+    else:
+        model, load = _timed_load(args.model)
+        report = dict(evaluate(model, records, args.min_confidence, args.repeat), **load)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_evaluation(report)
+
+# Global task classifier instance (routers import it lazily, only when TASK_CLASSIFIER_MODEL is set)
+task_classifier = TaskClassifier()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+"""Make the gateway modules (which import each other as top-level modules) importable"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,210 @@
+"""Admission priority queues, shedding and cancellation; streams releasing their slot"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import api_gateway
+import enhanced_router
+from admission_control import (
+    AdmissionConfig, AdmissionController, AdmissionRejected, BackendAdmission,
+    PRIORITY_BATCH, PRIORITY_COLLABORATION, PRIORITY_INTERACTIVE
+)
+from circuit_breaker import BreakerConfig, CircuitBreakerRegistry, CLOSED, OPEN
+from deadlines import Deadline, DeadlineExceeded, deadline_manager
+
+def make_admission(max_concurrent=1, max_queue=4, max_wait=5.0):
+    return BackendAdmission('general', AdmissionConfig(max_concurrent=max_concurrent, max_queue=max_queue,
+                                                       max_wait=max_wait))
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out waiting'
+        time.sleep(0.002)
+
+def queue_behind(admission, priority, granted):
+    """Start a thread that queues for a slot and records its priority once granted"""
+    def run():
+        admission.acquire(priority)
+        granted.append(priority)
+
+    thread = threading.Thread(target=run)
+    depth = admission.queue_depth
+    thread.start()
+    wait_until(lambda: admission.queue_depth == depth + 1)
+    return thread
+
+def release_one_by_one(admission, granted, threads):
+    for expected in range(len(granted) + 1, len(granted) + len(threads) + 1):
+        admission.release()
+        wait_until(lambda: len(granted) == expected)
+    for thread in threads:
+        thread.join(2)
+
+def test_admits_up_to_the_concurrency_limit():
+    admission = make_admission(max_concurrent=2)
+    admission.acquire()
+    admission.acquire()
+
+    assert admission.in_flight == 2 and admission.queue_depth == 0
+
+def test_released_slots_go_to_the_highest_priority_waiter():
+    admission = make_admission(max_concurrent=1, max_queue=8)
+    admission.acquire()
+    granted = []
+    threads = [queue_behind(admission, priority, granted)
+               for priority in (PRIORITY_BATCH, PRIORITY_COLLABORATION, PRIORITY_INTERACTIVE, PRIORITY_BATCH)]
+
+    release_one_by_one(admission, granted, threads)
+
+    assert granted == [PRIORITY_INTERACTIVE, PRIORITY_COLLABORATION, PRIORITY_BATCH, PRIORITY_BATCH]
+    # Each slot passed straight to a waiter; the last holder still has it
+    assert admission.in_flight == 1
+
+def test_lower_priorities_are_shed_at_their_queue_share():
+    admission = make_admission(max_concurrent=1, max_queue=4)
+    admission.acquire()
+    granted = []
+    threads = [queue_behind(admission, PRIORITY_BATCH, granted) for _ in range(2)]
+
+    # Batch may fill half the queue, collaboration 80%; interactive work still gets in
+    with pytest.raises(AdmissionRejected) as raised:
+        admission.acquire(PRIORITY_BATCH)
+    threads.append(queue_behind(admission, PRIORITY_COLLABORATION, granted))
+    with pytest.raises(AdmissionRejected):
+        admission.acquire(PRIORITY_COLLABORATION)
+    threads.append(queue_behind(admission, PRIORITY_INTERACTIVE, granted))
+
+    assert raised.value.status_code == 429 and raised.value.retry_after >= 1
+    assert admission.snapshot()['rejected_queue_full'] == 2
+    release_one_by_one(admission, granted, threads)
+    assert granted == [PRIORITY_INTERACTIVE, PRIORITY_COLLABORATION, PRIORITY_BATCH, PRIORITY_BATCH]
+
+def test_queue_timeout_sheds_with_503_and_frees_the_place():
+    admission = make_admission(max_concurrent=1, max_wait=0.05)
+    admission.acquire()
+
+    with pytest.raises(AdmissionRejected) as raised:
+        admission.acquire()
+    admission.release()
+
+    assert raised.value.status_code == 503
+    assert admission.queue_depth == 0 and admission.in_flight == 0
+    assert admission.snapshot()['rejected_timeout'] == 1
+
+def test_queueing_stops_at_the_request_deadline():
+    admission = make_admission(max_concurrent=1, max_wait=5.0)
+    admission.acquire()
+
+    started = time.monotonic()
+    with deadline_manager.scope(Deadline(0.05)):
+        with pytest.raises(DeadlineExceeded):
+            admission.acquire()
+
+    assert time.monotonic() - started < 1.0
+    assert admission.snapshot()['rejected_deadline'] == 1
+
+def test_async_waiter_cancelled_in_the_queue_withdraws():
+    admission = make_admission(max_concurrent=1)
+    admission.acquire()
+
+    async def run():
+        task = asyncio.ensure_future(admission.acquire_async())
+        while admission.queue_depth == 0:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    admission.release()
+
+    assert admission.queue_depth == 0 and admission.in_flight == 0
+
+def test_async_waiter_cancelled_after_its_grant_hands_the_slot_back():
+    admission = make_admission(max_concurrent=1)
+    admission.acquire()
+
+    async def run():
+        task = asyncio.ensure_future(admission.acquire_async())
+        while admission.queue_depth == 0:
+            await asyncio.sleep(0.001)
+        # Granted, but cancelled before the waiter ran again
+        admission.release()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    assert admission.in_flight == 0
+
+def test_controller_release_callback_is_idempotent():
+    controller = AdmissionController()
+    controller.configure('general', AdmissionConfig(max_concurrent=1))
+    release = controller.acquire('general')
+
+    release()
+    release()
+
+    assert controller.get('general').in_flight == 0
+    assert controller.stats()['general']['released'] == 1
+
+def test_disabled_admission_never_queues():
+    controller = AdmissionController()
+    controller.configure('general', AdmissionConfig(enabled=False, max_concurrent=1))
+
+    with controller.slot('general'), controller.slot('general'):
+        assert controller.get('general').in_flight == 0
+
+@pytest.fixture
+def breakers(monkeypatch):
+    registry = CircuitBreakerRegistry(BreakerConfig(failure_threshold=5, open_seconds=60.0))
+    monkeypatch.setattr(api_gateway, 'circuit_breakers', registry)
+    monkeypatch.setattr(enhanced_router, 'circuit_breakers', registry)
+    return registry
+
+def chunks(*errors):
+    yield b'data: {"choices": []}\n\n'
+    for error in errors:
+        raise error
+    yield b'data: [DONE]\n\n'
+
+def open_stream(upstream, released):
+    return api_gateway.TrackedStream(upstream, 'general', time.time(), lambda: released.append(True))
+
+def test_streams_closed_by_the_client_leave_the_breaker_closed(breakers):
+    released = []
+    for _ in range(10):
+        stream = open_stream(chunks(), released)
+        next(stream)
+        stream.close()
+
+    assert breakers.get('general').state == CLOSED
+    assert breakers.get('general').consecutive_failures == 0
+    assert len(released) == 10
+
+def test_close_after_the_stream_ended_is_a_no_op(breakers):
+    released = []
+    stream = open_stream(chunks(), released)
+    assert list(stream) == [b'data: {"choices": []}\n\n', b'data: [DONE]\n\n']
+
+    stream.close()
+
+    assert len(released) == 1
+    assert breakers.get('general').window[-1][1] is True
+
+def test_upstream_errors_count_as_failures(breakers):
+    released = []
+    for _ in range(5):
+        stream = open_stream(chunks(ConnectionError('reset by peer')), released)
+        next(stream)
+        with pytest.raises(ConnectionError):
+            next(stream)
+        stream.close()
+
+    assert breakers.get('general').state == OPEN
+    assert len(released) == 5
@@ -0,0 +1,125 @@
+"""BackendPool replica selection, ejection and health-probe handling"""
+
+import time
+
+import pytest
+
+from backend_pools import BackendPool, BalancerConfig, EndpointSpec, parse_endpoints
+
+class FakeClient:
+    """Stands in for a BackendClient: the pool installs on_result on it"""
+
+    def __init__(self, url):
+        self.url = url
+        self.on_result = None
+
+    def call(self, success, latency=0.1):
+        self.on_result(None, None, started=True)
+        self.on_result(latency, success)
+
+def make_pool(urls=('http://a', 'http://b'), **config):
+    # Defaults eject after 3 failures for 10s, at most half the replicas at once
+    return BackendPool('general', [EndpointSpec(url) for url in urls], FakeClient, BalancerConfig(**config))
+
+def endpoint(pool, url):
+    return next(endpoint for endpoint in pool.endpoints if endpoint.url == url)
+
+def fail(pool, url, times):
+    for _ in range(times):
+        endpoint(pool, url).client.call(False)
+
+def test_parse_endpoints_with_weights():
+    specs = parse_endpoints('http://a:8000/;weight=2, http://b:8000')
+
+    assert specs == [EndpointSpec('http://a:8000', 2.0), EndpointSpec('http://b:8000', 1.0)]
+    with pytest.raises(ValueError):
+        parse_endpoints('http://a;weight=0')
+    with pytest.raises(ValueError):
+        parse_endpoints('http://a;zone=x')
+
+def test_consecutive_failures_eject_a_replica():
+    pool = make_pool()
+    fail(pool, 'http://a', 2)
+    assert not endpoint(pool, 'http://a').ejected(time.monotonic())
+
+    fail(pool, 'http://a', 1)
+
+    assert endpoint(pool, 'http://a').ejected(time.monotonic())
+    assert {pool.pick().url for _ in range(50)} == {'http://b'}
+    assert pool.stats()['ejections'] == 1
+
+def test_success_resets_the_failure_run():
+    pool = make_pool()
+    fail(pool, 'http://a', 2)
+    endpoint(pool, 'http://a').client.call(True)
+    fail(pool, 'http://a', 2)
+
+    assert not endpoint(pool, 'http://a').ejected(time.monotonic())
+
+def test_outcomes_cut_short_by_the_caller_do_not_count():
+    pool = make_pool()
+    client = endpoint(pool, 'http://a').client
+    for _ in range(5):
+        client.call(None)
+
+    replica = endpoint(pool, 'http://a')
+    assert replica.consecutive_failures == 0
+    assert replica.outstanding == 0
+    assert not replica.ejected(time.monotonic())
+
+def test_ejection_share_is_capped():
+    pool = make_pool()
+    fail(pool, 'http://a', 3)
+    fail(pool, 'http://b', 3)
+
+    ejected = [replica.url for replica in pool.endpoints if replica.ejected(time.monotonic())]
+    assert ejected == ['http://a']
+
+def test_repeat_ejections_back_off():
+    pool = make_pool(urls=('http://a', 'http://b', 'http://c', 'http://d'))
+    replica = endpoint(pool, 'http://a')
+    fail(pool, 'http://a', 3)
+    first = replica.ejected_until - time.monotonic()
+
+    replica.ejected_until = 0.0
+    fail(pool, 'http://a', 3)
+    second = replica.ejected_until - time.monotonic()
+
+    assert first == pytest.approx(10.0, abs=0.5)
+    assert second == pytest.approx(20.0, abs=0.5)
+
+def test_single_replica_pool_is_never_ejected():
+    pool = make_pool(urls=('http://only',))
+    fail(pool, 'http://only', 10)
+
+    assert not pool.endpoints[0].ejected(time.monotonic())
+    assert pool.pick().url == 'http://only'
+
+def test_probe_failures_take_replicas_out_and_back():
+    pool = make_pool()
+
+    pool.observe_probe('http://a', False)
+    assert {pool.pick().url for _ in range(50)} == {'http://b'}
+
+    pool.observe_probe('http://a', True)
+    assert not endpoint(pool, 'http://a').probe_down
+
+def test_pool_fails_open_when_every_replica_is_out():
+    pool = make_pool(max_ejected_share=1.0)
+    pool.observe_probe('http://a', False)
+    pool.observe_probe('http://b', False)
+
+    assert pool.pick().url in ('http://a', 'http://b')
+    assert pool.stats()['all_ejected'] >= 1
+
+def test_power_of_two_choices_prefers_the_less_loaded_replica():
+    pool = make_pool()
+    endpoint(pool, 'http://a').outstanding = 10
+
+    assert {pool.pick().url for _ in range(50)} == {'http://b'}
+
+def test_latency_ewma_tracks_successes():
+    pool = make_pool(latency_alpha=0.5, initial_latency=1.0)
+    endpoint(pool, 'http://a').client.call(True, latency=3.0)
+
+    assert endpoint(pool, 'http://a').latency == pytest.approx(2.0)
@@ -0,0 +1,152 @@
+"""CircuitBreaker trips, half-open probes and read-only ranking checks"""
+
+import time
+
+import api_gateway
+import enhanced_router
+from circuit_breaker import BreakerConfig, CircuitBreaker, CircuitBreakerRegistry, CLOSED, HALF_OPEN, OPEN
+
+def make_breaker(failure_threshold=3, min_window_requests=100, open_seconds=0.0, **config):
+    return CircuitBreaker('backend', BreakerConfig(failure_threshold=failure_threshold,
+                                                   min_window_requests=min_window_requests,
+                                                   open_seconds=open_seconds, **config))
+
+def trip(breaker):
+    for _ in range(breaker.config.failure_threshold):
+        breaker.record(False)
+
+def test_consecutive_failures_open_the_breaker():
+    breaker = make_breaker(open_seconds=60.0)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == CLOSED
+
+    breaker.record(False)
+
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.acquire() is None
+    assert breaker.snapshot()['rejected'] == 1
+
+def test_success_resets_the_failure_run():
+    breaker = make_breaker()
+    breaker.record(False)
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+
+    assert breaker.state == CLOSED
+
+def test_error_rate_opens_the_breaker():
+    breaker = make_breaker(failure_threshold=100, min_window_requests=4, error_rate_threshold=0.5,
+                           open_seconds=60.0)
+    for success in (True, False, True, False):
+        breaker.record(success)
+
+    assert breaker.state == OPEN
+
+def test_allow_never_takes_the_probe_slot():
+    breaker = make_breaker()
+    trip(breaker)
+
+    for _ in range(10):
+        assert breaker.allow()
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.snapshot()['probes_in_flight'] == 0
+    assert breaker.acquire() == HALF_OPEN
+    assert not breaker.allow()
+    assert breaker.acquire() is None
+
+def test_successful_probes_close_the_breaker():
+    breaker = make_breaker()
+    trip(breaker)
+
+    for _ in range(2):
+        assert breaker.acquire()
+        breaker.record(True)
+
+    assert breaker.state == CLOSED
+
+def test_failed_probe_reopens_with_longer_cool_down():
+    breaker = make_breaker(max_open_seconds=10.0)
+    trip(breaker)
+    breaker.open_seconds = 1.0
+    breaker.state, breaker.opened_at = HALF_OPEN, 0.0
+
+    assert breaker.acquire()
+    breaker.record(False)
+
+    assert breaker.state == OPEN
+    assert breaker.open_seconds == 2.0
+    assert breaker.trips == 2
+
+def test_abandon_returns_the_probe_slot():
+    breaker = make_breaker()
+    trip(breaker)
+    assert breaker.acquire()
+
+    breaker.abandon()
+
+    assert breaker.snapshot()['probes_in_flight'] == 0
+    assert breaker.acquire()
+
+def test_stale_probe_slot_is_reclaimed():
+    breaker = make_breaker(probe_timeout=0.0)
+    trip(breaker)
+    assert breaker.acquire()
+
+    assert breaker.acquire()
+
+def test_closed_admission_holds_no_probe_slot():
+    breaker = make_breaker()
+    assert breaker.acquire() == CLOSED
+
+def test_stream_admitted_closed_does_not_free_anothers_probe(monkeypatch):
+    registry = CircuitBreakerRegistry(BreakerConfig(failure_threshold=1, open_seconds=0.0))
+    monkeypatch.setattr(api_gateway, 'circuit_breakers', registry)
+    probe = api_gateway.admit_circuit('backend')
+    stream = api_gateway.TrackedStream(iter([b'data: {}\n\n']), 'backend', time.time(),
+                                       lambda: None, probe=probe)
+    assert not probe
+
+    registry.record('backend', False)
+    assert api_gateway.admit_circuit('backend')
+    stream._finish(False, record=False)
+
+    assert registry.get('backend').snapshot()['probes_in_flight'] == 1
+
+def test_disabled_registry_admits_everything():
+    registry = CircuitBreakerRegistry(BreakerConfig(enabled=False, failure_threshold=1))
+    registry.record('backend', False)
+
+    assert registry.allow('backend') and registry.acquire('backend')
+    assert registry.breakers == {}
+
+def test_dry_run_routing_leaves_half_open_probe_free(monkeypatch):
+    registry = CircuitBreakerRegistry(BreakerConfig(failure_threshold=1, open_seconds=0.0))
+    monkeypatch.setattr(enhanced_router, 'circuit_breakers', registry)
+    router = enhanced_router.IntelligentRouter()
+    model, _ = router.get_optimal_model('Write a haiku about autumn', 'creative')
+    registry.record(model, False)
+
+    for _ in range(5):
+        chosen, routing_info = router.get_optimal_model('Write a haiku about autumn', 'creative')
+        assert chosen == model
+        assert not routing_info['circuit_fail_open']
+
+    assert registry.get(model).snapshot()['probes_in_flight'] == 0
+    assert registry.acquire(model)
+
+def test_routing_fails_open_when_every_breaker_is_open(monkeypatch):
+    registry = CircuitBreakerRegistry(BreakerConfig(failure_threshold=1, open_seconds=60.0))
+    monkeypatch.setattr(enhanced_router, 'circuit_breakers', registry)
+    router = enhanced_router.IntelligentRouter()
+    for name in router.models:
+        registry.record(name, False)
+
+    model, routing_info = router.get_optimal_model('Explain recursion', 'general')
+
+    assert model in router.models
+    assert routing_info['circuit_fail_open']
+    assert routing_info['fallback_models'] == []
@@ -0,0 +1,94 @@
+"""Deadline sources and precedence, the budget cap, and per-hop timeouts"""
+
+import asyncio
+import time
+
+import pytest
+
+from deadlines import DEADLINE_HEADER, Deadline, DeadlineConfig, DeadlineExceeded, DeadlineManager
+
+@pytest.fixture
+def manager():
+    return DeadlineManager(DeadlineConfig(default_timeout=120.0, max_timeout=600.0,
+                                          endpoint_timeouts={'/v1/completions': 90.0}))
+
+def test_header_wins_over_body_and_endpoint_default(manager):
+    deadline = manager.from_request('/v1/completions', {DEADLINE_HEADER: '12.5'}, {'timeout': 30})
+
+    assert (deadline.budget, deadline.source) == (12.5, 'header')
+
+def test_body_timeout_when_no_header(manager):
+    deadline = manager.from_request('/v1/completions', {}, {'timeout': '30'})
+
+    assert (deadline.budget, deadline.source) == (30.0, 'body')
+
+@pytest.mark.parametrize('header', ['soon', '0', '-5', ''])
+def test_unusable_header_falls_through_to_body(manager, header):
+    deadline = manager.from_request('/v1/completions', {DEADLINE_HEADER: header}, {'timeout': 30})
+
+    assert (deadline.budget, deadline.source) == (30.0, 'body')
+
+def test_endpoint_default_then_global_default(manager):
+    assert manager.from_request('/v1/completions', {}, {'prompt': 'hi'}).budget == 90.0
+    assert manager.from_request('/v1/other', {}, None).budget == 120.0
+    assert manager.from_request('/v1/other', {}, None).source == 'default'
+
+def test_budgets_are_capped(manager):
+    assert manager.from_request('/v1/completions', {DEADLINE_HEADER: '3600'}).budget == 600.0
+    assert manager.from_request('/v1/completions', {}, {'timeout': 10 ** 6}).budget == 600.0
+
+def test_disabled_manager_sets_no_deadline():
+    assert DeadlineManager(DeadlineConfig(enabled=False)).from_request('/v1/completions', {DEADLINE_HEADER: '5'}) is None
+
+def test_source_counters(manager):
+    manager.from_request('/v1/completions', {DEADLINE_HEADER: '5'})
+    manager.from_request('/v1/completions', {}, {'timeout': 5})
+    manager.from_request('/v1/completions', {})
+
+    stats = manager.stats()
+    assert (stats['requests'], stats['from_header'], stats['from_body']) == (3, 1, 1)
+
+def test_hop_timeouts_are_capped_by_the_remaining_budget(manager):
+    assert manager.timeout(30.0) == 30.0
+    with manager.scope(Deadline(2.0)):
+        assert 1.9 < manager.timeout(30.0) <= 2.0
+        assert manager.timeout(0.5) == 0.5
+    with manager.scope(Deadline(-1.0)):
+        # Never zero: aiohttp and asyncio read that as no timeout at all
+        assert manager.timeout(30.0) == 0.001
+
+def test_check_raises_once_the_budget_is_spent(manager):
+    with manager.scope(Deadline(10.0)):
+        manager.check('backend')
+    with manager.scope(Deadline(0.01)):
+        with pytest.raises(DeadlineExceeded) as raised:
+            manager.check('backend', 'general')
+
+    assert raised.value.stage == 'backend' and raised.value.status_code == 504
+    assert manager.stats()['exceeded'] == 1
+
+def test_inject_forwards_the_remaining_budget(manager):
+    assert DEADLINE_HEADER not in manager.inject({'Accept': 'text/plain'})
+    with manager.scope(Deadline(5.0)):
+        headers = manager.inject({'Accept': 'text/plain'})
+
+    assert headers['Accept'] == 'text/plain'
+    assert 4.9 < float(headers[DEADLINE_HEADER]) <= 5.0
+
+def test_scope_restores_the_outer_deadline(manager):
+    outer = Deadline(10.0)
+    with manager.scope(outer):
+        with manager.scope(None):
+            assert manager.current() is None
+        assert manager.current() is outer
+    assert manager.current() is None
+
+def test_run_within_cancels_at_the_deadline(manager):
+    async def run():
+        with manager.scope(Deadline(0.05)):
+            await manager.run_within(asyncio.sleep(5), 'orchestrator')
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run())
+    assert time.monotonic() - started < 1.0
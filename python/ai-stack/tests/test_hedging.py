@@ -0,0 +1,174 @@
+"""Hedger budget, pool sizing and loser cancellation"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from hedging import Attempt, HedgeConfig, HedgeFailed, Hedger, attempt_cancelled, current_attempt
+
+def make_hedger(budget_ratio=0.0, budget_burst=10.0, **config):
+    # No budget earned from traffic: each test hands out exactly the burst it needs
+    return Hedger(HedgeConfig(budget_ratio=budget_ratio, budget_burst=budget_burst, **config))
+
+def slow(result, seconds, seen=None):
+    """A call that waits `seconds` unless its attempt is cancelled first"""
+    def call():
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if attempt_cancelled():
+                if seen is not None:
+                    seen.append('cancelled')
+                raise ConnectionError('cut off')
+            time.sleep(0.005)
+        return result
+    return call
+
+def test_fast_primary_wins_without_hedging():
+    hedger = make_hedger()
+
+    result, hedge_won = hedger.race(lambda: 'primary', lambda: 'hedge', delay=1.0)
+
+    assert (result, hedge_won) == ('primary', False)
+    stats = hedger.stats()
+    assert stats['hedges_fired'] == 0
+    assert stats['budget_tokens'] == 10.0
+
+def test_primary_runs_inline_when_no_hedge_is_possible():
+    caller = threading.current_thread()
+    threads = []
+
+    def primary():
+        threads.append(threading.current_thread())
+        return 'ok'
+
+    make_hedger().race(primary, None, delay=0.01)
+    make_hedger(budget_burst=0.0).race(primary, lambda: 'hedge', delay=0.01)
+    make_hedger(enabled=False).race(primary, lambda: 'hedge', delay=0.01)
+
+    assert threads == [caller, caller, caller]
+
+def test_slow_primary_is_hedged_and_the_loser_cancelled():
+    hedger = make_hedger()
+    seen = []
+
+    result, hedge_won = hedger.race(slow('primary', 5.0, seen), lambda: 'hedge', delay=0.02)
+
+    assert (result, hedge_won) == ('hedge', True)
+    deadline = time.monotonic() + 2
+    while not seen and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert seen == ['cancelled']
+    stats = hedger.stats()
+    assert stats['hedges_fired'] == 1
+    assert stats['hedge_wins'] == 1
+    assert stats['losers_cancelled'] == 1
+
+def test_budget_limits_hedges():
+    hedger = make_hedger(budget_burst=1.0)
+
+    _, first_hedged = hedger.race(slow('primary', 0.1), lambda: 'hedge', delay=0.01)
+    _, second_hedged = hedger.race(slow('primary', 0.1), lambda: 'hedge', delay=0.01)
+
+    assert (first_hedged, second_hedged) == (True, False)
+    assert hedger.stats()['hedges_fired'] == 1
+
+def test_budget_is_earned_by_primaries():
+    hedger = make_hedger(budget_ratio=0.5, budget_burst=1.0)
+    hedger.budget.tokens = 0.0
+
+    hedger.race(lambda: 'a', lambda: 'hedge', delay=1.0)
+    assert not hedger.budget.available()
+    hedger.race(lambda: 'b', lambda: 'hedge', delay=1.0)
+    assert hedger.budget.available()
+
+def test_full_pool_skips_the_hedge_instead_of_queueing_it():
+    hedger = make_hedger(max_workers=1)
+
+    result, hedge_won = hedger.race(slow('primary', 0.1), lambda: 'hedge', delay=0.01)
+
+    assert (result, hedge_won) == ('primary', False)
+    stats = hedger.stats()
+    assert stats['pool_full'] == 1
+    assert stats['hedges_fired'] == 0
+
+def test_hedge_failed_when_both_calls_fail():
+    hedger = make_hedger()
+
+    def primary():
+        time.sleep(0.05)
+        raise ConnectionError('primary down')
+
+    def hedge():
+        raise ConnectionError('hedge down')
+
+    with pytest.raises(HedgeFailed) as error:
+        hedger.race(primary, hedge, delay=0.01)
+    assert error.value.hedged
+    assert 'primary down' in str(error.value.primary_error)
+
+def test_fast_primary_failure_is_not_hedged():
+    hedger = make_hedger()
+
+    def primary():
+        raise ConnectionError('refused')
+
+    with pytest.raises(HedgeFailed) as error:
+        hedger.race(primary, lambda: 'hedge', delay=1.0)
+    assert not error.value.hedged
+    assert hedger.stats()['hedges_fired'] == 0
+
+def test_each_call_sees_its_own_attempt():
+    hedger = make_hedger()
+    attempts = {}
+
+    def primary():
+        attempts['primary'] = current_attempt.get()
+        time.sleep(0.2)
+        return 'primary'
+
+    def hedge():
+        attempts['hedge'] = current_attempt.get()
+        return 'hedge'
+
+    hedger.race(primary, hedge, delay=0.01)
+
+    assert attempts['primary'] is not attempts['hedge']
+    assert attempts['primary'].cancelled and not attempts['hedge'].cancelled
+    assert current_attempt.get() is None
+
+class Connection:
+    def __init__(self, sock):
+        self.sock = sock
+
+def test_cancel_shuts_down_registered_connections():
+    client, server = socket.socketpair()
+    try:
+        attempt = Attempt()
+        attempt.register(Connection(client))
+        attempt.register(Connection(None))
+
+        attempt.cancel()
+
+        assert attempt.cancelled
+        assert server.recv(1) == b''
+    finally:
+        client.close()
+        server.close()
+
+def test_unregistered_connections_are_left_alone():
+    client, server = socket.socketpair()
+    try:
+        attempt = Attempt()
+        connection = Connection(client)
+        attempt.register(connection)
+        attempt.unregister(connection)
+
+        attempt.cancel()
+
+        client.sendall(b'x')
+        assert server.recv(1) == b'x'
+    finally:
+        client.close()
+        server.close()
@@ -0,0 +1,100 @@
+"""Quantile sketch accuracy against a sorted reference, ring buffer, EWMA and rate windows"""
+
+import math
+import random
+
+import pytest
+
+from latency_stats import LatencyStatsConfig, ModelLatencyStats, QuantileSketch, RateWindow, RingBuffer
+
+QUANTILES = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 0.999)
+
+def reference(values, q):
+    """Exact quantile by rank: the ceil(q * n)-th smallest value"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+@pytest.mark.parametrize('accuracy', [0.01, 0.02, 0.05])
+def test_sketch_quantiles_are_within_relative_accuracy(accuracy):
+    rng = random.Random(42)
+    values = [rng.lognormvariate(-0.5, 1.0) for _ in range(20000)]
+    sketch = QuantileSketch(accuracy, half_life=10 ** 9)
+    for value in values:
+        sketch.add(value)
+
+    for q, estimate in zip(QUANTILES, sketch.quantiles(QUANTILES)):
+        exact = reference(values, q)
+        assert abs(estimate - exact) <= accuracy * exact * (1 + 1e-9), q
+
+def test_quantiles_in_any_order_match_single_lookups():
+    rng = random.Random(1)
+    sketch = QuantileSketch(half_life=10 ** 9)
+    for _ in range(1000):
+        sketch.add(rng.uniform(0.05, 3.0))
+
+    shuffled = (0.99, 0.5, 0.01, 0.95)
+    assert sketch.quantiles(shuffled) == [sketch.quantile(q) for q in shuffled]
+
+def test_sketch_extremes_and_empty():
+    sketch = QuantileSketch(0.02, max_value=10.0)
+    assert sketch.quantile(0.5) is None
+
+    sketch.add(0.0)
+    sketch.add(500.0)
+
+    low, high = sketch.quantiles((0.0, 1.0))
+    assert low <= sketch.min_value * 1.05
+    assert high == pytest.approx(10.0, rel=0.03)
+
+def test_sketch_follows_a_latency_shift():
+    sketch = QuantileSketch(0.02, half_life=256)
+    for _ in range(2000):
+        sketch.add(0.1)
+    for _ in range(2000):
+        sketch.add(1.0)
+
+    assert sketch.quantile(0.5) == pytest.approx(1.0, rel=0.025)
+    assert sketch.total < 512
+
+def test_ring_buffer_mean_covers_the_last_window():
+    ring = RingBuffer(3)
+    for value in (1.0, 2.0, 3.0, 4.0, 5.0):
+        ring.append(value)
+
+    assert ring.values() == [3.0, 4.0, 5.0]
+    assert ring.mean == pytest.approx(4.0)
+    assert ring.count == 3
+    assert RingBuffer(3).mean is None
+
+def test_rate_window_forgets_old_seconds():
+    window = RateWindow(10)
+    window.record(True, now=100.0)
+    window.record(False, now=105.5)
+    window.record(True, now=105.9)
+
+    assert window.totals(106.0)['requests'] == 3
+    later = window.totals(112.0)
+    assert (later['requests'], later['errors'], later['error_rate']) == (2, 1, 0.5)
+    assert window.totals(200.0)['requests'] == 0
+
+def test_model_stats_track_outcomes_and_signals():
+    stats = ModelLatencyStats(LatencyStatsConfig(window_size=4, ewma_alpha=0.5))
+    for latency, success in ((1.0, True), (3.0, False), (2.0, True)):
+        stats.record(latency, success, now=50.0)
+
+    assert stats.latency('mean') == pytest.approx(2.0)
+    assert stats.latency('ewma') == pytest.approx(2.0)
+    assert stats.latency('p50') == pytest.approx(2.0, rel=0.025)
+    assert stats.success_rate == pytest.approx(2 / 3)
+    assert stats.snapshot(now=50.0)['recent']['errors'] == 1
+
+def test_cached_percentiles_refresh_after_a_sample():
+    stats = ModelLatencyStats()
+    stats.record(1.0, True)
+    assert stats.percentile(95) == pytest.approx(1.0, rel=0.025)
+
+    for _ in range(99):
+        stats.record(5.0, True)
+
+    assert stats.percentile(95) == pytest.approx(5.0, rel=0.025)
+    assert stats.percentile(1) == pytest.approx(1.0, rel=0.025)
@@ -0,0 +1,146 @@
+"""MicroBatcher windows and batch sizes, and splitting batched choices back to callers"""
+
+import threading
+import time
+
+import pytest
+import requests
+
+import api_gateway
+from micro_batching import BatchConfig, MicroBatcher
+
+TEMPLATE = '[INST] {prompt} [/INST]'
+
+def make_batcher(window, target, templates=None):
+    batcher = MicroBatcher(BatchConfig(enabled=True, backends=('general',), max_wait_ms=window * 1000,
+                                       prompt_templates={'general': TEMPLATE} if templates is None else templates))
+    # Pin the adaptive plan so the test controls the window and target size
+    batcher._plan = lambda load: (window, target)
+    return batcher
+
+def submit_all(batcher, prompts, send_batch, send_one=lambda: 'solo'):
+    results = {}
+    barrier = threading.Barrier(len(prompts))
+
+    def submit(prompt):
+        barrier.wait()
+        try:
+            results[prompt] = batcher.submit('general', (512, 0.0), prompt, send_one, send_batch)
+        except Exception as e:
+            results[prompt] = e
+
+    threads = [threading.Thread(target=submit, args=(prompt,)) for prompt in prompts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+def echo_batch(calls):
+    def send_batch(prompts):
+        calls.append(list(prompts))
+        return [f"answer to {prompt}" for prompt in prompts]
+    return send_batch
+
+def test_window_flushes_a_partial_batch():
+    batcher = make_batcher(window=0.2, target=10)
+    calls = []
+
+    results = submit_all(batcher, ['a', 'b', 'c'], echo_batch(calls))
+
+    assert len(calls) == 1
+    assert sorted(calls[0]) == ['[INST] a [/INST]', '[INST] b [/INST]', '[INST] c [/INST]']
+    assert results == {prompt: f"answer to [INST] {prompt} [/INST]" for prompt in 'abc'}
+    assert batcher.stats()['batched_requests'] == 3
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    batcher = make_batcher(window=5.0, target=3)
+    calls = []
+
+    started = time.monotonic()
+    results = submit_all(batcher, ['a', 'b', 'c'], echo_batch(calls))
+
+    assert time.monotonic() - started < 2.0
+    assert [len(prompts) for prompts in calls] == [3]
+    assert all(not isinstance(result, Exception) for result in results.values())
+
+def test_batch_error_reaches_every_member():
+    batcher = make_batcher(window=0.2, target=10)
+
+    def send_batch(prompts):
+        raise requests.exceptions.ConnectionError('backend down')
+
+    results = submit_all(batcher, ['a', 'b'], send_batch)
+
+    assert all(isinstance(result, requests.exceptions.ConnectionError) for result in results.values())
+    assert batcher.stats()['batch_errors'] == 1
+
+def test_idle_backend_sends_immediately():
+    batcher = MicroBatcher(BatchConfig(enabled=True, backends=('general',), prompt_templates={'general': TEMPLATE}))
+
+    result = batcher.submit('general', (512, 0.0), 'a', lambda: 'solo', lambda prompts: pytest.fail('batched'))
+
+    assert result == 'solo'
+    assert batcher.stats()['solo_requests'] == 1
+
+def test_backends_without_a_chat_template_are_not_batched():
+    batcher = MicroBatcher(BatchConfig(enabled=True, backends=('general', 'coding'),
+                                       prompt_templates={'general': TEMPLATE, 'coding': 'no placeholder'}))
+
+    assert batcher.applies_to('general')
+    assert not batcher.applies_to('coding')
+    assert not batcher.applies_to('general', stream=True)
+
+def test_templates_from_env(monkeypatch):
+    monkeypatch.setenv('MICRO_BATCH_BACKENDS', 'general,coding')
+    monkeypatch.setenv('MICRO_BATCH_PROMPT_TEMPLATE', TEMPLATE)
+    monkeypatch.setenv('CODING_MICRO_BATCH_PROMPT_TEMPLATE', '### Instruction:\n{prompt}\n### Response:\n')
+
+    config = BatchConfig.from_env()
+
+    assert config.prompt_templates == {
+        'general': TEMPLATE, 'coding': '### Instruction:\n{prompt}\n### Response:\n'
+    }
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+class FakeClient:
+    def __init__(self, body):
+        self.body = body
+        self.posted = []
+
+    def post(self, path, json=None):
+        self.posted.append((path, json))
+        return FakeResponse(self.body)
+
+def test_batched_choices_are_split_back_by_index(monkeypatch):
+    client = FakeClient({'id': 'cmpl-1', 'model': 'mistral', 'choices': [
+        {'index': 1, 'text': 'second', 'finish_reason': 'stop'},
+        {'index': 0, 'text': 'first', 'finish_reason': 'length'}
+    ]})
+    monkeypatch.setattr(api_gateway.backend_clients, 'get', lambda model: client)
+
+    bodies = api_gateway.call_backend_batch('general', ['[INST] a [/INST]', '[INST] b [/INST]'],
+                                            max_tokens=64, temperature=0.0)
+
+    path, payload = client.posted[0]
+    assert path == '/v1/completions'
+    assert payload['prompt'] == ['[INST] a [/INST]', '[INST] b [/INST]'] and 'messages' not in payload
+    assert [body['choices'][0]['message']['content'] for body in bodies] == ['first', 'second']
+    assert [body['choices'][0]['finish_reason'] for body in bodies] == ['length', 'stop']
+    assert [body['batch'] for body in bodies] == [{'size': 2, 'index': 0}, {'size': 2, 'index': 1}]
+
+def test_choice_count_mismatch_fails_the_batch(monkeypatch):
+    client = FakeClient({'choices': [{'index': 0, 'text': 'only one'}]})
+    monkeypatch.setattr(api_gateway.backend_clients, 'get', lambda model: client)
+
+    with pytest.raises(requests.exceptions.RequestException):
+        api_gateway.call_backend_batch('general', ['a', 'b'])
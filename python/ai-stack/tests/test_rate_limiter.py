@@ -0,0 +1,154 @@
+"""RateLimiter charging, refunds, store eviction and caller identity"""
+
+import time
+
+import pytest
+
+import rate_limiter
+from rate_limiter import (
+    MemoryStore, RateLimit, RateLimitConfig, RateLimiter, SQLiteStore, caller_identity, parse_networks
+)
+
+# No meaningful refill during a test
+SLOW_REFILL = dict(requests_per_second=0.001, tokens_per_second=0.001)
+
+def make_limiter(store=None, **limits):
+    limiter = RateLimiter(RateLimitConfig(enabled=True, default=RateLimit(**limits)),
+                          config_path='', store_path='')
+    if store is not None:
+        limiter.store = store
+    return limiter
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    return MemoryStore() if request.param == 'memory' else SQLiteStore(str(tmp_path / 'limits.db'))
+
+def test_disabled_by_default(monkeypatch):
+    monkeypatch.delenv('RATE_LIMIT_ENABLED', raising=False)
+    limiter = RateLimiter(RateLimitConfig.from_env(), config_path='', store_path='')
+
+    assert limiter.check('ip:10.0.0.1', None, 100) is None
+
+def test_concurrency_rejection_is_not_charged(store):
+    limiter = make_limiter(store, burst_requests=2, max_concurrent=1, **SLOW_REFILL)
+
+    holder = limiter.check('key:a', None, 10)
+    turned_away = limiter.check('key:a', None, 10)
+    holder.release()
+    after = limiter.check('key:a', None, 10)
+
+    assert holder.allowed
+    assert not turned_away.allowed and 'concurrent' in turned_away.reason
+    assert turned_away.retry_after == 1
+    # Only the two admitted requests were charged to the 2-request burst
+    assert after.allowed
+    assert after.remaining_requests == pytest.approx(0, abs=0.01)
+    assert limiter.stats()['rejected_concurrency'] == 1
+
+def test_rate_rejection_returns_the_concurrency_slot(store):
+    limiter = make_limiter(store, burst_requests=1, max_concurrent=1, **SLOW_REFILL)
+
+    first = limiter.check('key:a', None, 10)
+    first.release()
+    limited = limiter.check('key:a', None, 10)
+
+    assert not limited.allowed and limited.reason == 'request rate exceeded'
+    assert limited.retry_after >= 1
+    assert store.active('key:a') == 0
+
+def test_token_budget_rejection(store):
+    limiter = make_limiter(store, burst_tokens=100, max_concurrent=4, **SLOW_REFILL)
+
+    first = limiter.check('key:a', None, 80)
+    second = limiter.check('key:a', None, 80)
+
+    assert first.allowed
+    assert not second.allowed and second.reason == 'token rate exceeded'
+    assert second.headers()['Retry-After'] == str(second.retry_after)
+
+def test_release_is_idempotent(store):
+    limiter = make_limiter(store, max_concurrent=2)
+
+    decision = limiter.check('key:a', None, 1)
+    other = limiter.check('key:a', None, 1)
+    decision.release()
+    decision.release()
+
+    assert store.active('key:a') == 1
+    other.release()
+    assert store.active('key:a') == 0
+
+def test_callers_are_limited_independently():
+    limiter = make_limiter(burst_requests=1, **SLOW_REFILL)
+
+    assert limiter.check('key:a', None, 1).allowed
+    assert not limiter.check('key:a', None, 1).allowed
+    assert limiter.check('key:b', None, 1).allowed
+
+def test_memory_store_forgets_idle_callers():
+    store = MemoryStore(idle_ttl=60)
+    limit = RateLimit()
+    store.take('key:idle', limit, 1)
+    store.take('key:busy', limit, 1)
+
+    store._buckets['key:idle'] = {name: (tokens, updated_at - 120)
+                                  for name, (tokens, updated_at) in store._buckets['key:idle'].items()}
+    store._sweep(time.time())
+
+    assert len(store) == 1
+    assert 'key:busy' in store._buckets
+
+def test_memory_store_drops_released_concurrency_entries():
+    store = MemoryStore()
+    lease = store.enter('key:a', 1)
+    store.leave('key:a', lease)
+
+    assert store._active == {}
+
+def test_api_key_identity_is_hashed():
+    keys = {'secret-key': RateLimit()}
+    identity, config_key = caller_identity({'Authorization': 'Bearer secret-key'}, '10.0.0.5', keys)
+
+    assert identity.startswith('key:') and 'secret' not in identity
+    assert config_key == 'secret-key'
+    assert caller_identity({'X-API-Key': 'secret-key'}, '10.0.0.6', keys)[0] == identity
+
+def test_unknown_api_key_falls_back_to_client_ip():
+    identity, config_key = caller_identity({'X-API-Key': 'made-up'}, '10.0.0.5', {'secret-key': RateLimit()})
+
+    assert identity == config_key == 'ip:10.0.0.5'
+
+def test_rotating_unknown_keys_does_not_reset_the_bucket():
+    limiter = make_limiter(burst_requests=3, max_concurrent=10, **SLOW_REFILL)
+    limiter.config.keys['secret-key'] = RateLimit(burst_requests=100, max_concurrent=10, **SLOW_REFILL)
+
+    decisions = [limiter.check(*limiter.identify({'X-API-Key': f'random-{i}'}, '10.0.0.5'), 10)
+                 for i in range(5)]
+
+    assert [decision.allowed for decision in decisions] == [True, True, True, False, False]
+    assert len(limiter.store) == 1
+    assert limiter.check(*limiter.identify({'X-API-Key': 'secret-key'}, '10.0.0.5'), 10).allowed
+
+def test_forwarded_for_ignored_from_untrusted_peer(monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'TRUST_FORWARDED_FOR', False)
+    monkeypatch.setattr(rate_limiter, 'TRUSTED_PROXIES', parse_networks('172.17.0.0/16'))
+
+    identity, _ = caller_identity({'X-Forwarded-For': '1.2.3.4'}, '203.0.113.9')
+
+    assert identity == 'ip:203.0.113.9'
+
+def test_forwarded_for_from_trusted_proxy_uses_nearest_untrusted_hop(monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'TRUST_FORWARDED_FOR', False)
+    monkeypatch.setattr(rate_limiter, 'TRUSTED_PROXIES', parse_networks('172.17.0.0/16, 10.1.0.1'))
+
+    # The client spoofed 1.2.3.4; nginx appended the address it actually saw
+    direct = caller_identity({'X-Forwarded-For': '198.51.100.7'}, '172.17.0.1')
+    spoofed = caller_identity({'X-Forwarded-For': '1.2.3.4, 198.51.100.7, 10.1.0.1'}, '172.17.0.1')
+
+    assert direct[0] == 'ip:198.51.100.7'
+    assert spoofed[0] == 'ip:198.51.100.7'
+
+def test_parse_networks_skips_invalid_entries():
+    networks = parse_networks('127.0.0.1, not-a-network, ::1/128,')
+
+    assert [str(network) for network in networks] == ['127.0.0.1/32', '::1/128']
@@ -0,0 +1,169 @@
+"""StreamFanout subscription lifecycle and SingleFlight sharing"""
+
+import os
+import threading
+import time
+
+import pytest
+
+import request_coalescing
+from request_coalescing import SingleFlight, StreamFanout
+
+class Upstream:
+    """Chunk iterator that records whether it was closed"""
+
+    def __init__(self, chunks, error=None):
+        self.chunks = iter(chunks)
+        self.error = error
+        self.closed = False
+        self.pulled = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            if self.error is not None:
+                raise self.error
+            raise
+        self.pulled += 1
+        return chunk
+
+    def close(self):
+        self.closed = True
+
+def make_fanout(upstream, subscribers=1):
+    finished = []
+    fanout = StreamFanout(upstream, meta='meta', on_finished=lambda: finished.append(True))
+    for _ in range(subscribers):
+        assert fanout.attach()
+    return fanout, finished
+
+def test_close_before_first_read_detaches_and_closes_upstream():
+    upstream = Upstream([b'a', b'b'])
+    fanout, finished = make_fanout(upstream)
+
+    fanout.subscribe().close()
+
+    assert upstream.closed
+    assert finished == [True]
+    assert upstream.pulled == 0
+    assert not fanout.attach()
+
+def test_close_is_idempotent():
+    upstream = Upstream([b'a'])
+    fanout, _ = make_fanout(upstream, subscribers=2)
+    first = fanout.subscribe()
+
+    first.close()
+    first.close()
+
+    # The second subscriber still holds the stream open
+    assert not upstream.closed
+    assert list(fanout.subscribe()) == [b'a']
+
+def test_every_subscriber_sees_every_chunk():
+    upstream = Upstream([b'a', b'b', b'c'])
+    fanout, finished = make_fanout(upstream, subscribers=2)
+    first, second = fanout.subscribe(), fanout.subscribe()
+
+    assert next(first) == b'a'
+    assert list(second) == [b'a', b'b', b'c']
+    assert list(first) == [b'b', b'c']
+    assert upstream.pulled == 3
+    assert not upstream.closed
+    assert finished == [True]
+
+def test_one_subscriber_leaving_keeps_the_stream_for_the_others():
+    upstream = Upstream([b'a', b'b'])
+    fanout, _ = make_fanout(upstream, subscribers=2)
+    leaver, stayer = fanout.subscribe(), fanout.subscribe()
+
+    assert next(leaver) == b'a'
+    leaver.close()
+
+    assert not upstream.closed
+    assert list(stayer) == [b'a', b'b']
+
+def test_last_subscriber_leaving_mid_stream_closes_upstream():
+    upstream = Upstream([b'a', b'b', b'c'])
+    fanout, finished = make_fanout(upstream)
+    subscription = fanout.subscribe()
+
+    assert next(subscription) == b'a'
+    subscription.close()
+
+    assert upstream.closed
+    assert finished == [True]
+    assert list(subscription) == []
+
+def test_upstream_error_reaches_every_subscriber():
+    upstream = Upstream([b'a'], error=ConnectionError('backend reset'))
+    fanout, _ = make_fanout(upstream, subscribers=2)
+    first, second = fanout.subscribe(), fanout.subscribe()
+
+    for subscription in (first, second):
+        assert next(subscription) == b'a'
+        with pytest.raises(ConnectionError):
+            next(subscription)
+    assert not upstream.closed
+
+def test_stream_shares_one_upstream_between_callers():
+    coalescer = SingleFlight('all')
+    opened = []
+
+    def open_stream():
+        upstream = Upstream([b'x', b'y'])
+        opened.append(upstream)
+        return upstream, 'model'
+
+    first, meta, shared_first = coalescer.stream('key', open_stream)
+    second, _, shared_second = coalescer.stream('key', open_stream)
+
+    assert len(opened) == 1
+    assert (meta, shared_first, shared_second) == ('model', False, True)
+    assert list(first) == [b'x', b'y']
+    assert list(second) == [b'x', b'y']
+    assert coalescer.stats()['in_flight_streams'] == 0
+
+def test_do_shares_one_call_between_concurrent_callers():
+    coalescer = SingleFlight('all')
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {'ok': True}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(coalescer.do('k', slow_call)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(coalescer.do('k', slow_call)))
+    follower.start()
+    deadline = time.monotonic() + 5
+    while coalescer.stats()['coalesced'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True]
+    assert all(result == {'ok': True} for result, _ in results)
+
+def test_deterministic_mode_only_coalesces_temperature_zero():
+    coalescer = SingleFlight('deterministic')
+
+    assert coalescer.applies_to({'temperature': 0})
+    assert not coalescer.applies_to({'temperature': 0.7})
+    assert not coalescer.applies_to({})
+
+def test_default_mode_is_deterministic():
+    if 'REQUEST_COALESCING' in os.environ:
+        pytest.skip('REQUEST_COALESCING overrides the default')
+    assert request_coalescing.COALESCING_MODE == 'deterministic'
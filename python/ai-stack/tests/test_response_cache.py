@@ -0,0 +1,131 @@
+"""Response cache eligibility, LRU/TTL eviction and the SQLite tier"""
+
+import time
+
+import pytest
+
+from response_cache import (
+    CACHE_BYPASS, CACHE_DEFAULT, CACHE_REFRESH, CacheConfig, ResponseCache, cache_policy_from_headers,
+    is_deterministic, request_fingerprint
+)
+
+GREEDY = {'messages': [{'role': 'user', 'content': 'hi'}], 'max_tokens': 16, 'temperature': 0}
+
+def make_cache(tmp_path=None, max_entries=1024, ttl_seconds=300.0, **config):
+    disk_path = str(tmp_path / 'responses.db') if tmp_path is not None else None
+    return ResponseCache(CacheConfig(enabled=True, max_entries=max_entries, ttl_seconds=ttl_seconds,
+                                     disk_path=disk_path, **config))
+
+@pytest.mark.parametrize('payload, expected', [
+    ({'temperature': 0}, True),
+    ({'temperature': '0.0'}, True),
+    ({'temperature': 0.7}, False),
+    ({}, False),
+    ({'temperature': 'hot'}, False),
+    ({'temperature': None}, False)
+])
+def test_only_greedy_requests_are_deterministic(payload, expected):
+    assert is_deterministic(payload) is expected
+
+@pytest.mark.parametrize('headers, policy', [
+    ({}, CACHE_DEFAULT),
+    ({'X-Gateway-Cache': 'refresh'}, CACHE_REFRESH),
+    ({'X-Gateway-Cache': 'BYPASS'}, CACHE_BYPASS),
+    ({'Cache-Control': 'no-store'}, CACHE_BYPASS),
+    ({'Cache-Control': 'max-age=0, no-cache'}, CACHE_REFRESH),
+    ({'X-Gateway-Cache': 'bypass', 'Cache-Control': 'no-cache'}, CACHE_BYPASS)
+])
+def test_cache_policy_from_headers(headers, policy):
+    assert cache_policy_from_headers(headers) == policy
+
+def test_should_cache():
+    cache = make_cache()
+
+    assert cache.should_cache(GREEDY)
+    assert cache.should_cache(GREEDY, CACHE_REFRESH)
+    assert not cache.should_cache(GREEDY, CACHE_BYPASS)
+    assert not cache.should_cache(dict(GREEDY, temperature=0.2))
+    assert not ResponseCache(CacheConfig(enabled=False)).should_cache(GREEDY)
+
+def test_fingerprint_ignores_key_order_but_not_content():
+    reordered = {'temperature': 0, 'max_tokens': 16, 'messages': [{'content': 'hi', 'role': 'user'}]}
+
+    assert request_fingerprint('general', '/v1/chat/completions', GREEDY) == \
+        request_fingerprint('general', '/v1/chat/completions', reordered)
+    assert request_fingerprint('general', '/v1/chat/completions', GREEDY) != \
+        request_fingerprint('coding', '/v1/chat/completions', GREEDY)
+    assert request_fingerprint('general', '/v1/chat/completions', GREEDY) != \
+        request_fingerprint('general', '/v1/chat/completions', dict(GREEDY, max_tokens=17))
+
+def test_hit_and_miss_counters():
+    cache = make_cache()
+    assert cache.get('k') is None
+
+    cache.put('k', {'text': 'hello'})
+
+    assert cache.get('k') == {'text': 'hello'}
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['stores'], stats['hit_rate']) == (1, 1, 1, 0.5)
+
+def test_least_recently_used_entry_is_evicted():
+    cache = make_cache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions_lru'] == 1
+
+def test_expired_entries_are_dropped():
+    cache = make_cache(ttl_seconds=0.05)
+    cache.put('k', 1)
+    time.sleep(0.06)
+
+    assert cache.get('k') is None
+    assert cache.stats()['evictions_expired'] == 1
+    assert cache.stats()['memory_entries'] == 0
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    make_cache(tmp_path).put('k', {'text': 'hello'})
+
+    restarted = make_cache(tmp_path)
+
+    assert restarted.get('k') == {'text': 'hello'}
+    assert restarted.stats()['disk_hits'] == 1
+    # Promoted into memory on the way out
+    assert restarted.get('k') == {'text': 'hello'}
+    assert restarted.stats()['memory_hits'] == 1
+
+def test_disk_tier_honours_the_ttl(tmp_path):
+    make_cache(tmp_path, ttl_seconds=0.05).put('k', 1)
+    time.sleep(0.06)
+
+    assert make_cache(tmp_path).get('k') is None
+
+def test_disk_tier_is_bounded(tmp_path):
+    cache = make_cache(tmp_path, max_entries=10, disk_max_entries=50)
+    for i in range(100):
+        cache.put(f'k{i}', i)
+
+    assert cache.disk.size() == 50
+    assert cache.stats()['evictions_disk'] == 50
+    assert make_cache(tmp_path).get('k99') == 99
+
+def test_clear_empties_both_tiers(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('k', 1)
+
+    cache.clear()
+
+    assert cache.get('k') is None
+    assert cache.disk.size() == 0
+
+def test_unusable_disk_path_leaves_memory_tier_working(tmp_path):
+    cache = ResponseCache(CacheConfig(enabled=True, disk_path=str(tmp_path / 'missing' / 'responses.db')))
+    cache.put('k', 1)
+
+    assert cache.disk is None
+    assert cache.get('k') == 1
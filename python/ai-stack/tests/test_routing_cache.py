@@ -0,0 +1,60 @@
+"""Routing decisions with the decision cache on match those with it off"""
+
+import random
+
+import pytest
+
+import enhanced_router
+from circuit_breaker import BreakerConfig, CircuitBreakerRegistry
+from routing_cache import RoutingCacheConfig, RoutingDecisionCache
+
+PROMPTS = [
+    ('Write a haiku about autumn', 'creative'),
+    ('Explain recursion', None),
+    ('Prove that there are infinitely many primes', None),
+    ('Implement a thread-safe LRU cache in Python with type hints', 'coding'),
+    ('Summarise the causes of the first world war', None),
+    ('Design a distributed rate limiter for a multi-region API', None),
+    ('hi', None)
+]
+
+@pytest.fixture(autouse=True)
+def no_breakers(monkeypatch):
+    # Both routers feed outcomes to the breakers; keep them out of the comparison
+    monkeypatch.setattr(enhanced_router, 'circuit_breakers', CircuitBreakerRegistry(BreakerConfig(enabled=False)))
+
+def make_router(cache_enabled):
+    router = enhanced_router.IntelligentRouter()
+    router.routing_cache = RoutingDecisionCache(RoutingCacheConfig(enabled=cache_enabled))
+    return router
+
+def replay(router, rounds=40, seed=7):
+    rng = random.Random(seed)
+    decisions = []
+    for _ in range(rounds):
+        for prompt, task_type in PROMPTS:
+            model, routing_info = router.get_optimal_model(prompt, task_type)
+            decisions.append((model, routing_info['model_scores']))
+            # Sub-2s latencies with jitter: the mean moves on every completion
+            router.update_performance_metrics(model, rng.uniform(0.3, 1.9), rng.random() > 0.05)
+    return decisions
+
+def test_cached_decisions_match_uncached():
+    cached = make_router(cache_enabled=True)
+
+    assert replay(cached) == replay(make_router(cache_enabled=False))
+
+def test_small_latency_shifts_keep_cached_scores():
+    router = make_router(cache_enabled=True)
+    completions = len(replay(router, rounds=100))
+
+    stats = router.routing_cache.stats()
+    # Only latency bonus moves of 0.001 or more invalidate, not every completion
+    assert stats['invalidations'] < completions / 4
+    assert stats['hits'] > 0
+
+def test_latency_bonus_steps():
+    assert enhanced_router._latency_bonus(2.5) == 0
+    assert enhanced_router._latency_bonus(1.0) == 0.02
+    assert enhanced_router._latency_bonus(1.0) == enhanced_router._latency_bonus(1.02)
+    assert enhanced_router._latency_bonus(1.0) != enhanced_router._latency_bonus(1.05)
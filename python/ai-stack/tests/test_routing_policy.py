@@ -0,0 +1,115 @@
+"""RoutingPolicy warm start, exploration cap, learning and shared state persistence"""
+
+import os
+import random
+
+import pytest
+
+from routing_policy import RoutingPolicy, RoutingPolicyConfig, context_key
+
+CONTEXT = context_key('general', 'moderate')
+
+def make_policy(policy='thompson', state_path=None, **config):
+    routing_policy = RoutingPolicy(RoutingPolicyConfig(policy=policy, state_path=state_path, **config))
+    routing_policy._random = random.Random(1)
+    return routing_policy
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / 'routing_policy.json')
+
+def test_static_policy_keeps_score_order():
+    ranked, explored = make_policy('static').rank(CONTEXT, {'a': 0.5, 'b': 0.9, 'c': 0.7})
+
+    assert ranked == ['b', 'c', 'a'] and not explored
+
+@pytest.mark.parametrize('policy', ['thompson', 'ucb'])
+def test_warm_start_follows_static_scores(policy):
+    routing_policy = make_policy(policy, max_exploration=0.0)
+
+    for _ in range(20):
+        ranked, explored = routing_policy.rank(CONTEXT, {'a': 0.6, 'b': 0.9})
+        assert ranked[0] == 'b' and not explored
+
+def test_models_ruled_out_by_static_scores_are_never_tried():
+    routing_policy = make_policy(max_exploration=1.0, min_static_ratio=0.5)
+
+    firsts = {routing_policy.rank(CONTEXT, {'a': 1.0, 'b': 0.4})[0][0] for _ in range(200)}
+
+    assert firsts == {'a'}
+
+def test_exploration_is_capped_per_context():
+    routing_policy = make_policy(max_exploration=0.1, prior_weight=1.0)
+
+    explored = sum(routing_policy.rank(CONTEXT, {'a': 1.0, 'b': 0.95})[1] for _ in range(500))
+
+    assert 0 < explored <= 50
+    assert routing_policy.stats()['exploration_capped'] > 0
+
+def test_rewards_move_the_greedy_pick():
+    routing_policy = make_policy(max_exploration=0.0, prior_weight=5.0)
+    scores = {'a': 1.0, 'b': 0.9}
+    routing_policy.rank(CONTEXT, scores)
+
+    for _ in range(50):
+        routing_policy.update(CONTEXT, 'a', 5.0, False)
+        routing_policy.update(CONTEXT, 'b', 0.2, True)
+
+    assert routing_policy.rank(CONTEXT, scores)[0][0] == 'b'
+
+def test_state_survives_a_restart(state_path):
+    routing_policy = make_policy(state_path=state_path, decay=1.0)
+    routing_policy.rank(CONTEXT, {'a': 1.0, 'b': 0.9})
+    routing_policy.update(CONTEXT, 'a', 1.0, True)
+    routing_policy.save()
+
+    reloaded = make_policy(state_path=state_path)
+
+    assert reloaded.stats()['contexts'] == routing_policy.stats()['contexts']
+    assert reloaded._contexts[CONTEXT].arms == routing_policy._contexts[CONTEXT].arms
+
+def test_workers_merge_what_they_learned(state_path):
+    first = make_policy(state_path=state_path, decay=1.0)
+    second = make_policy(state_path=state_path, decay=1.0)
+    other = context_key('coding', 'complex')
+    for routing_policy, context, model in ((first, CONTEXT, 'a'), (second, CONTEXT, 'b'), (second, other, 'a')):
+        routing_policy.rank(context, {'a': 1.0, 'b': 0.9})
+        routing_policy.update(context, model, 1.0, True)
+
+    first.save()
+    second.save()
+    first.update(CONTEXT, 'a', 1.0, False)
+    first.save()
+
+    merged = make_policy(state_path=state_path)._contexts
+    assert merged[CONTEXT].decisions == 2
+    assert merged[CONTEXT].arms['a'][1] == pytest.approx(first._contexts[CONTEXT].arms['a'][1])
+    assert set(merged[CONTEXT].arms) == {'a', 'b'}
+    assert other in merged and other in first._contexts
+    assert [name for name in os.listdir(os.path.dirname(state_path)) if name.endswith('.tmp')] == []
+
+def test_decay_since_the_last_save_applies_to_merged_state(state_path):
+    first = make_policy(state_path=state_path, decay=0.5)
+    first.rank(CONTEXT, {'a': 1.0})
+    first.update(CONTEXT, 'a', 1.0, True)
+    first.save()
+    second = make_policy(state_path=state_path, decay=0.5)
+
+    second.update(CONTEXT, 'a', 1.0, True)
+    second.save()
+
+    # What `first` saved was decayed by the second worker's update before it was added
+    saved = first._read(state_path)[CONTEXT]
+    assert saved.decisions == pytest.approx(0.5 * 0.5)
+    assert sum(saved.arms['a']) == pytest.approx(1.0 * 0.5 + 1.0)
+
+def test_reset_replaces_the_saved_state(state_path):
+    routing_policy = make_policy(state_path=state_path)
+    routing_policy.rank(CONTEXT, {'a': 1.0})
+    routing_policy.update(CONTEXT, 'a', 1.0, True)
+    routing_policy.save()
+
+    routing_policy.reset()
+    routing_policy.save()
+
+    assert routing_policy._read(state_path) == {}
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Lightweight Request Tracing for the AI Stack
+OpenTelemetry-compatible spans (trace/span IDs, W3C traceparent propagation,
+OTLP/JSON export) recorded across gateway -> router -> orchestrator -> backend.
+Every traced request gets a Server-Timing breakdown; sampled traces are exported
+in the background to a JSONL file or an OTLP/HTTP collector.
+
+Run standalone for a local collector stand-in or to summarize exported traces:
+    python tracing.py collector --port 4318 --out traces.jsonl
+    python tracing.py summarize traces.jsonl
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import asyncio
+import argparse
+import functools
+import threading
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = 'traceparent'
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+@dataclass
+class TracingConfig:
+    """Tracing and export settings"""
+    enabled: bool = True
+    export: str = ''                    # '', 'file:<path>' or 'otlp:<http://collector:4318/v1/traces>'
+    sample_ratio: float = 1.0           # share of new traces exported (Server-Timing is always sent)
+    service_name: str = 'ai-stack-gateway'
+    inline_timing: bool = False         # add a 'timing' breakdown to every JSON response body
+    max_spans_per_trace: int = 512
+    export_batch_size: int = 64
+    export_interval: float = 2.0
+    export_queue_size: int = 2048
+
+    @classmethod
+    def from_env(cls) -> 'TracingConfig':
+        return cls(
+            enabled=os.getenv('TRACING_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            export=os.getenv('TRACE_EXPORT', ''),
+            sample_ratio=float(os.getenv('TRACE_SAMPLE_RATIO', '1.0')),
+            service_name=os.getenv('TRACE_SERVICE_NAME', 'ai-stack-gateway'),
+            inline_timing=os.getenv('TRACE_INLINE_TIMING', 'false').lower() in ('1', 'true', 'yes'),
+            max_spans_per_trace=int(os.getenv('TRACE_MAX_SPANS', '512')),
+            export_batch_size=int(os.getenv('TRACE_EXPORT_BATCH', '64')),
+            export_interval=float(os.getenv('TRACE_EXPORT_INTERVAL', '2.0')),
+            export_queue_size=int(os.getenv('TRACE_EXPORT_QUEUE', '2048'))
+        )
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, parent_span_id, sampled) from a W3C traceparent header, or None if invalid"""
+    parts = (header or '').strip().split('-')
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+class Trace:
+    """Spans finished so far for one request, in completion order"""
+
+    def __init__(self, trace_id: str, sampled: bool, max_spans: int):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.max_spans = max_spans
+        self.spans: List['Span'] = []
+        self.dropped = 0
+
+    def record(self, span: 'Span'):
+        if len(self.spans) < self.max_spans:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+class Span:
+    """One timed operation; a root span (no parent in this process) owns the Trace"""
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str] = None,
+                 kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.trace = trace
+        self.name = name
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_UNSET
+        self.status_message = ''
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else self.start_ns + time.perf_counter_ns() - self._started
+        return (end - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_error(self, error: Any):
+        self.status = STATUS_ERROR
+        self.status_message = str(error)[:500]
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = self.start_ns + time.perf_counter_ns() - self._started
+            self.trace.record(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.trace.sampled else '00'}"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or self.start_ns),
+            'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in self.attributes.items()],
+            'status': {'code': self.status, 'message': self.status_message} if self.status_message
+                      else {'code': self.status}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+class _NoopSpan:
+    """Stand-in when there is no active trace, so instrumented code never has to check"""
+    trace = None
+    trace_id = ''
+    span_id = ''
+    duration_ms = 0.0
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_error(self, error: Any):
+        pass
+
+    def end(self):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+class SpanExporter:
+    """Batches finished traces on a background thread and writes them as OTLP/JSON"""
+
+    def __init__(self, target: str, service_name: str, batch_size: int = 64,
+                 interval: float = 2.0, queue_size: int = 2048):
+        self.kind, _, self.destination = target.partition(':')
+        if self.kind not in ('file', 'otlp') or not self.destination:
+            raise ValueError(f"TRACE_EXPORT must be 'file:<path>' or 'otlp:<url>', got '{target}'")
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: 'queue.Queue[List[Span]]' = queue.Queue(maxsize=queue_size)
+        self._session = requests.Session() if self.kind == 'otlp' else None
+        self.stats_counters = {'traces': 0, 'spans': 0, 'dropped_traces': 0, 'export_errors': 0}
+        self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._thread.start()
+
+    def submit(self, spans: List[Span]):
+        """Queue a finished trace; dropped (and counted) when the exporter falls behind"""
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.stats_counters['dropped_traces'] += 1
+
+    def payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [
+                    {'key': 'service.name', 'value': {'stringValue': self.service_name}}
+                ]},
+                'scopeSpans': [{
+                    'scope': {'name': 'ai-stack.tracing'},
+                    'spans': [span.to_otlp() for span in spans]
+                }]
+            }]
+        }
+
+    def _run(self):
+        while True:
+            batch: List[Span] = []
+            traces = 0
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size * 8 and traces < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.extend(self._queue.get(timeout=timeout))
+                    traces += 1
+                except queue.Empty:
+                    break
+            if batch:
+                self._export(batch, traces)
+            for _ in range(traces):
+                self._queue.task_done()
+
+    def _export(self, spans: List[Span], traces: int):
+        payload = self.payload(spans)
+        try:
+            if self.kind == 'file':
+                with open(self.destination, 'a') as f:
+                    f.write(json.dumps(payload, separators=(',', ':')) + '\n')
+            else:
+                self._session.post(self.destination, json=payload, timeout=5).raise_for_status()
+            self.stats_counters['traces'] += traces
+            self.stats_counters['spans'] += len(spans)
+        except Exception as e:
+            self.stats_counters['export_errors'] += 1
+            logger.warning(f"Trace export to {self.kind}:{self.destination} failed: {e}")
+
+    def flush(self, timeout: float = 5.0):
+        """Wait (up to `timeout`) until every submitted trace has been written"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+class Tracer:
+    """Creates spans in the current context and exports finished traces"""
+
+    def __init__(self, config: Optional[TracingConfig] = None):
+        self.config = config or TracingConfig.from_env()
+        self.exporter: Optional[SpanExporter] = None
+        if self.config.enabled and self.config.export:
+            try:
+                self.exporter = SpanExporter(
+                    self.config.export, self.config.service_name, self.config.export_batch_size,
+                    self.config.export_interval, self.config.export_queue_size
+                )
+            except ValueError as e:
+                logger.error(f"Trace export disabled: {e}")
+
+    def current_span(self):
+        """Innermost active span, or a no-op span outside any trace"""
+        return _current_span.get() or NOOP_SPAN
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None,
+                    attributes: Optional[Dict[str, Any]] = None):
+        """Open a request's root span (continuing an incoming traceparent) and make it current.
+        Returns (span, token); pass both to finish_trace()"""
+        if not self.config.enabled:
+            return NOOP_SPAN, None
+        parent = parse_traceparent(traceparent)
+        if parent:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = f'{random.getrandbits(128):032x}', None
+            sampled = random.random() < self.config.sample_ratio
+        trace = Trace(trace_id, sampled, self.config.max_spans_per_trace)
+        span = Span(trace, name, parent_id, SPAN_KIND_SERVER, attributes)
+        return span, _current_span.set(span)
+
+    def detach(self, token):
+        """Stop treating the request's root span as current (it may still be open for a stream)"""
+        if token is not None:
+            _current_span.reset(token)
+
+    def finish_trace(self, span):
+        """End the root span and hand a sampled trace to the exporter"""
+        if span is NOOP_SPAN or span.end_ns is not None:
+            return
+        span.end()
+        if self.exporter is not None and span.trace.sampled:
+            self.exporter.submit(list(span.trace.spans))
+
+    @contextmanager
+    def span(self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes) -> Iterator[Any]:
+        """Time a block as a child of the current span (a no-op outside a trace)"""
+        parent = _current_span.get()
+        if parent is None:
+            yield NOOP_SPAN
+            return
+        span = Span(parent.trace, name, parent.span_id, kind, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+                span.set_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def traced(self, name: str, kind: int = SPAN_KIND_INTERNAL):
+        """Decorator running a sync or async function inside a child span"""
+        def decorator(fn: Callable) -> Callable:
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name, kind):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, kind):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def inject(self, headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Copy of `headers` carrying the current span as W3C traceparent"""
+        headers = dict(headers or {})
+        span = _current_span.get()
+        if span is not None:
+            headers[TRACEPARENT_HEADER] = span.traceparent()
+        return headers
+
+    def server_timing(self, root, limit: int = 24) -> str:
+        """Server-Timing header value: total plus finished spans aggregated by name"""
+        if root is NOOP_SPAN:
+            return ''
+        totals: Dict[str, List[float]] = {}
+        for span in list(root.trace.spans):
+            if span is root:
+                continue
+            entry = totals.setdefault(span.name, [0.0, 0])
+            entry[0] += span.duration_ms
+            entry[1] += 1
+        metrics = [f'total;dur={root.duration_ms:.1f}']
+        for name, (duration, count) in list(totals.items())[:limit]:
+            desc = f';desc="x{count}"' if count > 1 else ''
+            metrics.append(f'{name};dur={duration:.1f}{desc}')
+        return ', '.join(metrics)
+
+    def breakdown(self, root) -> Dict[str, Any]:
+        """Inline timing breakdown of the spans finished so far, in start order"""
+        if root is NOOP_SPAN:
+            return {}
+        spans = sorted((s for s in list(root.trace.spans) if s is not root), key=lambda s: s.start_ns)
+        return {
+            'trace_id': root.trace_id,
+            'total_ms': round(root.duration_ms, 2),
+            'spans': [{
+                'name': span.name,
+                'span_id': span.span_id,
+                'parent_span_id': span.parent_id,
+                'start_offset_ms': round((span.start_ns - root.start_ns) / 1e6, 2),
+                'duration_ms': round(span.duration_ms, 2),
+                'error': span.status_message or None,
+                'attributes': span.attributes
+            } for span in spans],
+            'dropped_spans': root.trace.dropped
+        }
+
+    def wants_inline_timing(self, headers, args) -> bool:
+        """Inline breakdown requested via config, X-Timing-Breakdown: 1 or ?timing=1"""
+        flag = (headers.get('X-Timing-Breakdown') or args.get('timing') or '').lower()
+        return self.config.inline_timing or flag in ('1', 'true', 'yes')
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.config.enabled,
+            'export': self.config.export or None,
+            'sample_ratio': self.config.sample_ratio,
+            **(self.exporter.stats_counters if self.exporter else {})
+        }
+
+# Global tracer instance
+tracer = Tracer()
+
+def _load_spans(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Exported OTLP/JSON lines grouped by trace ID"""
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource in json.loads(line).get('resourceSpans', []):
+                for scope in resource.get('scopeSpans', []):
+                    for span in scope.get('spans', []):
+                        traces.setdefault(span['traceId'], []).append(span)
+    return traces
+
+def summarize(path: str, trace_id: Optional[str] = None, slowest: int = 5):
+    """Print the span tree of the slowest exported traces (or one given trace)"""
+    def duration(span):
+        return (int(span['endTimeUnixNano']) - int(span['startTimeUnixNano'])) / 1e6
+
+    traces = _load_spans(path)
+    if trace_id:
+        selected = [trace_id] if trace_id in traces else []
+    else:
+        def trace_duration(spans):
+            return max(int(s['endTimeUnixNano']) for s in spans) - min(int(s['startTimeUnixNano']) for s in spans)
+        selected = sorted(traces, key=lambda t: trace_duration(traces[t]), reverse=True)[:slowest]
+
+    print(f"{len(traces)} traces in {path}")
+    for tid in selected:
+        spans = traces[tid]
+        ids = {span['spanId'] for span in spans}
+        children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for span in spans:
+            parent = span.get('parentSpanId') if span.get('parentSpanId') in ids else None
+            children.setdefault(parent, []).append(span)
+        origin = min(int(span['startTimeUnixNano']) for span in spans)
+
+        print(f"\ntrace {tid}")
+
+        def show(span, depth):
+            offset = (int(span['startTimeUnixNano']) - origin) / 1e6
+            error = ' ERROR' if span.get('status', {}).get('code') == STATUS_ERROR else ''
+            attrs = ' '.join(f"{a['key']}={list(a['value'].values())[0]}" for a in span.get('attributes', []))
+            print(f"  {'  ' * depth}{span['name']:<{40 - 2 * depth}} +{offset:9.1f}ms {duration(span):9.1f}ms{error}  {attrs}")
+            for child in sorted(children.get(span['spanId'], []), key=lambda s: int(s['startTimeUnixNano'])):
+                show(child, depth + 1)
+
+        for root in sorted(children.get(None, []), key=lambda s: int(s['startTimeUnixNano'])):
+            show(root, 0)
+
+def run_collector(host: str, port: int, out: str):
+    """Minimal OTLP/HTTP JSON collector stand-in that appends received traces to a file"""
+    from aiohttp import web
+
+    async def receive(request: web.Request) -> web.Response:
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({'error': 'expected OTLP/JSON'}, status=400)
+        with open(out, 'a') as f:
+            f.write(json.dumps(payload, separators=(',', ':')) + '\n')
+        spans = sum(len(scope.get('spans', [])) for resource in payload.get('resourceSpans', [])
+                    for scope in resource.get('scopeSpans', []))
+        logger.info(f"Received {spans} spans")
+        return web.json_response({'partialSuccess': {}})
+
+    app = web.Application()
+    app.router.add_post('/v1/traces', receive)
+    logger.info(f"OTLP collector stand-in on http://{host}:{port}/v1/traces writing to {out}")
+    web.run_app(app, host=host, port=port, access_log=None, print=None)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Trace collector stand-in and trace summaries')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    collector = subparsers.add_parser('collector', help='Accept OTLP/JSON traces over HTTP')
+    collector.add_argument('--host', default='127.0.0.1')
+    collector.add_argument('--port', type=int, default=4318)
+    collector.add_argument('--out', default='traces.jsonl')
+
+    summary = subparsers.add_parser('summarize', help='Print span trees from an exported trace file')
+    summary.add_argument('path')
+    summary.add_argument('--trace-id', default=None)
+    summary.add_argument('--slowest', type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == 'collector':
+        run_collector(args.host, args.port, args.out)
+    else:
+        summarize(args.path, args.trace_id, args.slowest)
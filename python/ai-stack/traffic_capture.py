@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Sanitised Traffic Capture for the API Gateway
+Optionally appends one JSON line per gateway request with its arrival time,
+endpoint, status, latency, prompt size and generation parameters - never the
+prompt text or credentials - so real traffic shapes can be replayed against
+stub backends with load_harness.py.
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import hashlib
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Request body fields copied verbatim (all small scalars that shape backend load)
+CAPTURED_PARAMS = ('task_type', 'max_tokens', 'temperature', 'top_p', 'top_k', 'stream',
+                   'budget_factor', 'template', 'template_name', 'server_name')
+
+@dataclass
+class CaptureConfig:
+    """Where and how much traffic to record"""
+    path: str = ''                  # empty disables capture
+    sample_ratio: float = 1.0
+    endpoint_prefix: str = '/v1/'   # only record API traffic, not health/metrics polling
+    queue_size: int = 10000
+
+    @classmethod
+    def from_env(cls) -> 'CaptureConfig':
+        return cls(
+            path=os.getenv('TRAFFIC_CAPTURE_PATH', ''),
+            sample_ratio=float(os.getenv('TRAFFIC_CAPTURE_SAMPLE', '1.0')),
+            endpoint_prefix=os.getenv('TRAFFIC_CAPTURE_PREFIX', '/v1/'),
+            queue_size=int(os.getenv('TRAFFIC_CAPTURE_QUEUE', '10000'))
+        )
+
+def prompt_shape(data: Any) -> Dict[str, int]:
+    """Size of the prompt in a completion, chat or collaboration body (no text)"""
+    if not isinstance(data, dict):
+        return {'prompt_chars': 0}
+    messages = data.get('messages')
+    if isinstance(messages, list):
+        contents = [str(m.get('content', '')) for m in messages if isinstance(m, dict)]
+        return {'prompt_chars': sum(len(c) for c in contents), 'messages': len(contents)}
+    return {'prompt_chars': len(str(data.get('prompt') or ''))}
+
+def sanitise(endpoint: str, method: str, data: Any, headers) -> Dict[str, Any]:
+    """The replayable shape of one request"""
+    entry: Dict[str, Any] = {'endpoint': endpoint, 'method': method, **prompt_shape(data)}
+    if isinstance(data, dict):
+        entry['params'] = {k: data[k] for k in CAPTURED_PARAMS
+                           if k in data and isinstance(data[k], (str, int, float, bool))}
+    priority = headers.get('X-Priority')
+    if priority:
+        entry['priority'] = priority[:32]
+    api_key = headers.get('X-API-Key') or headers.get('Authorization')
+    if api_key:
+        # Stable pseudonym so per-caller rate limits replay realistically
+        entry['caller'] = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]
+    return entry
+
+class TrafficCapture:
+    """Appends sanitised request records to a JSONL file from a background thread"""
+
+    def __init__(self, config: Optional[CaptureConfig] = None):
+        self.config = config or CaptureConfig.from_env()
+        self._queue: 'queue.Queue[Dict[str, Any]]' = queue.Queue(maxsize=self.config.queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats_counters = {'recorded': 0, 'dropped': 0, 'write_errors': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config.path)
+
+    def wants(self, endpoint: str) -> bool:
+        """Whether this request should be captured (checked before any work is done)"""
+        return (self.enabled and endpoint.startswith(self.config.endpoint_prefix)
+                and random.random() < self.config.sample_ratio)
+
+    def record(self, entry: Dict[str, Any], arrived_at: float, status: int, duration: float):
+        """Queue one finished request; dropped (and counted) if the writer falls behind"""
+        entry = dict(entry, ts=round(arrived_at, 6), status=status, duration_ms=round(duration * 1000, 2))
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.stats_counters['dropped'] += 1
+
+    def _ensure_writer(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='traffic-capture', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            entries = [self._queue.get()]
+            while len(entries) < 512:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.config.path, 'a') as f:
+                    f.write(''.join(json.dumps(e, separators=(',', ':')) + '\n' for e in entries))
+                self.stats_counters['recorded'] += len(entries)
+            except OSError as e:
+                self.stats_counters['write_errors'] += 1
+                logger.warning(f"Traffic capture write to {self.config.path} failed: {e}")
+            for _ in entries:
+                self._queue.task_done()
+
+    def flush(self, timeout: float = 5.0):
+        """Wait (up to `timeout`) for queued records to be written"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'path': self.config.path or None,
+            'sample_ratio': self.config.sample_ratio,
+            **self.stats_counters
+        }
+
+# Global traffic capture instance
+traffic_capture = TrafficCapture()
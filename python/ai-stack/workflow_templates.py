@@ -11,6 +11,8 @@ from dataclasses import dataclass, asdict
 from enum import Enum
 import uuid
 
+from startup import Lazy
+
 class TaskType(Enum):
     """Task types for different AI services"""
     REASONING = "reasoning"
@@ -310,17 +312,20 @@ class WorkflowManager:
     def _generate_task_prompt(self, task_type: TaskType, original_prompt: str, template: WorkflowTemplate) -> str:
         """Generate a specific prompt for a task type based on the original prompt"""
         
+        # The shared request leads every task prompt, so a backend serving several of a plan's
+        # tasks reuses its KV cache for that prefix instead of recomputing it per task
         prompt_templates = {
-            TaskType.RESEARCH: f"Research and gather information about: {original_prompt}",
-            TaskType.REASONING: f"Analyze and reason about: {original_prompt}. Consider the research findings and provide logical conclusions.",
-            TaskType.CODING: f"Develop code or technical solution for: {original_prompt}. Use research insights to inform the implementation.",
-            TaskType.CREATIVE: f"Create creative content related to: {original_prompt}. Draw inspiration from research and analysis.",
-            TaskType.GENERAL: f"Provide a comprehensive summary and final response for: {original_prompt}. Integrate insights from all previous analyses.",
-            TaskType.ANALYSIS: f"Perform detailed analysis of: {original_prompt}",
-            TaskType.MULTIMODAL: f"Process and analyze multimodal content for: {original_prompt}"
+            TaskType.RESEARCH: "Research and gather information about the request above.",
+            TaskType.REASONING: "Analyze and reason about the request above. Consider the research findings and provide logical conclusions.",
+            TaskType.CODING: "Develop code or technical solution for the request above. Use research insights to inform the implementation.",
+            TaskType.CREATIVE: "Create creative content related to the request above. Draw inspiration from research and analysis.",
+            TaskType.GENERAL: "Provide a comprehensive summary and final response for the request above. Integrate insights from all previous analyses.",
+            TaskType.ANALYSIS: "Perform detailed analysis of the request above.",
+            TaskType.MULTIMODAL: "Process and analyze multimodal content for the request above."
         }
         
-        return prompt_templates.get(task_type, f"Process the following request: {original_prompt}")
+        instruction = prompt_templates.get(task_type, "Process the request above.")
+        return f"Request: {original_prompt}\n\n{instruction}"
     
     def get_workflow_config(self, template_name: str) -> Dict[str, Any]:
         """Get complete workflow configuration as dictionary"""
@@ -360,7 +365,7 @@ WORKFLOW_EXAMPLES = {
 }
 
 # Global workflow manager instance
-workflow_manager = WorkflowManager()
+workflow_manager = Lazy(WorkflowManager, 'workflow_manager')
 
 if __name__ == "__main__":
     # Test the workflow manager